@@ -31,6 +31,7 @@ try:
     argparser.add_argument( '--db_memory_journaling', action='store_true', help = 'run db journaling entirely in memory (DANGEROUS)' )
     argparser.add_argument( '--db_synchronous_override', help = 'override SQLite Synchronous PRAGMA (range 0-3, default=2)' )
     argparser.add_argument( '--no_db_temp_files', action='store_true', help = 'run db temp operations entirely in memory' )
+    argparser.add_argument( '--db_read_connections', type = int, help = 'override how many extra read-only db connections serve searches and other reads in parallel (0 to turn off)' )
     
     result = argparser.parse_args()
     
@@ -92,6 +93,11 @@ try:
     
     HG.no_db_temp_files = result.no_db_temp_files
     
+    if result.db_read_connections is not None:
+        
+        HG.db_read_connections = max( 0, result.db_read_connections )
+        
+    
     if result.temp_dir is not None:
         
         HydrusPaths.SetEnvTempDir( result.temp_dir )
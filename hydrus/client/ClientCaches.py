@@ -1,6 +1,9 @@
 import collections
+import hashlib
 import json
+import mmap
 import os
+import struct
 import threading
 import time
 import typing
@@ -13,23 +16,45 @@ from hydrus.client import ClientRendering
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusImageHandling
+from hydrus.core import HydrusPaths
 from hydrus.core import HydrusThreading
+from hydrus.core import HydrusVideoHandling
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
 
 class DataCache( object ):
     
-    def __init__( self, controller, cache_size, timeout = 1200 ):
+    def __init__( self, controller, name, cache_size, timeout = 1200, scan_resistant = False ):
         
         self._controller = controller
+        self._name = name
         self._cache_size = cache_size
         self._timeout = timeout
+        self._scan_resistant = scan_resistant
         
         self._keys_to_data = {}
+        self._keys_to_estimated_memory_footprints = {}
+        
+        # this is an LRU--least recently used at the front. when we are scan resistant, this only holds keys that have been used more than once
         self._keys_fifo = collections.OrderedDict()
         
+        # when we are scan resistant, new keys wait here first, in a FIFO, and only get into the LRU above if they are asked for again after being dropped
+        # this means a single long scroll through a page of thumbnails cannot push out everything the user keeps coming back to
+        self._probationary_keys_fifo = collections.OrderedDict()
+        self._probationary_estimated_memory_footprint = 0
+        
+        # the same keys in last access order, so the timeout check can stop at the first one still in use
+        self._probationary_keys_to_last_access_times = collections.OrderedDict()
+        
+        # keys recently dropped from probation. if they come back, they skip probation
+        self._ghost_keys = collections.OrderedDict()
+        
         self._total_estimated_memory_footprint = 0
         
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        
         self._lock = threading.Lock()
         
         self._controller.sub( self, 'MaintainCache', 'memory_maintenance_pulse' )
@@ -42,34 +67,84 @@ class DataCache( object ):
             return
             
         
-        deletee_data = self._keys_to_data[ key ]
-        
         del self._keys_to_data[ key ]
         
-        self._RecalcMemoryUsage()
+        estimated_memory_footprint = self._keys_to_estimated_memory_footprints.pop( key )
+        
+        self._total_estimated_memory_footprint -= estimated_memory_footprint
+        
+        if key in self._probationary_keys_fifo:
+            
+            del self._probationary_keys_fifo[ key ]
+            del self._probationary_keys_to_last_access_times[ key ]
+            
+            self._probationary_estimated_memory_footprint -= estimated_memory_footprint
+            
+        
+        if key in self._keys_fifo:
+            
+            del self._keys_fifo[ key ]
+            
         
     
     def _DeleteItem( self ):
         
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+        probationary_limit = self._cache_size // 4
+        
+        if len( self._probationary_keys_fifo ) > 0 and ( len( self._keys_fifo ) == 0 or self._probationary_estimated_memory_footprint > probationary_limit ):
+            
+            ( deletee_key, last_access_time ) = next( iter( self._probationary_keys_fifo.items() ) )
+            
+            self._ghost_keys[ deletee_key ] = None
+            
+            while len( self._ghost_keys ) > max( len( self._keys_to_data ), 1 ):
+                
+                self._ghost_keys.popitem( last = False )
+                
+            
+        else:
+            
+            ( deletee_key, last_access_time ) = next( iter( self._keys_fifo.items() ) )
+            
         
         self._Delete( deletee_key )
         
+        self._evictions += 1
+        
     
-    def _RecalcMemoryUsage( self ):
+    def _GetOldestKeyAndAccessTime( self ):
+        
+        candidates = [ next( iter( fifo.items() ) ) for fifo in ( self._keys_fifo, self._probationary_keys_to_last_access_times ) if len( fifo ) > 0 ]
         
-        self._total_estimated_memory_footprint = sum( ( data.GetEstimatedMemoryFootprint() for data in self._keys_to_data.values() ) )
+        if len( candidates ) == 0:
+            
+            return None
+            
+        
+        return min( candidates, key = lambda pair: pair[1] )
         
     
     def _TouchKey( self, key ):
         
-        # have to delete first, rather than overwriting, so the ordereddict updates its internal order
-        if key in self._keys_fifo:
+        if key in self._probationary_keys_fifo:
             
-            del self._keys_fifo[ key ]
+            # uses while on probation are usually the same burst of work (a thumb is drawn several times as it is scrolled past), so they do not count
+            # we just update the access time. the key only graduates if it comes back after it has been dropped
+            
+            self._probationary_keys_to_last_access_times.move_to_end( key )
+            
+            self._probationary_keys_to_last_access_times[ key ] = HydrusData.GetNow()
+            
+        else:
+            
+            if key in self._keys_fifo:
+                
+                self._keys_fifo.move_to_end( key )
+                
+            
+            self._keys_fifo[ key ] = HydrusData.GetNow()
             
         
-        self._keys_fifo[ key ] = HydrusData.GetNow()
         
     
     def Clear( self ):
@@ -77,9 +152,15 @@ class DataCache( object ):
         with self._lock:
             
             self._keys_to_data = {}
+            self._keys_to_estimated_memory_footprints = {}
+            
             self._keys_fifo = collections.OrderedDict()
+            self._probationary_keys_fifo = collections.OrderedDict()
+            self._probationary_keys_to_last_access_times = collections.OrderedDict()
+            self._ghost_keys = collections.OrderedDict()
             
             self._total_estimated_memory_footprint = 0
+            self._probationary_estimated_memory_footprint = 0
             
         
     
@@ -89,16 +170,34 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
-                while self._total_estimated_memory_footprint > self._cache_size:
+                estimated_memory_footprint = data.GetEstimatedMemoryFootprint()
+                
+                while len( self._keys_to_data ) > 0 and self._total_estimated_memory_footprint + estimated_memory_footprint > self._cache_size:
                     
                     self._DeleteItem()
                     
                 
                 self._keys_to_data[ key ] = data
+                self._keys_to_estimated_memory_footprints[ key ] = estimated_memory_footprint
                 
-                self._TouchKey( key )
+                self._total_estimated_memory_footprint += estimated_memory_footprint
                 
-                self._RecalcMemoryUsage()
+                if self._scan_resistant and key not in self._ghost_keys:
+                    
+                    self._probationary_keys_fifo[ key ] = HydrusData.GetNow()
+                    self._probationary_keys_to_last_access_times[ key ] = HydrusData.GetNow()
+                    
+                    self._probationary_estimated_memory_footprint += estimated_memory_footprint
+                    
+                else:
+                    
+                    if key in self._ghost_keys:
+                        
+                        del self._ghost_keys[ key ]
+                        
+                    
+                    self._keys_fifo[ key ] = HydrusData.GetNow()
+                    
                 
             
         
@@ -117,9 +216,13 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
+                self._misses += 1
+                
                 raise Exception( 'Cache error! Looking for ' + str( key ) + ', but it was missing.' )
                 
             
+            self._hits += 1
+            
             self._TouchKey( key )
             
             return self._keys_to_data[ key ]
@@ -132,17 +235,40 @@ class DataCache( object ):
             
             if key in self._keys_to_data:
                 
+                self._hits += 1
+                
                 self._TouchKey( key )
                 
                 return self._keys_to_data[ key ]
                 
             else:
                 
+                self._misses += 1
+                
                 return None
                 
             
         
     
+    def GetStatistics( self ):
+        
+        with self._lock:
+            
+            statistics = {}
+            
+            statistics[ 'name' ] = self._name
+            statistics[ 'hits' ] = self._hits
+            statistics[ 'misses' ] = self._misses
+            statistics[ 'evictions' ] = self._evictions
+            statistics[ 'num_items' ] = len( self._keys_to_data )
+            statistics[ 'num_probationary_items' ] = len( self._probationary_keys_fifo )
+            statistics[ 'estimated_memory_footprint' ] = self._total_estimated_memory_footprint
+            statistics[ 'cache_size' ] = self._cache_size
+            
+            return statistics
+            
+        
+    
     def HasData( self, key ):
         
         with self._lock:
@@ -157,22 +283,22 @@ class DataCache( object ):
             
             while True:
                 
-                if len( self._keys_fifo ) == 0:
+                result = self._GetOldestKeyAndAccessTime()
+                
+                if result is None:
                     
                     break
                     
-                else:
+                
+                ( key, last_access_time ) = result
+                
+                if HydrusData.TimeHasPassed( last_access_time + self._timeout ):
                     
-                    ( key, last_access_time ) = next( iter( self._keys_fifo.items() ) )
+                    self._Delete( key )
                     
-                    if HydrusData.TimeHasPassed( last_access_time + self._timeout ):
-                        
-                        self._DeleteItem()
-                        
-                    else:
-                        
-                        break
-                        
+                else:
+                    
+                    break
                     
                 
             
@@ -331,15 +457,23 @@ class LocalBooruCache( object ):
             
         
     
+PARSE_RESULTS_CACHE_SIZE = 5000
+PARSE_RESULTS_CACHE_TIMEOUT = 600
+
 class ParsingCache( object ):
     
     def __init__( self ):
         
         self._next_clean_cache_time = HydrusData.GetNow()
         
-        self._html_to_soups = {}
+        self._html_to_documents = {}
         self._json_to_jsons = {}
         
+        # a page parser runs many formulas over the same text, and gallery and subscription checks often see the same text again, so we remember what each formula got
+        # this is keyed on digests so we do not hold on to big documents
+        self._texts_to_digests = {}
+        self._parse_results = collections.OrderedDict()
+        
         self._lock = threading.Lock()
         
     
@@ -347,7 +481,7 @@ class ParsingCache( object ):
         
         if HydrusData.TimeHasPassed( self._next_clean_cache_time ):
             
-            for cache in ( self._html_to_soups, self._json_to_jsons ):
+            for cache in ( self._html_to_documents, self._json_to_jsons, self._texts_to_digests ):
                 
                 dead_datas = set()
                 
@@ -365,10 +499,46 @@ class ParsingCache( object ):
                     
                 
             
+            # this is an LRU, so the oldest are at the front
+            while len( self._parse_results ) > 0:
+                
+                ( key, ( last_accessed, results ) ) = next( iter( self._parse_results.items() ) )
+                
+                if not HydrusData.TimeHasPassed( last_accessed + PARSE_RESULTS_CACHE_TIMEOUT ):
+                    
+                    break
+                    
+                
+                del self._parse_results[ key ]
+                
+            
             self._next_clean_cache_time = HydrusData.GetNow() + 5
             
         
     
+    def _GetTextDigest( self, text ):
+        
+        now = HydrusData.GetNow()
+        
+        if text in self._texts_to_digests:
+            
+            ( last_accessed, digest ) = self._texts_to_digests[ text ]
+            
+        else:
+            
+            digest = hashlib.sha256( text.encode( 'utf-8', errors = 'surrogatepass' ) ).digest()
+            
+        
+        self._texts_to_digests[ text ] = ( now, digest )
+        
+        if len( self._texts_to_digests ) > 10:
+            
+            self._CleanCache()
+            
+        
+        return digest
+        
+    
     def CleanCache( self ):
         
         with self._lock:
@@ -377,6 +547,35 @@ class ParsingCache( object ):
             
         
     
+    def GetHTMLDocument( self, html ):
+        
+        with self._lock:
+            
+            now = HydrusData.GetNow()
+            
+            if html not in self._html_to_documents:
+                
+                document = ClientParsing.GetHTMLDocument( html )
+                
+                self._html_to_documents[ html ] = ( now, document )
+                
+            
+            ( last_accessed, document ) = self._html_to_documents[ html ]
+            
+            if last_accessed != now:
+                
+                self._html_to_documents[ html ] = ( now, document )
+                
+            
+            if len( self._html_to_documents ) > 10:
+                
+                self._CleanCache()
+                
+            
+            return document
+            
+        
+    
     def GetJSON( self, json_text ):
         
         with self._lock:
@@ -406,33 +605,43 @@ class ParsingCache( object ):
             
         
     
-    def GetSoup( self, html ):
+    def GetParseResults( self, formula, parsing_text, parse_callable ):
+        
+        # the formula may be edited between calls, so we key on what it is right now
+        formula_digest = hashlib.sha256( formula.DumpToString().encode( 'utf-8' ) ).digest()
         
         with self._lock:
             
-            now = HydrusData.GetNow()
+            key = ( self._GetTextDigest( parsing_text ), formula_digest )
             
-            if html not in self._html_to_soups:
+            if key in self._parse_results:
                 
-                soup = ClientParsing.GetSoup( html )
+                ( last_accessed, results ) = self._parse_results[ key ]
                 
-                self._html_to_soups[ html ] = ( now, soup )
+                self._parse_results[ key ] = ( HydrusData.GetNow(), results )
                 
-            
-            ( last_accessed, soup ) = self._html_to_soups[ html ]
-            
-            if last_accessed != now:
+                self._parse_results.move_to_end( key )
                 
-                self._html_to_soups[ html ] = ( now, soup )
+                return list( results )
                 
             
-            if len( self._html_to_soups ) > 10:
+        
+        # not under the lock, since this will want the document or json from us. if it raises, we do not remember anything
+        results = parse_callable()
+        
+        with self._lock:
+            
+            self._parse_results[ key ] = ( HydrusData.GetNow(), list( results ) )
+            
+            self._parse_results.move_to_end( key )
+            
+            while len( self._parse_results ) > PARSE_RESULTS_CACHE_SIZE:
                 
-                self._CleanCache()
+                self._parse_results.popitem( last = False )
                 
             
-            return soup
-            
+        
+        return results
         
     
 class RenderedImageCache( object ):
@@ -444,7 +653,9 @@ class RenderedImageCache( object ):
         cache_size = self._controller.options[ 'fullscreen_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'image_cache_timeout' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        scan_resistant = self._controller.new_options.GetBoolean( 'scan_resistant_media_caches' )
+        
+        self._data_cache = DataCache( self._controller, 'image cache', cache_size, timeout = cache_timeout, scan_resistant = scan_resistant )
         
     
     def Clear( self ):
@@ -471,14 +682,308 @@ class RenderedImageCache( object ):
             image_renderer = result
             
         
-        return image_renderer
+        return image_renderer
+        
+    
+    def GetStatistics( self ):
+        
+        return self._data_cache.GetStatistics()
+        
+    
+    def HasImageRenderer( self, hash ):
+        
+        key = hash
+        
+        return self._data_cache.HasData( key )
+        
+    
+class DecodedThumbnailSlabCache( object ):
+    
+    # a second tier under the thumbnail DataCache. decoded thumbnail pixels are kept in fixed-size slots in a handful of memory-mapped files
+    # so a client restart or a big scroll back to old thumbs can skip the jpeg/png decode and go straight to a bitmap
+    
+    SLOTS_PER_SLAB = 256
+    
+    # hash, width, height, depth, valid
+    HEADER_STRUCT = struct.Struct( '>32sHHBB' )
+    HEADER_SIZE = 40
+    
+    def __init__( self, controller, max_size ):
+        
+        self._controller = controller
+        
+        self._max_size = max_size
+        
+        self._lock = threading.Lock()
+        
+        self._dir = os.path.join( self._controller.db_dir, 'client_thumbnail_slabs' )
+        
+        self._bounding_dimensions = None
+        self._slot_size = 0
+        self._num_slots = 0
+        
+        self._slab_files = []
+        self._slabs = []
+        
+        self._hashes_to_slots = {}
+        self._slots_to_hashes = {}
+        
+        self._free_slots = []
+        self._clock_hand = 0
+        
+        self._InitialiseSlabs( self._controller.options[ 'thumbnail_dimensions' ] )
+        
+    
+    def _CloseSlabs( self ):
+        
+        for slab in self._slabs:
+            
+            slab.close()
+            
+        
+        for slab_file in self._slab_files:
+            
+            slab_file.close()
+            
+        
+        self._slab_files = []
+        self._slabs = []
+        
+        self._hashes_to_slots = {}
+        self._slots_to_hashes = {}
+        
+        self._free_slots = []
+        self._clock_hand = 0
+        
+    
+    def _GetSlabFilename( self, bounding_dimensions, slab_index ):
+        
+        ( width, height ) = bounding_dimensions
+        
+        return 'thumbnails_{}x{}_{}.slab'.format( width, height, slab_index )
+        
+    
+    def _GetSlabAndOffset( self, slot ):
+        
+        ( slab_index, slot_index ) = divmod( slot, self.SLOTS_PER_SLAB )
+        
+        return ( self._slabs[ slab_index ], slot_index * self._slot_size )
+        
+    
+    def _InitialiseSlabs( self, bounding_dimensions ):
+        
+        self._CloseSlabs()
+        
+        ( width, height ) = bounding_dimensions
+        
+        self._bounding_dimensions = tuple( bounding_dimensions )
+        
+        self._slot_size = self.HEADER_SIZE + width * height * 4
+        
+        num_slabs = max( 1, self._max_size // ( self._slot_size * self.SLOTS_PER_SLAB ) )
+        
+        self._num_slots = num_slabs * self.SLOTS_PER_SLAB
+        
+        slab_size = self._slot_size * self.SLOTS_PER_SLAB
+        
+        HydrusPaths.MakeSureDirectoryExists( self._dir )
+        
+        wanted_filenames = { self._GetSlabFilename( bounding_dimensions, slab_index ) for slab_index in range( num_slabs ) }
+        
+        # slabs from old thumbnail dimensions or a previously larger cache are dead weight
+        for filename in os.listdir( self._dir ):
+            
+            if filename.endswith( '.slab' ) and filename not in wanted_filenames:
+                
+                HydrusPaths.DeletePath( os.path.join( self._dir, filename ) )
+                
+            
+        
+        for slab_index in range( num_slabs ):
+            
+            path = os.path.join( self._dir, self._GetSlabFilename( bounding_dimensions, slab_index ) )
+            
+            if not os.path.exists( path ):
+                
+                with open( path, 'wb' ) as f:
+                    
+                    f.truncate( slab_size )
+                    
+                
+            elif os.path.getsize( path ) != slab_size:
+                
+                with open( path, 'r+b' ) as f:
+                    
+                    f.truncate( slab_size )
+                    
+                
+            
+            slab_file = open( path, 'r+b' )
+            
+            self._slab_files.append( slab_file )
+            self._slabs.append( mmap.mmap( slab_file.fileno(), slab_size ) )
+            
+        
+        for slot in range( self._num_slots ):
+            
+            ( slab, offset ) = self._GetSlabAndOffset( slot )
+            
+            ( hash, slot_width, slot_height, depth, valid ) = self.HEADER_STRUCT.unpack_from( slab, offset )
+            
+            if valid == 1 and hash not in self._hashes_to_slots:
+                
+                self._hashes_to_slots[ hash ] = slot
+                self._slots_to_hashes[ slot ] = hash
+                
+            else:
+                
+                self._free_slots.append( slot )
+                
+            
+        
+        # we pop off the end, so reverse to fill from the front
+        self._free_slots.reverse()
+        
+    
+    def _InvalidateSlot( self, slot ):
+        
+        ( slab, offset ) = self._GetSlabAndOffset( slot )
+        
+        slab[ offset : offset + self.HEADER_SIZE ] = bytes( self.HEADER_SIZE )
+        
+        hash = self._slots_to_hashes.pop( slot, None )
+        
+        if hash is not None:
+            
+            del self._hashes_to_slots[ hash ]
+            
+        
+    
+    def _GetWriteSlot( self ):
+        
+        if len( self._free_slots ) > 0:
+            
+            return self._free_slots.pop()
+            
+        
+        # full, so a clock hand goes round the slots in slot order and overwrites whatever it is pointing at
+        # slots freed by invalidation get reused out of turn, so this is only roughly the oldest write
+        
+        slot = self._clock_hand
+        
+        self._clock_hand = ( self._clock_hand + 1 ) % self._num_slots
+        
+        self._InvalidateSlot( slot )
+        
+        return slot
+        
+    
+    def AddNumPyImage( self, hash, numpy_image ):
+        
+        ( height, width, depth ) = numpy_image.shape
+        
+        data = numpy_image.tobytes()
+        
+        with self._lock:
+            
+            if len( data ) > self._slot_size - self.HEADER_SIZE or max( width, height ) > 65535:
+                
+                return
+                
+            
+            if hash in self._hashes_to_slots:
+                
+                slot = self._hashes_to_slots[ hash ]
+                
+                self._InvalidateSlot( slot )
+                
+            else:
+                
+                slot = self._GetWriteSlot()
+                
+            
+            
+            ( slab, offset ) = self._GetSlabAndOffset( slot )
+            
+            pixel_offset = offset + self.HEADER_SIZE
+            
+            slab[ pixel_offset : pixel_offset + len( data ) ] = data
+            
+            # header last, so a half-written slot is never seen as valid
+            self.HEADER_STRUCT.pack_into( slab, offset, hash, width, height, depth, 1 )
+            
+            self._hashes_to_slots[ hash ] = slot
+            self._slots_to_hashes[ slot ] = hash
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            self._CloseSlabs()
+            
+        
+    
+    def DeleteThumbnails( self, hashes ):
+        
+        with self._lock:
+            
+            for hash in hashes:
+                
+                if hash in self._hashes_to_slots:
+                    
+                    slot = self._hashes_to_slots[ hash ]
+                    
+                    self._InvalidateSlot( slot )
+                    
+                    self._free_slots.append( slot )
+                    
+                
+            
+        
+    
+    def GetHydrusBitmap( self, hash ):
+        
+        with self._lock:
+            
+            if hash not in self._hashes_to_slots:
+                
+                return None
+                
+            
+            slot = self._hashes_to_slots[ hash ]
+            
+            ( slab, offset ) = self._GetSlabAndOffset( slot )
+            
+            ( slot_hash, width, height, depth, valid ) = self.HEADER_STRUCT.unpack_from( slab, offset )
+            
+            if slot_hash != hash or valid != 1:
+                
+                self._InvalidateSlot( slot )
+                
+                self._free_slots.append( slot )
+                
+                return None
+                
+            
+            pixel_offset = offset + self.HEADER_SIZE
+            
+            data = slab[ pixel_offset : pixel_offset + width * height * depth ]
+            
+        
+        return ClientRendering.HydrusBitmap( data, ( width, height ), depth )
         
     
-    def HasImageRenderer( self, hash ):
-        
-        key = hash
+    def SetBoundingDimensions( self, bounding_dimensions ):
         
-        return self._data_cache.HasData( key )
+        with self._lock:
+            
+            if tuple( bounding_dimensions ) != self._bounding_dimensions:
+                
+                self._InitialiseSlabs( bounding_dimensions )
+                
+            
         
     
 class ThumbnailCache( object ):
@@ -489,8 +994,9 @@ class ThumbnailCache( object ):
         
         cache_size = self._controller.options[ 'thumbnail_cache_size' ]
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
+        scan_resistant = self._controller.new_options.GetBoolean( 'scan_resistant_media_caches' )
         
-        self._data_cache = DataCache( self._controller, cache_size, timeout = cache_timeout )
+        self._data_cache = DataCache( self._controller, 'thumbnail cache', cache_size, timeout = cache_timeout, scan_resistant = scan_resistant )
         
         self._magic_mime_thumbnail_ease_score_lookup = {}
         
@@ -509,17 +1015,98 @@ class ThumbnailCache( object ):
         self._delayed_regeneration_queue = []
         
         self._waterfall_event = threading.Event()
+        self._waterfall_workers_event = threading.Event()
         
         self._special_thumbs = {}
         
+        self._decoded_thumbnail_slab_cache = None
+        
         self.Clear()
         
+        decoded_thumbnail_disk_cache_mb = self._controller.new_options.GetNoneableInteger( 'decoded_thumbnail_disk_cache_mb' )
+        
+        if decoded_thumbnail_disk_cache_mb is not None:
+            
+            try:
+                
+                self._decoded_thumbnail_slab_cache = DecodedThumbnailSlabCache( self._controller, decoded_thumbnail_disk_cache_mb * 1048576 )
+                
+            except Exception as e:
+                
+                HydrusData.Print( 'Could not start the decoded thumbnail disk cache:' )
+                
+                HydrusData.PrintException( e )
+                
+            
+        
         self._controller.CallToThreadLongRunning( self.MainLoop )
         
+        # the main loop is one waterfall worker, these are the rest
+        num_waterfall_workers = self._controller.new_options.GetInteger( 'thumbnail_waterfall_workers' )
+        
+        for i in range( num_waterfall_workers - 1 ):
+            
+            self._controller.CallToThreadLongRunning( self.WaterfallWorkerLoop )
+            
+        
         self._controller.sub( self, 'Clear', 'reset_thumbnail_cache' )
         self._controller.sub( self, 'ClearThumbnails', 'clear_thumbnails' )
         
     
+    def _DoWaterfallWork( self ):
+        
+        # pops the next few items off the sorted waterfall queue and renders them. several threads can run this at once
+        
+        start_time = HydrusData.GetNowPrecise()
+        stop_time = start_time + 0.005 # a bit of a typical frame
+        
+        page_keys_to_rendered_medias = collections.defaultdict( list )
+        
+        num_done = 0
+        max_at_once = 16
+        
+        while not HydrusData.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
+            
+            with self._lock:
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    break
+                    
+                
+                result = self._waterfall_queue.pop()
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    self._waterfall_queue_empty_event.set()
+                    
+                
+                self._waterfall_queue_quick.discard( result )
+                
+            
+            ( page_key, media ) = result
+            
+            if media.GetDisplayMedia() is not None:
+                
+                self.GetThumbnail( media )
+                
+                page_keys_to_rendered_medias[ page_key ].append( media )
+                
+            
+            num_done += 1
+            
+        
+        if len( page_keys_to_rendered_medias ) > 0:
+            
+            for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
+                
+                self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
+                
+            
+            time.sleep( 0.00001 )
+            
+        
+    
     def _GetThumbnailHydrusBitmap( self, display_media ):
         
         bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
@@ -708,6 +1295,11 @@ class ThumbnailCache( object ):
                 
             
         
+        if self._decoded_thumbnail_slab_cache is not None:
+            
+            self._decoded_thumbnail_slab_cache.AddNumPyImage( hash, numpy_image )
+            
+        
         hydrus_bitmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
         
         return hydrus_bitmap
@@ -838,6 +1430,106 @@ class ThumbnailCache( object ):
         self._delayed_regeneration_queue.sort( key = sort_regen, reverse = True )
         
     
+    def BenchmarkThumbnailDecoding( self, medias, nums_workers ):
+        
+        # copies the given thumbnails to a temp dir and decodes those copies with each number of threads, so no cache, queue, or real thumbnail file is touched
+        # returns ( num_workers, thumbnails per second ) for each run
+        
+        display_medias = [ media.GetDisplayMedia() for media in medias ]
+        
+        display_medias = [ display_media for display_media in display_medias if display_media is not None and display_media.GetMime() in HC.MIMES_WITH_THUMBNAILS and display_media.GetLocationsManager().ShouldIdeallyHaveThumbnail() ]
+        
+        temp_dir = HydrusPaths.GetTempDir()
+        
+        try:
+            
+            paths_and_mimes = []
+            
+            for display_media in display_medias:
+                
+                hash = display_media.GetHash()
+                
+                if not self._controller.client_files_manager.LocklessHasThumbnail( hash ):
+                    
+                    continue
+                    
+                
+                source_path = self._controller.client_files_manager.GetThumbnailPath( display_media )
+                
+                path = os.path.join( temp_dir, hash.hex() + '.thumbnail' )
+                
+                HydrusPaths.MirrorFile( source_path, path )
+                
+                paths_and_mimes.append( ( path, display_media.GetMime() ) )
+                
+            
+            def do_run( num_workers ):
+                
+                queue = list( paths_and_mimes )
+                queue_lock = threading.Lock()
+                
+                def work():
+                    
+                    while True:
+                        
+                        with queue_lock:
+                            
+                            if len( queue ) == 0:
+                                
+                                return
+                                
+                            
+                            ( path, mime ) = queue.pop()
+                            
+                        
+                        try:
+                            
+                            numpy_image = ClientImageHandling.GenerateNumPyImage( path, mime )
+                            
+                            ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
+                            
+                        except:
+                            
+                            pass
+                            
+                        
+                    
+                
+                threads = [ threading.Thread( target = work ) for i in range( num_workers ) ]
+                
+                start_time = HydrusData.GetNowPrecise()
+                
+                for thread in threads:
+                    
+                    thread.start()
+                    
+                
+                for thread in threads:
+                    
+                    thread.join()
+                    
+                
+                time_taken = max( HydrusData.GetNowPrecise() - start_time, 0.000001 )
+                
+                return len( paths_and_mimes ) / time_taken
+                
+            
+            if len( paths_and_mimes ) == 0:
+                
+                return [ ( num_workers, 0.0 ) for num_workers in nums_workers ]
+                
+            
+            # one throwaway run so the OS disk cache is warm for all the timed ones
+            do_run( max( nums_workers ) )
+            
+            return [ ( num_workers, do_run( num_workers ) ) for num_workers in nums_workers ]
+            
+        finally:
+            
+            HydrusPaths.DeletePath( temp_dir )
+            
+        
+    
     def CancelWaterfall( self, page_key: bytes, medias: list ):
         
         with self._lock:
@@ -875,6 +1567,12 @@ class ThumbnailCache( object ):
             
             bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
             
+            # this is called on every options save, so the slabs only get wiped if the thumbnail dimensions actually changed
+            if self._decoded_thumbnail_slab_cache is not None:
+                
+                self._decoded_thumbnail_slab_cache.SetBoundingDimensions( bounding_dimensions )
+                
+            
             for name in names:
                 
                 path = os.path.join( HC.STATIC_DIR, name + '.png' )
@@ -910,6 +1608,11 @@ class ThumbnailCache( object ):
                 self._data_cache.DeleteData( hash )
                 
             
+            if self._decoded_thumbnail_slab_cache is not None:
+                
+                self._decoded_thumbnail_slab_cache.DeleteThumbnails( hashes )
+                
+            
         
     
     def WaitUntilFree( self ):
@@ -954,6 +1657,16 @@ class ThumbnailCache( object ):
                 
                 result = self._data_cache.GetIfHasData( hash )
                 
+                if result is None and self._decoded_thumbnail_slab_cache is not None:
+                    
+                    result = self._decoded_thumbnail_slab_cache.GetHydrusBitmap( hash )
+                    
+                    if result is not None:
+                        
+                        self._data_cache.AddData( hash, result )
+                        
+                    
+                
                 if result is None:
                     
                     try:
@@ -987,6 +1700,11 @@ class ThumbnailCache( object ):
             
         
     
+    def GetStatistics( self ):
+        
+        return self._data_cache.GetStatistics()
+        
+    
     def HasThumbnailCached( self, media ):
         
         display_media = media.GetDisplayMedia()
@@ -1020,6 +1738,32 @@ class ThumbnailCache( object ):
             
         
         self._waterfall_event.set()
+        self._waterfall_workers_event.set()
+        
+    
+    def WaterfallWorkerLoop( self ):
+        
+        while not HydrusThreading.IsThreadShuttingDown():
+            
+            with self._lock:
+                
+                do_wait = len( self._waterfall_queue ) == 0
+                
+                if do_wait:
+                    
+                    self._waterfall_workers_event.clear()
+                    
+                
+            
+            if do_wait:
+                
+                self._waterfall_workers_event.wait( 1 )
+                
+                continue
+                
+            
+            self._DoWaterfallWork()
+            
         
     
     def MainLoop( self ):
@@ -1044,54 +1788,7 @@ class ThumbnailCache( object ):
                 last_paused = HydrusData.GetNowPrecise()
                 
             
-            start_time = HydrusData.GetNowPrecise()
-            stop_time = start_time + 0.005 # a bit of a typical frame
-            
-            page_keys_to_rendered_medias = collections.defaultdict( list )
-            
-            num_done = 0
-            max_at_once = 16
-            
-            while not HydrusData.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
-                
-                with self._lock:
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        break
-                        
-                    
-                    result = self._waterfall_queue.pop()
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        self._waterfall_queue_empty_event.set()
-                        
-                    
-                    self._waterfall_queue_quick.discard( result )
-                    
-                
-                ( page_key, media ) = result
-                
-                if media.GetDisplayMedia() is not None:
-                    
-                    self.GetThumbnail( media )
-                    
-                    page_keys_to_rendered_medias[ page_key ].append( media )
-                    
-                
-                num_done += 1
-                
-            
-            if len( page_keys_to_rendered_medias ) > 0:
-                
-                for ( page_key, rendered_medias ) in page_keys_to_rendered_medias.items():
-                    
-                    self._controller.pub( 'waterfall_thumbnails', page_key, rendered_medias )
-                    
-                
-                time.sleep( 0.00001 )
-                
+            self._DoWaterfallWork()
             
             # now we will do regen if appropriate
             
@@ -1134,3 +1831,118 @@ class ThumbnailCache( object ):
             
         
     
+class VideoFrameCache( object ):
+    
+    # decoded video frames shared between video containers, so scrubbing back to somewhere we recently were, or reopening a vid, does not need ffmpeg again
+    # it also remembers each vid's keyframe timestamps, so renderers can tell when launching a new ffmpeg to seek is cheaper than decoding on through the pipe
+    
+    MAX_KEYFRAME_INDICES = 256
+    
+    def __init__( self, controller ):
+        
+        self._controller = controller
+        
+        cache_size = self._controller.new_options.GetInteger( 'video_frame_cache_mb' ) * 1048576
+        cache_timeout = self._controller.new_options.GetInteger( 'image_cache_timeout' )
+        
+        self._data_cache = DataCache( self._controller, 'video frame cache', cache_size, timeout = cache_timeout )
+        
+        self._enabled = cache_size > 0
+        
+        self._lock = threading.Lock()
+        
+        self._hashes_to_keyframe_timestamps = collections.OrderedDict()
+        self._hashes_being_indexed = set()
+        
+    
+    def _GenerateKeyframeTimestamps( self, hash, path ):
+        
+        try:
+            
+            keyframe_timestamps = HydrusVideoHandling.GetKeyframeTimestamps( path )
+            
+        except HydrusExceptions.ShutdownException:
+            
+            keyframe_timestamps = []
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not generate a keyframe index for the video at {}:'.format( path ) )
+            
+            HydrusData.PrintException( e, do_wait = False )
+            
+            keyframe_timestamps = []
+            
+        
+        with self._lock:
+            
+            self._hashes_being_indexed.discard( hash )
+            
+            self._hashes_to_keyframe_timestamps[ hash ] = keyframe_timestamps
+            
+            while len( self._hashes_to_keyframe_timestamps ) > self.MAX_KEYFRAME_INDICES:
+                
+                self._hashes_to_keyframe_timestamps.popitem( last = False )
+                
+            
+        
+    
+    def AddFrame( self, hash, target_resolution, index, frame ):
+        
+        if not self._enabled:
+            
+            return
+            
+        
+        self._data_cache.AddData( ( hash, target_resolution, index ), frame )
+        
+    
+    def Clear( self ):
+        
+        self._data_cache.Clear()
+        
+        with self._lock:
+            
+            self._hashes_to_keyframe_timestamps = collections.OrderedDict()
+            
+        
+    
+    def GetFrame( self, hash, target_resolution, index ):
+        
+        if not self._enabled:
+            
+            return None
+            
+        
+        return self._data_cache.GetIfHasData( ( hash, target_resolution, index ) )
+        
+    
+    def GetKeyframeTimestamps( self, hash, path ):
+        
+        # None means we do not know yet. the first ask kicks off a background scan of the file
+        
+        with self._lock:
+            
+            if hash in self._hashes_to_keyframe_timestamps:
+                
+                self._hashes_to_keyframe_timestamps.move_to_end( hash )
+                
+                return self._hashes_to_keyframe_timestamps[ hash ]
+                
+            
+            if hash not in self._hashes_being_indexed:
+                
+                self._hashes_being_indexed.add( hash )
+                
+                self._controller.CallToThread( self._GenerateKeyframeTimestamps, hash, path )
+                
+            
+        
+        return None
+        
+    
+    def GetStatistics( self ):
+        
+        return self._data_cache.GetStatistics()
+        
+    
@@ -968,6 +968,7 @@ class Controller( HydrusController.HydrusController ):
             
             self._caches[ 'images' ] = ClientCaches.RenderedImageCache( self )
             self._caches[ 'thumbnail' ] = ClientCaches.ThumbnailCache( self )
+            self._caches[ 'video_frames' ] = ClientCaches.VideoFrameCache( self )
             
             self.bitmap_manager = ClientManagers.BitmapManager( self )
             
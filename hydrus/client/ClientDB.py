@@ -3,6 +3,7 @@ import gc
 import hashlib
 import itertools    
 import json
+import numpy
 import os
 import psutil
 import random
@@ -19,12 +20,15 @@ from qtpy import QtWidgets as QW
 from hydrus.client import ClientAPI
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientData
+from hydrus.client import ClientDBIdCache
+from hydrus.client import ClientDBTagBitmaps
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientFiles
 from hydrus.client import ClientOptions
 from hydrus.client import ClientRatings
 from hydrus.client import ClientSearch
 from hydrus.client import ClientServices
+from hydrus.client import ClientSimilarFiles
 from hydrus.client import ClientTags
 from hydrus.client import ClientThreading
 from hydrus.client.gui import QtPorting as QP
@@ -300,12 +304,21 @@ class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
     
+    READ_POOL_SIZE = 2
+    
+    HASH_ID_CACHE_SIZE = 64 * 1048576
+    TAG_ID_CACHE_SIZE = 32 * 1048576
+    TAG_BITMAP_INDEX_SIZE = 256 * 1048576
+    
     def __init__( self, controller, db_dir, db_name ):
         
         self._initial_messages = []
         
         self._have_printed_a_cannot_vacuum_message = False
         
+        # commits tell this about themselves, and the first ones happen before the caches are set up
+        self._tag_bitmap_index = ClientDBTagBitmaps.TagBitmapIndex( 'tag bitmap index', self.TAG_BITMAP_INDEX_SIZE )
+        
         HydrusDB.HydrusDB.__init__( self, controller, db_dir, db_name )
         
     
@@ -340,6 +353,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'INSERT OR IGNORE INTO current_files VALUES ( ?, ?, ? );', ( ( service_id, hash_id, timestamp ) for ( hash_id, timestamp ) in valid_rows ) )
             
+            self._tag_bitmap_index.AddIds( ( HC.CONTENT_TYPE_FILES, service_id ), valid_hash_ids )
+            
             self._c.executemany( 'DELETE FROM file_transfers WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in valid_hash_ids ) )
             
             info = list( self._ExecuteManySelectSingleParam( 'SELECT hash_id, size, mime FROM files_info WHERE hash_id = ?;', valid_hash_ids ) )
@@ -838,9 +853,9 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheLocalTagIdsPotentialAdd( self, tag_ids ):
         
-        self._PopulateTagIdsToTagsCache( tag_ids )
+        tag_ids_to_tags = self._GetTagIdsToTags( tag_ids )
         
-        self._c.executemany( 'INSERT OR IGNORE INTO local_tags_cache ( tag_id, tag ) VALUES ( ?, ? );', ( ( tag_id, self._tag_ids_to_tags_cache[ tag_id ] ) for tag_id in tag_ids ) )
+        self._c.executemany( 'INSERT OR IGNORE INTO local_tags_cache ( tag_id, tag ) VALUES ( ?, ? );', tag_ids_to_tags.items() )
         
     
     def _CacheLocalTagIdsPotentialDelete( self, tag_ids ):
@@ -857,52 +872,44 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'DELETE FROM local_tags_cache WHERE tag_id = ?;', ( ( tag_id, ) for tag_id in bad_tag_ids ) )
         
     
-    def _CacheRepositoryNormaliseServiceHashId( self, service_id, service_hash_id ):
+    def _CacheRepositoryNormaliseServiceHashIdsToHashIds( self, service_id, service_hash_ids ):
         
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterCacheTableNames( service_id )
         
-        result = self._c.execute( 'SELECT hash_id FROM ' + hash_id_map_table_name + ' WHERE service_hash_id = ?;', ( service_hash_id, ) ).fetchone()
+        service_hash_ids = set( service_hash_ids )
         
-        if result is None:
+        with HydrusDB.TemporaryIntegerTable( self._c, service_hash_ids, 'service_hash_id' ) as temp_table_name:
             
-            self._HandleCriticalRepositoryDefinitionError( service_id )
+            # temp table first, so we do one primary key lookup on the map per row
+            
+            service_hash_ids_to_hash_ids = dict( self._c.execute( 'SELECT service_hash_id, hash_id FROM {} CROSS JOIN {} USING ( service_hash_id );'.format( temp_table_name, hash_id_map_table_name ) ) )
             
         
-        ( hash_id, ) = result
-        
-        return hash_id
-        
-    
-    def _CacheRepositoryNormaliseServiceHashIds( self, service_id, service_hash_ids ):
-        
-        ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterCacheTableNames( service_id )
-        
-        select_statement = 'SELECT hash_id FROM ' + hash_id_map_table_name + ' WHERE service_hash_id = ?;'
-        
-        hash_ids = self._STL( self._ExecuteManySelectSingleParam( select_statement, service_hash_ids ) )
-        
-        if len( hash_ids ) != len( service_hash_ids ):
+        if len( service_hash_ids_to_hash_ids ) != len( service_hash_ids ):
             
             self._HandleCriticalRepositoryDefinitionError( service_id )
             
         
-        return hash_ids
+        return service_hash_ids_to_hash_ids
         
     
-    def _CacheRepositoryNormaliseServiceTagId( self, service_id, service_tag_id ):
+    def _CacheRepositoryNormaliseServiceTagIdsToTagIds( self, service_id, service_tag_ids ):
         
         ( hash_id_map_table_name, tag_id_map_table_name ) = GenerateRepositoryMasterCacheTableNames( service_id )
         
-        result = self._c.execute( 'SELECT tag_id FROM ' + tag_id_map_table_name + ' WHERE service_tag_id = ?;', ( service_tag_id, ) ).fetchone()
+        service_tag_ids = set( service_tag_ids )
         
-        if result is None:
+        with HydrusDB.TemporaryIntegerTable( self._c, service_tag_ids, 'service_tag_id' ) as temp_table_name:
             
-            self._HandleCriticalRepositoryDefinitionError( service_id )
+            service_tag_ids_to_tag_ids = dict( self._c.execute( 'SELECT service_tag_id, tag_id FROM {} CROSS JOIN {} USING ( service_tag_id );'.format( temp_table_name, tag_id_map_table_name ) ) )
             
         
-        ( tag_id, ) = result
+        if len( service_tag_ids_to_tag_ids ) != len( service_tag_ids ):
+            
+            self._HandleCriticalRepositoryDefinitionError( service_id )
+            
         
-        return tag_id
+        return service_tag_ids_to_tag_ids
         
     
     def _CacheRepositoryDrop( self, service_id ):
@@ -1634,6 +1641,13 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _Commit( self ):
+        
+        HydrusDB.HydrusDB._Commit( self )
+        
+        self._tag_bitmap_index.NotifyCommitted()
+        
+    
     def _CreateDB( self ):
         
         client_files_default = os.path.join( self._db_dir, 'client_files' )
@@ -2015,6 +2029,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.executemany( 'DELETE FROM current_files WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in existing_hash_ids ) )
             
+            self._tag_bitmap_index.DeleteIds( ( HC.CONTENT_TYPE_FILES, service_id ), existing_hash_ids )
+            
             self._c.executemany( 'DELETE FROM file_petitions WHERE service_id = ? AND hash_id = ?;', ( ( service_id, hash_id ) for hash_id in existing_hash_ids ) )
             
             info = list( self._ExecuteManySelectSingleParam( 'SELECT size, mime FROM files_info WHERE hash_id = ?;', existing_hash_ids ) )
@@ -2199,6 +2215,8 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.execute( 'DELETE FROM remote_thumbnails WHERE service_id = ?;', ( service_id, ) )
         
+        self._tag_bitmap_index.Clear()
+        
         if service_type in HC.REPOSITORIES:
             
             repository_updates_table_name = GenerateRepositoryRepositoryUpdatesTableName( service_id )
@@ -3459,9 +3477,9 @@ class DB( HydrusDB.HydrusDB ):
         
         batch_of_pairs_of_hash_ids = [ ( media_ids_to_best_king_ids[ smaller_media_id ], media_ids_to_best_king_ids[ larger_media_id ] ) for ( smaller_media_id, larger_media_id ) in batch_of_pairs_of_media_ids if smaller_media_id in media_ids_to_best_king_ids and larger_media_id in media_ids_to_best_king_ids ]
         
-        self._PopulateHashIdsToHashesCache( seen_hash_ids )
+        hash_ids_to_hashes = self._GetHashIdsToHashesCached( seen_hash_ids )
         
-        batch_of_pairs_of_hashes = [ ( self._hash_ids_to_hashes_cache[ hash_id_a ], self._hash_ids_to_hashes_cache[ hash_id_b ] ) for ( hash_id_a, hash_id_b ) in batch_of_pairs_of_hash_ids ]
+        batch_of_pairs_of_hashes = [ ( hash_ids_to_hashes[ hash_id_a ], hash_ids_to_hashes[ hash_id_b ] ) for ( hash_id_a, hash_id_b ) in batch_of_pairs_of_hash_ids ]
         
         return batch_of_pairs_of_hashes
         
@@ -4600,9 +4618,9 @@ class DB( HydrusDB.HydrusDB ):
                 
                 #
                 
-                self._PopulateTagIdsToTagsCache( list( ids_to_count.keys() ) )
+                tag_ids_to_tags = self._GetTagIdsToTags( list( ids_to_count.keys() ) )
                 
-                tags_and_counts_generator = ( ( self._tag_ids_to_tags_cache[ id ], ids_to_count[ id ] ) for id in ids_to_count.keys() )
+                tags_and_counts_generator = ( ( tag_ids_to_tags[ id ], ids_to_count[ id ] ) for id in ids_to_count.keys() )
                 
                 predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, tag, inclusive, min_current_count = min_current_count, min_pending_count = min_pending_count, max_current_count = max_current_count, max_pending_count = max_pending_count ) for ( tag, ( min_current_count, max_current_count, min_pending_count, max_pending_count ) ) in tags_and_counts_generator ]
                 
@@ -4792,6 +4810,29 @@ class DB( HydrusDB.HydrusDB ):
         return result
         
     
+    def _GetFileCountEstimate( self, service_id ):
+        
+        # cheap guess at how many files a service covers, for the search planner. we don't want to do a COUNT( * ) here, so fall back to the size of the whole hash table
+        
+        result = self._c.execute( 'SELECT info FROM service_info WHERE service_id = ? AND info_type = ?;', ( service_id, HC.SERVICE_INFO_NUM_FILES ) ).fetchone()
+        
+        if result is None:
+            
+            ( num_files, ) = self._c.execute( 'SELECT MAX( hash_id ) FROM hashes;' ).fetchone()
+            
+        else:
+            
+            ( num_files, ) = result
+            
+        
+        if num_files is None:
+            
+            num_files = 0
+            
+        
+        return num_files
+        
+    
     def _GetFileHashes( self, given_hashes, given_hash_type, desired_hash_type ):
         
         if given_hash_type == 'sha256':
@@ -4957,95 +4998,55 @@ class DB( HydrusDB.HydrusDB ):
         return predicates
         
     
-    def _GetForceRefreshTagsManagers( self, hash_ids, hash_ids_to_current_file_service_ids = None ):
-        
-        if hash_ids_to_current_file_service_ids is None:
-            
-            hash_ids_to_current_file_service_ids = HydrusData.BuildKeyToListDict( self._ExecuteManySelectSingleParam( 'SELECT hash_id, service_id FROM current_files WHERE hash_id = ?;', hash_ids ) )
-            
+    def _GetFilesBitmap( self, file_service_id ):
         
-        # Let's figure out if there is a common specific file service to this batch
+        key = ( HC.CONTENT_TYPE_FILES, file_service_id )
         
-        file_service_id_counter = collections.Counter()
+        bitmap = self._tag_bitmap_index.GetBitmap( key )
         
-        for file_service_ids in hash_ids_to_current_file_service_ids.values():
-            
-            for file_service_id in file_service_ids:
-                
-                file_service_id_counter[ file_service_id ] += 1
-                
+        if bitmap is None:
             
-        
-        common_file_service_id = None
-        
-        for ( file_service_id, count ) in file_service_id_counter.items():
+            bitmap = ClientDBTagBitmaps.BitMap( self._STI( self._c.execute( 'SELECT hash_id FROM current_files WHERE service_id = ?;', ( file_service_id, ) ) ) )
             
-            if count == len( hash_ids ): # i.e. every hash has this file service
-                
-                ( file_service_type, ) = self._c.execute( 'SELECT service_type FROM services WHERE service_id = ?;', ( file_service_id, ) ).fetchone()
-                
-                if file_service_type in HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES:
-                    
-                    common_file_service_id = file_service_id
-                    
-                    break
-                    
-                
+            self._SetTagBitmap( key, bitmap )
             
         
-        #
-        
-        tag_data = []
+        return bitmap
         
-        tag_service_ids = self._GetServiceIds( HC.REAL_TAG_SERVICES )
+    
+    def _GetForceRefreshTagsManagers( self, hash_ids, hash_ids_to_current_file_service_ids = None ):
         
-        for tag_service_id in tag_service_ids:
+        with HydrusDB.TemporaryIntegerTable( self._c, hash_ids, 'hash_id' ) as temp_table_name:
             
-            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
+            self._AnalyzeTempTable( temp_table_name )
             
-            if common_file_service_id is None:
+            if hash_ids_to_current_file_service_ids is None:
                 
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + current_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_DELETED, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + deleted_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + pending_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
+                file_service_ids_to_counts = collections.Counter( self._STI( self._c.execute( 'SELECT service_id FROM current_files NATURAL JOIN {};'.format( temp_table_name ) ) ) )
                 
             else:
                 
-                ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name ) = GenerateSpecificMappingsCacheTableNames( common_file_service_id, tag_service_id )
-                
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + cache_current_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_DELETED, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + cache_deleted_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
-                tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + cache_pending_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
+                file_service_ids_to_counts = collections.Counter( ( file_service_id for file_service_ids in hash_ids_to_current_file_service_ids.values() for file_service_id in file_service_ids ) )
                 
             
-            tag_data.extend( ( hash_id, ( tag_service_id, HC.CONTENT_STATUS_PETITIONED, tag_id ) ) for ( hash_id, tag_id ) in self._ExecuteManySelectSingleParam( 'SELECT hash_id, tag_id FROM ' + petitioned_mappings_table_name + ' WHERE hash_id = ?;', hash_ids ) )
+            tag_rows = self._GetRawTagRows( temp_table_name, len( hash_ids ), file_service_ids_to_counts )
             
         
-        seen_tag_ids = { tag_id for ( hash_id, ( tag_service_id, status, tag_id ) ) in tag_data }
+        tag_ids_to_tags = self._GetTagIdsToTags( { tag_id for ( hash_id, tag_service_id, status, tag_id ) in tag_rows } )
         
-        hash_ids_to_raw_tag_data = HydrusData.BuildKeyToListDict( tag_data )
+        service_ids_to_service_keys = { service_id : service_key for ( service_id, service_key ) in self._c.execute( 'SELECT service_id, service_key FROM services;' ) }
         
-        self._PopulateTagIdsToTagsCache( seen_tag_ids )
+        tag_display_lookup = self._GetTagDisplayLookup( tag_rows, tag_ids_to_tags, service_ids_to_service_keys )
         
-        service_ids_to_service_keys = { service_id : service_key for ( service_id, service_key ) in self._c.execute( 'SELECT service_id, service_key FROM services;' ) }
+        hash_ids_to_offsets = ClientMediaResult.IndexRowsByHashId( tag_rows )
         
         hash_ids_to_tag_managers = {}
         
         for hash_id in hash_ids:
             
-            # service_id, status, tag_id
-            raw_tag_data = hash_ids_to_raw_tag_data[ hash_id ]
-            
-            # service_id -> ( status, tag )
-            service_ids_to_tag_data = HydrusData.BuildKeyToListDict( ( ( tag_service_id, ( status, self._tag_ids_to_tags_cache[ tag_id ] ) ) for ( tag_service_id, status, tag_id ) in raw_tag_data ) )
+            ( start, end ) = hash_ids_to_offsets.get( hash_id, ( 0, 0 ) )
             
-            service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
-            
-            service_keys_to_statuses_to_tags.update( { service_ids_to_service_keys[ service_id ] : HydrusData.BuildKeyToSetDict( tag_data ) for ( service_id, tag_data ) in list(service_ids_to_tag_data.items()) } )
-            
-            tags_manager = ClientMediaManagers.TagsManager( service_keys_to_statuses_to_tags )
-            
-            hash_ids_to_tag_managers[ hash_id ] = tags_manager
+            hash_ids_to_tag_managers[ hash_id ] = ClientMediaResult.GenerateTagsManager( service_ids_to_service_keys, tag_ids_to_tags, tag_rows[ start : end ], tag_display_lookup = tag_display_lookup )
             
         
         return hash_ids_to_tag_managers
@@ -5053,20 +5054,32 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetHash( self, hash_id ):
         
-        self._PopulateHashIdsToHashesCache( ( hash_id, ) )
+        hash = self._hash_ids_to_hashes_cache.GetValue( hash_id )
+        
+        if hash is None:
+            
+            hash = self._GetHashIdsToHashesCached( ( hash_id, ) )[ hash_id ]
+            
         
-        return self._hash_ids_to_hashes_cache[ hash_id ]
+        return hash
         
     
     def _GetHashes( self, hash_ids ):
         
-        self._PopulateHashIdsToHashesCache( hash_ids )
+        hash_ids_to_hashes = self._GetHashIdsToHashesCached( hash_ids )
         
-        return [ self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids ]
+        return [ hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids ]
         
     
     def _GetHashId( self, hash ):
         
+        hash_id = self._hash_ids_to_hashes_cache.GetId( hash )
+        
+        if hash_id is not None:
+            
+            return hash_id
+            
+        
         result = self._c.execute( 'SELECT hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
         
         if result is None:
@@ -5080,20 +5093,21 @@ class DB( HydrusDB.HydrusDB ):
             ( hash_id, ) = result
             
         
+        self._hash_ids_to_hashes_cache.AddPairs( ( ( hash_id, hash ), ) )
+        
         return hash_id
         
     
     def _GetHashIds( self, hashes ):
         
-        hash_ids = set()
+        ( hashes_to_hash_ids, uncached_hashes ) = self._hash_ids_to_hashes_cache.GetValuesToIds( ( hash for hash in hashes if hash is not None ) )
+        
+        hash_ids = set( hashes_to_hash_ids.values() )
         hashes_not_in_db = set()
         
-        for hash in hashes:
-            
-            if hash is None:
-                
-                continue
-                
+        new_hash_ids_and_hashes = []
+        
+        for hash in uncached_hashes:
             
             result = self._c.execute( 'SELECT hash_id FROM hashes WHERE hash = ?;', ( sqlite3.Binary( hash ), ) ).fetchone()
             
@@ -5107,6 +5121,8 @@ class DB( HydrusDB.HydrusDB ):
                 
                 hash_ids.add( hash_id )
                 
+                new_hash_ids_and_hashes.append( ( hash_id, hash ) )
+                
             
         
         if len( hashes_not_in_db ) > 0:
@@ -5119,12 +5135,58 @@ class DB( HydrusDB.HydrusDB ):
                 
                 hash_ids.add( hash_id )
                 
+                new_hash_ids_and_hashes.append( ( hash_id, hash ) )
+                
             
         
+        self._hash_ids_to_hashes_cache.AddPairs( new_hash_ids_and_hashes )
+        
         return hash_ids
         
     
-    def _GetHashIdsFromFileViewingStatistics( self, view_type, viewing_locations, operator, viewing_value ):
+    def _GetHashIdsBitmapFromTag( self, file_service_key, tag_service_key, search_tag, include_current_tags, include_pending_tags ):
+        
+        # the same as _GetHashIdsFromTag, but done with the compressed bitmap index, which is much faster for popular tags
+        # the specific mappings caches are the raw mappings limited to the file domain, so that is what we do here
+        
+        tag_ids = self._GetTagIdsFromSearchTag( tag_service_key, search_tag )
+        
+        file_service_id = self._GetServiceId( file_service_key )
+        
+        if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            search_tag_service_ids = self._GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            search_tag_service_ids = [ self._GetServiceId( tag_service_key ) ]
+            
+        
+        statuses = []
+        
+        if include_current_tags:
+            
+            statuses.append( HC.CONTENT_STATUS_CURRENT )
+            
+        
+        if include_pending_tags:
+            
+            statuses.append( HC.CONTENT_STATUS_PENDING )
+            
+        
+        bitmaps = [ self._GetMappingsBitmap( search_tag_service_id, status, tag_id ) for ( search_tag_service_id, status, tag_id ) in itertools.product( search_tag_service_ids, statuses, tag_ids ) ]
+        
+        hash_ids_bitmap = ClientDBTagBitmaps.BitMap.union( ClientDBTagBitmaps.BitMap(), *bitmaps )
+        
+        if file_service_id != self._combined_file_service_id:
+            
+            hash_ids_bitmap = hash_ids_bitmap & self._GetFilesBitmap( file_service_id )
+            
+        
+        return hash_ids_bitmap
+        
+    
+    def _GetHashIdsFromFileViewingStatistics( self, view_type, viewing_locations, operator, viewing_value, hash_ids_table_name = None ):
         
         # only works for positive values like '> 5'. won't work for '= 0' or '< 1' since those are absent from the table
         
@@ -5172,7 +5234,14 @@ class DB( HydrusDB.HydrusDB ):
             test_phrase = content_phrase + operator + str( viewing_value )
             
         
-        select_statement = 'SELECT hash_id FROM file_viewing_stats WHERE ' + test_phrase + ';'
+        table = 'file_viewing_stats'
+        
+        if hash_ids_table_name is not None:
+            
+            table += ' NATURAL JOIN {}'.format( hash_ids_table_name )
+            
+        
+        select_statement = 'SELECT hash_id FROM ' + table + ' WHERE ' + test_phrase + ';'
         
         hash_ids = self._STS( self._c.execute( select_statement ) )
         
@@ -5593,11 +5662,30 @@ class DB( HydrusDB.HydrusDB ):
                 # blue eyes OR green eyes
                 
                 or_query_hash_ids = set()
+                or_query_hash_ids_bitmap = None
                 
                 for or_subpredicate in or_predicate.GetValue():
                     
                     # blue eyes
                     
+                    if ClientDBTagBitmaps.ROARING_OK and or_subpredicate.GetType() == ClientSearch.PREDICATE_TYPE_TAG and or_subpredicate.GetInclusive():
+                        
+                        # a plain tag does not need a whole sub-search, we can OR its bitmap straight in
+                        
+                        tag_hash_ids_bitmap = self._GetHashIdsBitmapFromTag( file_service_key, tag_service_key, or_subpredicate.GetValue(), include_current_tags, include_pending_tags )
+                        
+                        if or_query_hash_ids_bitmap is None:
+                            
+                            or_query_hash_ids_bitmap = tag_hash_ids_bitmap
+                            
+                        else:
+                            
+                            or_query_hash_ids_bitmap = or_query_hash_ids_bitmap | tag_hash_ids_bitmap
+                            
+                        
+                        continue
+                        
+                    
                     or_search_context = file_search_context.Duplicate()
                     
                     or_search_context.SetPredicates( [ or_subpredicate ] )
@@ -5611,6 +5699,16 @@ class DB( HydrusDB.HydrusDB ):
                         
                     
                 
+                if or_query_hash_ids_bitmap is not None:
+                    
+                    if query_hash_ids is not None:
+                        
+                        or_query_hash_ids_bitmap = or_query_hash_ids_bitmap & ClientDBTagBitmaps.BitMap( query_hash_ids )
+                        
+                    
+                    or_query_hash_ids.update( or_query_hash_ids_bitmap )
+                    
+                
                 query_hash_ids = intersection_update_qhi( query_hash_ids, or_query_hash_ids )
                 
             
@@ -5636,28 +5734,21 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
+        # now the positive preds that can populate query_hash_ids
+        # rather than doing these in a fixed order, we estimate how many files each will match and do the most selective first
+        # the rest can then limit themselves to a small temp table of what is left, rather than building huge sets that will mostly be thrown away
+        
+        file_domain_estimate = self._GetFileCountEstimate( file_service_id )
+        
+        query_plan = []
+        
         if 'hash' in simple_preds:
             
-            specific_hash_ids = set()
-            
             ( search_hashes, search_hash_type ) = simple_preds[ 'hash' ]
             
-            if search_hash_type == 'sha256':
-                
-                matching_sha256_hashes = [ search_hash for search_hash in search_hashes if self._HashExists( search_hash ) ]
-                
-            else:
-                
-                matching_sha256_hashes = self._GetFileHashes( search_hashes, search_hash_type, 'sha256' )
-                
-            
-            specific_hash_ids = self._GetHashIds( matching_sha256_hashes )
-            
-            query_hash_ids = intersection_update_qhi( query_hash_ids, specific_hash_ids )
+            query_plan.append( ( len( search_hashes ), 'system:hash', 'hash', ( search_hashes, search_hash_type ) ) )
             
         
-        #
-        
         modified_timestamp_predicates = []
         
         if 'min_modified_timestamp' in simple_preds: modified_timestamp_predicates.append( 'file_modified_timestamp >= ' + str( simple_preds[ 'min_modified_timestamp' ] ) )
@@ -5665,33 +5756,12 @@ class DB( HydrusDB.HydrusDB ):
         
         if len( modified_timestamp_predicates ) > 0:
             
-            pred_string = ' AND '.join( modified_timestamp_predicates )
-            
-            modified_timestamp_hash_ids = self._STS( self._c.execute( 'SELECT hash_id FROM file_modified_timestamps WHERE {};'.format( pred_string ) ) )
-            
-            query_hash_ids = intersection_update_qhi( query_hash_ids, modified_timestamp_hash_ids )
+            query_plan.append( ( file_domain_estimate, 'system:modified time', 'modified_timestamp', ' AND '.join( modified_timestamp_predicates ) ) )
             
         
-        #
-        
         if system_predicates.HasSimilarTo():
             
-            ( similar_to_hashes, max_hamming ) = system_predicates.GetSimilarTo()
-            
-            all_similar_hash_ids = set()
-            
-            for similar_to_hash in similar_to_hashes:
-                
-                hash_id = self._GetHashId( similar_to_hash )
-                
-                similar_hash_ids_and_distances = self._PHashesSearch( hash_id, max_hamming )
-                
-                similar_hash_ids = [ similar_hash_id for ( similar_hash_id, distance ) in similar_hash_ids_and_distances ]
-                
-                all_similar_hash_ids.update( similar_hash_ids )
-                
-            
-            query_hash_ids = intersection_update_qhi( query_hash_ids, all_similar_hash_ids )
+            query_plan.append( ( file_domain_estimate, 'system:similar to', 'similar_to', system_predicates.GetSimilarTo() ) )
             
         
         for ( operator, value, rating_service_key ) in system_predicates.GetRatingsPredicates():
@@ -5703,16 +5773,14 @@ class DB( HydrusDB.HydrusDB ):
                 continue
                 
             
+            service = HG.client_controller.services_manager.GetService( rating_service_key )
+            
             if value == 'rated':
                 
-                rating_hash_ids = self._STI( self._c.execute( 'SELECT hash_id FROM local_ratings WHERE service_id = ?;', ( service_id, ) ) )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, rating_hash_ids )
+                predicate = None
                 
             else:
                 
-                service = HG.client_controller.services_manager.GetService( rating_service_key )
-                
                 if service.GetServiceType() == HC.LOCAL_RATING_LIKE:
                     
                     half_a_star_value = 0.5
@@ -5753,17 +5821,15 @@ class DB( HydrusDB.HydrusDB ):
                     predicate = str( value - half_a_star_value ) + ' < rating AND rating <= ' + str( value + half_a_star_value )
                     
                 
-                rating_hash_ids = self._STI( self._c.execute( 'SELECT hash_id FROM local_ratings WHERE service_id = ? AND ' + predicate + ';', ( service_id, ) ) )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, rating_hash_ids )
-                
+            
+            query_plan.append( ( self._GetFileCountEstimate( service_id ), 'system:rating for ' + service.GetName(), 'rating', ( service_id, predicate ) ) )
             
         
         is_inbox = system_predicates.MustBeInbox()
         
         if is_inbox:
             
-            query_hash_ids = intersection_update_qhi( query_hash_ids, self._inbox_hash_ids, force_create_new_set = True )
+            query_plan.append( ( len( self._inbox_hash_ids ), 'system:inbox', 'inbox', None ) )
             
         
         for ( operator, num_relationships, dupe_type ) in system_predicates.GetDuplicateRelationshipCountPredicates():
@@ -5781,11 +5847,7 @@ class DB( HydrusDB.HydrusDB ):
                 
             else:
                 
-                dupe_hash_ids = self._DuplicatesGetHashIdsFromDuplicateCountPredicate( file_service_key, operator, num_relationships, dupe_type )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, dupe_hash_ids )
-                
-                have_cross_referenced_file_service = True
+                query_plan.append( ( file_domain_estimate, 'system:num duplicate relationships', 'duplicate_count', ( operator, num_relationships, dupe_type ) ) )
                 
             
         
@@ -5804,129 +5866,265 @@ class DB( HydrusDB.HydrusDB ):
                 
             else:
                 
-                viewing_hash_ids = self._GetHashIdsFromFileViewingStatistics( view_type, viewing_locations, operator, viewing_value )
-                
-                query_hash_ids = intersection_update_qhi( query_hash_ids, viewing_hash_ids )
+                query_plan.append( ( file_domain_estimate, 'system:file viewing stats', 'file_viewing_stats', ( view_type, viewing_locations, operator, viewing_value ) ) )
                 
             
         
-        # first tags
+        for tag in tags_to_include:
+            
+            tag_estimate = self._GetHashIdsFromTagEstimate( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags )
+            
+            query_plan.append( ( tag_estimate, tag, 'tag', tag ) )
+            
+        
+        # no cheap counts for these, and they are the expensive ones, so they go after anything with a similar estimate
         
-        if there_are_tags_to_search:
+        for namespace in namespaces_to_include:
             
-            def sort_longest_first_key( s ):
-                
-                return -len( s )
-                
+            query_plan.append( ( file_domain_estimate, namespace + ':*anything*', 'namespace', namespace ) )
+            
+        
+        for wildcard in wildcards_to_include:
             
-            tags_to_include = list( tags_to_include )
+            query_plan.append( ( file_domain_estimate, wildcard, 'wildcard', wildcard ) )
             
-            tags_to_include.sort( key = sort_longest_first_key )
+        
+        def do_query_plan_step( step_type, step_data, hash_ids_table_name ):
             
-            for tag in tags_to_include:
+            if step_type == 'hash':
                 
-                if query_hash_ids is None:
-                    
-                    tag_query_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags )
-                    
-                elif is_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                ( search_hashes, search_hash_type ) = step_data
+                
+                if search_hash_type == 'sha256':
                     
-                    tag_query_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = 'file_inbox' )
+                    matching_sha256_hashes = [ search_hash for search_hash in search_hashes if self._HashExists( search_hash ) ]
                     
                 else:
                     
-                    with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        tag_query_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
-                        
+                    matching_sha256_hashes = self._GetFileHashes( search_hashes, search_hash_type, 'sha256' )
                     
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, tag_query_hash_ids )
+                return self._GetHashIds( matching_sha256_hashes )
                 
-                have_cross_referenced_file_service = True
+            elif step_type == 'modified_timestamp':
+                
+                table = 'file_modified_timestamps'
                 
-                if query_hash_ids == set():
+                if hash_ids_table_name is not None:
                     
-                    return query_hash_ids
+                    table += ' NATURAL JOIN {}'.format( hash_ids_table_name )
                     
                 
-            
-            for namespace in namespaces_to_include:
+                return self._STS( self._c.execute( 'SELECT hash_id FROM {} WHERE {};'.format( table, step_data ) ) )
                 
-                if query_hash_ids is None:
-                    
-                    namespace_query_hash_ids = self._GetHashIdsFromNamespace( file_service_key, tag_search_context, namespace, include_siblings = True )
+            elif step_type == 'similar_to':
+                
+                ( similar_to_hashes, max_hamming ) = step_data
+                
+                all_similar_hash_ids = set()
+                
+                for similar_to_hash in similar_to_hashes:
                     
-                elif is_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                    hash_id = self._GetHashId( similar_to_hash )
                     
-                    namespace_query_hash_ids = self._GetHashIdsFromNamespace( file_service_key, tag_search_context, namespace, include_siblings = True, hash_ids_table_name = 'file_inbox' )
+                    similar_hash_ids_and_distances = self._PHashesSearch( hash_id, max_hamming )
                     
-                else:
+                    similar_hash_ids = [ similar_hash_id for ( similar_hash_id, distance ) in similar_hash_ids_and_distances ]
                     
-                    with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        namespace_query_hash_ids = self._GetHashIdsFromNamespace( file_service_key, tag_search_context, namespace, include_siblings = True, hash_ids_table_name = temp_table_name )
-                        
+                    all_similar_hash_ids.update( similar_hash_ids )
                     
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, namespace_query_hash_ids )
+                return all_similar_hash_ids
                 
-                have_cross_referenced_file_service = True
+            elif step_type == 'rating':
                 
-                if query_hash_ids == set():
-                    
-                    return query_hash_ids
-                    
+                ( service_id, predicate ) = step_data
                 
-            
-            for wildcard in wildcards_to_include:
+                table = 'local_ratings'
                 
-                if query_hash_ids is None:
+                if hash_ids_table_name is not None:
                     
-                    wildcard_query_hash_ids = self._GetHashIdsFromWildcard( file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags )
+                    table += ' NATURAL JOIN {}'.format( hash_ids_table_name )
                     
-                elif is_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                
+                if predicate is None:
                     
-                    wildcard_query_hash_ids = self._GetHashIdsFromWildcard( file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags, hash_ids_table_name = 'file_inbox' )
+                    return self._STS( self._c.execute( 'SELECT hash_id FROM {} WHERE service_id = ?;'.format( table ), ( service_id, ) ) )
                     
                 else:
                     
-                    with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
-                        
-                        self._AnalyzeTempTable( temp_table_name )
-                        
-                        wildcard_query_hash_ids = self._GetHashIdsFromWildcard( file_service_key, tag_service_key, wildcard, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
-                        
+                    return self._STS( self._c.execute( 'SELECT hash_id FROM {} WHERE service_id = ? AND {};'.format( table, predicate ), ( service_id, ) ) )
                     
                 
-                query_hash_ids = intersection_update_qhi( query_hash_ids, wildcard_query_hash_ids )
+            elif step_type == 'inbox':
                 
-                have_cross_referenced_file_service = True
+                return self._inbox_hash_ids
                 
-                if query_hash_ids == set():
-                    
-                    return query_hash_ids
-                    
+            elif step_type == 'duplicate_count':
                 
-            
-        
-        #
-        
-        # OR round two--if file preds will not be fast, let's step in to reduce the file domain search space
-        if not ( there_are_simple_files_info_preds_to_search_for or done_or_predicates ):
-            
-            if len( or_predicates ) > 0:
+                ( operator, num_relationships, dupe_type ) = step_data
                 
-                query_hash_ids = do_or_preds( or_predicates, query_hash_ids )
+                return self._DuplicatesGetHashIdsFromDuplicateCountPredicate( file_service_key, operator, num_relationships, dupe_type )
                 
-                have_cross_referenced_file_service = True
+            elif step_type == 'file_viewing_stats':
+                
+                ( view_type, viewing_locations, operator, viewing_value ) = step_data
+                
+                return self._GetHashIdsFromFileViewingStatistics( view_type, viewing_locations, operator, viewing_value, hash_ids_table_name = hash_ids_table_name )
+                
+            elif step_type == 'tag':
+                
+                return self._GetHashIdsFromTag( file_service_key, tag_service_key, step_data, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
+                
+            elif step_type == 'namespace':
+                
+                return self._GetHashIdsFromNamespace( file_service_key, tag_search_context, step_data, include_siblings = True, hash_ids_table_name = hash_ids_table_name )
+                
+            elif step_type == 'wildcard':
+                
+                return self._GetHashIdsFromWildcard( file_service_key, tag_service_key, step_data, include_current_tags, include_pending_tags, hash_ids_table_name = hash_ids_table_name )
                 
-            
-            done_or_predicates = True
+            
+        
+        # these steps fetch their results without looking at query_hash_ids, so there is no point making a temp table for them
+        steps_that_ignore_hash_ids_table = { 'hash', 'similar_to', 'inbox', 'duplicate_count' }
+        steps_that_cross_reference_file_service = { 'duplicate_count', 'tag', 'namespace', 'wildcard' }
+        
+        def query_plan_sort_key( step ):
+            
+            ( estimate, description, step_type, step_data ) = step
+            
+            # an estimate can be an overcount--a tag's is summed over siblings, namespaces and services--but no step can match more than the whole file domain
+            # capping it means the sort, which is stable, keeps the expensive steps that are pinned to the file domain estimate at the end
+            
+            return min( estimate, file_domain_estimate )
+            
+        
+        query_plan.sort( key = query_plan_sort_key )
+        
+        query_plan_report_lines = []
+        
+        done_inbox = False
+        
+        # with the bitmap index, runs of tag steps are ANDed as compressed bitmaps, and we only make a python set when another step needs one
+        query_hash_ids_bitmap = None
+        
+        for ( estimate, description, step_type, step_data ) in query_plan:
+            
+            step_started = HydrusData.GetNowPrecise()
+            
+            if step_type == 'tag' and ClientDBTagBitmaps.ROARING_OK:
+                
+                step_hash_ids = self._GetHashIdsBitmapFromTag( file_service_key, tag_service_key, step_data, include_current_tags, include_pending_tags )
+                
+                if query_hash_ids_bitmap is None:
+                    
+                    if query_hash_ids is None:
+                        
+                        query_hash_ids_bitmap = step_hash_ids
+                        
+                    else:
+                        
+                        query_hash_ids_bitmap = ClientDBTagBitmaps.BitMap( query_hash_ids ) & step_hash_ids
+                        
+                    
+                else:
+                    
+                    query_hash_ids_bitmap = query_hash_ids_bitmap & step_hash_ids
+                    
+                
+                num_left = len( query_hash_ids_bitmap )
+                
+            else:
+                
+                if query_hash_ids_bitmap is not None:
+                    
+                    query_hash_ids = set( query_hash_ids_bitmap )
+                    
+                    query_hash_ids_bitmap = None
+                    
+                
+                if query_hash_ids is None or step_type in steps_that_ignore_hash_ids_table:
+                    
+                    step_hash_ids = do_query_plan_step( step_type, step_data, None )
+                    
+                elif done_inbox and len( query_hash_ids ) == len( self._inbox_hash_ids ):
+                    
+                    step_hash_ids = do_query_plan_step( step_type, step_data, 'file_inbox' )
+                    
+                else:
+                    
+                    with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
+                        
+                        self._AnalyzeTempTable( temp_table_name )
+                        
+                        step_hash_ids = do_query_plan_step( step_type, step_data, temp_table_name )
+                        
+                    
+                
+                query_hash_ids = intersection_update_qhi( query_hash_ids, step_hash_ids, force_create_new_set = step_type == 'inbox' )
+                
+                num_left = len( query_hash_ids )
+                
+            
+            if step_type == 'inbox':
+                
+                done_inbox = True
+                
+            
+            if step_type in steps_that_cross_reference_file_service:
+                
+                have_cross_referenced_file_service = True
+                
+            
+            if HG.db_report_mode:
+                
+                query_plan_report_lines.append( '{}: estimated {}, matched {}, {} left, took {}'.format( description, HydrusData.ToHumanInt( estimate ), HydrusData.ToHumanInt( len( step_hash_ids ) ), HydrusData.ToHumanInt( num_left ), HydrusData.TimeDeltaToPrettyTimeDelta( HydrusData.GetNowPrecise() - step_started ) ) )
+                
+            
+            if num_left == 0 or job_key.IsCancelled():
+                
+                break
+                
+            
+        
+        if query_hash_ids_bitmap is not None:
+            
+            query_hash_ids = set( query_hash_ids_bitmap )
+            
+        
+        if HG.db_report_mode and len( query_plan ) > 0:
+            
+            message = 'File search plan, for a file domain of about ' + HydrusData.ToHumanInt( file_domain_estimate ) + ' files:'
+            message += os.linesep * 2
+            message += os.linesep.join( query_plan_report_lines )
+            
+            HydrusData.ShowText( message )
+            
+        
+        if job_key.IsCancelled():
+            
+            return set()
+            
+        
+        if query_hash_ids == set():
+            
+            return query_hash_ids
+            
+        
+        #
+        
+        # OR round two--if file preds will not be fast, let's step in to reduce the file domain search space
+        if not ( there_are_simple_files_info_preds_to_search_for or done_or_predicates ):
+            
+            if len( or_predicates ) > 0:
+                
+                query_hash_ids = do_or_preds( or_predicates, query_hash_ids )
+                
+                have_cross_referenced_file_service = True
+                
+            
+            done_or_predicates = True
             
         
         # now the simple preds and desperate last shot to populate query_hash_ids
@@ -6052,13 +6250,22 @@ class DB( HydrusDB.HydrusDB ):
         
         for tag in tags_to_exclude:
             
-            with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
+            if ClientDBTagBitmaps.ROARING_OK:
                 
-                self._AnalyzeTempTable( temp_table_name )
+                unwanted_hash_ids_bitmap = self._GetHashIdsBitmapFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags )
                 
-                unwanted_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
+                query_hash_ids.difference_update( ClientDBTagBitmaps.BitMap( query_hash_ids ) & unwanted_hash_ids_bitmap )
                 
-                query_hash_ids.difference_update( unwanted_hash_ids )
+            else:
+                
+                with HydrusDB.TemporaryIntegerTable( self._c, query_hash_ids, 'hash_id' ) as temp_table_name:
+                    
+                    self._AnalyzeTempTable( temp_table_name )
+                    
+                    unwanted_hash_ids = self._GetHashIdsFromTag( file_service_key, tag_service_key, tag, include_current_tags, include_pending_tags, hash_ids_table_name = temp_table_name )
+                    
+                    query_hash_ids.difference_update( unwanted_hash_ids )
+                    
                 
             
             if len( query_hash_ids ) == 0:
@@ -6536,6 +6743,11 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetHashIdsFromTag( self, file_service_key, tag_service_key, search_tag, include_current_tags, include_pending_tags, hash_ids_table_name = None ):
         
+        if hash_ids_table_name is None and ClientDBTagBitmaps.ROARING_OK:
+            
+            return set( self._GetHashIdsBitmapFromTag( file_service_key, tag_service_key, search_tag, include_current_tags, include_pending_tags ) )
+            
+        
         siblings_manager = self._controller.tag_siblings_manager
         
         tags = siblings_manager.GetAllSiblings( tag_service_key, search_tag )
@@ -6610,6 +6822,44 @@ class DB( HydrusDB.HydrusDB ):
         return hash_ids
         
     
+    def _GetHashIdsFromTagEstimate( self, file_service_key, tag_service_key, search_tag, include_current_tags, include_pending_tags ):
+        
+        # same tag matching as _GetHashIdsFromTag, but read from the autocomplete count caches, so this is cheap
+        # siblings and unnamespaced matches across namespaces can overlap, so this is an upper bound
+        
+        tag_ids = self._GetTagIdsFromSearchTag( tag_service_key, search_tag )
+        
+        if len( tag_ids ) == 0:
+            
+            return 0
+            
+        
+        file_service_id = self._GetServiceId( file_service_key )
+        
+        if tag_service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            search_tag_service_ids = self._GetServiceIds( HC.REAL_TAG_SERVICES )
+            
+        else:
+            
+            search_tag_service_ids = [ self._GetServiceId( tag_service_key ) ]
+            
+        
+        estimate = 0
+        
+        for search_tag_service_id in search_tag_service_ids:
+            
+            ids_to_count = self._GetAutocompleteCounts( search_tag_service_id, file_service_id, tag_ids, include_current_tags, include_pending_tags )
+            
+            for ( current_min, current_max, pending_min, pending_max ) in ids_to_count.values():
+                
+                estimate += current_min + pending_min
+                
+            
+        
+        return estimate
+        
+    
     def _GetHashIdsFromURLRule( self, rule_type, rule, hash_ids_table_name = None ):
         
         if rule_type == 'exact_match':
@@ -6869,9 +7119,7 @@ class DB( HydrusDB.HydrusDB ):
         
         if hash_ids is not None:
             
-            self._PopulateHashIdsToHashesCache( hash_ids, exception_on_error = True )
-            
-            hash_ids_to_hashes = { hash_id : self._hash_ids_to_hashes_cache[ hash_id ] for hash_id in hash_ids }
+            hash_ids_to_hashes = self._GetHashIdsToHashesCached( hash_ids, exception_on_error = True )
             
         elif hashes is not None:
             
@@ -7225,6 +7473,25 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _GetJSONDumpsNamed( self, dump_type, dump_names ):
+        
+        dump_names_to_objs = {}
+        
+        for dump_name in dump_names:
+            
+            try:
+                
+                dump_names_to_objs[ dump_name ] = self._GetJSONDumpNamed( dump_type, dump_name = dump_name )
+                
+            except HydrusExceptions.DataMissing:
+                
+                continue
+                
+            
+        
+        return dump_names_to_objs
+        
+    
     def _GetJSONDumpNames( self, dump_type ):
         
         names = [ name for ( name, ) in self._c.execute( 'SELECT DISTINCT dump_name FROM json_dumps_named WHERE dump_type = ?;', ( dump_type, ) ) ]
@@ -7340,6 +7607,33 @@ class DB( HydrusDB.HydrusDB ):
         return tables
         
     
+    def _GetMappingsBitmap( self, tag_service_id, status, tag_id ):
+        
+        key = ( HC.CONTENT_TYPE_MAPPINGS, tag_service_id, status, tag_id )
+        
+        bitmap = self._tag_bitmap_index.GetBitmap( key )
+        
+        if bitmap is None:
+            
+            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
+            
+            if status == HC.CONTENT_STATUS_CURRENT:
+                
+                table_name = current_mappings_table_name
+                
+            else:
+                
+                table_name = pending_mappings_table_name
+                
+            
+            bitmap = ClientDBTagBitmaps.BitMap( self._STI( self._c.execute( 'SELECT hash_id FROM {} WHERE tag_id = ?;'.format( table_name ), ( tag_id, ) ) ) )
+            
+            self._SetTagBitmap( key, bitmap )
+            
+        
+        return bitmap
+        
+    
     def _GetMediaResults( self, hash_ids: typing.Iterable[ int ] ):
         
         ( cached_media_results, missing_hash_ids ) = self._weakref_media_result_cache.GetMediaResultsAndMissing( hash_ids )
@@ -7348,126 +7642,84 @@ class DB( HydrusDB.HydrusDB ):
             
             hash_ids = missing_hash_ids
             
-            # get first detailed results
+            # we fetch each table in one go and group the rows by hash_id
+            # only the file info managers are made now. the rest are made from the batch's rows when each media first needs them, so a big page does not pay for managers it never looks at
             
-            self._PopulateHashIdsToHashesCache( hash_ids )
+            hash_ids_to_hashes = self._GetHashIdsToHashesCached( hash_ids )
             
             with HydrusDB.TemporaryIntegerTable( self._c, hash_ids, 'hash_id' ) as temp_table_name:
                 
                 self._AnalyzeTempTable( temp_table_name )
                 
-                hash_ids_to_info = { hash_id : ClientMediaManagers.FileInfoManager( hash_id, self._hash_ids_to_hashes_cache[ hash_id ], size, mime, width, height, duration, num_frames, has_audio, num_words ) for ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) in self._c.execute( 'SELECT * FROM files_info NATURAL JOIN {};'.format( temp_table_name ) ) }
+                hash_ids_to_info = { hash_id : ClientMediaManagers.FileInfoManager( hash_id, hash_ids_to_hashes[ hash_id ], size, mime, width, height, duration, num_frames, has_audio, num_words ) for ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) in self._c.execute( 'SELECT * FROM files_info NATURAL JOIN {};'.format( temp_table_name ) ) }
                 
-                hash_ids_to_current_file_service_ids_and_timestamps = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, timestamp ) ) for ( hash_id, service_id, timestamp ) in self._c.execute( 'SELECT hash_id, service_id, timestamp FROM current_files NATURAL JOIN {};'.format( temp_table_name ) ) ) )
+                current_file_rows = self._c.execute( 'SELECT hash_id, service_id, timestamp FROM current_files NATURAL JOIN {};'.format( temp_table_name ) ).fetchall()
                 
-                hash_ids_to_deleted_file_service_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT hash_id, service_id FROM deleted_files NATURAL JOIN {};'.format( temp_table_name ) ) )
+                deleted_file_rows = self._c.execute( 'SELECT hash_id, service_id FROM deleted_files NATURAL JOIN {};'.format( temp_table_name ) ).fetchall()
                 
-                hash_ids_to_pending_file_service_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT hash_id, service_id FROM file_transfers NATURAL JOIN {};'.format( temp_table_name ) ) )
+                pending_file_rows = self._c.execute( 'SELECT hash_id, service_id FROM file_transfers NATURAL JOIN {};'.format( temp_table_name ) ).fetchall()
                 
-                hash_ids_to_petitioned_file_service_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT hash_id, service_id FROM file_petitions NATURAL JOIN {};'.format( temp_table_name ) ) )
+                petitioned_file_rows = self._c.execute( 'SELECT hash_id, service_id FROM file_petitions NATURAL JOIN {};'.format( temp_table_name ) ).fetchall()
                 
-                hash_ids_to_urls = HydrusData.BuildKeyToSetDict( self._c.execute( 'SELECT hash_id, url FROM url_map NATURAL JOIN urls NATURAL JOIN {};'.format( temp_table_name ) ) )
+                url_rows = self._c.execute( 'SELECT hash_id, url FROM url_map NATURAL JOIN urls NATURAL JOIN {};'.format( temp_table_name ) ).fetchall()
                 
-                hash_ids_to_service_ids_and_filenames = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, filename ) ) for ( hash_id, service_id, filename ) in self._c.execute( 'SELECT hash_id, service_id, filename FROM service_filenames NATURAL JOIN {};'.format( temp_table_name ) ) ) )
+                service_filename_rows = self._c.execute( 'SELECT hash_id, service_id, filename FROM service_filenames NATURAL JOIN {};'.format( temp_table_name ) ).fetchall()
                 
-                hash_ids_to_local_ratings = HydrusData.BuildKeyToListDict( ( ( hash_id, ( service_id, rating ) ) for ( service_id, hash_id, rating ) in self._c.execute( 'SELECT service_id, hash_id, rating FROM local_ratings NATURAL JOIN {};'.format( temp_table_name ) ) ) )
+                local_rating_rows = self._c.execute( 'SELECT hash_id, service_id, rating FROM local_ratings NATURAL JOIN {};'.format( temp_table_name ) ).fetchall()
                 
-                hash_ids_to_names_and_notes = HydrusData.BuildKeyToListDict( ( ( hash_id, ( name, note ) ) for ( hash_id, name, note ) in self._c.execute( 'SELECT file_notes.hash_id, label, note FROM file_notes, labels, notes, {} ON ( file_notes.name_id = labels.label_id AND file_notes.note_id = notes.note_id AND file_notes.hash_id = {}.hash_id );'.format( temp_table_name, temp_table_name ) ) ) )
+                note_rows = self._c.execute( 'SELECT file_notes.hash_id, label, note FROM file_notes, labels, notes, {} ON ( file_notes.name_id = labels.label_id AND file_notes.note_id = notes.note_id AND file_notes.hash_id = {}.hash_id );'.format( temp_table_name, temp_table_name ) ).fetchall()
                 
-                hash_ids_to_file_viewing_stats_managers = { hash_id : ClientMediaManagers.FileViewingStatsManager( preview_views, preview_viewtime, media_views, media_viewtime ) for ( hash_id, preview_views, preview_viewtime, media_views, media_viewtime ) in self._c.execute( 'SELECT hash_id, preview_views, preview_viewtime, media_views, media_viewtime FROM file_viewing_stats NATURAL JOIN {};'.format( temp_table_name ) ) }
+                hash_ids_to_file_viewing_stats = { hash_id : ( preview_views, preview_viewtime, media_views, media_viewtime ) for ( hash_id, preview_views, preview_viewtime, media_views, media_viewtime ) in self._c.execute( 'SELECT hash_id, preview_views, preview_viewtime, media_views, media_viewtime FROM file_viewing_stats NATURAL JOIN {};'.format( temp_table_name ) ) }
                 
                 hash_ids_to_file_modified_timestamps = dict( self._c.execute( 'SELECT hash_id, file_modified_timestamp FROM file_modified_timestamps NATURAL JOIN {};'.format( temp_table_name ) ) )
                 
+                file_service_ids_to_counts = collections.Counter( ( service_id for ( hash_id, service_id, timestamp ) in current_file_rows ) )
+                
+                tag_rows = self._GetRawTagRows( temp_table_name, len( hash_ids ), file_service_ids_to_counts )
+                
             
-            hash_ids_to_current_file_service_ids = { hash_id : [ file_service_id for ( file_service_id, timestamp ) in file_service_ids_and_timestamps ] for ( hash_id, file_service_ids_and_timestamps ) in list(hash_ids_to_current_file_service_ids_and_timestamps.items()) }
-            
-            hash_ids_to_tags_managers = self._GetForceRefreshTagsManagers( hash_ids, hash_ids_to_current_file_service_ids = hash_ids_to_current_file_service_ids )
-            
-            # build it
+            tag_ids_to_tags = self._GetTagIdsToTags( { tag_id for ( hash_id, tag_service_id, status, tag_id ) in tag_rows } )
             
             service_ids_to_service_keys = { service_id : service_key for ( service_id, service_key ) in self._c.execute( 'SELECT service_id, service_key FROM services;' ) }
             
+            tag_display_lookup = self._GetTagDisplayLookup( tag_rows, tag_ids_to_tags, service_ids_to_service_keys )
+            
+            inbox_hash_ids = { hash_id for hash_id in hash_ids if hash_id in self._inbox_hash_ids }
+            
+            batch = ClientMediaResult.MediaResultBatch(
+                service_ids_to_service_keys,
+                inbox_hash_ids,
+                tag_ids_to_tags,
+                current_file_rows,
+                deleted_file_rows,
+                pending_file_rows,
+                petitioned_file_rows,
+                url_rows,
+                service_filename_rows,
+                local_rating_rows,
+                note_rows,
+                tag_rows,
+                tag_display_lookup,
+                hash_ids_to_file_modified_timestamps,
+                hash_ids_to_file_viewing_stats
+            )
+            
             missing_media_results = []
             
             for hash_id in hash_ids:
                 
-                tags_manager = hash_ids_to_tags_managers[ hash_id ]
-                
-                #
-                
-                current_file_service_keys = { service_ids_to_service_keys[ service_id ] for ( service_id, timestamp ) in hash_ids_to_current_file_service_ids_and_timestamps[ hash_id ] }
-                
-                deleted_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in hash_ids_to_deleted_file_service_ids[ hash_id ] }
-                
-                pending_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in hash_ids_to_pending_file_service_ids[ hash_id ] }
-                
-                petitioned_file_service_keys = { service_ids_to_service_keys[ service_id ] for service_id in hash_ids_to_petitioned_file_service_ids[ hash_id ] }
-                
-                inbox = hash_id in self._inbox_hash_ids
-                
-                urls = hash_ids_to_urls[ hash_id ]
-                
-                service_ids_to_filenames = HydrusData.BuildKeyToListDict( hash_ids_to_service_ids_and_filenames[ hash_id ] )
-                
-                service_keys_to_filenames = { service_ids_to_service_keys[ service_id ] : filenames for ( service_id, filenames ) in list(service_ids_to_filenames.items()) }
-                
-                current_file_service_keys_to_timestamps = { service_ids_to_service_keys[ service_id ] : timestamp for ( service_id, timestamp ) in hash_ids_to_current_file_service_ids_and_timestamps[ hash_id ] }
-                
-                if hash_id in hash_ids_to_file_modified_timestamps:
-                    
-                    file_modified_timestamp = hash_ids_to_file_modified_timestamps[ hash_id ]
-                    
-                else:
-                    
-                    file_modified_timestamp = None
-                    
-                
-                locations_manager = ClientMediaManagers.LocationsManager( current_file_service_keys, deleted_file_service_keys, pending_file_service_keys, petitioned_file_service_keys, inbox, urls, service_keys_to_filenames, current_to_timestamps = current_file_service_keys_to_timestamps, file_modified_timestamp = file_modified_timestamp )
-                
-                #
-                
-                local_ratings = { service_ids_to_service_keys[ service_id ] : rating for ( service_id, rating ) in hash_ids_to_local_ratings[ hash_id ] }
-                
-                ratings_manager = ClientMediaManagers.RatingsManager( local_ratings )
-                
-                #
-                
-                if hash_id in hash_ids_to_names_and_notes:
-                    
-                    names_to_notes = dict( hash_ids_to_names_and_notes[ hash_id ] )
-                    
-                else:
-                    
-                    names_to_notes = dict()
-                    
-                
-                notes_manager = ClientMediaManagers.NotesManager( names_to_notes )
-                
-                #
-                
-                if hash_id in hash_ids_to_file_viewing_stats_managers:
-                    
-                    file_viewing_stats_manager = hash_ids_to_file_viewing_stats_managers[ hash_id ]
-                    
-                else:
-                    
-                    file_viewing_stats_manager = ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager()
-                    
-                
-                #
-                
                 if hash_id in hash_ids_to_info:
                     
                     file_info_manager = hash_ids_to_info[ hash_id ]
                     
                 else:
                     
-                    hash = self._hash_ids_to_hashes_cache[ hash_id ]
+                    hash = hash_ids_to_hashes[ hash_id ]
                     
                     file_info_manager = ClientMediaManagers.FileInfoManager( hash_id, hash )
                     
                 
-                missing_media_results.append( ClientMediaResult.MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager ) )
+                missing_media_results.append( ClientMediaResult.LazyMediaResult( file_info_manager, batch ) )
                 
             
             self._weakref_media_result_cache.AddMediaResults( missing_media_results )
@@ -7802,6 +8054,86 @@ class DB( HydrusDB.HydrusDB ):
         return None
         
     
+    def _GetPreImportStatuses( self, urls, hash_types_and_hashes ):
+        
+        # everything the pre-import url and hash predictions of a batch of new file seeds will want to look up, in one job
+        
+        urls_to_url_statuses = { url : self._GetURLStatuses( url ) for url in urls }
+        
+        hash_types_and_hashes_to_hash_statuses = { ( hash_type, hash ) : self._GetHashStatus( hash_type, hash, prefix = 'hash recognised' ) for ( hash_type, hash ) in hash_types_and_hashes }
+        
+        # a single clear url match gets double-checked against the other urls that file has
+        
+        matched_hashes = { url_statuses[0][1] for url_statuses in urls_to_url_statuses.values() if len( url_statuses ) == 1 and url_statuses[0][0] != CC.STATUS_UNKNOWN }
+        
+        hashes_to_urls = {}
+        
+        for hash in matched_hashes:
+            
+            hash_id = self._GetHashId( hash )
+            
+            hashes_to_urls[ hash ] = self._STS( self._c.execute( 'SELECT url FROM url_map NATURAL JOIN urls WHERE hash_id = ?;', ( hash_id, ) ) )
+            
+        
+        return ( urls_to_url_statuses, hash_types_and_hashes_to_hash_statuses, hashes_to_urls )
+        
+    
+    def _GetRawTagRows( self, hash_ids_table_name, num_hash_ids, file_service_ids_to_counts ):
+        
+        # one join per mappings table rather than one select per hash_id, which matters a lot when we are loading a whole page of files
+        # returns ( hash_id, tag_service_id, status, tag_id ) rows
+        
+        # Let's figure out if there is a common specific file service to this batch
+        
+        common_file_service_id = None
+        
+        for ( file_service_id, count ) in file_service_ids_to_counts.items():
+            
+            if count == num_hash_ids: # i.e. every hash has this file service
+                
+                ( file_service_type, ) = self._c.execute( 'SELECT service_type FROM services WHERE service_id = ?;', ( file_service_id, ) ).fetchone()
+                
+                if file_service_type in HC.AUTOCOMPLETE_CACHE_SPECIFIC_FILE_SERVICES:
+                    
+                    common_file_service_id = file_service_id
+                    
+                    break
+                    
+                
+            
+        
+        #
+        
+        tag_rows = []
+        
+        tag_service_ids = self._GetServiceIds( HC.REAL_TAG_SERVICES )
+        
+        for tag_service_id in tag_service_ids:
+            
+            ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( tag_service_id )
+            
+            if common_file_service_id is None:
+                
+                statuses_to_table_names = { HC.CONTENT_STATUS_CURRENT : current_mappings_table_name, HC.CONTENT_STATUS_DELETED : deleted_mappings_table_name, HC.CONTENT_STATUS_PENDING : pending_mappings_table_name }
+                
+            else:
+                
+                ( cache_files_table_name, cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name, ac_cache_table_name ) = GenerateSpecificMappingsCacheTableNames( common_file_service_id, tag_service_id )
+                
+                statuses_to_table_names = { HC.CONTENT_STATUS_CURRENT : cache_current_mappings_table_name, HC.CONTENT_STATUS_DELETED : cache_deleted_mappings_table_name, HC.CONTENT_STATUS_PENDING : cache_pending_mappings_table_name }
+                
+            
+            statuses_to_table_names[ HC.CONTENT_STATUS_PETITIONED ] = petitioned_mappings_table_name
+            
+            for ( status, mappings_table_name ) in statuses_to_table_names.items():
+                
+                tag_rows.extend( ( ( hash_id, tag_service_id, status, tag_id ) for ( hash_id, tag_id ) in self._c.execute( 'SELECT hash_id, tag_id FROM {} NATURAL JOIN {};'.format( mappings_table_name, hash_ids_table_name ) ) ) )
+                
+            
+        
+        return tag_rows
+        
+    
     def _GetRecentTags( self, service_key ):
         
         service_id = self._GetServiceId( service_key )
@@ -7835,9 +8167,9 @@ class DB( HydrusDB.HydrusDB ):
         
         sorted_recent_tag_ids = newest_first[ : num_we_want ]
         
-        self._PopulateTagIdsToTagsCache( sorted_recent_tag_ids )
+        tag_ids_to_tags = self._GetTagIdsToTags( sorted_recent_tag_ids )
         
-        sorted_recent_tags = [ self._tag_ids_to_tags_cache[ tag_id ] for tag_id in sorted_recent_tag_ids ]
+        sorted_recent_tags = [ tag_ids_to_tags[ tag_id ] for tag_id in sorted_recent_tag_ids ]
         
         return sorted_recent_tags
         
@@ -8450,9 +8782,72 @@ class DB( HydrusDB.HydrusDB ):
     
     def _GetTag( self, tag_id ):
         
-        self._PopulateTagIdsToTagsCache( ( tag_id, ) )
+        tag = self._tag_ids_to_tags_cache.GetValue( tag_id )
+        
+        if tag is None:
+            
+            tag = self._GetTagIdsToTags( ( tag_id, ) )[ tag_id ]
+            
         
-        return self._tag_ids_to_tags_cache[ tag_id ]
+        return tag
+        
+    
+    def _GetTagDisplayLookup( self, tag_rows, tag_ids_to_tags, service_ids_to_service_keys ):
+        
+        # works out the sibling and display filter results once per tag for a whole batch, rather than once per tag per file in every TagsManager
+        # returns ( tag_service_id, tag_id ) -> ( collapsed_tag, single_media_ok, selection_list_ok ), or None if the siblings are busy
+        
+        tag_siblings_manager = self._controller.tag_siblings_manager
+        tag_display_manager = self._controller.tag_display_manager
+        
+        tag_service_ids_to_tag_ids = collections.defaultdict( set )
+        
+        for ( hash_id, tag_service_id, status, tag_id ) in tag_rows:
+            
+            tag_service_ids_to_tag_ids[ tag_service_id ].add( tag_id )
+            
+        
+        tag_display_lookup = {}
+        
+        for ( tag_service_id, tag_ids ) in tag_service_ids_to_tag_ids.items():
+            
+            service_key = service_ids_to_service_keys[ tag_service_id ]
+            
+            tags_to_collapsed_tags = tag_siblings_manager.GetTagsToCollapsedTags( service_key, ( tag_ids_to_tags[ tag_id ] for tag_id in tag_ids ) )
+            
+            if tags_to_collapsed_tags is None:
+                
+                return None
+                
+            
+            collapsed_tags = set( tags_to_collapsed_tags.values() )
+            
+            tag_display_types_to_ok_tags = {}
+            
+            for tag_display_type in ( ClientTags.TAG_DISPLAY_SINGLE_MEDIA, ClientTags.TAG_DISPLAY_SELECTION_LIST ):
+                
+                if tag_display_manager.FiltersTags( tag_display_type, service_key ):
+                    
+                    tag_display_types_to_ok_tags[ tag_display_type ] = tag_display_manager.FilterTags( tag_display_type, service_key, collapsed_tags )
+                    
+                else:
+                    
+                    tag_display_types_to_ok_tags[ tag_display_type ] = collapsed_tags
+                    
+                
+            
+            single_media_ok_tags = tag_display_types_to_ok_tags[ ClientTags.TAG_DISPLAY_SINGLE_MEDIA ]
+            selection_list_ok_tags = tag_display_types_to_ok_tags[ ClientTags.TAG_DISPLAY_SELECTION_LIST ]
+            
+            for tag_id in tag_ids:
+                
+                collapsed_tag = tags_to_collapsed_tags[ tag_ids_to_tags[ tag_id ] ]
+                
+                tag_display_lookup[ ( tag_service_id, tag_id ) ] = ( collapsed_tag, collapsed_tag in single_media_ok_tags, collapsed_tag in selection_list_ok_tags )
+                
+            
+        
+        return tag_display_lookup
         
     
     def _GetTagId( self, tag ):
@@ -8461,6 +8856,13 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusTags.CheckTagNotEmpty( tag )
         
+        tag_id = self._tag_ids_to_tags_cache.GetId( tag )
+        
+        if tag_id is not None:
+            
+            return tag_id
+            
+        
         ( namespace, subtag ) = HydrusTags.SplitTag( tag )
         
         result = self._c.execute( 'SELECT tag_id FROM tags NATURAL JOIN namespaces NATURAL JOIN subtags WHERE namespace = ? AND subtag = ?;', ( namespace, subtag ) ).fetchone()
@@ -8479,9 +8881,76 @@ class DB( HydrusDB.HydrusDB ):
             ( tag_id, ) = result
             
         
+        self._tag_ids_to_tags_cache.AddPairs( ( ( tag_id, tag ), ) )
+        
         return tag_id
         
     
+    def _GetTagIdsFromSearchTag( self, tag_service_key, search_tag ):
+        
+        # all the tag_ids a tag search should match: its siblings, and for an unnamespaced search, every namespaced version
+        # unlike _GetTagId, this never creates anything
+        
+        siblings_manager = self._controller.tag_siblings_manager
+        
+        tags = siblings_manager.GetAllSiblings( tag_service_key, search_tag )
+        
+        tag_ids = set()
+        
+        for tag in tags:
+            
+            ( namespace, subtag ) = HydrusTags.SplitTag( tag )
+            
+            if namespace != '' or tag != search_tag:
+                
+                if not self._TagExists( tag ):
+                    
+                    continue
+                    
+                
+                tag_ids.add( self._GetTagId( tag ) )
+                
+            else:
+                
+                if not self._SubtagExists( subtag ):
+                    
+                    continue
+                    
+                
+                subtag_id = self._GetSubtagId( subtag )
+                
+                tag_ids.update( self._STI( self._c.execute( 'SELECT tag_id FROM tags WHERE subtag_id = ?;', ( subtag_id, ) ) ) )
+                
+            
+        
+        return tag_ids
+        
+    
+    def _GetTagParentPairsForChildTagIds( self, service_ids_to_child_tag_ids ):
+        
+        service_keys_to_children_and_pairs = {}
+        
+        for ( service_id, child_tag_ids ) in service_ids_to_child_tag_ids.items():
+            
+            service_key = self._GetService( service_id ).GetServiceKey()
+            
+            with HydrusDB.TemporaryIntegerTable( self._c, child_tag_ids, 'child_tag_id' ) as temp_table_name:
+                
+                pair_ids = self._c.execute( 'SELECT child_tag_id, parent_tag_id FROM {} NATURAL JOIN tag_parents WHERE service_id = ? AND status = ? UNION SELECT child_tag_id, parent_tag_id FROM {} NATURAL JOIN tag_parent_petitions WHERE service_id = ? AND status = ?;'.format( temp_table_name, temp_table_name ), ( service_id, HC.CONTENT_STATUS_CURRENT, service_id, HC.CONTENT_STATUS_PENDING ) ).fetchall()
+                
+            
+            tag_ids_to_tags = self._GetTagIdsToTags( set( child_tag_ids ).union( ( parent_tag_id for ( child_tag_id, parent_tag_id ) in pair_ids ) ) )
+            
+            children = { tag_ids_to_tags[ child_tag_id ] for child_tag_id in child_tag_ids }
+            
+            pairs = { ( tag_ids_to_tags[ child_tag_id ], tag_ids_to_tags[ parent_tag_id ] ) for ( child_tag_id, parent_tag_id ) in pair_ids }
+            
+            service_keys_to_children_and_pairs[ service_key ] = ( children, pairs )
+            
+        
+        return service_keys_to_children_and_pairs
+        
+    
     def _GetTagParents( self, service_key = None ):
         
         def convert_statuses_and_pair_ids_to_statuses_to_pairs( statuses_and_pair_ids ):
@@ -8494,9 +8963,9 @@ class DB( HydrusDB.HydrusDB ):
                 all_tag_ids.add( parent_tag_id )
                 
             
-            self._PopulateTagIdsToTagsCache( all_tag_ids )
+            tag_ids_to_tags = self._GetTagIdsToTags( all_tag_ids )
             
-            statuses_to_pairs = HydrusData.BuildKeyToSetDict( ( ( status, ( self._tag_ids_to_tags_cache[ child_tag_id ], self._tag_ids_to_tags_cache[ parent_tag_id ] ) ) for ( status, child_tag_id, parent_tag_id ) in statuses_and_pair_ids ) )
+            statuses_to_pairs = HydrusData.BuildKeyToSetDict( ( ( status, ( tag_ids_to_tags[ child_tag_id ], tag_ids_to_tags[ parent_tag_id ] ) ) for ( status, child_tag_id, parent_tag_id ) in statuses_and_pair_ids ) )
             
             return statuses_to_pairs
             
@@ -8542,6 +9011,31 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _GetTagSiblingPairsForBadTagIds( self, service_ids_to_bad_tag_ids ):
+        
+        service_keys_to_bad_tags_and_pairs = {}
+        
+        for ( service_id, bad_tag_ids ) in service_ids_to_bad_tag_ids.items():
+            
+            service_key = self._GetService( service_id ).GetServiceKey()
+            
+            with HydrusDB.TemporaryIntegerTable( self._c, bad_tag_ids, 'bad_tag_id' ) as temp_table_name:
+                
+                pair_ids = self._c.execute( 'SELECT bad_tag_id, good_tag_id FROM {} NATURAL JOIN tag_siblings WHERE service_id = ? AND status = ? UNION SELECT bad_tag_id, good_tag_id FROM {} NATURAL JOIN tag_sibling_petitions WHERE service_id = ? AND status = ?;'.format( temp_table_name, temp_table_name ), ( service_id, HC.CONTENT_STATUS_CURRENT, service_id, HC.CONTENT_STATUS_PENDING ) ).fetchall()
+                
+            
+            tag_ids_to_tags = self._GetTagIdsToTags( set( bad_tag_ids ).union( ( good_tag_id for ( bad_tag_id, good_tag_id ) in pair_ids ) ) )
+            
+            bad_tags = { tag_ids_to_tags[ bad_tag_id ] for bad_tag_id in bad_tag_ids }
+            
+            pairs = { ( tag_ids_to_tags[ bad_tag_id ], tag_ids_to_tags[ good_tag_id ] ) for ( bad_tag_id, good_tag_id ) in pair_ids }
+            
+            service_keys_to_bad_tags_and_pairs[ service_key ] = ( bad_tags, pairs )
+            
+        
+        return service_keys_to_bad_tags_and_pairs
+        
+    
     def _GetTagSiblings( self, service_key = None ):
         
         def convert_statuses_and_pair_ids_to_statuses_to_pairs( statuses_and_pair_ids ):
@@ -8554,9 +9048,9 @@ class DB( HydrusDB.HydrusDB ):
                 all_tag_ids.add( good_tag_id )
                 
             
-            self._PopulateTagIdsToTagsCache( all_tag_ids )
+            tag_ids_to_tags = self._GetTagIdsToTags( all_tag_ids )
             
-            statuses_to_pairs = HydrusData.BuildKeyToSetDict( ( ( status, ( self._tag_ids_to_tags_cache[ bad_tag_id ], self._tag_ids_to_tags_cache[ good_tag_id ] ) ) for ( status, bad_tag_id, good_tag_id ) in statuses_and_pair_ids ) )
+            statuses_to_pairs = HydrusData.BuildKeyToSetDict( ( ( status, ( tag_ids_to_tags[ bad_tag_id ], tag_ids_to_tags[ good_tag_id ] ) ) for ( status, bad_tag_id, good_tag_id ) in statuses_and_pair_ids ) )
             
             return statuses_to_pairs
             
@@ -9021,8 +9515,11 @@ class DB( HydrusDB.HydrusDB ):
         self._service_cache = {}
         
         self._weakref_media_result_cache = ClientMediaResultCache.MediaResultCache()
-        self._hash_ids_to_hashes_cache = {}
-        self._tag_ids_to_tags_cache = {}
+        self._hash_ids_to_hashes_cache = ClientDBIdCache.IdCache( 'hash id cache', self.HASH_ID_CACHE_SIZE )
+        self._tag_ids_to_tags_cache = ClientDBIdCache.IdCache( 'tag id cache', self.TAG_ID_CACHE_SIZE )
+        self._tag_bitmap_index = ClientDBTagBitmaps.TagBitmapIndex( 'tag bitmap index', self.TAG_BITMAP_INDEX_SIZE )
+        
+        self._phash_index = None
         
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
@@ -9054,6 +9551,13 @@ class DB( HydrusDB.HydrusDB ):
         self._db_filenames[ 'external_master' ] = 'client.master.db'
         
     
+    def _InitReadOnlyView( self ):
+        
+        HydrusDB.HydrusDB._InitReadOnlyView( self )
+        
+        self._tag_bitmap_index_generation = self._tag_bitmap_index.GetCommittedGeneration()
+        
+    
     def _InInbox( self, hash_param ):
         
         if isinstance( hash_param, bytes ):
@@ -9333,9 +9837,9 @@ class DB( HydrusDB.HydrusDB ):
                 
                 tag_ids = self._STL( self._c.execute( select_query, ( hash_id, ) ) )
                 
-                self._PopulateTagIdsToTagsCache( tag_ids )
+                tag_ids_to_tags = self._GetTagIdsToTags( tag_ids )
                 
-                tags.update( ( self._tag_ids_to_tags_cache[ tag_id ] for tag_id in tag_ids ) )
+                tags.update( tag_ids_to_tags.values() )
                 
             
             if not tag_filter.AllowsEverything():
@@ -9659,6 +10163,11 @@ class DB( HydrusDB.HydrusDB ):
             
             phash_ids.add( phash_id )
             
+            if self._phash_index is not None:
+                
+                self._phash_index.AddPHash( phash_id, phash )
+                
+            
         
         self._c.executemany( 'INSERT OR IGNORE INTO shape_perceptual_hash_map ( phash_id, hash_id ) VALUES ( ?, ? );', ( ( phash_id, hash_id ) for phash_id in phash_ids ) )
         
@@ -9712,6 +10221,11 @@ class DB( HydrusDB.HydrusDB ):
         
         self._c.executemany( 'INSERT OR IGNORE INTO shape_maintenance_branch_regen ( phash_id ) VALUES ( ? );', ( ( phash_id, ) for phash_id in useless_phash_ids ) )
         
+        if self._phash_index is not None:
+            
+            self._phash_index.RemovePHashIds( useless_phash_ids )
+            
+        
     
     def _PHashesGenerateBranch( self, job_key, parent_id, phash_id, phash, children ):
         
@@ -9742,15 +10256,17 @@ class DB( HydrusDB.HydrusDB ):
                 
             else:
                 
-                children = sorted( ( ( HydrusData.Get64BitHammingDistance( phash, child_phash ), child_id, child_phash ) for ( child_id, child_phash ) in children ) )
+                children_distances = HydrusData.Get64BitHammingDistances( phash, [ child_phash for ( child_id, child_phash ) in children ] )
                 
                 median_index = len( children ) // 2
                 
-                median_radius = children[ median_index ][0]
+                median_radius = int( numpy.partition( children_distances, median_index )[ median_index ] )
                 
-                inner_children = [ ( child_id, child_phash ) for ( distance, child_id, child_phash ) in children if distance < median_radius ]
-                radius_children = [ ( child_id, child_phash ) for ( distance, child_id, child_phash ) in children if distance == median_radius ]
-                outer_children = [ ( child_id, child_phash ) for ( distance, child_id, child_phash ) in children if distance > median_radius ]
+                children = list( zip( children_distances.tolist(), children ) )
+                
+                inner_children = [ child for ( distance, child ) in children if distance < median_radius ]
+                radius_children = [ child for ( distance, child ) in children if distance == median_radius ]
+                outer_children = [ child for ( distance, child ) in children if distance > median_radius ]
                 
                 if len( inner_children ) <= len( outer_children ):
                     
@@ -9807,6 +10323,45 @@ class DB( HydrusDB.HydrusDB ):
         return searched_distances_to_count
         
     
+    def _PHashesGetPHashIndex( self ):
+        
+        if self._is_read_only_view:
+            
+            # anything we set here would only go on our shallow copy and be thrown away, so we use the main thread's index if it has one and the on-disk tree if not
+            
+            if HG.client_controller.new_options.GetBoolean( 'use_in_memory_similar_files_index' ):
+                
+                return self._phash_index
+                
+            else:
+                
+                return None
+                
+            
+        
+        if not HG.client_controller.new_options.GetBoolean( 'use_in_memory_similar_files_index' ):
+            
+            self._phash_index = None
+            
+        elif self._phash_index is None:
+            
+            HG.client_controller.pub( 'splash_set_status_subtext', 'loading similar files index' )
+            
+            # only phashes that still have files are useful. orphans are waiting for a branch regen to be cleared out
+            
+            phash_ids_and_phashes = self._c.execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map );' ).fetchall()
+            
+            self._phash_index = ClientSimilarFiles.PHashIndex( phash_ids_and_phashes )
+            
+            if HG.db_report_mode:
+                
+                HydrusData.ShowText( 'Similar files index loaded with ' + HydrusData.ToHumanInt( len( self._phash_index ) ) + ' phashes.' )
+                
+            
+        
+        return self._phash_index
+        
+    
     def _PHashesGetPHashId( self, phash ):
         
         result = self._c.execute( 'SELECT phash_id FROM shape_perceptual_hashes WHERE phash = ?;', ( sqlite3.Binary( phash ), ) ).fetchone()
@@ -9951,9 +10506,13 @@ class DB( HydrusDB.HydrusDB ):
         
         final_scores = []
         
-        for ( v_id, v_phash ) in viewpoints:
+        viewpoints_to_sample_distances = HydrusData.Get64BitHammingDistanceMatrix( [ v_phash for ( v_id, v_phash ) in viewpoints ], [ s_phash for ( s_id, s_phash ) in sample ] ).tolist()
+        
+        sample_ids = [ s_id for ( s_id, s_phash ) in sample ]
+        
+        for ( ( v_id, v_phash ), sample_distances ) in zip( viewpoints, viewpoints_to_sample_distances ):
             
-            views = sorted( ( HydrusData.Get64BitHammingDistance( v_phash, s_phash ) for ( s_id, s_phash ) in sample if v_id != s_id ) )
+            views = sorted( ( distance for ( s_id, distance ) in zip( sample_ids, sample_distances ) if v_id != s_id ) )
             
             # let's figure out the ratio of left_children to right_children, preferring 1:1, and convert it to a discrete integer score
             
@@ -10090,6 +10649,8 @@ class DB( HydrusDB.HydrusDB ):
             
             self._c.execute( 'DELETE FROM shape_perceptual_hash_map WHERE hash_id NOT IN ( SELECT hash_id FROM current_files );' )
             
+            self._phash_index = None
+            
             job_key.SetVariable( 'popup_text_1', 'gathering all leaves' )
             
             self._c.execute( 'DELETE FROM shape_vptree;' )
@@ -10146,7 +10707,20 @@ class DB( HydrusDB.HydrusDB ):
             
             total_done_previously = total_num_hash_ids_in_cache - len( hash_ids )
             
-            for ( i, hash_id ) in enumerate( hash_ids ):
+            # the in-memory index can search many files for about the same cost as one, so we go in blocks when we have it
+            
+            if search_distance > 0 and self._PHashesGetPHashIndex() is not None:
+                
+                block_size = 256
+                
+            else:
+                
+                block_size = 1
+                
+            
+            for ( i, block_of_hash_ids ) in enumerate( HydrusData.SplitListIntoChunks( hash_ids, block_size ) ):
+                
+                num_done = i * block_size
                 
                 job_key.SetVariable( 'popup_title', 'similar files duplicate pair discovery' )
                 
@@ -10166,23 +10740,35 @@ class DB( HydrusDB.HydrusDB ):
                     return
                     
                 
-                if i % 25 == 0:
+                if block_size > 1 or num_done % 25 == 0:
                     
-                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + i, total_num_hash_ids_in_cache ) + ' files'
+                    text = 'searched ' + HydrusData.ConvertValueRangeToPrettyString( total_done_previously + num_done, total_num_hash_ids_in_cache ) + ' files'
                     
                     job_key.SetVariable( 'popup_text_1', text )
-                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + i, total_num_hash_ids_in_cache ) )
+                    job_key.SetVariable( 'popup_gauge_1', ( total_done_previously + num_done, total_num_hash_ids_in_cache ) )
                     
                     HG.client_controller.pub( 'splash_set_status_subtext', text )
                     
                 
-                media_id = self._DuplicatesGetMediaId( hash_id )
-                
-                potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in self._PHashesSearch( hash_id, search_distance ) if duplicate_hash_id != hash_id ]
+                if block_size > 1:
+                    
+                    hash_ids_to_similar_hash_ids_and_distances = self._PHashesSearchWithIndex( self._phash_index, block_of_hash_ids, search_distance )
+                    
+                else:
+                    
+                    hash_ids_to_similar_hash_ids_and_distances = { hash_id : self._PHashesSearch( hash_id, search_distance ) for hash_id in block_of_hash_ids }
+                    
                 
-                self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                for hash_id in block_of_hash_ids:
+                    
+                    media_id = self._DuplicatesGetMediaId( hash_id )
+                    
+                    potential_duplicate_media_ids_and_distances = [ ( self._DuplicatesGetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in hash_ids_to_similar_hash_ids_and_distances[ hash_id ] if duplicate_hash_id != hash_id ]
+                    
+                    self._DuplicatesAddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
+                    
                 
-                self._c.execute( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( search_distance, hash_id ) )
+                self._c.executemany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in block_of_hash_ids ) )
                 
             
         finally:
@@ -10206,6 +10792,13 @@ class DB( HydrusDB.HydrusDB ):
             
         else:
             
+            phash_index = self._PHashesGetPHashIndex()
+            
+            if phash_index is not None:
+                
+                return self._PHashesSearchWithIndex( phash_index, ( hash_id, ), max_hamming_distance )[ hash_id ]
+                
+            
             search_radius = max_hamming_distance
             
             top_node_result = self._c.execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
@@ -10251,12 +10844,12 @@ class DB( HydrusDB.HydrusDB ):
                         
                         results = list( self._ExecuteManySelectSingleParam( select_statement, group_of_current_potentials ) )
                         
-                        for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results:
+                        node_hamming_distances = HydrusData.Get64BitHammingDistances( search_phash, [ node_phash for ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ) in results ] ).tolist()
+                        
+                        for ( ( node_phash_id, node_phash, node_radius, inner_phash_id, outer_phash_id ), node_hamming_distance ) in zip( results, node_hamming_distances ):
                             
                             # first check the node itself--is it similar?
                             
-                            node_hamming_distance = HydrusData.Get64BitHammingDistance( search_phash, node_phash )
-                            
                             if node_hamming_distance <= search_radius:
                                 
                                 similar_phash_ids_to_distances[ node_phash_id ] = node_hamming_distance
@@ -10341,6 +10934,63 @@ class DB( HydrusDB.HydrusDB ):
         return similar_hash_ids_and_distances
         
     
+    def _PHashesSearchWithIndex( self, phash_index, hash_ids, max_hamming_distance ):
+        
+        search_rows = list( self._ExecuteManySelectSingleParam( 'SELECT hash_id, phash FROM shape_perceptual_hashes NATURAL JOIN shape_perceptual_hash_map WHERE hash_id = ?;', hash_ids ) )
+        
+        search_results = phash_index.Search( [ search_phash for ( search_hash_id, search_phash ) in search_rows ], max_hamming_distance )
+        
+        # files can have multiple phashes, so merge each file's results, keeping the smallest distance
+        
+        hash_ids_to_similar_phash_ids_to_distances = collections.defaultdict( dict )
+        
+        for ( ( search_hash_id, search_phash ), similar_phash_ids_to_distances ) in zip( search_rows, search_results ):
+            
+            merged_phash_ids_to_distances = hash_ids_to_similar_phash_ids_to_distances[ search_hash_id ]
+            
+            for ( phash_id, distance ) in similar_phash_ids_to_distances.items():
+                
+                if phash_id not in merged_phash_ids_to_distances or distance < merged_phash_ids_to_distances[ phash_id ]:
+                    
+                    merged_phash_ids_to_distances[ phash_id ] = distance
+                    
+                
+            
+        
+        all_similar_phash_ids = set()
+        
+        for similar_phash_ids_to_distances in hash_ids_to_similar_phash_ids_to_distances.values():
+            
+            all_similar_phash_ids.update( similar_phash_ids_to_distances.keys() )
+            
+        
+        similar_phash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._ExecuteManySelectSingleParam( 'SELECT phash_id, hash_id FROM shape_perceptual_hash_map WHERE phash_id = ?;', all_similar_phash_ids ) )
+        
+        hash_ids_to_similar_hash_ids_and_distances = {}
+        
+        for hash_id in hash_ids:
+            
+            similar_hash_ids_to_distances = {}
+            
+            similar_phash_ids_to_distances = hash_ids_to_similar_phash_ids_to_distances.get( hash_id, {} )
+            
+            for ( phash_id, distance ) in similar_phash_ids_to_distances.items():
+                
+                for similar_hash_id in similar_phash_ids_to_hash_ids[ phash_id ]:
+                    
+                    if similar_hash_id not in similar_hash_ids_to_distances or distance < similar_hash_ids_to_distances[ similar_hash_id ]:
+                        
+                        similar_hash_ids_to_distances[ similar_hash_id ] = distance
+                        
+                    
+                
+            
+            hash_ids_to_similar_hash_ids_and_distances[ hash_id ] = list( similar_hash_ids_to_distances.items() )
+            
+        
+        return hash_ids_to_similar_hash_ids_and_distances
+        
+    
     def _PHashesSetFileMetadata( self, hash_id, phashes ):
         
         current_phash_ids = self._STS( self._c.execute( 'SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ?;', ( hash_id, ) ) )
@@ -10356,14 +11006,21 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _PopulateHashIdsToHashesCache( self, hash_ids, exception_on_error = False ):
+    def _GetCacheReportLines( self ):
         
-        if len( self._hash_ids_to_hashes_cache ) > 100000:
+        lines = [ self._hash_ids_to_hashes_cache.GetReportText(), self._tag_ids_to_tags_cache.GetReportText() ]
+        
+        if ClientDBTagBitmaps.ROARING_OK:
             
-            self._hash_ids_to_hashes_cache = {}
+            lines.append( self._tag_bitmap_index.GetReportText() )
             
         
-        uncached_hash_ids = { hash_id for hash_id in hash_ids if hash_id not in self._hash_ids_to_hashes_cache }
+        return lines
+        
+    
+    def _GetHashIdsToHashesCached( self, hash_ids, exception_on_error = False ):
+        
+        ( hash_ids_to_hashes, uncached_hash_ids ) = self._hash_ids_to_hashes_cache.GetIdsToValues( hash_ids )
         
         if len( uncached_hash_ids ) > 0:
             
@@ -10410,18 +11067,17 @@ class DB( HydrusDB.HydrusDB ):
                     
                 
             
-            self._hash_ids_to_hashes_cache.update( uncached_hash_ids_to_hashes )
+            self._hash_ids_to_hashes_cache.AddPairs( uncached_hash_ids_to_hashes.items() )
+            
+            hash_ids_to_hashes.update( uncached_hash_ids_to_hashes )
             
         
-    
-    def _PopulateTagIdsToTagsCache( self, tag_ids ):
+        return hash_ids_to_hashes
         
-        if len( self._tag_ids_to_tags_cache ) > 100000:
-            
-            self._tag_ids_to_tags_cache = {}
-            
+    
+    def _GetTagIdsToTags( self, tag_ids ):
         
-        uncached_tag_ids = { tag_id for tag_id in tag_ids if tag_id not in self._tag_ids_to_tags_cache }
+        ( tag_ids_to_tags, uncached_tag_ids ) = self._tag_ids_to_tags_cache.GetIdsToValues( tag_ids )
         
         if len( uncached_tag_ids ) > 0:
             
@@ -10439,9 +11095,11 @@ class DB( HydrusDB.HydrusDB ):
                 local_uncached_tag_ids_to_tags = { tag_id : tag for ( tag_id, tag ) in self._ExecuteManySelectSingleParam( 'SELECT tag_id, tag FROM local_tags_cache WHERE tag_id = ?;', uncached_tag_ids ) }
                 
             
-            self._tag_ids_to_tags_cache.update( local_uncached_tag_ids_to_tags )
+            self._tag_ids_to_tags_cache.AddPairs( local_uncached_tag_ids_to_tags.items() )
             
-            uncached_tag_ids = { tag_id for tag_id in uncached_tag_ids if tag_id not in self._tag_ids_to_tags_cache }
+            tag_ids_to_tags.update( local_uncached_tag_ids_to_tags )
+            
+            uncached_tag_ids = { tag_id for tag_id in uncached_tag_ids if tag_id not in local_uncached_tag_ids_to_tags }
             
         
         if len( uncached_tag_ids ) > 0:
@@ -10484,9 +11142,13 @@ class DB( HydrusDB.HydrusDB ):
                     
                 
             
-            self._tag_ids_to_tags_cache.update( uncached_tag_ids_to_tags )
+            self._tag_ids_to_tags_cache.AddPairs( uncached_tag_ids_to_tags.items() )
+            
+            tag_ids_to_tags.update( uncached_tag_ids_to_tags )
             
         
+        return tag_ids_to_tags
+        
     
     def _ProcessContentUpdates( self, service_keys_to_content_updates, do_pubsubs = True ):
         
@@ -10496,6 +11158,11 @@ class DB( HydrusDB.HydrusDB ):
         notify_new_siblings = False
         notify_new_force_refresh_tags = False
         
+        # the managers can update just the bits that changed if we tell them which pairs to look at
+        
+        service_ids_to_child_tag_ids = collections.defaultdict( set )
+        service_ids_to_bad_tag_ids = collections.defaultdict( set )
+        
         for ( service_key, content_updates ) in service_keys_to_content_updates.items():
             
             try:
@@ -10825,6 +11492,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             pairs = ( ( child_tag_id, parent_tag_id ), )
                             
+                            service_ids_to_child_tag_ids[ service_id ].add( child_tag_id )
+                            
                             if action == HC.CONTENT_UPDATE_ADD:
                                 
                                 self._AddTagParents( service_id, pairs, make_content_updates = True )
@@ -10864,6 +11533,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._c.execute( 'DELETE FROM tag_parent_petitions WHERE service_id = ? AND child_tag_id = ? AND parent_tag_id = ?;', ( service_id, child_tag_id, parent_tag_id ) )
                             
+                            service_ids_to_child_tag_ids[ service_id ].add( child_tag_id )
+                            
                             self._c.execute( 'INSERT OR IGNORE INTO tag_parent_petitions ( service_id, child_tag_id, parent_tag_id, reason_id, status ) VALUES ( ?, ?, ?, ?, ? );', ( service_id, child_tag_id, parent_tag_id, reason_id, new_status ) )
                             
                             notify_new_pending = True
@@ -10894,6 +11565,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._c.execute( 'DELETE FROM tag_parent_petitions WHERE service_id = ? AND child_tag_id = ? AND parent_tag_id = ? AND status = ?;', ( service_id, child_tag_id, parent_tag_id, deletee_status ) )
                             
+                            service_ids_to_child_tag_ids[ service_id ].add( child_tag_id )
+                            
                             notify_new_pending = True
                             
                         
@@ -10918,6 +11591,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             pairs = ( ( bad_tag_id, good_tag_id ), )
                             
+                            service_ids_to_bad_tag_ids[ service_id ].add( bad_tag_id )
+                            
                             if action == HC.CONTENT_UPDATE_ADD:
                                 
                                 self._AddTagSiblings( service_id, pairs, make_content_updates = True )
@@ -10961,6 +11636,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._CacheTagSiblingsUpdateChains( service_id, { bad_tag_id, good_tag_id } )
                             
+                            service_ids_to_bad_tag_ids[ service_id ].add( bad_tag_id )
+                            
                             notify_new_pending = True
                             
                         elif action in ( HC.CONTENT_UPDATE_RESCIND_PEND, HC.CONTENT_UPDATE_RESCIND_PETITION ):
@@ -10989,6 +11666,8 @@ class DB( HydrusDB.HydrusDB ):
                             
                             self._CacheTagSiblingsUpdateChains( service_id, { bad_tag_id } )
                             
+                            service_ids_to_bad_tag_ids[ service_id ].add( bad_tag_id )
+                            
                             notify_new_pending = True
                             
                         
@@ -11101,12 +11780,14 @@ class DB( HydrusDB.HydrusDB ):
                 
             if notify_new_siblings:
                 
-                self.pub_after_job( 'notify_new_siblings_data' )
+                # parents are collapsed by siblings, so they still need a full refresh
+                
+                self.pub_after_job( 'notify_new_siblings_data', self._GetTagSiblingPairsForBadTagIds( service_ids_to_bad_tag_ids ) )
                 self.pub_after_job( 'notify_new_parents' )
                 
             elif notify_new_parents:
                 
-                self.pub_after_job( 'notify_new_parents' )
+                self.pub_after_job( 'notify_new_parents', self._GetTagParentPairsForChildTagIds( service_ids_to_child_tag_ids ) )
                 
             if notify_new_force_refresh_tags:
                 
@@ -11117,7 +11798,7 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
-    def _ProcessRepositoryContent( self, service_key, content_hash, content_iterator_dict, job_key, work_time ):
+    def _ProcessRepositoryContent( self, service_key, content_hash, content_iterator_dict, job_key, work_time, stage_timer = None ):
         
         FILES_INITIAL_CHUNK_SIZE = 20
         MAPPINGS_INITIAL_CHUNK_SIZE = 50
@@ -11130,6 +11811,35 @@ class DB( HydrusDB.HydrusDB ):
         
         num_rows_processed = 0
         
+        # each chunk has all its service ids normalised in one go, and then the master id rows are written
+        
+        def report_stage( stage, num_rows, started ):
+            
+            if stage_timer is not None:
+                
+                stage_timer.AddTime( stage, num_rows, HydrusData.GetNowPrecise() - started )
+                
+            
+        
+        def normalise_pairs( chunk ):
+            
+            service_tag_ids_to_tag_ids = self._CacheRepositoryNormaliseServiceTagIdsToTagIds( service_id, itertools.chain.from_iterable( chunk ) )
+            
+            return [ ( service_tag_ids_to_tag_ids[ service_tag_id_a ], service_tag_ids_to_tag_ids[ service_tag_id_b ] ) for ( service_tag_id_a, service_tag_id_b ) in chunk ]
+            
+        
+        def normalise_mappings( chunk ):
+            
+            service_tag_ids_to_tag_ids = self._CacheRepositoryNormaliseServiceTagIdsToTagIds( service_id, ( service_tag_id for ( service_tag_id, service_hash_ids ) in chunk ) )
+            service_hash_ids_to_hash_ids = self._CacheRepositoryNormaliseServiceHashIdsToHashIds( service_id, itertools.chain.from_iterable( ( service_hash_ids for ( service_tag_id, service_hash_ids ) in chunk ) ) )
+            
+            mappings_ids = [ ( service_tag_ids_to_tag_ids[ service_tag_id ], [ service_hash_ids_to_hash_ids[ service_hash_id ] for service_hash_id in service_hash_ids ] ) for ( service_tag_id, service_hash_ids ) in chunk ]
+            
+            num_rows = sum( ( len( service_hash_ids ) for ( service_tag_id, service_hash_ids ) in chunk ) )
+            
+            return ( mappings_ids, num_rows )
+            
+        
         if 'new_files' in content_iterator_dict:
             
             has_audio = None # hack until we figure this out better
@@ -11138,22 +11848,32 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, FILES_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
                 
+                started = HydrusData.GetNowPrecise()
+                
+                service_hash_ids_to_hash_ids = self._CacheRepositoryNormaliseServiceHashIdsToHashIds( service_id, ( row[0] for row in chunk ) )
+                
                 files_info_rows = []
                 files_rows = []
                 
                 for ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words ) in chunk:
                     
-                    hash_id = self._CacheRepositoryNormaliseServiceHashId( service_id, service_hash_id )
+                    hash_id = service_hash_ids_to_hash_ids[ service_hash_id ]
                     
                     files_info_rows.append( ( hash_id, size, mime, width, height, duration, num_frames, has_audio, num_words ) )
                     
                     files_rows.append( ( hash_id, timestamp ) )
                     
                 
+                report_stage( 'normalising', len( files_rows ), started )
+                
+                started = HydrusData.GetNowPrecise()
+                
                 self._AddFilesInfo( files_info_rows )
                 
                 self._AddFiles( service_id, files_rows )
                 
+                report_stage( 'writing', len( files_rows ), started )
+                
                 num_rows_processed += len( files_rows )
                 
                 if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
@@ -11173,12 +11893,18 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, FILES_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
                 
-                service_hash_ids = chunk
+                started = HydrusData.GetNowPrecise()
                 
-                hash_ids = self._CacheRepositoryNormaliseServiceHashIds( service_id, service_hash_ids )
+                hash_ids = list( self._CacheRepositoryNormaliseServiceHashIdsToHashIds( service_id, chunk ).values() )
+                
+                report_stage( 'normalising', len( hash_ids ), started )
+                
+                started = HydrusData.GetNowPrecise()
                 
                 self._DeleteFiles( service_id, hash_ids )
                 
+                report_stage( 'writing', len( hash_ids ), started )
+                
                 num_rows_processed += len( hash_ids )
                 
                 if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
@@ -11198,22 +11924,18 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitMappingIteratorIntoAutothrottledChunks( i, MAPPINGS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
                 
-                mappings_ids = []
+                started = HydrusData.GetNowPrecise()
                 
-                num_rows = 0
+                ( mappings_ids, num_rows ) = normalise_mappings( chunk )
                 
-                for ( service_tag_id, service_hash_ids ) in chunk:
-                    
-                    tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_tag_id )
-                    hash_ids = self._CacheRepositoryNormaliseServiceHashIds( service_id, service_hash_ids )
-                    
-                    mappings_ids.append( ( tag_id, hash_ids ) )
-                    
-                    num_rows += len( service_hash_ids )
-                    
+                report_stage( 'normalising', num_rows, started )
+                
+                started = HydrusData.GetNowPrecise()
                 
                 self._UpdateMappings( service_id, mappings_ids = mappings_ids )
                 
+                report_stage( 'writing', num_rows, started )
+                
                 num_rows_processed += num_rows
                 
                 if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
@@ -11233,22 +11955,18 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitMappingIteratorIntoAutothrottledChunks( i, MAPPINGS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
                 
-                deleted_mappings_ids = []
+                started = HydrusData.GetNowPrecise()
                 
-                num_rows = 0
+                ( deleted_mappings_ids, num_rows ) = normalise_mappings( chunk )
                 
-                for ( service_tag_id, service_hash_ids ) in chunk:
-                    
-                    tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_tag_id )
-                    hash_ids = self._CacheRepositoryNormaliseServiceHashIds( service_id, service_hash_ids )
-                    
-                    deleted_mappings_ids.append( ( tag_id, hash_ids ) )
-                    
-                    num_rows += len( service_hash_ids )
-                    
+                report_stage( 'normalising', num_rows, started )
+                
+                started = HydrusData.GetNowPrecise()
                 
                 self._UpdateMappings( service_id, deleted_mappings_ids = deleted_mappings_ids )
                 
+                report_stage( 'writing', num_rows, started )
+                
                 num_rows_processed += num_rows
                 
                 if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
@@ -11262,131 +11980,44 @@ class DB( HydrusDB.HydrusDB ):
         
         #
         
-        if 'new_parents' in content_iterator_dict:
-            
-            i = content_iterator_dict[ 'new_parents' ]
-            
-            for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, NEW_TAG_PARENTS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
-                
-                parent_ids = []
-                
-                for ( service_child_tag_id, service_parent_tag_id ) in chunk:
-                    
-                    child_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_child_tag_id )
-                    parent_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_parent_tag_id )
-                    
-                    parent_ids.append( ( child_tag_id, parent_tag_id ) )
-                    
-                
-                self._AddTagParents( service_id, parent_ids )
-                
-                num_rows_processed += len( parent_ids )
-                
-                if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
-                    
-                    return num_rows_processed
-                    
-                
-            
-            del content_iterator_dict[ 'new_parents' ]
-            
+        pair_jobs = []
         
-        #
+        pair_jobs.append( ( 'new_parents', NEW_TAG_PARENTS_INITIAL_CHUNK_SIZE, self._AddTagParents ) )
+        pair_jobs.append( ( 'deleted_parents', PAIR_ROWS_INITIAL_CHUNK_SIZE, self._DeleteTagParents ) )
+        pair_jobs.append( ( 'new_siblings', PAIR_ROWS_INITIAL_CHUNK_SIZE, self._AddTagSiblings ) )
+        pair_jobs.append( ( 'deleted_siblings', PAIR_ROWS_INITIAL_CHUNK_SIZE, self._DeleteTagSiblings ) )
         
-        if 'deleted_parents' in content_iterator_dict:
-            
-            i = content_iterator_dict[ 'deleted_parents' ]
+        for ( content_iterator_name, initial_chunk_size, write_call ) in pair_jobs:
             
-            for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, PAIR_ROWS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
-                
-                parent_ids = []
-                
-                for ( service_child_tag_id, service_parent_tag_id ) in chunk:
-                    
-                    child_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_child_tag_id )
-                    parent_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_parent_tag_id )
-                    
-                    parent_ids.append( ( child_tag_id, parent_tag_id ) )
-                    
-                
-                self._DeleteTagParents( service_id, parent_ids )
+            if content_iterator_name in content_iterator_dict:
                 
-                num_rows = len( parent_ids )
+                i = content_iterator_dict[ content_iterator_name ]
                 
-                num_rows_processed += num_rows
-                
-                if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
-                    
-                    return num_rows_processed
+                for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, initial_chunk_size, precise_time_to_stop ):
                     
-                
-            
-            del content_iterator_dict[ 'deleted_parents' ]
-            
-        
-        #
-        
-        if 'new_siblings' in content_iterator_dict:
-            
-            i = content_iterator_dict[ 'new_siblings' ]
-            
-            for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, PAIR_ROWS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
-                
-                sibling_ids = []
-                
-                for ( service_bad_tag_id, service_good_tag_id ) in chunk:
+                    started = HydrusData.GetNowPrecise()
                     
-                    bad_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_bad_tag_id )
-                    good_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_good_tag_id )
+                    pair_ids = normalise_pairs( chunk )
                     
-                    sibling_ids.append( ( bad_tag_id, good_tag_id ) )
+                    report_stage( 'normalising', len( pair_ids ), started )
                     
-                
-                self._AddTagSiblings( service_id, sibling_ids )
-                
-                num_rows = len( sibling_ids )
-                
-                num_rows_processed += num_rows
-                
-                if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
+                    started = HydrusData.GetNowPrecise()
                     
-                    return num_rows_processed
+                    write_call( service_id, pair_ids )
                     
-                
-            
-            del content_iterator_dict[ 'new_siblings' ]
-            
-        
-        #
-        
-        if 'deleted_siblings' in content_iterator_dict:
-            
-            i = content_iterator_dict[ 'deleted_siblings' ]
-            
-            for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, PAIR_ROWS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
-                
-                sibling_ids = []
-                
-                for ( service_bad_tag_id, service_good_tag_id ) in chunk:
+                    report_stage( 'writing', len( pair_ids ), started )
                     
-                    bad_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_bad_tag_id )
-                    good_tag_id = self._CacheRepositoryNormaliseServiceTagId( service_id, service_good_tag_id )
+                    num_rows_processed += len( pair_ids )
                     
-                    sibling_ids.append( ( bad_tag_id, good_tag_id ) )
+                    if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
+                        
+                        return num_rows_processed
+                        
                     
                 
-                self._DeleteTagSiblings( service_id, sibling_ids )
-                
-                num_rows_processed += len( sibling_ids )
-                
-                if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
-                    
-                    return num_rows_processed
-                    
+                del content_iterator_dict[ content_iterator_name ]
                 
             
-            del content_iterator_dict[ 'deleted_siblings' ]
-            
         
         repository_updates_table_name = GenerateRepositoryRepositoryUpdatesTableName( service_id )
         
@@ -11397,7 +12028,7 @@ class DB( HydrusDB.HydrusDB ):
         return num_rows_processed
         
     
-    def _ProcessRepositoryDefinitions( self, service_key, definition_hash, definition_iterator_dict, job_key, work_time ):
+    def _ProcessRepositoryDefinitions( self, service_key, definition_hash, definition_iterator_dict, job_key, work_time, stage_timer = None ):
         
         service_id = self._GetServiceId( service_key )
         
@@ -11413,6 +12044,8 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, 50, precise_time_to_stop ):
                 
+                started = HydrusData.GetNowPrecise()
+                
                 inserts = []
                 
                 for ( service_hash_id, hash ) in chunk:
@@ -11424,6 +12057,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 self._c.executemany( 'INSERT OR IGNORE INTO {} ( service_hash_id, hash_id ) VALUES ( ?, ? );'.format( hash_id_map_table_name ), inserts )
                 
+                if stage_timer is not None:
+                    
+                    stage_timer.AddTime( 'writing', len( inserts ), HydrusData.GetNowPrecise() - started )
+                    
+                
                 num_rows_processed += len( inserts )
                 
                 if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
@@ -11441,6 +12079,8 @@ class DB( HydrusDB.HydrusDB ):
             
             for chunk in HydrusData.SplitIteratorIntoAutothrottledChunks( i, 50, precise_time_to_stop ):
                 
+                started = HydrusData.GetNowPrecise()
+                
                 inserts = []
                 
                 for ( service_tag_id, tag ) in chunk:
@@ -11452,6 +12092,11 @@ class DB( HydrusDB.HydrusDB ):
                 
                 self._c.executemany( 'INSERT OR IGNORE INTO {} ( service_tag_id, tag_id ) VALUES ( ?, ? );'.format( tag_id_map_table_name ), inserts )
                 
+                if stage_timer is not None:
+                    
+                    stage_timer.AddTime( 'writing', len( inserts ), HydrusData.GetNowPrecise() - started )
+                    
+                
                 num_rows_processed += len( inserts )
                 
                 if HydrusData.TimeHasPassedPrecise( precise_time_to_stop ) or job_key.IsCancelled():
@@ -11529,6 +12174,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'trash_hashes': result = self._GetTrashHashes( *args, **kwargs )
         elif action == 'options': result = self._GetOptions( *args, **kwargs )
         elif action == 'pending': result = self._GetPending( *args, **kwargs )
+        elif action == 'pre_import_statuses': result = self._GetPreImportStatuses( *args, **kwargs )
         elif action == 'random_potential_duplicate_hashes': result = self._DuplicatesGetRandomPotentialDuplicateHashes( *args, **kwargs )
         elif action == 'recent_tags': result = self._GetRecentTags( *args, **kwargs )
         elif action == 'repository_progress': result = self._GetRepositoryProgress( *args, **kwargs )
@@ -11539,6 +12185,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'serialisable_named': result = self._GetJSONDumpNamed( *args, **kwargs )
         elif action == 'serialisable_names': result = self._GetJSONDumpNames( *args, **kwargs )
         elif action == 'serialisable_names_to_backup_timestamps': result = self._GetJSONDumpNamesToBackupTimestamps( *args, **kwargs )
+        elif action == 'serialisables_named': result = self._GetJSONDumpsNamed( *args, **kwargs )
         elif action == 'service_directory': result = self._GetServiceDirectoryHashes( *args, **kwargs )
         elif action == 'service_directories': result = self._GetServiceDirectoriesInfo( *args, **kwargs )
         elif action == 'service_filenames': result = self._GetServiceFilenames( *args, **kwargs )
@@ -11740,8 +12387,11 @@ class DB( HydrusDB.HydrusDB ):
         self._service_cache = {}
         
         self._weakref_media_result_cache = ClientMediaResultCache.MediaResultCache()
-        self._hash_ids_to_hashes_cache = {}
-        self._tag_ids_to_tags_cache = {}
+        self._hash_ids_to_hashes_cache = ClientDBIdCache.IdCache( 'hash id cache', self.HASH_ID_CACHE_SIZE )
+        self._tag_ids_to_tags_cache = ClientDBIdCache.IdCache( 'tag id cache', self.TAG_ID_CACHE_SIZE )
+        self._tag_bitmap_index = ClientDBTagBitmaps.TagBitmapIndex( 'tag bitmap index', self.TAG_BITMAP_INDEX_SIZE )
+        
+        self._phash_index = None
         
         ( self._null_namespace_id, ) = self._c.execute( 'SELECT namespace_id FROM namespaces WHERE namespace = ?;', ( '', ) ).fetchone()
         
@@ -12125,6 +12775,17 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _Rollback( self ):
+        
+        HydrusDB.HydrusDB._Rollback( self )
+        
+        # anything we cached in the rolled back transaction may refer to an id that no longer exists
+        
+        self._hash_ids_to_hashes_cache.Clear()
+        self._tag_ids_to_tags_cache.Clear()
+        self._tag_bitmap_index.Clear()
+        
+    
     def _SaveDirtyServices( self, dirty_services ):
         
         # if allowed to save objects
@@ -12397,6 +13058,23 @@ class DB( HydrusDB.HydrusDB ):
         self._c.executemany( 'INSERT INTO service_directory_file_map ( service_id, directory_id, hash_id ) VALUES ( ?, ?, ? );', ( ( service_id, directory_id, hash_id ) for hash_id in hash_ids ) )
         
     
+    def _SetTagBitmap( self, key, bitmap ):
+        
+        if self._is_read_only_view:
+            
+            # our snapshot may be behind the main thread, so we can only store this if nothing has changed since it began
+            
+            if self._tag_bitmap_index_generation is not None:
+                
+                self._tag_bitmap_index.SetBitmap( key, bitmap, generation = self._tag_bitmap_index_generation )
+                
+            
+        else:
+            
+            self._tag_bitmap_index.SetBitmap( key, bitmap )
+            
+        
+    
     def _SetYAMLDump( self, dump_type, dump_name, data ):
         
         if dump_type == YAML_DUMP_ID_LOCAL_BOORU:
@@ -12781,15 +13459,15 @@ class DB( HydrusDB.HydrusDB ):
                 
                 i = 0
                 
-                self._tag_ids_to_tags_cache = {}
+                self._tag_ids_to_tags_cache.Clear()
                 
                 for block_of_tag_ids in HydrusData.SplitListIntoChunks( tag_ids, 1000 ):
                     
                     self._controller.pub( 'splash_set_status_subtext', 'generating new local tag cache: {}'.format( HydrusData.ConvertValueRangeToPrettyString( i, num_to_do ) ) )
                     
-                    self._PopulateTagIdsToTagsCache( block_of_tag_ids )
+                    tag_ids_to_tags = self._GetTagIdsToTags( block_of_tag_ids )
                     
-                    self._c.executemany( 'INSERT OR IGNORE INTO local_tags_cache ( tag_id, tag ) VALUES ( ?, ? );', ( ( tag_id, self._tag_ids_to_tags_cache[ tag_id ] ) for tag_id in block_of_tag_ids ) )
+                    self._c.executemany( 'INSERT OR IGNORE INTO local_tags_cache ( tag_id, tag ) VALUES ( ?, ? );', tag_ids_to_tags.items() )
                     
                     i += 1000
                     
@@ -14896,6 +15574,9 @@ class DB( HydrusDB.HydrusDB ):
                 combined_files_pending_counter[ tag_id ] -= num_pending_deleted
                 combined_files_current_counter[ tag_id ] += num_current_inserted
                 
+                self._tag_bitmap_index.AddIds( ( HC.CONTENT_TYPE_MAPPINGS, tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ), hash_ids )
+                self._tag_bitmap_index.DeleteIds( ( HC.CONTENT_TYPE_MAPPINGS, tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ), hash_ids )
+                
             
             for file_service_id in file_service_ids:
                 
@@ -14925,6 +15606,8 @@ class DB( HydrusDB.HydrusDB ):
                 
                 combined_files_current_counter[ tag_id ] -= num_current_deleted
                 
+                self._tag_bitmap_index.DeleteIds( ( HC.CONTENT_TYPE_MAPPINGS, tag_service_id, HC.CONTENT_STATUS_CURRENT, tag_id ), hash_ids )
+                
             
             for file_service_id in file_service_ids:
                 
@@ -14960,6 +15643,8 @@ class DB( HydrusDB.HydrusDB ):
                 
                 combined_files_pending_counter[ tag_id ] += num_pending_inserted
                 
+                self._tag_bitmap_index.AddIds( ( HC.CONTENT_TYPE_MAPPINGS, tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ), hash_ids )
+                
             
             for file_service_id in file_service_ids:
                 
@@ -14979,6 +15664,8 @@ class DB( HydrusDB.HydrusDB ):
                 
                 combined_files_pending_counter[ tag_id ] -= num_pending_deleted
                 
+                self._tag_bitmap_index.DeleteIds( ( HC.CONTENT_TYPE_MAPPINGS, tag_service_id, HC.CONTENT_STATUS_PENDING, tag_id ), hash_ids )
+                
             
             for file_service_id in file_service_ids:
                 
@@ -0,0 +1,287 @@
+import array
+import threading
+
+from hydrus.core import HydrusData
+
+# rough per-entry cost of our two dict entries, the slot arrays and the id int, on top of the value itself
+ENTRY_OVERHEAD = 200
+
+class IdCache( object ):
+    
+    # a memory-budgeted two-way map of db ids to their hashes or tags
+    # entries live in slots, and a clock hand sweeps the slots to evict anything that has not been used since it last came round
+    # this keeps a good hit rate on a big client, rather than throwing everything away when we pass a size limit
+    
+    def __init__( self, name, max_memory ):
+        
+        self._name = name
+        self._max_memory = max_memory
+        
+        self._lock = threading.Lock()
+        
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        
+        self._Reset()
+        
+    
+    def _Add( self, id, value ):
+        
+        if id in self._ids_to_slots:
+            
+            slot = self._ids_to_slots[ id ]
+            
+            if self._slot_values[ slot ] == value:
+                
+                self._slot_referenced[ slot ] = 1
+                
+                return
+                
+            
+            self._Delete( slot )
+            
+        
+        entry_size = ENTRY_OVERHEAD + len( value )
+        
+        while self._memory_used + entry_size > self._max_memory and len( self._ids_to_slots ) > 0:
+            
+            self._EvictOne()
+            
+        
+        if len( self._free_slots ) > 0:
+            
+            slot = self._free_slots.pop()
+            
+            self._slot_ids[ slot ] = id
+            self._slot_values[ slot ] = value
+            self._slot_referenced[ slot ] = 0
+            
+        else:
+            
+            slot = len( self._slot_ids )
+            
+            self._slot_ids.append( id )
+            self._slot_values.append( value )
+            self._slot_referenced.append( 0 )
+            
+        
+        self._ids_to_slots[ id ] = slot
+        self._values_to_slots[ value ] = slot
+        
+        self._memory_used += entry_size
+        
+    
+    def _Delete( self, slot ):
+        
+        id = self._slot_ids[ slot ]
+        value = self._slot_values[ slot ]
+        
+        del self._ids_to_slots[ id ]
+        
+        if self._values_to_slots.get( value, None ) == slot:
+            
+            del self._values_to_slots[ value ]
+            
+        
+        self._slot_ids[ slot ] = -1
+        self._slot_values[ slot ] = None
+        self._slot_referenced[ slot ] = 0
+        
+        self._free_slots.append( slot )
+        
+        self._memory_used -= ENTRY_OVERHEAD + len( value )
+        
+    
+    def _EvictOne( self ):
+        
+        num_slots = len( self._slot_ids )
+        
+        while True:
+            
+            if self._clock_hand >= num_slots:
+                
+                self._clock_hand = 0
+                
+            
+            slot = self._clock_hand
+            
+            self._clock_hand += 1
+            
+            if self._slot_ids[ slot ] == -1:
+                
+                continue
+                
+            
+            if self._slot_referenced[ slot ] == 1:
+                
+                self._slot_referenced[ slot ] = 0
+                
+            else:
+                
+                self._Delete( slot )
+                
+                self._evictions += 1
+                
+                return
+                
+            
+        
+    
+    def _Reset( self ):
+        
+        self._ids_to_slots = {}
+        self._values_to_slots = {}
+        
+        self._slot_ids = array.array( 'q' )
+        self._slot_values = []
+        self._slot_referenced = bytearray()
+        
+        self._free_slots = []
+        
+        self._clock_hand = 0
+        self._memory_used = 0
+        
+    
+    def AddPairs( self, ids_and_values ):
+        
+        with self._lock:
+            
+            for ( id, value ) in ids_and_values:
+                
+                self._Add( id, value )
+                
+            
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._Reset()
+            
+        
+    
+    def GetId( self, value ):
+        
+        with self._lock:
+            
+            slot = self._values_to_slots.get( value, None )
+            
+            if slot is None:
+                
+                self._misses += 1
+                
+                return None
+                
+            
+            self._hits += 1
+            
+            self._slot_referenced[ slot ] = 1
+            
+            return self._slot_ids[ slot ]
+            
+        
+    
+    def GetIdsToValues( self, ids ):
+        
+        # returns what we have, and what the caller will need to fetch
+        
+        ids_to_values = {}
+        uncached_ids = set()
+        
+        with self._lock:
+            
+            for id in ids:
+                
+                slot = self._ids_to_slots.get( id, None )
+                
+                if slot is None:
+                    
+                    uncached_ids.add( id )
+                    
+                else:
+                    
+                    self._slot_referenced[ slot ] = 1
+                    
+                    ids_to_values[ id ] = self._slot_values[ slot ]
+                    
+                
+            
+            self._hits += len( ids_to_values )
+            self._misses += len( uncached_ids )
+            
+        
+        return ( ids_to_values, uncached_ids )
+        
+    
+    def GetReportText( self ):
+        
+        with self._lock:
+            
+            num_lookups = self._hits + self._misses
+            
+            if num_lookups == 0:
+                
+                hit_rate = 'no lookups'
+                
+            else:
+                
+                hit_rate = '{} hit rate'.format( HydrusData.ConvertFloatToPercentage( self._hits / num_lookups ) )
+                
+            
+            return '{}: {} ({} hits, {} misses, {} evictions), {} entries using about {}'.format( self._name, hit_rate, HydrusData.ToHumanInt( self._hits ), HydrusData.ToHumanInt( self._misses ), HydrusData.ToHumanInt( self._evictions ), HydrusData.ToHumanInt( len( self._ids_to_slots ) ), HydrusData.ToHumanBytes( self._memory_used ) )
+            
+        
+    
+    def GetValue( self, id ):
+        
+        with self._lock:
+            
+            slot = self._ids_to_slots.get( id, None )
+            
+            if slot is None:
+                
+                self._misses += 1
+                
+                return None
+                
+            
+            self._hits += 1
+            
+            self._slot_referenced[ slot ] = 1
+            
+            return self._slot_values[ slot ]
+            
+        
+    
+    def GetValuesToIds( self, values ):
+        
+        values_to_ids = {}
+        uncached_values = set()
+        
+        with self._lock:
+            
+            for value in values:
+                
+                slot = self._values_to_slots.get( value, None )
+                
+                if slot is None:
+                    
+                    uncached_values.add( value )
+                    
+                else:
+                    
+                    self._slot_referenced[ slot ] = 1
+                    
+                    values_to_ids[ value ] = self._slot_ids[ slot ]
+                    
+                
+            
+            self._hits += len( values_to_ids )
+            self._misses += len( uncached_values )
+            
+        
+        return ( values_to_ids, uncached_values )
+        
+    
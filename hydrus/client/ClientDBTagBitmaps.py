@@ -0,0 +1,200 @@
+import collections
+import threading
+
+from hydrus.core import HydrusData
+
+ROARING_OK = False
+
+try:
+    
+    from pyroaring import BitMap
+    
+    ROARING_OK = True
+    
+except Exception as e:
+    
+    pass
+    
+
+# rough cost of the dict entry and the BitMap object itself, on top of its containers
+ENTRY_OVERHEAD = 200
+
+def GetBitmapMemoryUsage( bitmap ):
+    
+    statistics = bitmap.get_statistics()
+    
+    return ENTRY_OVERHEAD + statistics[ 'n_bytes_array_containers' ] + statistics[ 'n_bytes_run_containers' ] + statistics[ 'n_bytes_bitset_containers' ]
+    
+
+class TagBitmapIndex( object ):
+    
+    # a memory-budgeted cache of compressed hash_id bitmaps, one per ( status, tag service, tag ) posting list and one per file domain
+    # bitmaps are fetched from the db the first time they are searched and then kept up to date as mappings and files change
+    # anything not in here is simply looked up again, so updates for keys we do not hold are ignored
+    # read connections see an older snapshot than the main thread, so every change bumps a generation, and a read may only store what it fetched if nothing changed since its snapshot began
+    
+    def __init__( self, name, max_memory ):
+        
+        self._name = name
+        self._max_memory = max_memory
+        
+        self._lock = threading.Lock()
+        
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        
+        self._generation = 0
+        self._committed_generation = 0
+        
+        self._Reset()
+        
+    
+    def _Reset( self ):
+        
+        self._keys_to_bitmaps = collections.OrderedDict()
+        self._keys_to_memory_usage = {}
+        
+        self._memory_used = 0
+        
+    
+    def _UpdateMemoryUsage( self, key ):
+        
+        bitmap = self._keys_to_bitmaps[ key ]
+        
+        memory_usage = GetBitmapMemoryUsage( bitmap )
+        
+        self._memory_used += memory_usage - self._keys_to_memory_usage.get( key, 0 )
+        
+        self._keys_to_memory_usage[ key ] = memory_usage
+        
+    
+    def AddIds( self, key, ids ):
+        
+        with self._lock:
+            
+            self._generation += 1
+            
+            if key in self._keys_to_bitmaps:
+                
+                self._keys_to_bitmaps[ key ].update( BitMap( ids ) )
+                
+                self._UpdateMemoryUsage( key )
+                
+            
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._generation += 1
+            
+            self._Reset()
+            
+        
+    
+    def DeleteIds( self, key, ids ):
+        
+        with self._lock:
+            
+            self._generation += 1
+            
+            if key in self._keys_to_bitmaps:
+                
+                self._keys_to_bitmaps[ key ].difference_update( BitMap( ids ) )
+                
+                self._UpdateMemoryUsage( key )
+                
+            
+        
+    
+    def GetBitmap( self, key ):
+        
+        # the caller must not alter what it gets, so do bitmap operations that make new objects, like a & b, rather than a &= b
+        
+        with self._lock:
+            
+            if key in self._keys_to_bitmaps:
+                
+                self._hits += 1
+                
+                self._keys_to_bitmaps.move_to_end( key )
+                
+                return self._keys_to_bitmaps[ key ]
+                
+            
+            self._misses += 1
+            
+            return None
+            
+        
+    
+    def GetCommittedGeneration( self ):
+        
+        # a read that starts its snapshot now will see everything up to this generation, or None if the main thread has uncommitted changes
+        
+        with self._lock:
+            
+            if self._generation == self._committed_generation:
+                
+                return self._generation
+                
+            
+            return None
+            
+        
+    
+    def GetReportText( self ):
+        
+        with self._lock:
+            
+            num_lookups = self._hits + self._misses
+            
+            if num_lookups == 0:
+                
+                hit_rate = 'no lookups'
+                
+            else:
+                
+                hit_rate = '{} hit rate'.format( HydrusData.ConvertFloatToPercentage( self._hits / num_lookups ) )
+                
+            
+            return '{}: {} ({} hits, {} misses, {} evictions), {} bitmaps using about {}'.format( self._name, hit_rate, HydrusData.ToHumanInt( self._hits ), HydrusData.ToHumanInt( self._misses ), HydrusData.ToHumanInt( self._evictions ), HydrusData.ToHumanInt( len( self._keys_to_bitmaps ) ), HydrusData.ToHumanBytes( self._memory_used ) )
+            
+        
+    
+    def NotifyCommitted( self ):
+        
+        with self._lock:
+            
+            self._committed_generation = self._generation
+            
+        
+    
+    def SetBitmap( self, key, bitmap, generation = None ):
+        
+        with self._lock:
+            
+            if generation is not None and generation != self._generation:
+                
+                return
+                
+            
+            self._keys_to_bitmaps[ key ] = bitmap
+            
+            self._keys_to_bitmaps.move_to_end( key )
+            
+            self._UpdateMemoryUsage( key )
+            
+            while self._memory_used > self._max_memory and len( self._keys_to_bitmaps ) > 1:
+                
+                ( evicted_key, evicted_bitmap ) = self._keys_to_bitmaps.popitem( last = False )
+                
+                self._memory_used -= self._keys_to_memory_usage.pop( evicted_key )
+                
+                self._evictions += 1
+                
+            
+        
+    
@@ -275,7 +275,7 @@ class HydrusResourceBooruFile( HydrusResourceBooru ):
         
         path = client_files_manager.GetFilePath( hash, mime )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, etag = hash.hex() )
         
         return response_context
         
@@ -470,6 +470,8 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
         
         response_context_mime = HC.IMAGE_PNG
         
+        etag = None
+        
         if mime in HC.MIMES_WITH_THUMBNAILS:
             
             client_files_manager = HG.client_controller.client_files_manager
@@ -478,6 +480,8 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
             
             response_context_mime = HC.APPLICATION_UNKNOWN
             
+            etag = HydrusServerResources.GenerateThumbnailETag( hash, path )
+            
         elif mime in HC.AUDIO:
             
             path = os.path.join( HC.STATIC_DIR, 'audio.png' )
@@ -495,7 +499,7 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
             path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = response_context_mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = response_context_mime, path = path, etag = etag )
         
         return response_context
         
@@ -1386,7 +1390,7 @@ class HydrusResourceClientAPIRestrictedGetFilesGetFile( HydrusResourceClientAPIR
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path, etag = hash.hex() )
         
         return response_context
         
@@ -1564,7 +1568,9 @@ class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClien
             raise HydrusExceptions.NotFoundException( 'Could not find that file!' )
             
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path )
+        etag = HydrusServerResources.GenerateThumbnailETag( media_result.GetHash(), path )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_OCTET_STREAM, path = path, etag = etag )
         
         return response_context
         
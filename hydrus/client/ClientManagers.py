@@ -17,7 +17,7 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTags
 
 # now let's fill out grandparents
-def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents ):
+def BuildChildrenToParents( simple_children_to_parents, children = None ):
     
     # important thing here, and reason why it is recursive, is because we want to preserve the parent-grandparent interleaving in list order
     def AddParentsAndGrandparents( simple_children_to_parents, this_childs_parents, parents ):
@@ -39,20 +39,34 @@ def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_pare
             
         
     
-    service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
-    
-    for ( service_key, simple_children_to_parents ) in service_keys_to_simple_children_to_parents.items():
+    if children is None:
+        
+        children = list( simple_children_to_parents.keys() )
         
-        children_to_parents = service_keys_to_children_to_parents[ service_key ]
+    
+    children_to_parents = HydrusData.default_dict_list()
+    
+    for child in children:
         
-        for ( child, parents ) in list( simple_children_to_parents.items() ):
+        if child in simple_children_to_parents:
             
             this_childs_parents = children_to_parents[ child ]
             
-            AddParentsAndGrandparents( simple_children_to_parents, this_childs_parents, parents )
+            AddParentsAndGrandparents( simple_children_to_parents, this_childs_parents, simple_children_to_parents[ child ] )
             
         
     
+    return children_to_parents
+    
+def BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents ):
+    
+    service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
+    
+    for ( service_key, simple_children_to_parents ) in service_keys_to_simple_children_to_parents.items():
+        
+        service_keys_to_children_to_parents[ service_key ] = BuildChildrenToParents( simple_children_to_parents )
+        
+    
     return service_keys_to_children_to_parents
     
 def BuildServiceKeysToSimpleChildrenToParents( service_keys_to_pairs_flat ):
@@ -631,6 +645,169 @@ class ServicesManager( object ):
             
         
     
+class TagParentsGraph( object ):
+    
+    # the child -> parent graph for one service, with the grandparent lists kept up to date as single pairs come and go
+    
+    def __init__( self, pairs ):
+        
+        self._simple_children_to_parents = BuildSimpleChildrenToParents( pairs )
+        self._simple_parents_to_children = HydrusData.default_dict_set()
+        
+        for ( child, parents ) in self._simple_children_to_parents.items():
+            
+            for parent in parents:
+                
+                self._simple_parents_to_children[ parent ].add( child )
+                
+            
+        
+        # pairs that would make a loop right now. they get another go whenever a pair is deleted
+        self._looping_pairs = { ( child, parent ) for ( child, parent ) in pairs if parent not in self._simple_children_to_parents.get( child, () ) }
+        
+        self._children_to_parents = BuildChildrenToParents( self._simple_children_to_parents )
+        
+    
+    def _AddSimplePair( self, child, parent ):
+        
+        self._simple_children_to_parents[ child ].add( parent )
+        self._simple_parents_to_children[ parent ].add( child )
+        
+    
+    def _GetDescendants( self, tag ):
+        
+        descendants = set()
+        
+        search_tags = { tag }
+        
+        while len( search_tags ) > 0:
+            
+            next_search_tags = set()
+            
+            for search_tag in search_tags:
+                
+                for child in self._simple_parents_to_children.get( search_tag, () ):
+                    
+                    if child not in descendants:
+                        
+                        descendants.add( child )
+                        next_search_tags.add( child )
+                        
+                    
+                
+            
+            search_tags = next_search_tags
+            
+        
+        return descendants
+        
+    
+    def _PairMakesLoop( self, child, parent ):
+        
+        return child == parent or ( parent in self._simple_children_to_parents and LoopInSimpleChildrenToParents( self._simple_children_to_parents, child, parent ) )
+        
+    
+    def _RegenerateChildren( self, children ):
+        
+        new_children_to_parents = BuildChildrenToParents( self._simple_children_to_parents, children )
+        
+        for child in children:
+            
+            if child in new_children_to_parents:
+                
+                self._children_to_parents[ child ] = new_children_to_parents[ child ]
+                
+            elif child in self._children_to_parents:
+                
+                del self._children_to_parents[ child ]
+                
+            
+        
+    
+    def AddPair( self, child, parent ):
+        
+        if parent in self._simple_children_to_parents.get( child, () ) or ( child, parent ) in self._looping_pairs:
+            
+            return
+            
+        
+        if self._PairMakesLoop( child, parent ):
+            
+            self._looping_pairs.add( ( child, parent ) )
+            
+            return
+            
+        
+        self._AddSimplePair( child, parent )
+        
+        # only the child and everything under it can have new grandparents
+        
+        affected_children = self._GetDescendants( child )
+        
+        affected_children.add( child )
+        
+        self._RegenerateChildren( affected_children )
+        
+    
+    def DeletePair( self, child, parent ):
+        
+        if ( child, parent ) in self._looping_pairs:
+            
+            self._looping_pairs.discard( ( child, parent ) )
+            
+            return
+            
+        
+        if parent not in self._simple_children_to_parents.get( child, () ):
+            
+            return
+            
+        
+        affected_children = self._GetDescendants( child )
+        
+        affected_children.add( child )
+        
+        self._simple_children_to_parents[ child ].discard( parent )
+        self._simple_parents_to_children[ parent ].discard( child )
+        
+        if len( self._simple_children_to_parents[ child ] ) == 0:
+            
+            del self._simple_children_to_parents[ child ]
+            
+        
+        if len( self._simple_parents_to_children[ parent ] ) == 0:
+            
+            del self._simple_parents_to_children[ parent ]
+            
+        
+        for ( looping_child, looping_parent ) in list( self._looping_pairs ):
+            
+            if not self._PairMakesLoop( looping_child, looping_parent ):
+                
+                self._looping_pairs.discard( ( looping_child, looping_parent ) )
+                
+                self._AddSimplePair( looping_child, looping_parent )
+                
+                affected_children.update( self._GetDescendants( looping_child ) )
+                affected_children.add( looping_child )
+                
+            
+        
+        self._RegenerateChildren( affected_children )
+        
+    
+    def GetParents( self, tag ):
+        
+        if tag in self._children_to_parents:
+            
+            return self._children_to_parents[ tag ]
+            
+        else:
+            
+            return []
+            
+        
+    
 class TagParentsManager( object ):
     
     def __init__( self, controller ):
@@ -640,7 +817,9 @@ class TagParentsManager( object ):
         self._dirty = False
         self._refresh_job = None
         
-        self._service_keys_to_children_to_parents = collections.defaultdict( HydrusData.default_dict_list )
+        self._service_keys_to_children_to_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._service_keys_to_collapsed_pair_counts = collections.defaultdict( collections.Counter )
+        self._service_keys_to_graphs = {}
         
         self._RefreshParents()
         
@@ -649,15 +828,28 @@ class TagParentsManager( object ):
         self._controller.sub( self, 'NotifyNewParents', 'notify_new_parents' )
         
     
+    def _GetParents( self, service_key, tag ):
+        
+        if service_key in self._service_keys_to_graphs:
+            
+            return self._service_keys_to_graphs[ service_key ].GetParents( tag )
+            
+        else:
+            
+            return []
+            
+        
+    
     def _RefreshParents( self ):
         
         service_keys_to_statuses_to_pairs = self._controller.Read( 'tag_parents' )
         
-        # first collapse siblings
-        
         siblings_manager = self._controller.tag_siblings_manager
         
-        collapsed_service_keys_to_statuses_to_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._service_keys_to_children_to_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._service_keys_to_collapsed_pair_counts = collections.defaultdict( collections.Counter )
+        
+        combined_collapsed_pair_counts = self._service_keys_to_collapsed_pair_counts[ CC.COMBINED_TAG_SERVICE_KEY ]
         
         for ( service_key, statuses_to_pairs ) in service_keys_to_statuses_to_pairs.items():
             
@@ -666,41 +858,135 @@ class TagParentsManager( object ):
                 continue
                 
             
-            for ( status, pairs ) in statuses_to_pairs.items():
+            # collapse current and pending, and then siblings
+            
+            pairs_flat = statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_pairs[ HC.CONTENT_STATUS_PENDING ] )
+            
+            pairs_to_collapsed_pairs = siblings_manager.GetPairsToCollapsedPairs( service_key, pairs_flat )
+            
+            children_to_pairs = self._service_keys_to_children_to_pairs[ service_key ]
+            collapsed_pair_counts = self._service_keys_to_collapsed_pair_counts[ service_key ]
+            
+            for ( pair, collapsed_pair ) in pairs_to_collapsed_pairs.items():
                 
-                pairs = siblings_manager.CollapsePairs( service_key, pairs )
+                children_to_pairs[ pair[0] ].add( pair )
                 
-                collapsed_service_keys_to_statuses_to_pairs[ service_key ][ status ] = pairs
+                collapsed_pair_counts[ collapsed_pair ] += 1
                 
             
+            # the combined tag service counts how many services have each pair
+            
+            combined_collapsed_pair_counts.update( collapsed_pair_counts.keys() )
+            
         
-        # now collapse current and pending
+        self._service_keys_to_graphs = { service_key : TagParentsGraph( list( collapsed_pair_counts.keys() ) ) for ( service_key, collapsed_pair_counts ) in self._service_keys_to_collapsed_pair_counts.items() }
         
-        service_keys_to_pairs_flat = HydrusData.default_dict_set()
+    
+    def _UpdateParents( self, service_keys_to_children_and_pairs ):
         
-        for ( service_key, statuses_to_pairs ) in collapsed_service_keys_to_statuses_to_pairs.items():
-            
-            pairs_flat = statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_pairs[ HC.CONTENT_STATUS_PENDING ] )
-            
-            service_keys_to_pairs_flat[ service_key ] = pairs_flat
-            
+        # each update has some child tags and the full current and pending pairs for those children on that service
         
-        # now create the combined tag service
+        siblings_manager = self._controller.tag_siblings_manager
         
-        combined_pairs_flat = set()
+        combined_collapsed_pair_counts = self._service_keys_to_collapsed_pair_counts[ CC.COMBINED_TAG_SERVICE_KEY ]
         
-        for pairs_flat in service_keys_to_pairs_flat.values():
+        if CC.COMBINED_TAG_SERVICE_KEY not in self._service_keys_to_graphs:
             
-            combined_pairs_flat.update( pairs_flat )
+            self._service_keys_to_graphs[ CC.COMBINED_TAG_SERVICE_KEY ] = TagParentsGraph( [] )
             
         
-        service_keys_to_pairs_flat[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_pairs_flat
-        
-        #
+        combined_graph = self._service_keys_to_graphs[ CC.COMBINED_TAG_SERVICE_KEY ]
         
-        service_keys_to_simple_children_to_parents = BuildServiceKeysToSimpleChildrenToParents( service_keys_to_pairs_flat )
-        
-        self._service_keys_to_children_to_parents = BuildServiceKeysToChildrenToParents( service_keys_to_simple_children_to_parents )
+        for ( service_key, ( children, pairs ) ) in service_keys_to_children_and_pairs.items():
+            
+            if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                
+                continue
+                
+            
+            children_to_pairs = self._service_keys_to_children_to_pairs[ service_key ]
+            
+            existing_pairs = { pair for child in children for pair in children_to_pairs.get( child, () ) }
+            
+            pairs = set( pairs )
+            
+            deletee_pairs = existing_pairs.difference( pairs )
+            addee_pairs = pairs.difference( existing_pairs )
+            
+            if len( deletee_pairs ) == 0 and len( addee_pairs ) == 0:
+                
+                continue
+                
+            
+            pairs_to_collapsed_pairs = siblings_manager.GetPairsToCollapsedPairs( service_key, deletee_pairs.union( addee_pairs ) )
+            
+            collapsed_pair_counts = self._service_keys_to_collapsed_pair_counts[ service_key ]
+            
+            if service_key not in self._service_keys_to_graphs:
+                
+                self._service_keys_to_graphs[ service_key ] = TagParentsGraph( [] )
+                
+            
+            graph = self._service_keys_to_graphs[ service_key ]
+            
+            for pair in deletee_pairs:
+                
+                child = pair[0]
+                
+                children_to_pairs[ child ].discard( pair )
+                
+                if len( children_to_pairs[ child ] ) == 0:
+                    
+                    del children_to_pairs[ child ]
+                    
+                
+                collapsed_pair = pairs_to_collapsed_pairs[ pair ]
+                
+                if collapsed_pair not in collapsed_pair_counts:
+                    
+                    continue
+                    
+                
+                collapsed_pair_counts[ collapsed_pair ] -= 1
+                
+                if collapsed_pair_counts[ collapsed_pair ] == 0:
+                    
+                    del collapsed_pair_counts[ collapsed_pair ]
+                    
+                    graph.DeletePair( *collapsed_pair )
+                    
+                    combined_collapsed_pair_counts[ collapsed_pair ] -= 1
+                    
+                    if combined_collapsed_pair_counts[ collapsed_pair ] <= 0:
+                        
+                        del combined_collapsed_pair_counts[ collapsed_pair ]
+                        
+                        combined_graph.DeletePair( *collapsed_pair )
+                        
+                    
+                
+            
+            for pair in addee_pairs:
+                
+                children_to_pairs[ pair[0] ].add( pair )
+                
+                collapsed_pair = pairs_to_collapsed_pairs[ pair ]
+                
+                collapsed_pair_counts[ collapsed_pair ] += 1
+                
+                if collapsed_pair_counts[ collapsed_pair ] == 1:
+                    
+                    graph.AddPair( *collapsed_pair )
+                    
+                    combined_collapsed_pair_counts[ collapsed_pair ] += 1
+                    
+                    if combined_collapsed_pair_counts[ collapsed_pair ] == 1:
+                        
+                        combined_graph.AddPair( *collapsed_pair )
+                        
+                    
+                
+            
         
     
     def ExpandPredicates( self, service_key, predicates, service_strict = False ):
@@ -722,7 +1008,7 @@ class TagParentsManager( object ):
                     
                     tag = predicate.GetValue()
                     
-                    parents = self._service_keys_to_children_to_parents[ service_key ][ tag ]
+                    parents = self._GetParents( service_key, tag )
                     
                     for parent in parents:
                         
@@ -750,7 +1036,7 @@ class TagParentsManager( object ):
             
             for tag in tags:
                 
-                tags_results.update( self._service_keys_to_children_to_parents[ service_key ][ tag ] )
+                tags_results.update( self._GetParents( service_key, tag ) )
                 
             
             return tags_results
@@ -766,14 +1052,24 @@ class TagParentsManager( object ):
         
         with self._lock:
             
-            return self._service_keys_to_children_to_parents[ service_key ][ tag ]
+            return self._GetParents( service_key, tag )
             
         
     
-    def NotifyNewParents( self ):
+    def NotifyNewParents( self, service_keys_to_children_and_pairs = None ):
         
         with self._lock:
             
+            # a small edit comes with its pairs, so we can update just that bit of the graph right now
+            # if a full refresh is already coming, it will pick the edit up anyway
+            
+            if service_keys_to_children_and_pairs is not None and not self._dirty:
+                
+                self._UpdateParents( service_keys_to_children_and_pairs )
+                
+                return
+                
+            
             self._dirty = True
             
             if self._refresh_job is not None:
@@ -810,6 +1106,9 @@ class TagSiblingsManager( object ):
         self._service_keys_to_siblings = collections.defaultdict( dict )
         self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
         
+        self._service_keys_to_tags_to_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._local_tag_service_keys = set()
+        
         self._RefreshSiblings()
         
         self._lock = threading.Lock()
@@ -829,6 +1128,9 @@ class TagSiblingsManager( object ):
         self._service_keys_to_siblings = collections.defaultdict( dict )
         self._service_keys_to_reverse_lookup = collections.defaultdict( dict )
         
+        self._service_keys_to_tags_to_pairs = collections.defaultdict( HydrusData.default_dict_set )
+        self._local_tag_service_keys = set()
+        
         local_tags_pairs = set()
         
         tag_repo_pairs = set()
@@ -843,6 +1145,8 @@ class TagSiblingsManager( object ):
             
             if service.GetServiceType() == HC.LOCAL_TAG:
                 
+                self._local_tag_service_keys.add( service_key )
+                
                 local_tags_pairs.update( all_pairs )
                 
             else:
@@ -850,6 +1154,16 @@ class TagSiblingsManager( object ):
                 tag_repo_pairs.update( all_pairs )
                 
             
+            tags_to_pairs = self._service_keys_to_tags_to_pairs[ service_key ]
+            
+            for pair in all_pairs:
+                
+                ( bad, good ) = pair
+                
+                tags_to_pairs[ bad ].add( pair )
+                tags_to_pairs[ good ].add( pair )
+                
+            
             siblings = CollapseTagSiblingPairs( [ all_pairs ] )
             
             self._service_keys_to_siblings[ service_key ] = siblings
@@ -878,6 +1192,187 @@ class TagSiblingsManager( object ):
         self._service_keys_to_reverse_lookup[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_reverse_lookup
         
     
+    def _RegenerateSiblingComponents( self, service_key, tags ):
+        
+        # a tag's ideal sibling only depends on the pairs connected to it, so we only have to redo the connected groups these tags are in
+        
+        if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            service_keys_and_tags_to_pairs = list( self._service_keys_to_tags_to_pairs.items() )
+            
+        else:
+            
+            service_keys_and_tags_to_pairs = [ ( service_key, self._service_keys_to_tags_to_pairs[ service_key ] ) ]
+            
+        
+        component_tags = set()
+        
+        search_tags = set( tags )
+        
+        while len( search_tags ) > 0:
+            
+            tag = search_tags.pop()
+            
+            component_tags.add( tag )
+            
+            for ( source_service_key, tags_to_pairs ) in service_keys_and_tags_to_pairs:
+                
+                for pair in tags_to_pairs.get( tag, () ):
+                    
+                    for connected_tag in pair:
+                        
+                        if connected_tag not in component_tags:
+                            
+                            search_tags.add( connected_tag )
+                            
+                        
+                    
+                
+            
+        
+        local_tags_pairs = set()
+        
+        tag_repo_pairs = set()
+        
+        for ( source_service_key, tags_to_pairs ) in service_keys_and_tags_to_pairs:
+            
+            if source_service_key in self._local_tag_service_keys:
+                
+                component_pairs = local_tags_pairs
+                
+            else:
+                
+                component_pairs = tag_repo_pairs
+                
+            
+            for tag in component_tags:
+                
+                component_pairs.update( tags_to_pairs.get( tag, () ) )
+                
+            
+        
+        if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+            
+            new_siblings = CollapseTagSiblingPairs( [ local_tags_pairs, tag_repo_pairs ] )
+            
+        else:
+            
+            new_siblings = CollapseTagSiblingPairs( [ local_tags_pairs.union( tag_repo_pairs ) ] )
+            
+        
+        siblings = self._service_keys_to_siblings[ service_key ]
+        reverse_lookup = self._service_keys_to_reverse_lookup[ service_key ]
+        
+        for tag in component_tags:
+            
+            if tag in siblings:
+                
+                del siblings[ tag ]
+                
+            
+            if tag in reverse_lookup:
+                
+                del reverse_lookup[ tag ]
+                
+            
+        
+        for ( bad, good ) in new_siblings.items():
+            
+            siblings[ bad ] = good
+            
+            if good not in reverse_lookup:
+                
+                reverse_lookup[ good ] = []
+                
+            
+            reverse_lookup[ good ].append( bad )
+            
+        
+    
+    def _UpdateSiblings( self, service_keys_to_bad_tags_and_pairs ):
+        
+        # each update has some bad tags and the full current and pending pairs for those bad tags on that service
+        
+        all_affected_tags = set()
+        
+        for ( service_key, ( bad_tags, pairs ) ) in service_keys_to_bad_tags_and_pairs.items():
+            
+            if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                
+                continue
+                
+            
+            tags_to_pairs = self._service_keys_to_tags_to_pairs[ service_key ]
+            
+            existing_pairs = { pair for bad_tag in bad_tags for pair in tags_to_pairs.get( bad_tag, () ) if pair[0] == bad_tag }
+            
+            pairs = set( pairs )
+            
+            deletee_pairs = existing_pairs.difference( pairs )
+            addee_pairs = pairs.difference( existing_pairs )
+            
+            if len( deletee_pairs ) == 0 and len( addee_pairs ) == 0:
+                
+                continue
+                
+            
+            if service_key not in self._local_tag_service_keys:
+                
+                try:
+                    
+                    service = self._controller.services_manager.GetService( service_key )
+                    
+                except HydrusExceptions.DataMissing:
+                    
+                    continue
+                    
+                
+                if service.GetServiceType() == HC.LOCAL_TAG:
+                    
+                    self._local_tag_service_keys.add( service_key )
+                    
+                
+            
+            affected_tags = set()
+            
+            for pair in deletee_pairs:
+                
+                for tag in pair:
+                    
+                    tags_to_pairs[ tag ].discard( pair )
+                    
+                    if len( tags_to_pairs[ tag ] ) == 0:
+                        
+                        del tags_to_pairs[ tag ]
+                        
+                    
+                    affected_tags.add( tag )
+                    
+                
+            
+            for pair in addee_pairs:
+                
+                for tag in pair:
+                    
+                    tags_to_pairs[ tag ].add( pair )
+                    
+                    affected_tags.add( tag )
+                    
+                
+            
+            self._RegenerateSiblingComponents( service_key, affected_tags )
+            
+            all_affected_tags.update( affected_tags )
+            
+        
+        if len( all_affected_tags ) > 0:
+            
+            self._RegenerateSiblingComponents( CC.COMBINED_TAG_SERVICE_KEY, all_affected_tags )
+            
+        
+        return len( all_affected_tags ) > 0
+        
+    
     def CollapsePredicates( self, service_key, predicates, service_strict = False ):
         
         if not service_strict and self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
@@ -1078,6 +1573,67 @@ class TagSiblingsManager( object ):
         return ( ideal_sibling_predicate, other_sibling_predicates )
         
     
+    def GetPairsToCollapsedPairs( self, service_key, pairs, service_strict = False ):
+        
+        if not service_strict and self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
+            
+            service_key = CC.COMBINED_TAG_SERVICE_KEY
+            
+        
+        with self._lock:
+            
+            siblings = self._service_keys_to_siblings[ service_key ]
+            
+            pairs_to_collapsed_pairs = {}
+            
+            for pair in pairs:
+                
+                ( a, b ) = pair
+                
+                if a in siblings:
+                    
+                    a = siblings[ a ]
+                    
+                
+                if b in siblings:
+                    
+                    b = siblings[ b ]
+                    
+                
+                pairs_to_collapsed_pairs[ pair ] = ( a, b )
+                
+            
+            return pairs_to_collapsed_pairs
+            
+        
+    
+    def GetTagsToCollapsedTags( self, service_key, tags, service_strict = False ):
+        
+        # the db calls this while building media results, and a sibling refresh holds our lock while it waits on a db read
+        # so rather than wait, we return None and let the caller fall back to working it out later
+        
+        if not service_strict and self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
+            
+            service_key = CC.COMBINED_TAG_SERVICE_KEY
+            
+        
+        if not self._lock.acquire( False ):
+            
+            return None
+            
+        
+        try:
+            
+            siblings = self._service_keys_to_siblings[ service_key ]
+            
+            return { tag : siblings[ tag ] if tag in siblings else tag for tag in tags }
+            
+        finally:
+            
+            self._lock.release()
+            
+        
+    
     def GetSibling( self, service_key, tag, service_strict = False ):
         
         if not service_strict and self._controller.new_options.GetBoolean( 'apply_all_siblings_to_all_services' ):
@@ -1133,10 +1689,25 @@ class TagSiblingsManager( object ):
             
         
     
-    def NotifyNewSiblings( self ):
+    def NotifyNewSiblings( self, service_keys_to_bad_tags_and_pairs = None ):
         
         with self._lock:
             
+            # a small edit comes with its pairs, so we can update just the sibling groups it touches right now
+            # if a full refresh is already coming, it will pick the edit up anyway
+            
+            if service_keys_to_bad_tags_and_pairs is not None and not self._dirty:
+                
+                siblings_changed = self._UpdateSiblings( service_keys_to_bad_tags_and_pairs )
+                
+                if siblings_changed:
+                    
+                    self._controller.pub( 'notify_new_tag_display_rules' )
+                    
+                
+                return
+                
+            
             self._dirty = True
             
             if self._refresh_job is not None:
@@ -145,11 +145,14 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'load_images_with_pil' ] = False
         
+        self._dictionary[ 'booleans' ][ 'scan_resistant_media_caches' ] = False
+        
         self._dictionary[ 'booleans' ][ 'use_system_ffmpeg' ] = False
         
         self._dictionary[ 'booleans' ][ 'elide_page_tab_names' ] = True
         
         self._dictionary[ 'booleans' ][ 'maintain_similar_files_duplicate_pairs_during_idle' ] = False
+        self._dictionary[ 'booleans' ][ 'use_in_memory_similar_files_index' ] = False
         
         self._dictionary[ 'booleans' ][ 'show_namespaces' ] = True
         
@@ -176,6 +179,9 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'booleans' ][ 'save_page_sort_on_change' ] = False
         
         self._dictionary[ 'booleans' ][ 'pause_all_new_network_traffic' ] = False
+        
+        self._dictionary[ 'booleans' ][ 'network_async_downloads' ] = False
+        self._dictionary[ 'booleans' ][ 'parse_html_with_lxml' ] = False
         self._dictionary[ 'booleans' ][ 'pause_all_file_queues' ] = False
         self._dictionary[ 'booleans' ][ 'pause_all_watcher_checkers' ] = False
         self._dictionary[ 'booleans' ][ 'pause_all_gallery_searches' ] = False
@@ -283,6 +289,7 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ] = {}
         
         self._dictionary[ 'integers' ][ 'video_buffer_size_mb' ] = 96
+        self._dictionary[ 'integers' ][ 'video_frame_cache_mb' ] = 128
         
         self._dictionary[ 'integers' ][ 'related_tags_search_1_duration_ms' ] = 250
         self._dictionary[ 'integers' ][ 'related_tags_search_2_duration_ms' ] = 2000
@@ -316,7 +323,12 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'max_network_jobs' ] = 15
         self._dictionary[ 'integers' ][ 'max_network_jobs_per_domain' ] = 3
         
+        self._dictionary[ 'integers' ][ 'network_connection_pool_hosts' ] = 10
+        self._dictionary[ 'integers' ][ 'network_connection_pool_size' ] = 10
+        self._dictionary[ 'integers' ][ 'network_connection_idle_timeout' ] = 60
+        
         self._dictionary[ 'integers' ][ 'max_simultaneous_subscriptions' ] = 1
+        self._dictionary[ 'integers' ][ 'max_simultaneous_subscription_queries' ] = 4
         
         self._dictionary[ 'integers' ][ 'gallery_page_wait_period_pages' ] = 15
         self._dictionary[ 'integers' ][ 'gallery_page_wait_period_subscriptions' ] = 5
@@ -344,6 +356,10 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'thumbnail_cache_timeout' ] = 86400
         self._dictionary[ 'integers' ][ 'image_cache_timeout' ] = 600
         
+        self._dictionary[ 'integers' ][ 'thumbnail_waterfall_workers' ] = 2
+        
+        self._dictionary[ 'integers' ][ 'file_import_preparation_workers' ] = 4
+        
         self._dictionary[ 'integers' ][ 'thumbnail_border' ] = 1
         self._dictionary[ 'integers' ][ 'thumbnail_margin' ] = 2
         
@@ -387,6 +403,10 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'noneable_integers' ][ 'disk_cache_maintenance_mb' ] = 256
         self._dictionary[ 'noneable_integers' ][ 'disk_cache_init_period' ] = 4
         
+        self._dictionary[ 'noneable_integers' ][ 'decoded_thumbnail_disk_cache_mb' ] = None
+        
+        self._dictionary[ 'noneable_integers' ][ 'network_connection_max_requests' ] = 100
+        
         self._dictionary[ 'noneable_integers' ][ 'num_recent_tags' ] = 20
         
         self._dictionary[ 'noneable_integers' ][ 'maintenance_vacuum_period_days' ] = 30
@@ -549,6 +569,13 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'frame_locations' ] = {}
         
+        #
+        
+        self._dictionary[ 'max_network_jobs_per_specific_domain' ] = {}
+        
+        # domain : ( pool size, max requests per connection, idle timeout )
+        self._dictionary[ 'network_connection_pool_settings_per_specific_domain' ] = {}
+        
         # remember size, remember position, last_size, last_pos, default gravity, default position, maximised, fullscreen
         self._dictionary[ 'frame_locations' ][ 'file_import_status' ] = ( True, True, None, None, ( -1, -1 ), 'topleft', False, False )
         self._dictionary[ 'frame_locations' ][ 'gallery_import_log' ] = ( True, True, None, None, ( -1, -1 ), 'topleft', False, False )
@@ -920,6 +947,14 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetMaxNetworkJobsPerSpecificDomain( self ):
+        
+        with self._lock:
+            
+            return dict( self._dictionary[ 'max_network_jobs_per_specific_domain' ] )
+            
+        
+    
     def GetMediaShowAction( self, mime ):
         
         with self._lock:
@@ -988,6 +1023,14 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetNetworkConnectionPoolSettingsPerSpecificDomain( self ):
+        
+        with self._lock:
+            
+            return { domain : tuple( pool_settings ) for ( domain, pool_settings ) in self._dictionary[ 'network_connection_pool_settings_per_specific_domain' ].items() }
+            
+        
+    
     def GetNoneableInteger( self, name ):
         
         with self._lock:
@@ -1203,6 +1246,14 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def SetMaxNetworkJobsPerSpecificDomain( self, domains_to_max_jobs ):
+        
+        with self._lock:
+            
+            self._dictionary[ 'max_network_jobs_per_specific_domain' ] = dict( domains_to_max_jobs )
+            
+        
+    
     def SetMediaViewOptions( self, mimes_to_media_view_options ):
         
         with self._lock:
@@ -1227,6 +1278,14 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def SetNetworkConnectionPoolSettingsPerSpecificDomain( self, domains_to_pool_settings ):
+        
+        with self._lock:
+            
+            self._dictionary[ 'network_connection_pool_settings_per_specific_domain' ] = dict( domains_to_pool_settings )
+            
+        
+    
     def SetNoneableInteger( self, name, value ):
         
         with self._lock:
@@ -32,6 +32,8 @@ except ImportError:
 try:
     
     import lxml
+    import lxml.etree
+    import lxml.html
     
     LXML_IS_OK = True
     
@@ -39,6 +41,132 @@ except ImportError:
     
     LXML_IS_OK = False
     
+# bs4 splits these attributes on whitespace and matches against any single value or the whole thing, so the lxml backend does the same
+HTML_MULTI_VALUED_ATTRIBUTES = bs4.builder.HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES
+
+# html5lib's bs4 tree gives these no strings of their own, although they count in their parents' strings
+HTML_RAW_TEXT_TAGS = { 'script', 'style', 'template' }
+
+# libxml2 fills these in with their own name when they have no value, which html5lib leaves empty
+HTML_BOOLEAN_ATTRIBUTES_FILLED_BY_LXML = { 'checked', 'compact', 'declare', 'defer', 'disabled', 'ismap', 'multiple', 'nohref', 'noresize', 'noshade', 'nowrap', 'readonly', 'selected' }
+
+# libxml2 does not know these are void, and puts what follows them inside them
+HTML5_VOID_TAGS_UNKNOWN_TO_LXML = ( 'embed', 'keygen', 'source', 'track', 'wbr' )
+
+# bs4 writes these as <br/> when they are empty, and does not escape the text inside the others
+HTML_VOID_TAGS = { 'area', 'base', 'basefont', 'bgsound', 'br', 'col', 'command', 'embed', 'frame', 'hr', 'image', 'img', 'input', 'isindex', 'keygen', 'link', 'menuitem', 'meta', 'nextid', 'param', 'source', 'spacer', 'track', 'wbr' }
+HTML_UNESCAPED_TEXT_TAGS = { 'script', 'style' }
+
+class LXMLHTMLDocument( object ):
+    
+    # bs4 gives us a document object above <html> that descending rules search from and ascending rules can reach, so we wrap the lxml root to do the same
+    
+    name = '[document]'
+    
+    def __init__( self, root ):
+        
+        self.root = root
+        
+    
+def ConvertLXMLNodeToHTML( node ):
+    
+    # this writes what str() gives for the same node in bs4's html5lib tree, so an HTML_CONTENT_HTML formula gets the same text from either backend
+    
+    chunks = []
+    
+    def write_text( text, parent_tag ):
+        
+        if text is None:
+            
+            return
+            
+        
+        if parent_tag in HTML_UNESCAPED_TEXT_TAGS:
+            
+            chunks.append( text )
+            
+        else:
+            
+            chunks.append( bs4.dammit.EntitySubstitution.substitute_xml( text ) )
+            
+        
+    
+    def write_element( element ):
+        
+        if element.tag is lxml.etree.Comment:
+            
+            chunks.append( '<!--{}-->'.format( element.text or '' ) )
+            
+            return
+            
+        elif not isinstance( element.tag, str ):
+            
+            return
+            
+        
+        chunks.append( '<' + element.tag )
+        
+        for attribute in sorted( element.attrib.keys() ):
+            
+            value = GetHTMLNodeAttribute( element, attribute )
+            
+            if isinstance( value, list ):
+                
+                value = ' '.join( value )
+                
+            
+            chunks.append( ' {}={}'.format( attribute, bs4.dammit.EntitySubstitution.quoted_attribute_value( bs4.dammit.EntitySubstitution.substitute_xml( value ) ) ) )
+            
+        
+        if element.tag in HTML_VOID_TAGS and element.text is None and len( element ) == 0:
+            
+            chunks.append( '/>' )
+            
+            return
+            
+        
+        chunks.append( '>' )
+        
+        write_text( element.text, element.tag )
+        
+        for child in element:
+            
+            write_element( child )
+            
+            write_text( child.tail, element.tag )
+            
+        
+        chunks.append( '</{}>'.format( element.tag ) )
+        
+    
+    if isinstance( node, LXMLHTMLDocument ):
+        
+        doctype = node.root.getroottree().docinfo.doctype
+        
+        if doctype != '':
+            
+            chunks.append( doctype + '\n' )
+            
+        
+        for sibling in reversed( list( node.root.itersiblings( preceding = True ) ) ):
+            
+            write_element( sibling )
+            
+        
+        write_element( node.root )
+        
+        for sibling in node.root.itersiblings():
+            
+            write_element( sibling )
+            
+        
+    else:
+        
+        write_element( node )
+        
+    
+    return ''.join( chunks )
+    
 def ConvertParseResultToPrettyString( result ):
     
     ( ( name, content_type, additional_info ), parsed_text ) = result
@@ -257,11 +385,176 @@ def GetHashesFromParseResults( results ):
     
     return hash_results
     
+def FindHTMLNodes( node, tag_name, tag_attributes ):
+    
+    if not ( isinstance( node, LXMLHTMLDocument ) or IsLXMLElement( node ) ):
+        
+        kwargs = { 'attrs' : tag_attributes }
+        
+        if tag_name is not None:
+            
+            kwargs[ 'name' ] = tag_name
+            
+        
+        return node.find_all( **kwargs )
+        
+    
+    if isinstance( node, LXMLHTMLDocument ):
+        
+        candidates = node.root.iter()
+        
+    else:
+        
+        candidates = node.iterdescendants()
+        
+    
+    found_nodes = []
+    
+    for candidate in candidates:
+        
+        if not isinstance( candidate.tag, str ): # comments and processing instructions
+            
+            continue
+            
+        
+        if tag_name is not None and candidate.tag != tag_name:
+            
+            continue
+            
+        
+        if HTMLNodeMatchesAttributes( candidate, tag_attributes ):
+            
+            found_nodes.append( candidate )
+            
+        
+    
+    return found_nodes
+    
+def GetHTMLDocument( html ):
+    
+    # the lxml backend is much faster, but it only imitates html5lib's tree, so it is opt-in
+    
+    if LXML_IS_OK and HG.client_controller.new_options.GetBoolean( 'parse_html_with_lxml' ):
+        
+        return GetLXMLDocument( html )
+        
+    else:
+        
+        return GetSoup( html )
+        
+    
+def GetHTMLNodeAttribute( node, attribute ):
+    
+    # None if missing, and a list for multi-valued attributes like 'class', just like bs4
+    
+    if isinstance( node, LXMLHTMLDocument ):
+        
+        return None
+        
+    elif not IsLXMLElement( node ):
+        
+        return node.get( attribute )
+        
+    
+    value = node.get( attribute )
+    
+    if value is None and attribute != attribute.lower():
+        
+        # libxml2 lowercases everything, but html5lib keeps svg's camelCase attributes like viewBox
+        value = node.get( attribute.lower() )
+        
+    
+    if value is None:
+        
+        return None
+        
+    
+    if attribute in HTML_BOOLEAN_ATTRIBUTES_FILLED_BY_LXML and value == attribute:
+        
+        value = ''
+        
+    
+    if attribute in HTML_MULTI_VALUED_ATTRIBUTES[ '*' ] or attribute in HTML_MULTI_VALUED_ATTRIBUTES.get( node.tag, () ):
+        
+        value = value.split()
+        
+    
+    return value
+    
+def GetHTMLNodeHTML( node ):
+    
+    if isinstance( node, LXMLHTMLDocument ) or IsLXMLElement( node ):
+        
+        return ConvertLXMLNodeToHTML( node )
+        
+    else:
+        
+        return str( node )
+        
+    
+def GetHTMLNodeName( node ):
+    
+    if IsLXMLElement( node ):
+        
+        return node.tag
+        
+    else:
+        
+        return node.name
+        
+    
+def GetHTMLNodeParent( node ):
+    
+    # None once we are above the document
+    
+    if isinstance( node, LXMLHTMLDocument ):
+        
+        return None
+        
+    elif IsLXMLElement( node ):
+        
+        parent = node.getparent()
+        
+        if parent is None:
+            
+            return LXMLHTMLDocument( node )
+            
+        
+        return parent
+        
+    else:
+        
+        parent = node.parent
+        
+        if not isinstance( parent, bs4.element.Tag ):
+            
+            return None
+            
+        
+        return parent
+        
+    
 def GetHTMLTagString( tag ):
     
     try:
         
-        all_strings = [ s for s in tag.strings if len( s ) > 0 ]
+        if isinstance( tag, LXMLHTMLDocument ):
+            
+            all_strings = [ s for s in IterateLXMLStrings( tag.root ) if len( s ) > 0 ]
+            
+        elif IsLXMLElement( tag ):
+            
+            if tag.tag in HTML_RAW_TEXT_TAGS:
+                
+                return ''
+                
+            
+            all_strings = [ s for s in IterateLXMLStrings( tag ) if len( s ) > 0 ]
+            
+        else:
+            
+            all_strings = [ s for s in tag.strings if len( s ) > 0 ]
+            
         
     except:
         
@@ -287,6 +580,106 @@ def GetNamespacesFromParsableContent( parsable_content ):
     
     return namespaces
     
+def GetLXMLDocument( html ):
+    
+    if not LXML_IS_OK:
+        
+        raise HydrusExceptions.ParseException( 'This client does not have access to lxml!' )
+        
+    
+    # bytes, since lxml will not take a str that has an encoding declaration
+    # and no made-up doctype, since html5lib only has one if the page does
+    parser = lxml.html.HTMLParser( encoding = 'utf-8', default_doctype = False )
+    
+    html_bytes = html.encode( 'utf-8' )
+    
+    if html_bytes.strip() == b'':
+        
+        root = lxml.html.document_fromstring( b'<html><body></body></html>', parser = parser )
+        
+    else:
+        
+        root = lxml.html.document_fromstring( html_bytes, parser = parser )
+        
+    
+    # now tidy up the few places libxml2 builds a different tree to the html5 spec, so rules count nodes the same way whatever the backend
+    
+    if root.text is not None and root.text.strip() == '':
+        
+        root.text = None
+        
+    
+    if root.find( 'head' ) is None:
+        
+        root.insert( 0, root.makeelement( 'head', {} ) )
+        
+    
+    if root.find( 'body' ) is None:
+        
+        root.append( root.makeelement( 'body', {} ) )
+        
+    
+    for table in list( root.iter( 'table' ) ):
+        
+        tbody = None
+        
+        for child in list( table ):
+            
+            if child.tag == 'tr':
+                
+                if tbody is None:
+                    
+                    tbody = table.makeelement( 'tbody', {} )
+                    
+                    child.addprevious( tbody )
+                    
+                
+                tbody.append( child )
+                
+            elif isinstance( child.tag, str ):
+                
+                tbody = None
+                
+            
+        
+    
+    for element in list( root.iter( *HTML5_VOID_TAGS_UNKNOWN_TO_LXML ) ):
+        
+        children = list( element )
+        
+        if element.text is None and len( children ) == 0:
+            
+            continue
+            
+        
+        tail = element.tail
+        
+        element.tail = element.text
+        element.text = None
+        
+        for child in reversed( children ):
+            
+            element.addnext( child )
+            
+        
+        last_node = children[ -1 ] if len( children ) > 0 else element
+        
+        if tail is not None:
+            
+            last_node.tail = ( last_node.tail or '' ) + tail
+            
+        
+    
+    for element in root.iter( 'pre', 'textarea', 'listing' ):
+        
+        if element.text is not None and element.text.startswith( '\n' ):
+            
+            element.text = element.text[ 1 : ]
+            
+        
+    
+    return LXMLHTMLDocument( root )
+    
 def GetSoup( html ):
     
     if HTML5LIB_IS_OK:
@@ -460,6 +853,57 @@ def GetVariableFromParseResults( results ):
     
     return None
     
+def HTMLNodeMatchesAttributes( node, tag_attributes ):
+    
+    for ( attribute, desired_value ) in tag_attributes.items():
+        
+        value = GetHTMLNodeAttribute( node, attribute )
+        
+        if value is None:
+            
+            return False
+            
+        elif isinstance( value, list ):
+            
+            if desired_value not in value and ' '.join( value ) != desired_value:
+                
+                return False
+                
+            
+        elif value != desired_value:
+            
+            return False
+            
+        
+    
+    return True
+    
+def IsLXMLElement( node ):
+    
+    return LXML_IS_OK and isinstance( node, lxml.html.HtmlElement )
+    
+def IterateLXMLStrings( element ):
+    
+    # this matches bs4's html5lib tree, where comments are skipped but script and style text is included
+    
+    if element.text is not None and isinstance( element.tag, str ):
+        
+        yield element.text
+        
+    
+    for child in element:
+        
+        if isinstance( child.tag, str ):
+            
+            yield from IterateLXMLStrings( child )
+            
+        
+        if child.tail is not None:
+            
+            yield child.tail
+            
+        
+    
 def MakeParsedTextPretty( parsed_text ):
     
     if isinstance( parsed_text, bytes ):
@@ -510,6 +954,9 @@ class ParsingTestData( object ):
     
 class ParseFormula( HydrusSerialisable.SerialisableBase ):
     
+    # formulas whose results depend only on the text and their own definition, so the parsing cache can remember them
+    PARSE_RESULTS_ARE_CACHEABLE = False
+    
     def __init__( self, string_processor = None ):
         
         if string_processor is None:
@@ -535,7 +982,7 @@ class ParseFormula( HydrusSerialisable.SerialisableBase ):
         return self._string_processor
         
     
-    def Parse( self, parsing_context, parsing_text ):
+    def _ParseTexts( self, parsing_context, parsing_text ):
         
         raw_texts = self._ParseRawTexts( parsing_context, parsing_text )
         
@@ -560,6 +1007,16 @@ class ParseFormula( HydrusSerialisable.SerialisableBase ):
         return texts
         
     
+    def Parse( self, parsing_context, parsing_text ):
+        
+        if self.PARSE_RESULTS_ARE_CACHEABLE:
+            
+            return HG.client_controller.parsing_cache.GetParseResults( self, parsing_text, lambda: self._ParseTexts( parsing_context, parsing_text ) )
+            
+        
+        return self._ParseTexts( parsing_context, parsing_text )
+        
+    
     def ParsePretty( self, parsing_context, parsing_text ):
         
         texts = self.Parse( parsing_context, parsing_text )
@@ -854,6 +1311,8 @@ class ParseFormulaHTML( ParseFormula ):
     SERIALISABLE_NAME = 'HTML Parsing Formula'
     SERIALISABLE_VERSION = 7
     
+    PARSE_RESULTS_ARE_CACHEABLE = True
+    
     def __init__( self, tag_rules = None, content_to_fetch = None, attribute_to_fetch = None, string_processor = None ):
         
         ParseFormula.__init__( self, string_processor )
@@ -914,9 +1373,9 @@ class ParseFormulaHTML( ParseFormula ):
             
         elif self._content_to_fetch == HTML_CONTENT_ATTRIBUTE:
             
-            if tag.has_attr( self._attribute_to_fetch ):
-                
-                unknown_attr_result = tag[ self._attribute_to_fetch ]
+            unknown_attr_result = GetHTMLNodeAttribute( tag, self._attribute_to_fetch )
+            
+            if unknown_attr_result is not None:
                 
                 # 'class' attr returns a list because it has multiple values under html spec, wew
                 if isinstance( unknown_attr_result, list ):
@@ -946,7 +1405,7 @@ class ParseFormulaHTML( ParseFormula ):
             
         elif self._content_to_fetch == HTML_CONTENT_HTML:
             
-            result = str( tag )
+            result = GetHTMLNodeHTML( tag )
             
         
         if result is None or result == '':
@@ -1000,7 +1459,7 @@ class ParseFormulaHTML( ParseFormula ):
         
         try:
             
-            root = HG.client_controller.parsing_cache.GetSoup( parsing_text )
+            root = HG.client_controller.parsing_cache.GetHTMLDocument( parsing_text )
             
         except Exception as e:
             
@@ -1295,14 +1754,7 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
                 # instead do node.find_all( lambda tag: 'class' in tag.attrs and 'a' in tag[ 'class' ] and 'b' in tag[ 'class' ] )
                 # which means we want to just roll all this into one method to support multiple class matching
                 
-                kwargs = { 'attrs' : self._tag_attributes }
-                
-                if self._tag_name is not None:
-                    
-                    kwargs[ 'name' ] = self._tag_name
-                    
-                
-                found_nodes = node.find_all( **kwargs )
+                found_nodes = FindHTMLNodes( node, self._tag_name, self._tag_attributes )
                 
                 if self._tag_index is not None:
                     
@@ -1322,13 +1774,11 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
                 
                 found_nodes = []
                 
-                still_in_tree = lambda node: isinstance( node, bs4.element.Tag ) # if we go one above html, we get the BS document itself
-                
                 num_found = 0
                 
-                potential_parent = node.parent
+                potential_parent = GetHTMLNodeParent( node ) # if we go one above html, we get the document itself
                 
-                while still_in_tree( potential_parent ):
+                while potential_parent is not None:
                     
                     if self._tag_name is None:
                         
@@ -1336,7 +1786,7 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
                         
                     else:
                         
-                        if potential_parent.name == self._tag_name:
+                        if GetHTMLNodeName( potential_parent ) == self._tag_name:
                             
                             num_found += 1
                             
@@ -1349,7 +1799,7 @@ class ParseRuleHTML( HydrusSerialisable.SerialisableBase ):
                         break
                         
                     
-                    potential_parent = potential_parent.parent
+                    potential_parent = GetHTMLNodeParent( potential_parent )
                     
                 
             
@@ -1446,6 +1896,8 @@ class ParseFormulaJSON( ParseFormula ):
     SERIALISABLE_NAME = 'JSON Parsing Formula'
     SERIALISABLE_VERSION = 3
     
+    PARSE_RESULTS_ARE_CACHEABLE = True
+    
     def __init__( self, parse_rules = None, content_to_fetch = None, string_processor = None ):
         
         ParseFormula.__init__( self, string_processor )
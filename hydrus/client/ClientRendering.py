@@ -225,6 +225,8 @@ class RasterContainerVideo( RasterContainer ):
         self._initialised = False
         
         self._renderer = None
+        self._renderer_position = 0
+        self._renderer_has_keyframe_timestamps = False
         
         self._frames = {}
         
@@ -314,6 +316,34 @@ class RasterContainerVideo( RasterContainer ):
             
         
     
+    def _RenderFrame( self, frame_index ):
+        
+        # the renderer is only moved when we actually need it to decode something, so frames we already have or can get from the shared cache cost nothing
+        
+        if frame_index != self._renderer_position:
+            
+            if frame_index > self._renderer_position and not self._renderer_has_keyframe_timestamps and isinstance( self._renderer, HydrusVideoHandling.VideoRendererFFMPEG ):
+                
+                keyframe_timestamps = HG.client_controller.GetCache( 'video_frames' ).GetKeyframeTimestamps( self._media.GetHash(), self._path )
+                
+                if keyframe_timestamps is not None:
+                    
+                    self._renderer.SetKeyframeTimestamps( keyframe_timestamps )
+                    
+                    self._renderer_has_keyframe_timestamps = True
+                    
+                
+            
+            self._renderer.set_position( frame_index )
+            
+        
+        numpy_image = self._renderer.read_frame()
+        
+        self._renderer_position = ( frame_index + 1 ) % self.GetNumFrames()
+        
+        return numpy_image
+        
+    
     def THREADRender( self ):
         
         hash = self._media.GetHash()
@@ -323,6 +353,8 @@ class RasterContainerVideo( RasterContainer ):
         
         client_files_manager = HG.client_controller.client_files_manager
         
+        video_frame_cache = HG.client_controller.GetCache( 'video_frames' )
+        
         time.sleep( 0.00001 )
         
         if self._media.GetMime() == HC.IMAGE_GIF:
@@ -381,9 +413,7 @@ class RasterContainerVideo( RasterContainer ):
                 
                 if currently_rendering_out_of_buffer or will_not_get_to_ideal_frame:
                     
-                    # we cannot get to the ideal next frame, so we need to rewind/reposition
-                    
-                    self._renderer.set_position( self._buffer_start_index )
+                    # we cannot get to the ideal next frame, so we need to rewind/reposition. the renderer itself is moved when it next has to decode
                     
                     self._last_index_rendered = -1
                     
@@ -403,12 +433,26 @@ class RasterContainerVideo( RasterContainer ):
                     
                     frame_index = self._next_render_index # keep this before the get call, as it increments in a clock arithmetic way afterwards
                     
-                    renderer = self._renderer
+                    already_have_frame = self._HasFrame( frame_index )
                     
                 
+                frame = None
+                
                 try:
                     
-                    numpy_image = renderer.read_frame()
+                    if not already_have_frame:
+                        
+                        frame = video_frame_cache.GetFrame( hash, self._target_resolution, frame_index )
+                        
+                        if frame is None:
+                            
+                            numpy_image = self._RenderFrame( frame_index )
+                            
+                            frame = GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = False )
+                            
+                            video_frame_cache.AddFrame( hash, self._target_resolution, frame_index, frame )
+                            
+                        
                     
                 except Exception as e:
                     
@@ -430,21 +474,12 @@ class RasterContainerVideo( RasterContainer ):
                     
                     if self._next_render_index == 0 and self._buffer_end_index != num_frames_in_video - 1:
                         
-                        # we need to rewind renderer
-                        
-                        self._renderer.set_position( 0 )
+                        # we need to rewind
                         
                         self._last_index_rendered = -1
                         
                     
-                    should_save_frame = not self._HasFrame( frame_index )
-                    
-                
-                if should_save_frame:
-                    
-                    frame = GenerateHydrusBitmapFromNumPyImage( numpy_image, compressed = False )
-                    
-                    with self._lock:
+                    if frame is not None and not self._HasFrame( frame_index ):
                         
                         self._frames[ frame_index ] = frame
                         
@@ -1,6 +1,7 @@
 import hashlib
 import json
 import os
+import queue
 import threading
 import time
 import traceback
@@ -1147,6 +1148,189 @@ class ServiceRestricted( ServiceRemote ):
             
         
     
+class RepositoryProcessingStageTimer( object ):
+    
+    # update rows are loaded and parsed off disk, converted from the repository's ids to ours, and then written
+    # each stage reports how many rows it did and how long it took, so we can see which is holding things up
+    
+    STAGES = ( 'loading', 'normalising', 'writing' )
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._stages_to_rows_and_times = { stage : [ 0, 0.0 ] for stage in self.STAGES }
+        
+    
+    def AddTime( self, stage, num_rows, time_taken ):
+        
+        with self._lock:
+            
+            rows_and_time = self._stages_to_rows_and_times[ stage ]
+            
+            rows_and_time[0] += num_rows
+            rows_and_time[1] += time_taken
+            
+        
+    
+    def GetSummary( self ):
+        
+        with self._lock:
+            
+            stage_summaries = []
+            
+            for stage in self.STAGES:
+                
+                ( num_rows, time_taken ) = self._stages_to_rows_and_times[ stage ]
+                
+                if num_rows == 0 or time_taken == 0:
+                    
+                    continue
+                    
+                
+                stage_summaries.append( '{} at {} rows/s'.format( stage, HydrusData.ToHumanInt( int( num_rows / time_taken ) ) ) )
+                
+            
+            return ', '.join( stage_summaries )
+            
+        
+    
+class RepositoryUpdateLoader( object ):
+    
+    # reads and parses update files on a worker thread one ahead of the db, so the db is not sat waiting while the next one is decompressed and parsed
+    # the file read, zlib and sqlite release the GIL, but json.loads and building the update objects do not, so this only overlaps the parse with the db's sqlite work
+    # a process pool would parse outside the GIL, but it would have to pickle every parsed update back to us, which costs most of what the parse does, and frozen windows builds cannot fork
+    # memory: up to lookahead updates wait in the queue, plus the one being parsed here and the one the db is processing
+    
+    def __init__( self, update_hashes_and_mimes, stage_timer, lookahead = 1 ):
+        
+        self._update_hashes_and_mimes = list( update_hashes_and_mimes )
+        self._stage_timer = stage_timer
+        
+        self._results = queue.Queue( maxsize = lookahead )
+        
+        self._stopped = False
+        
+        self._thread = threading.Thread( target = self._THREADLoad, name = 'repository update loader', daemon = True )
+        
+    
+    def _LoadUpdate( self, update_hash, mime ):
+        
+        update_path = HG.client_controller.client_files_manager.GetFilePath( update_hash, mime )
+        
+        with open( update_path, 'rb' ) as f:
+            
+            update_network_bytes = f.read()
+            
+        
+        try:
+            
+            return HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+            
+        except Exception as e:
+            
+            raise HydrusExceptions.SerialisationException( str( e ) )
+            
+        
+    
+    def _THREADLoad( self ):
+        
+        for ( update_hash, mime ) in self._update_hashes_and_mimes:
+            
+            if self._stopped:
+                
+                return
+                
+            
+            started = HydrusData.GetNowPrecise()
+            
+            try:
+                
+                update = self._LoadUpdate( update_hash, mime )
+                
+                if isinstance( update, ( HydrusNetwork.DefinitionsUpdate, HydrusNetwork.ContentUpdate ) ):
+                    
+                    self._stage_timer.AddTime( 'loading', update.GetNumRows(), HydrusData.GetNowPrecise() - started )
+                    
+                
+                result = ( update_hash, update, None )
+                
+            except Exception as e:
+                
+                result = ( update_hash, None, e )
+                
+            
+            while True:
+                
+                if self._stopped:
+                    
+                    return
+                    
+                
+                try:
+                    
+                    self._results.put( result, timeout = 1 )
+                    
+                    break
+                    
+                except queue.Full:
+                    
+                    continue
+                    
+                
+            
+        
+    
+    def GetUpdate( self, update_hash ):
+        
+        while True:
+            
+            if HG.model_shutdown:
+                
+                raise HydrusExceptions.ShutdownException()
+                
+            
+            try:
+                
+                ( loaded_update_hash, update, e ) = self._results.get( timeout = 1 )
+                
+                break
+                
+            except queue.Empty:
+                
+                continue
+                
+            
+        
+        if loaded_update_hash != update_hash:
+            
+            raise Exception( 'The repository update loader fell out of sync!' )
+            
+        
+        if e is not None:
+            
+            raise e
+            
+        
+        return update
+        
+    
+    def Start( self ):
+        
+        self._thread.start()
+        
+    
+    def Stop( self ):
+        
+        self._stopped = True
+        
+        if self._thread.is_alive():
+            
+            # it checks in at least once a second unless it is in the middle of a big parse, so we do not wait forever
+            self._thread.join( timeout = 10 )
+            
+        
+    
 class ServiceRepository( ServiceRestricted ):
     
     def __init__( self, service_key, service_type, name, dictionary = None ):
@@ -1236,13 +1420,13 @@ class ServiceRepository( ServiceRestricted ):
         HydrusData.Print( summary )
         
     
-    def _ReportOngoingRowSpeed( self, job_key, rows_done, total_rows, precise_timestamp, rows_done_in_last_packet, row_name ):
+    def _ReportOngoingRowSpeed( self, job_key, rows_done, total_rows, precise_timestamp, rows_done_in_last_packet, row_name, stage_timer ):
         
         it_took = HydrusData.GetNowPrecise() - precise_timestamp
         
         rows_s = HydrusData.ToHumanInt( int( rows_done_in_last_packet / it_took ) )
         
-        popup_message = '{} {}: processing at {} rows/s'.format( row_name, HydrusData.ConvertValueRangeToPrettyString( rows_done, total_rows ), rows_s )
+        popup_message = '{} {}: processing at {} rows/s ({})'.format( row_name, HydrusData.ConvertValueRangeToPrettyString( rows_done, total_rows ), rows_s, stage_timer.GetSummary() )
         
         HG.client_controller.pub( 'splash_set_status_text', popup_message, print_to_log = False )
         job_key.SetVariable( 'popup_text_2', popup_message )
@@ -1490,6 +1674,8 @@ class ServiceRepository( ServiceRestricted ):
         
         work_done = False
         
+        update_loader = None
+        
         try:
             
             job_key = ClientThreading.JobKey( cancellable = True, maintenance_mode = maintenance_mode, stop_time = stop_time )
@@ -1513,6 +1699,15 @@ class ServiceRepository( ServiceRestricted ):
             HG.client_controller.pub( 'message', job_key )
             HG.client_controller.pub( 'splash_set_title_text', title, print_to_log = False )
             
+            stage_timer = RepositoryProcessingStageTimer()
+            
+            update_hashes_and_mimes = [ ( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS ) for definition_hash in definition_hashes ]
+            update_hashes_and_mimes.extend( ( ( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) for content_hash in content_hashes ) )
+            
+            update_loader = RepositoryUpdateLoader( update_hashes_and_mimes, stage_timer )
+            
+            update_loader.Start()
+            
             total_definition_rows_completed = 0
             total_content_rows_completed = 0
             
@@ -1538,7 +1733,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+                        definition_update = update_loader.GetUpdate( definition_hash )
                         
                     except HydrusExceptions.FileMissingException:
                         
@@ -1546,17 +1741,7 @@ class ServiceRepository( ServiceRestricted ):
                         
                         raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
                         
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        definition_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
+                    except HydrusExceptions.SerialisationException:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
                         
@@ -1598,7 +1783,7 @@ class ServiceRepository( ServiceRestricted ):
                             break_time = 0.05
                             
                         
-                        num_rows_done = HG.client_controller.WriteSynchronous( 'process_repository_definitions', self._service_key, definition_hash, iterator_dict, job_key, work_time )
+                        num_rows_done = HG.client_controller.WriteSynchronous( 'process_repository_definitions', self._service_key, definition_hash, iterator_dict, job_key, work_time, stage_timer = stage_timer )
                         
                         rows_done_in_this_update += num_rows_done
                         total_definition_rows_completed += num_rows_done
@@ -1624,7 +1809,7 @@ class ServiceRepository( ServiceRestricted ):
                             HG.client_controller.WaitUntilViewFree()
                             
                         
-                        self._ReportOngoingRowSpeed( job_key, rows_done_in_this_update, rows_in_this_update, this_work_start_time, num_rows_done, 'definitions' )
+                        self._ReportOngoingRowSpeed( job_key, rows_done_in_this_update, rows_in_this_update, this_work_start_time, num_rows_done, 'definitions', stage_timer )
                         
                     
                     num_updates_done += 1
@@ -1666,7 +1851,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+                        content_update = update_loader.GetUpdate( content_hash )
                         
                     except HydrusExceptions.FileMissingException:
                         
@@ -1674,17 +1859,7 @@ class ServiceRepository( ServiceRestricted ):
                         
                         raise Exception( 'An unusual error has occured during repository processing: an update file was missing. Your repository should be paused, and all update files have been scheduled for a presence check. Please permit file maintenance to check them, or tell it to do so manually, before unpausing your repository.' )
                         
-                    
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        content_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
+                    except HydrusExceptions.SerialisationException:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA )
                         
@@ -1732,7 +1907,7 @@ class ServiceRepository( ServiceRestricted ):
                             break_time = 0.05
                             
                         
-                        num_rows_done = HG.client_controller.WriteSynchronous( 'process_repository_content', self._service_key, content_hash, iterator_dict, job_key, work_time )
+                        num_rows_done = HG.client_controller.WriteSynchronous( 'process_repository_content', self._service_key, content_hash, iterator_dict, job_key, work_time, stage_timer = stage_timer )
                         
                         rows_done_in_this_update += num_rows_done
                         total_content_rows_completed += num_rows_done
@@ -1758,7 +1933,7 @@ class ServiceRepository( ServiceRestricted ):
                             HG.client_controller.WaitUntilViewFree()
                             
                         
-                        self._ReportOngoingRowSpeed( job_key, rows_done_in_this_update, rows_in_this_update, this_work_start_time, num_rows_done, 'content rows' )
+                        self._ReportOngoingRowSpeed( job_key, rows_done_in_this_update, rows_in_this_update, this_work_start_time, num_rows_done, 'content rows', stage_timer )
                         
                     
                     num_updates_done += 1
@@ -1800,8 +1975,15 @@ class ServiceRepository( ServiceRestricted ):
             
         finally:
             
+            if update_loader is not None:
+                
+                update_loader.Stop()
+                
+            
             if work_done:
                 
+                HydrusData.Print( '{} processing stages: {}'.format( self._name, stage_timer.GetSummary() ) )
+                
                 self._is_mostly_caught_up = None
                 
                 HG.client_controller.pub( 'notify_new_force_refresh_tags_data' )
@@ -0,0 +1,163 @@
+import collections
+import threading
+
+import numpy
+
+from hydrus.core import HydrusData
+
+# number of uint64 cells we are happy to have in a temporary search matrix at once, ~32MB
+SEARCH_BLOCK_CELLS = 4 * 1024 * 1024
+
+class PHashIndex( object ):
+    
+    def __init__( self, phash_ids_and_phashes = None ):
+        
+        # the db thread adds and removes while pooled reads search, so everything public holds this
+        self._lock = threading.Lock()
+        
+        self._phash_ids = numpy.empty( 0, dtype = numpy.int64 )
+        self._phashes = numpy.empty( 0, dtype = numpy.uint64 )
+        
+        self._phash_ids_to_indices = {}
+        
+        self._pending_phash_ids_to_phashes = collections.OrderedDict()
+        
+        self._num_dead = 0
+        
+        if phash_ids_and_phashes is not None:
+            
+            for ( phash_id, phash ) in phash_ids_and_phashes:
+                
+                self.AddPHash( phash_id, phash )
+                
+            
+            self._Consolidate()
+            
+        
+    
+    def __len__( self ):
+        
+        with self._lock:
+            
+            return len( self._phash_ids_to_indices ) + len( self._pending_phash_ids_to_phashes )
+            
+        
+    
+    def _Consolidate( self ):
+        
+        if self._num_dead > 0 and self._num_dead >= len( self._phash_ids ) // 4:
+            
+            alive = self._phash_ids != -1
+            
+            self._phash_ids = self._phash_ids[ alive ]
+            self._phashes = self._phashes[ alive ]
+            
+            self._phash_ids_to_indices = { phash_id : index for ( index, phash_id ) in enumerate( self._phash_ids.tolist() ) }
+            
+            self._num_dead = 0
+            
+        
+        if len( self._pending_phash_ids_to_phashes ) > 0:
+            
+            start_index = len( self._phash_ids )
+            
+            new_phash_ids = list( self._pending_phash_ids_to_phashes.keys() )
+            new_phashes = list( self._pending_phash_ids_to_phashes.values() )
+            
+            self._phash_ids = numpy.concatenate( ( self._phash_ids, numpy.array( new_phash_ids, dtype = numpy.int64 ) ) )
+            self._phashes = numpy.concatenate( ( self._phashes, HydrusData.ConvertPHashesToNumPy( new_phashes ) ) )
+            
+            for ( i, phash_id ) in enumerate( new_phash_ids ):
+                
+                self._phash_ids_to_indices[ phash_id ] = start_index + i
+                
+            
+            self._pending_phash_ids_to_phashes = collections.OrderedDict()
+            
+        
+    
+    def AddPHash( self, phash_id, phash ):
+        
+        with self._lock:
+            
+            if phash_id in self._phash_ids_to_indices or phash_id in self._pending_phash_ids_to_phashes:
+                
+                return
+                
+            
+            self._pending_phash_ids_to_phashes[ phash_id ] = phash
+            
+        
+    
+    def RemovePHashIds( self, phash_ids ):
+        
+        with self._lock:
+            
+            for phash_id in phash_ids:
+                
+                if phash_id in self._pending_phash_ids_to_phashes:
+                    
+                    del self._pending_phash_ids_to_phashes[ phash_id ]
+                    
+                elif phash_id in self._phash_ids_to_indices:
+                    
+                    index = self._phash_ids_to_indices.pop( phash_id )
+                    
+                    self._phash_ids[ index ] = -1
+                    
+                    self._num_dead += 1
+                    
+                
+            
+        
+    
+    def Search( self, search_phashes, max_hamming_distance ):
+        
+        # returns a list, one per search phash, of phash_id -> distance dicts
+        
+        with self._lock:
+            
+            self._Consolidate()
+            
+            results = [ {} for search_phash in search_phashes ]
+            
+            num_phashes = len( self._phashes )
+            
+            if num_phashes == 0 or len( search_phashes ) == 0:
+                
+                return results
+                
+            
+            search_array = HydrusData.ConvertPHashesToNumPy( search_phashes )
+            
+            num_searches = len( search_array )
+            
+            block_size = max( 1, SEARCH_BLOCK_CELLS // num_searches )
+            
+            for block_start in range( 0, num_phashes, block_size ):
+                
+                block_phashes = self._phashes[ block_start : block_start + block_size ]
+                block_phash_ids = self._phash_ids[ block_start : block_start + block_size ]
+                
+                distances = HydrusData.Get64BitHammingDistanceMatrix( search_array, block_phashes )
+                
+                ( search_indices, block_indices ) = numpy.nonzero( distances <= max_hamming_distance )
+                
+                hit_phash_ids = block_phash_ids[ block_indices ]
+                hit_distances = distances[ search_indices, block_indices ]
+                
+                for ( search_index, phash_id, distance ) in zip( search_indices.tolist(), hit_phash_ids.tolist(), hit_distances.tolist() ):
+                    
+                    if phash_id == -1:
+                        
+                        continue
+                        
+                    
+                    results[ search_index ][ phash_id ] = distance
+                    
+                
+            
+            return results
+            
+        
+    
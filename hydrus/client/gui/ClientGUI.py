@@ -1396,6 +1396,55 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
             
         
     
+    def _DebugBenchmarkThumbnailDecoding( self ):
+        
+        page = self._notebook.GetCurrentMediaPage()
+        
+        if page is None:
+            
+            return
+            
+        
+        medias = page.GetMedia()
+        
+        if len( medias ) == 0:
+            
+            return
+            
+        
+        def do_it( medias ):
+            
+            thumbnail_cache = self._controller.GetCache( 'thumbnail' )
+            
+            max_workers = os.cpu_count()
+            
+            if max_workers is None:
+                
+                max_workers = 4
+                
+            
+            nums_workers = []
+            
+            num_workers = 1
+            
+            while num_workers <= max_workers:
+                
+                nums_workers.append( num_workers )
+                
+                num_workers *= 2
+                
+            
+            for ( num_workers, thumbnails_per_second ) in thumbnail_cache.BenchmarkThumbnailDecoding( medias, nums_workers ):
+                
+                HydrusData.ShowText( 'Thumbnail decode benchmark, {} worker(s): {} thumbnails per second'.format( num_workers, HydrusData.ToHumanInt( int( thumbnails_per_second ) ) ) )
+                
+            
+        
+        HydrusData.ShowText( 'Benchmarking thumbnail decoding for {} files.'.format( HydrusData.ToHumanInt( len( medias ) ) ) )
+        
+        self._controller.CallToThread( do_it, medias )
+        
+    
     def _DebugShowGarbageDifferences( self ):
         
         count = collections.Counter()
@@ -1426,6 +1475,22 @@ class FrameGUI( ClientGUITopLevelWindows.MainFrameThatResizes ):
         HydrusData.ShowText( text )
         
     
+    def _DebugShowMediaCacheStatistics( self ):
+        
+        for name in ( 'images', 'thumbnail' ):
+            
+            statistics = self._controller.GetCache( name ).GetStatistics()
+            
+            num_requests = statistics[ 'hits' ] + statistics[ 'misses' ]
+            
+            hit_rate = statistics[ 'hits' ] / max( num_requests, 1 )
+            
+            message = '{}: {} items using {} of {}. {} hits, {} misses ({} hit rate), {} evictions.'.format( statistics[ 'name' ], HydrusData.ToHumanInt( statistics[ 'num_items' ] ), HydrusData.ToHumanBytes( statistics[ 'estimated_memory_footprint' ] ), HydrusData.ToHumanBytes( statistics[ 'cache_size' ] ), HydrusData.ToHumanInt( statistics[ 'hits' ] ), HydrusData.ToHumanInt( statistics[ 'misses' ] ), HydrusData.ConvertFloatToPercentage( hit_rate ), HydrusData.ToHumanInt( statistics[ 'evictions' ] ) )
+            
+            HydrusData.ShowText( message )
+            
+        
+    
     def _DebugTakeGarbageSnapshot( self ):
         
         count = collections.Counter()
@@ -4754,6 +4819,7 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
             ClientGUIMenus.AppendMenuItem( data_actions, 'subscription manager snapshot', 'Have the subscription system show what it is doing.', self._controller.subscriptions_manager.ShowSnapshot )
             ClientGUIMenus.AppendMenuItem( data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
+            ClientGUIMenus.AppendMenuItem( data_actions, 'benchmark thumbnail decoding', 'Decode all the thumbnails in the current page with different numbers of threads and report how many thumbnails per second each managed.', self._DebugBenchmarkThumbnailDecoding )
             ClientGUIMenus.AppendMenuItem( data_actions, 'enable truncated image loading', 'Enable the truncated image loading to test out broken jpegs.', self._EnableLoadTruncatedImages )
             
             ClientGUIMenus.AppendMenu( debug, data_actions, 'data actions' )
@@ -4765,6 +4831,7 @@ The password is cleartext here but obscured in the entry dialog. Enter a blank p
             ClientGUIMenus.AppendMenuItem( memory_actions, 'clear image rendering cache', 'Tell the image rendering system to forget all current images. This will often free up a bunch of memory immediately.', self._controller.ClearCaches )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'clear thumbnail cache', 'Tell the thumbnail cache to forget everything and redraw all current thumbs.', self._controller.pub, 'reset_thumbnail_cache' )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'clear db service info cache', 'Delete all cached service info like total number of mappings or files, in case it has become desynchronised. Some parts of the gui may be laggy immediately after this as these numbers are recalculated.', self._DeleteServiceInfo )
+            ClientGUIMenus.AppendMenuItem( memory_actions, 'show image and thumbnail cache statistics', 'Show how well the image and thumbnail caches are doing, to help size them.', self._DebugShowMediaCacheStatistics )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'print garbage', 'Print some information about the python garbage to the log.', self._DebugPrintGarbage )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'take garbage snapshot', 'Capture current garbage object counts.', self._DebugTakeGarbageSnapshot )
             ClientGUIMenus.AppendMenuItem( memory_actions, 'show garbage snapshot changes', 'Show object count differences from the last snapshot.', self._DebugShowGarbageDifferences )
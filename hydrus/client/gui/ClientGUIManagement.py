@@ -931,6 +931,10 @@ class ManagementPanelDuplicateFilter( ManagementPanel ):
         
         menu_items.append( ( 'check', 'search for duplicate pairs at the current distance during normal db maintenance', 'Tell the client to find duplicate pairs in its normal db maintenance cycles, whether you have that set to idle or shutdown time.', check_manager ) )
         
+        check_manager = ClientGUICommon.CheckboxManagerOptions( 'use_in_memory_similar_files_index' )
+        
+        menu_items.append( ( 'check', 'keep all similar files data in memory for faster searching', 'Load every perceptual hash into a memory index and search them all at once, rather than walking the search tree on disk. This is much faster for large clients, but it costs some memory and a little time to load.', check_manager ) )
+        
         self._cog_button = ClientGUICommon.MenuBitmapButton( self._main_left_panel, CC.global_pixmaps().cog, menu_items )
         
         menu_items = []
@@ -22,6 +22,7 @@ from hydrus.core import HydrusTags
 from hydrus.core import HydrusText
 from hydrus.client import ClientConstants as CC
 from hydrus.client.media import ClientMedia
+from hydrus.client import ClientParsing
 from hydrus.client import ClientRatings
 from hydrus.client import ClientServices
 from hydrus.client.gui import ClientGUIACDropdown
@@ -43,7 +44,9 @@ from hydrus.client.gui import ClientGUIStyle
 from hydrus.client.gui import ClientGUITime
 from hydrus.client.gui import ClientGUITopLevelWindowsPanels
 from hydrus.client.gui import QtPorting as QP
+from hydrus.client.networking import ClientNetworkingAsync
 from hydrus.client.networking import ClientNetworkingContexts
+from hydrus.client.networking import ClientNetworkingDomain
 from hydrus.client.networking import ClientNetworkingJobs
 from hydrus.client.networking import ClientNetworkingSessions
 
@@ -1723,6 +1726,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._verify_regular_https = QW.QCheckBox( general )
             
+            self._network_async_downloads = QW.QCheckBox( general )
+            self._network_async_downloads.setToolTip( 'Normal downloads will share one background thread rather than taking a thread each. Uploads, proxied traffic and hydrus services are unaffected. This needs the h11 library.' )
+            
+            if not ClientNetworkingAsync.H11_OK:
+                
+                self._network_async_downloads.setEnabled( False )
+                
+            
             if self._new_options.GetBoolean( 'advanced_mode' ):
                 
                 network_timeout_min = 1
@@ -1764,6 +1775,40 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            connection_pool_panel = ClientGUICommon.StaticBox( self, 'connection pooling' )
+            
+            self._network_connection_pool_hosts = QP.MakeQSpinBox( connection_pool_panel, min = 1, max = 100 )
+            self._network_connection_pool_hosts.setToolTip( 'How many different hosts each session will keep a pool of open connections for.' )
+            
+            self._network_connection_pool_size = QP.MakeQSpinBox( connection_pool_panel, min = 1, max = 100 )
+            self._network_connection_pool_size.setToolTip( 'How many open connections will be kept alive for reuse per host.' )
+            
+            self._network_connection_max_requests = ClientGUICommon.NoneableSpinCtrl( connection_pool_panel, none_phrase = 'no limit', min = 1, max = 10000 )
+            self._network_connection_max_requests.setToolTip( 'After this many requests down one kept-alive connection, the client will ask the server to close it, and the next request will get a new one.' )
+            
+            self._network_connection_idle_timeout = QP.MakeQSpinBox( connection_pool_panel, min = 5, max = 3600 )
+            self._network_connection_idle_timeout.setToolTip( 'If a session makes no requests for this long, its kept-alive connections will be closed.' )
+            
+            max_network_jobs_per_specific_domain = { domain : str( max_jobs ) for ( domain, max_jobs ) in self._new_options.GetMaxNetworkJobsPerSpecificDomain().items() }
+            
+            self._max_network_jobs_per_specific_domain = ClientGUIStringControls.StringToStringDictControl( connection_pool_panel, max_network_jobs_per_specific_domain, min_height = 4, key_name = 'domain', value_name = 'max simultaneous jobs' )
+            
+            network_connection_pool_settings_per_specific_domain = {}
+            
+            for ( domain, ( pool_size, max_requests_per_connection, idle_timeout ) ) in self._new_options.GetNetworkConnectionPoolSettingsPerSpecificDomain().items():
+                
+                if max_requests_per_connection is None:
+                    
+                    max_requests_per_connection = 'none'
+                    
+                
+                network_connection_pool_settings_per_specific_domain[ domain ] = '{}, {}, {}'.format( pool_size, max_requests_per_connection, idle_timeout )
+                
+            
+            self._network_connection_pool_settings_per_specific_domain = ClientGUIStringControls.StringToStringDictControl( connection_pool_panel, network_connection_pool_settings_per_specific_domain, min_height = 4, key_name = 'domain', value_name = 'pool size, max requests per connection, idle timeout' )
+            
+            #
+            
             proxy_panel = ClientGUICommon.StaticBox( self, 'proxy settings' )
             
             self._http_proxy = ClientGUICommon.NoneableTextCtrl( proxy_panel )
@@ -1772,6 +1817,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             #
             
             self._verify_regular_https.setChecked( self._new_options.GetBoolean( 'verify_regular_https' ) )
+            self._network_async_downloads.setChecked( self._new_options.GetBoolean( 'network_async_downloads' ) )
             
             self._http_proxy.SetValue( self._new_options.GetNoneableString( 'http_proxy' ) )
             self._https_proxy.SetValue( self._new_options.GetNoneableString( 'https_proxy' ) )
@@ -1788,6 +1834,11 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._max_network_jobs.setValue( self._new_options.GetInteger( 'max_network_jobs' ) )
             self._max_network_jobs_per_domain.setValue( self._new_options.GetInteger( 'max_network_jobs_per_domain' ) )
             
+            self._network_connection_pool_hosts.setValue( self._new_options.GetInteger( 'network_connection_pool_hosts' ) )
+            self._network_connection_pool_size.setValue( self._new_options.GetInteger( 'network_connection_pool_size' ) )
+            self._network_connection_max_requests.SetValue( self._new_options.GetNoneableInteger( 'network_connection_max_requests' ) )
+            self._network_connection_idle_timeout.setValue( self._new_options.GetInteger( 'network_connection_idle_timeout' ) )
+            
             #
             
             if self._new_options.GetBoolean( 'advanced_mode' ):
@@ -1810,6 +1861,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Halt new jobs as long as this many network infrastructure errors on their domain (0 for never wait): ', self._domain_network_infrastructure_error_velocity ) )
             rows.append( ( 'max number of simultaneous active network jobs: ', self._max_network_jobs ) )
             rows.append( ( 'max number of simultaneous active network jobs per domain: ', self._max_network_jobs_per_domain ) )
+            rows.append( ( 'EXPERIMENTAL: run downloads on a shared async loop:', self._network_async_downloads ) )
             rows.append( ( 'BUGFIX: verify regular https traffic:', self._verify_regular_https ) )
             
             gridbox = ClientGUICommon.WrapInGrid( general, rows )
@@ -1847,9 +1899,37 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            rows = []
+            
+            rows.append( ( 'max number of hosts to keep connections open for: ', self._network_connection_pool_hosts ) )
+            rows.append( ( 'max number of open connections per host: ', self._network_connection_pool_size ) )
+            rows.append( ( 'max number of requests per connection: ', self._network_connection_max_requests ) )
+            rows.append( ( 'close idle connections after (seconds): ', self._network_connection_idle_timeout ) )
+            
+            gridbox = ClientGUICommon.WrapInGrid( connection_pool_panel, rows )
+            
+            connection_pool_panel.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
+            
+            st = ClientGUICommon.BetterStaticText( connection_pool_panel, label = 'You can override the max number of simultaneous active network jobs for specific domains here, e.g. "example.com" to "2".' )
+            
+            st.setWordWrap( True )
+            
+            connection_pool_panel.Add( st, CC.FLAGS_EXPAND_PERPENDICULAR )
+            connection_pool_panel.Add( self._max_network_jobs_per_specific_domain, CC.FLAGS_EXPAND_BOTH_WAYS )
+            
+            st = ClientGUICommon.BetterStaticText( connection_pool_panel, label = 'You can also override the connection pool settings above for specific domains, e.g. "example.com" to "4, 100, 30". Use "none" for no limit on requests per connection.' )
+            
+            st.setWordWrap( True )
+            
+            connection_pool_panel.Add( st, CC.FLAGS_EXPAND_PERPENDICULAR )
+            connection_pool_panel.Add( self._network_connection_pool_settings_per_specific_domain, CC.FLAGS_EXPAND_BOTH_WAYS )
+            
+            #
+            
             vbox = QP.VBoxLayout()
             
             QP.AddToLayout( vbox, general, CC.FLAGS_EXPAND_PERPENDICULAR )
+            QP.AddToLayout( vbox, connection_pool_panel, CC.FLAGS_EXPAND_PERPENDICULAR )
             QP.AddToLayout( vbox, proxy_panel, CC.FLAGS_EXPAND_PERPENDICULAR )
             QP.AddToLayout( vbox, QW.QWidget( self ), CC.FLAGS_EXPAND_BOTH_WAYS )
             
@@ -1859,6 +1939,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
         def UpdateOptions( self ):
             
             self._new_options.SetBoolean( 'verify_regular_https', self._verify_regular_https.isChecked() )
+            self._new_options.SetBoolean( 'network_async_downloads', self._network_async_downloads.isChecked() )
             
             self._new_options.SetNoneableString( 'http_proxy', self._http_proxy.GetValue() )
             self._new_options.SetNoneableString( 'https_proxy', self._https_proxy.GetValue() )
@@ -1869,6 +1950,74 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'max_network_jobs', self._max_network_jobs.value() )
             self._new_options.SetInteger( 'max_network_jobs_per_domain', self._max_network_jobs_per_domain.value() )
             
+            self._new_options.SetInteger( 'network_connection_pool_hosts', self._network_connection_pool_hosts.value() )
+            self._new_options.SetInteger( 'network_connection_pool_size', self._network_connection_pool_size.value() )
+            self._new_options.SetNoneableInteger( 'network_connection_max_requests', self._network_connection_max_requests.GetValue() )
+            self._new_options.SetInteger( 'network_connection_idle_timeout', self._network_connection_idle_timeout.value() )
+            
+            domains_to_max_jobs = {}
+            
+            for ( domain, max_jobs ) in self._max_network_jobs_per_specific_domain.GetValue().items():
+                
+                try:
+                    
+                    second_level_domain = ClientNetworkingDomain.ConvertDomainIntoSecondLevelDomain( domain )
+                    
+                    max_jobs = int( max_jobs )
+                    
+                except ( HydrusExceptions.URLClassException, ValueError ):
+                    
+                    continue
+                    
+                
+                if max_jobs > 0:
+                    
+                    domains_to_max_jobs[ second_level_domain ] = max_jobs
+                    
+                
+            
+            self._new_options.SetMaxNetworkJobsPerSpecificDomain( domains_to_max_jobs )
+            
+            domains_to_pool_settings = {}
+            
+            for ( domain, pool_settings_string ) in self._network_connection_pool_settings_per_specific_domain.GetValue().items():
+                
+                try:
+                    
+                    second_level_domain = ClientNetworkingDomain.ConvertDomainIntoSecondLevelDomain( domain )
+                    
+                    ( pool_size, max_requests_per_connection, idle_timeout ) = [ value.strip() for value in pool_settings_string.split( ',' ) ]
+                    
+                    pool_size = int( pool_size )
+                    idle_timeout = int( idle_timeout )
+                    
+                    if max_requests_per_connection.lower() == 'none':
+                        
+                        max_requests_per_connection = None
+                        
+                    else:
+                        
+                        max_requests_per_connection = int( max_requests_per_connection )
+                        
+                        if max_requests_per_connection < 1:
+                            
+                            continue
+                            
+                        
+                    
+                except ( HydrusExceptions.URLClassException, ValueError ):
+                    
+                    continue
+                    
+                
+                if pool_size > 0 and idle_timeout > 0:
+                    
+                    domains_to_pool_settings[ second_level_domain ] = ( pool_size, max_requests_per_connection, idle_timeout )
+                    
+                
+            
+            self._new_options.SetNetworkConnectionPoolSettingsPerSpecificDomain( domains_to_pool_settings )
+            
             ( number, time_delta ) = self._domain_network_infrastructure_error_velocity.GetValue()
             
             self._new_options.SetInteger( 'domain_network_infrastructure_error_number', number )
@@ -1903,6 +2052,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._gallery_page_wait_period_subscriptions = QP.MakeQSpinBox( subscriptions, min=1, max=30 )
             self._max_simultaneous_subscriptions = QP.MakeQSpinBox( subscriptions, min=1, max=100 )
+            self._max_simultaneous_subscription_queries = QP.MakeQSpinBox( subscriptions, min=1, max=20 )
+            self._max_simultaneous_subscription_queries.setToolTip( 'A subscription will work on queries that hit different domains at the same time, up to this many. Queries on the same domain still take turns.' )
             
             self._subscription_file_error_cancel_threshold = ClientGUICommon.NoneableSpinCtrl( subscriptions, min = 1, max = 1000000, unit = 'errors' )
             self._subscription_file_error_cancel_threshold.setToolTip( 'This is a simple patch and will be replaced with a better "retry network errors later" system at some point, but is useful to increase if you have subs to unreliable websites.' )
@@ -1934,6 +2085,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._show_new_on_file_seed_short_summary = QW.QCheckBox( misc )
             self._show_deleted_on_file_seed_short_summary = QW.QCheckBox( misc )
             
+            self._parse_html_with_lxml = QW.QCheckBox( misc )
+            self._parse_html_with_lxml.setToolTip( 'HTML parsers will read pages with lxml directly rather than through html5lib. This is much faster, and the page is tidied to match html5lib, but odd markup may still parse differently. This needs the lxml library.' )
+            
+            if not ClientParsing.LXML_IS_OK:
+                
+                self._parse_html_with_lxml.setEnabled( False )
+                
+            
             if self._new_options.GetBoolean( 'advanced_mode' ):
                 
                 delay_min = 1
@@ -1970,6 +2129,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._gallery_page_wait_period_subscriptions.setValue( self._new_options.GetInteger( 'gallery_page_wait_period_subscriptions' ) )
             self._gallery_page_wait_period_subscriptions.setToolTip( gallery_page_tt )
             self._max_simultaneous_subscriptions.setValue( self._new_options.GetInteger( 'max_simultaneous_subscriptions' ) )
+            self._max_simultaneous_subscription_queries.setValue( self._new_options.GetInteger( 'max_simultaneous_subscription_queries' ) )
             
             self._subscription_file_error_cancel_threshold.SetValue( self._new_options.GetNoneableInteger( 'subscription_file_error_cancel_threshold' ) )
             
@@ -1979,6 +2139,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._stop_character.setText( self._new_options.GetString( 'stop_character' ) )
             self._show_new_on_file_seed_short_summary.setChecked( self._new_options.GetBoolean( 'show_new_on_file_seed_short_summary' ) )
             self._show_deleted_on_file_seed_short_summary.setChecked( self._new_options.GetBoolean( 'show_deleted_on_file_seed_short_summary' ) )
+            self._parse_html_with_lxml.setChecked( self._new_options.GetBoolean( 'parse_html_with_lxml' ) )
             
             self._watcher_page_wait_period.setValue( self._new_options.GetInteger( 'watcher_page_wait_period' ) )
             self._watcher_page_wait_period.setToolTip( gallery_page_tt )
@@ -2007,6 +2168,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             rows.append( ( 'Additional fixed time (in seconds) to wait between gallery page fetches:', self._gallery_page_wait_period_subscriptions ) )
             rows.append( ( 'Maximum number of subscriptions that can sync simultaneously:', self._max_simultaneous_subscriptions ) )
+            rows.append( ( 'Maximum number of queries a subscription can work on simultaneously:', self._max_simultaneous_subscription_queries ) )
             rows.append( ( 'If a subscription has this many failed file imports, stop and continue later:', self._subscription_file_error_cancel_threshold ) )
             rows.append( ( 'Sync subscriptions in random order:', self._process_subs_in_random_order ) )
             
@@ -2038,6 +2200,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Delay time on a gallery/watcher network error:', self._downloader_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription network error:', self._subscription_network_error_delay ) )
             rows.append( ( 'Delay time on a subscription other error:', self._subscription_other_error_delay ) )
+            rows.append( ( 'EXPERIMENTAL: parse html with lxml:', self._parse_html_with_lxml ) )
             
             gridbox = ClientGUICommon.WrapInGrid( misc, rows )
             
@@ -2067,6 +2230,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._new_options.SetInteger( 'gallery_page_wait_period_subscriptions', self._gallery_page_wait_period_subscriptions.value() )
             self._new_options.SetInteger( 'max_simultaneous_subscriptions', self._max_simultaneous_subscriptions.value() )
+            self._new_options.SetInteger( 'max_simultaneous_subscription_queries', self._max_simultaneous_subscription_queries.value() )
             self._new_options.SetNoneableInteger( 'subscription_file_error_cancel_threshold', self._subscription_file_error_cancel_threshold.GetValue() )
             self._new_options.SetBoolean( 'process_subs_in_random_order', self._process_subs_in_random_order.isChecked() )
             
@@ -2080,6 +2244,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetString( 'stop_character', self._stop_character.text() )
             self._new_options.SetBoolean( 'show_new_on_file_seed_short_summary', self._show_new_on_file_seed_short_summary.isChecked() )
             self._new_options.SetBoolean( 'show_deleted_on_file_seed_short_summary', self._show_deleted_on_file_seed_short_summary.isChecked() )
+            self._new_options.SetBoolean( 'parse_html_with_lxml', self._parse_html_with_lxml.isChecked() )
             
             self._new_options.SetInteger( 'subscription_network_error_delay', self._subscription_network_error_delay.GetValue() )
             self._new_options.SetInteger( 'subscription_other_error_delay', self._subscription_other_error_delay.GetValue() )
@@ -3041,6 +3206,15 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            local_panel = ClientGUICommon.StaticBox( self, 'local file imports' )
+            
+            self._file_import_preparation_workers = QP.MakeQSpinBox( local_panel, min = 0, max = 64 )
+            self._file_import_preparation_workers.setToolTip( 'When importing from your hard drive or an import folder, this many threads will copy, hash and generate thumbnails for the next files in the queue while the current one is saved. Each keeps a temporary copy of its file until the import gets to it, so this is also how many files it will work ahead. Set 0 to do one file at a time.' )
+            
+            self._file_import_preparation_workers.setValue( self._new_options.GetInteger( 'file_import_preparation_workers' ) )
+            
+            #
+            
             rows = []
             
             rows.append( ( 'For \'quiet\' import contexts like import folders and subscriptions:', self._quiet_fios ) )
@@ -3050,11 +3224,20 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             default_fios.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
             
+            rows = []
+            
+            rows.append( ( 'Threads preparing upcoming files:', self._file_import_preparation_workers ) )
+            
+            gridbox = ClientGUICommon.WrapInGrid( local_panel, rows )
+            
+            local_panel.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
+            
             #
             
             vbox = QP.VBoxLayout()
             
             QP.AddToLayout( vbox, default_fios, CC.FLAGS_EXPAND_PERPENDICULAR )
+            QP.AddToLayout( vbox, local_panel, CC.FLAGS_EXPAND_PERPENDICULAR )
             QP.AddToLayout( vbox, QW.QWidget( self ), CC.FLAGS_EXPAND_BOTH_WAYS )
             
             self.setLayout( vbox )
@@ -3065,6 +3248,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetDefaultFileImportOptions( 'quiet', self._quiet_fios.GetValue() )
             self._new_options.SetDefaultFileImportOptions( 'loud', self._loud_fios.GetValue() )
             
+            self._new_options.SetInteger( 'file_import_preparation_workers', self._file_import_preparation_workers.value() )
+            
         
     
     class _MaintenanceAndProcessingPanel( QW.QWidget ):
@@ -3918,6 +4103,15 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._image_cache_timeout = ClientGUITime.TimeDeltaButton( media_panel, min = 300, days = True, hours = True, minutes = True )
             self._image_cache_timeout.setToolTip( 'The amount of time after which a rendered image in the cache will naturally be removed, if it is not shunted out due to a new member exceeding the size limit. Requires restart to kick in.' )
             
+            self._thumbnail_waterfall_workers = QP.MakeQSpinBox( media_panel, min = 1, max = 64 )
+            self._thumbnail_waterfall_workers.setToolTip( 'How many threads will load and decode thumbnails at once when a page is first drawn. If you have many cores and a fast drive, more threads will fill big pages faster. Requires restart to kick in.' )
+            
+            self._scan_resistant_media_caches = QW.QCheckBox( media_panel )
+            self._scan_resistant_media_caches.setToolTip( 'If checked, new thumbnails and images will first go into a small probationary part of their cache, and only get into the main part if they are asked for again later. This stops one long scroll through a big page from pushing out everything you keep coming back to. Requires restart to kick in.' )
+            
+            self._decoded_thumbnail_disk_cache = ClientGUIControls.NoneableBytesControl( media_panel, initial_value = 512 * 1024 * 1024, none_label = 'do not keep decoded thumbnails on disk' )
+            self._decoded_thumbnail_disk_cache.setToolTip( 'The client can keep decoded thumbnails in a set of memory-mapped files in your db directory, so thumbnails that have fallen out of the memory cache, or that are loaded again after a restart, do not have to be decoded again. Each thumbnail takes about four bytes per pixel of your thumbnail dimensions. Requires restart to kick in.' )
+            
             #
             
             buffer_panel = ClientGUICommon.StaticBox( self, 'video buffer' )
@@ -3927,6 +4121,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._estimated_number_video_frames = QW.QLabel( '', buffer_panel )
             
+            self._video_frame_cache_mb = QP.MakeQSpinBox( buffer_panel, min = 0, max = 16 * 1024 )
+            self._video_frame_cache_mb.setToolTip( 'Recently decoded video frames are also kept in a cache shared by all your media viewers, so seeking back to somewhere you just were, or reopening a video, does not have to wait on ffmpeg. Set 0 to turn it off. Requires restart to kick in.' )
+            
             #
             
             ac_panel = ClientGUICommon.StaticBox( self, 'tag autocomplete' )
@@ -3966,7 +4163,25 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._thumbnail_cache_timeout.SetValue( self._new_options.GetInteger( 'thumbnail_cache_timeout' ) )
             self._image_cache_timeout.SetValue( self._new_options.GetInteger( 'image_cache_timeout' ) )
             
+            decoded_thumbnail_disk_cache_mb = self._new_options.GetNoneableInteger( 'decoded_thumbnail_disk_cache_mb' )
+            
+            if decoded_thumbnail_disk_cache_mb is None:
+                
+                decoded_thumbnail_disk_cache = decoded_thumbnail_disk_cache_mb
+                
+            else:
+                
+                decoded_thumbnail_disk_cache = decoded_thumbnail_disk_cache_mb * 1024 * 1024
+                
+            
+            self._decoded_thumbnail_disk_cache.SetValue( decoded_thumbnail_disk_cache )
+            
+            self._thumbnail_waterfall_workers.setValue( self._new_options.GetInteger( 'thumbnail_waterfall_workers' ) )
+            
+            self._scan_resistant_media_caches.setChecked( self._new_options.GetBoolean( 'scan_resistant_media_caches' ) )
+            
             self._video_buffer_size_mb.setValue( self._new_options.GetInteger( 'video_buffer_size_mb' ) )
+            self._video_frame_cache_mb.setValue( self._new_options.GetInteger( 'video_frame_cache_mb' ) )
             
             self._autocomplete_results_fetch_automatically.setChecked( self._new_options.GetBoolean( 'autocomplete_results_fetch_automatically' ) )
             
@@ -4013,6 +4228,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'MB memory reserved for image cache: ', fullscreens_sizer ) )
             rows.append( ( 'Thumbnail cache timeout: ', self._thumbnail_cache_timeout ) )
             rows.append( ( 'Image cache timeout: ', self._image_cache_timeout ) )
+            rows.append( ( 'Threads for loading thumbnails: ', self._thumbnail_waterfall_workers ) )
+            rows.append( ( 'Protect frequently used thumbnails and images from big scrolls: ', self._scan_resistant_media_caches ) )
+            rows.append( ( 'Disk space for decoded thumbnails: ', self._decoded_thumbnail_disk_cache ) )
             
             gridbox = ClientGUICommon.WrapInGrid( media_panel, rows )
             
@@ -4035,6 +4253,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows = []
             
             rows.append( ( 'MB memory for video buffer: ', video_buffer_sizer ) )
+            rows.append( ( 'MB memory for shared video frame cache: ', self._video_frame_cache_mb ) )
             
             gridbox = ClientGUICommon.WrapInGrid( buffer_panel, rows )
             
@@ -4153,7 +4372,25 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'thumbnail_cache_timeout', self._thumbnail_cache_timeout.GetValue() )
             self._new_options.SetInteger( 'image_cache_timeout', self._image_cache_timeout.GetValue() )
             
+            self._new_options.SetInteger( 'thumbnail_waterfall_workers', self._thumbnail_waterfall_workers.value() )
+            
+            self._new_options.SetBoolean( 'scan_resistant_media_caches', self._scan_resistant_media_caches.isChecked() )
+            
+            decoded_thumbnail_disk_cache = self._decoded_thumbnail_disk_cache.GetValue()
+            
+            if decoded_thumbnail_disk_cache is None:
+                
+                decoded_thumbnail_disk_cache_mb = decoded_thumbnail_disk_cache
+                
+            else:
+                
+                decoded_thumbnail_disk_cache_mb = decoded_thumbnail_disk_cache // ( 1024 * 1024 )
+                
+            
+            self._new_options.SetNoneableInteger( 'decoded_thumbnail_disk_cache_mb', decoded_thumbnail_disk_cache_mb )
+            
             self._new_options.SetInteger( 'video_buffer_size_mb', self._video_buffer_size_mb.value() )
+            self._new_options.SetInteger( 'video_frame_cache_mb', self._video_frame_cache_mb.value() )
             
             self._new_options.SetNoneableInteger( 'forced_search_limit', self._forced_search_limit.GetValue() )
             
@@ -3773,7 +3773,7 @@ class ReviewNetworkJobs( ClientGUIScrolledPanels.ReviewPanel ):
         
         self._list_ctrl_panel = ClientGUIListCtrl.BetterListCtrlPanel( self )
         
-        columns = [ ( 'position', 20 ), ( 'url', -1 ), ( 'status', 40 ), ( 'current speed', 8 ), ( 'progress', 12 ) ]
+        columns = [ ( 'position', 20 ), ( 'url', -1 ), ( 'status', 40 ), ( 'current speed', 8 ), ( 'progress', 12 ), ( 'connection', 8 ) ]
         
         self._list_ctrl = ClientGUIListCtrl.BetterListCtrl( self._list_ctrl_panel, 'network jobs review', 20, 30, columns, self._ConvertDataToListCtrlTuples )
         
@@ -3806,6 +3806,7 @@ class ReviewNetworkJobs( ClientGUIScrolledPanels.ReviewPanel ):
         url = job.GetURL()
         ( status, current_speed, num_bytes_read, num_bytes_to_read ) = job.GetStatus()
         progress = ( num_bytes_read, num_bytes_to_read )
+        connection_reused = job.GetConnectionReused()
         
         pretty_position = ClientNetworking.job_status_str_lookup[ position ]
         pretty_url = url
@@ -3813,8 +3814,19 @@ class ReviewNetworkJobs( ClientGUIScrolledPanels.ReviewPanel ):
         pretty_current_speed = HydrusData.ToHumanBytes( current_speed ) + '/s'
         pretty_progress = HydrusData.ConvertValueRangeToBytes( num_bytes_read, num_bytes_to_read )
         
-        display_tuple = ( pretty_position, pretty_url, pretty_status, pretty_current_speed, pretty_progress )
-        sort_tuple = ( position, url, status, current_speed, progress )
+        if connection_reused is None:
+            
+            pretty_connection = ''
+            sort_connection = -1
+            
+        else:
+            
+            pretty_connection = 'reused' if connection_reused else 'new'
+            sort_connection = int( connection_reused )
+            
+        
+        display_tuple = ( pretty_position, pretty_url, pretty_status, pretty_current_speed, pretty_progress, pretty_connection )
+        sort_tuple = ( position, url, status, current_speed, progress, sort_connection )
         
         return ( display_tuple, sort_tuple )
         
@@ -1,4 +1,6 @@
+import bisect
 import collections
+import gc
 import os
 import random
 import threading
@@ -46,6 +48,8 @@ class FileImportJob( object ):
         self._hash = None
         self._pre_import_status = None
         
+        self._header = None
+        
         self._file_info = None
         self._thumbnail_bytes = None
         self._phashes = None
@@ -77,16 +81,27 @@ class FileImportJob( object ):
             status_hook( 'calculating pre-import status' )
             
         
-        ( pre_import_status, hash, note ) = self.GenerateHashAndStatus()
+        if self._hash is None:
+            
+            ( pre_import_status, hash, note ) = self.GenerateHashAndStatus()
+            
+        else:
+            
+            # we were prepared ahead of time, but something else may have imported this file since
+            ( pre_import_status, hash, note ) = self.GenerateStatus()
+            
         
         if self.IsNewToDB():
             
-            if status_hook is not None:
+            if self._file_info is None:
                 
-                status_hook( 'generating metadata' )
+                if status_hook is not None:
+                    
+                    status_hook( 'generating metadata' )
+                    
+                
+                self.GenerateInfo()
                 
-            
-            self.GenerateInfo()
             
             self.CheckIsGoodToImport()
             
@@ -125,13 +140,20 @@ class FileImportJob( object ):
         
         HydrusImageHandling.ConvertToPngIfBmp( self._temp_path )
         
-        self._hash = HydrusFileHandling.GetHashFromPath( self._temp_path )
+        ( self._hash, md5, sha1, sha512, self._header ) = HydrusFileHandling.GetHashesAndHeaderFromPath( self._temp_path )
+        
+        self._extra_hashes = ( md5, sha1, sha512 )
         
         if HG.file_import_report_mode:
             
             HydrusData.ShowText( 'File import job hash: {}'.format( self._hash.hex() ) )
             
         
+        return self.GenerateStatus()
+        
+    
+    def GenerateStatus( self ):
+        
         ( self._pre_import_status, hash, note ) = HG.client_controller.Read( 'hash_status', 'sha256', self._hash, prefix = 'file recognised' )
         
         if HG.file_import_report_mode:
@@ -144,7 +166,7 @@ class FileImportJob( object ):
     
     def GenerateInfo( self ):
         
-        mime = HydrusFileHandling.GetMime( self._temp_path )
+        mime = HydrusFileHandling.GetMime( self._temp_path, bit_to_check = self._header )
         
         if HG.file_import_report_mode:
             
@@ -211,12 +233,15 @@ class FileImportJob( object ):
                 
             
         
-        if HG.file_import_report_mode:
+        if self._extra_hashes is None:
             
-            HydrusData.ShowText( 'File import job generating other hashes' )
+            if HG.file_import_report_mode:
+                
+                HydrusData.ShowText( 'File import job generating other hashes' )
+                
+            
+            self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
             
-        
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
         
         self._file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( self._temp_path )
         
@@ -294,9 +319,209 @@ class FileImportJob( object ):
         return False
         
     
+class FileImportJobPreparer( object ):
+    
+    # copies, hashes and generates file info, thumbnails and phashes for the next few paths of a path import in worker threads
+    # the import loop then only has to do file storage and the db write for each file, so a big folder is limited by disk rather than one core
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        self._file_seeds_to_events = {}
+        self._file_seeds_to_results = {}
+        
+    
+    def _CleanUpResult( self, result ):
+        
+        if result is not None:
+            
+            ( os_file_handle, temp_path, file_import_job ) = result
+            
+            HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+            
+        
+    
+    def _PrepareFileSeed( self, file_seed, file_import_options, limited_mimes ):
+        
+        result = None
+        
+        try:
+            
+            path = file_seed.file_seed_data
+            
+            if limited_mimes is not None:
+                
+                mime = HydrusFileHandling.GetMime( path )
+                
+                if mime not in limited_mimes:
+                    
+                    raise HydrusExceptions.VetoException( 'Not in allowed mimes!' )
+                    
+                
+            
+            ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+            
+            try:
+                
+                copied = HydrusPaths.MirrorFile( path, temp_path )
+                
+                if not copied:
+                    
+                    raise Exception( 'File failed to copy to temp path--see log for error.' )
+                    
+                
+                file_import_job = FileImportJob( temp_path, file_import_options )
+                
+                file_import_job.GenerateHashAndStatus()
+                
+                if file_import_job.IsNewToDB():
+                    
+                    file_import_job.GenerateInfo()
+                    
+                
+                result = ( os_file_handle, temp_path, file_import_job )
+                
+            except:
+                
+                HydrusPaths.CleanUpTempPath( os_file_handle, temp_path )
+                
+                raise
+                
+            
+        except:
+            
+            # the import loop will do this file the normal way, and that will deal with and report any error properly
+            
+            result = None
+            
+        
+        with self._lock:
+            
+            if file_seed in self._file_seeds_to_events:
+                
+                self._file_seeds_to_results[ file_seed ] = result
+                
+                self._file_seeds_to_events[ file_seed ].set()
+                
+            else:
+                
+                # we were cleaned up while working
+                
+                self._CleanUpResult( result )
+                
+            
+        
+    
+    def CleanUp( self ):
+        
+        with self._lock:
+            
+            for result in self._file_seeds_to_results.values():
+                
+                self._CleanUpResult( result )
+                
+            
+            for event in self._file_seeds_to_events.values():
+                
+                event.set()
+                
+            
+            self._file_seeds_to_events = {}
+            self._file_seeds_to_results = {}
+            
+        
+    
+    def GetPreparedFileImportJob( self, file_seed, file_import_options ):
+        
+        with self._lock:
+            
+            if file_seed not in self._file_seeds_to_events:
+                
+                return None
+                
+            
+            event = self._file_seeds_to_events[ file_seed ]
+            
+        
+        event.wait()
+        
+        with self._lock:
+            
+            if file_seed not in self._file_seeds_to_results:
+                
+                return None
+                
+            
+            del self._file_seeds_to_events[ file_seed ]
+            
+            result = self._file_seeds_to_results.pop( file_seed )
+            
+        
+        if result is not None:
+            
+            ( os_file_handle, temp_path, file_import_job ) = result
+            
+            if file_import_job.GetFileImportOptions() is not file_import_options:
+                
+                # the options changed since we started, so this work may be invalid
+                
+                self._CleanUpResult( result )
+                
+                return None
+                
+            
+        
+        return result
+        
+    
+    def PrepareNextFileSeeds( self, file_seed_cache: "FileSeedCache", file_import_options, limited_mimes = None ):
+        
+        num_workers = HG.client_controller.new_options.GetInteger( 'file_import_preparation_workers' )
+        
+        # one thread per outstanding file seed. each is holding a temp file once it is done, so we don't get further ahead than that
+        max_outstanding = num_workers
+        
+        file_seeds = file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, max_outstanding )
+        
+        with self._lock:
+            
+            for file_seed in file_seeds:
+                
+                if file_seed.file_seed_type != FILE_SEED_TYPE_HDD:
+                    
+                    continue
+                    
+                
+                if file_seed in self._file_seeds_to_events:
+                    
+                    continue
+                    
+                
+                if len( self._file_seeds_to_events ) >= max_outstanding:
+                    
+                    break
+                    
+                
+                self._file_seeds_to_events[ file_seed ] = threading.Event()
+                
+                HG.client_controller.CallToThread( self._PrepareFileSeed, file_seed, file_import_options, limited_mimes )
+                
+            
+        
+    
+
+
 FILE_SEED_TYPE_HDD = 0
 FILE_SEED_TYPE_URL = 1
 
+# a batch url/hash status lookup made when new file seeds are added is trusted for this long. a queue that is worked later than that checks live
+PRE_IMPORT_STATUS_LOOKUP_LIFETIME = 3600
+# a miss is only trusted briefly, since the file may have been imported by something else in the meantime
+# when a file seed is worked after that, it and the next file seeds in its queue are looked up again together, in one db job
+PRE_IMPORT_STATUS_LOOKUP_MISS_LIFETIME = 60
+PRE_IMPORT_STATUS_LOOKUP_REFRESH_BATCH_SIZE = 50
+
 class FileSeed( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_FILE_SEED
@@ -334,6 +559,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self._tags = set()
         self._hashes = {}
         
+        self._pre_import_status_lookup = None
+        self._pre_import_status_lookup_time = 0
+        
     
     def __eq__( self, other ):
         
@@ -382,6 +610,56 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self._hashes = { hash_type : bytes.fromhex( encoded_hash ) for ( hash_type, encoded_hash ) in serialisable_hashes if encoded_hash is not None }
         
     
+    def _GetPreImportStatusLookup( self ):
+        
+        if self._pre_import_status_lookup is not None and HydrusData.TimeHasPassed( self._pre_import_status_lookup_time + PRE_IMPORT_STATUS_LOOKUP_LIFETIME ):
+            
+            self._pre_import_status_lookup = None
+            
+        
+        return self._pre_import_status_lookup
+        
+    
+    def _PreImportStatusLookupMissesAreFresh( self ):
+        
+        return not HydrusData.TimeHasPassed( self._pre_import_status_lookup_time + PRE_IMPORT_STATUS_LOOKUP_MISS_LIFETIME )
+        
+    
+    def _GetPreImportStatusURLsToCheck( self, file_url = None ):
+        
+        urls = set( self._urls )
+        
+        if file_url is not None:
+            
+            urls.add( file_url )
+            
+        
+        if self.file_seed_type == FILE_SEED_TYPE_URL:
+            
+            urls.add( self.file_seed_data )
+            
+        
+        urls_to_check = []
+        
+        for url in urls:
+            
+            if HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ):
+                
+                continue
+                
+            
+            # we now only trust url-matched single urls and the post/file urls
+            # trusting unmatched source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
+            
+            if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) or url in ( self.file_seed_data, file_url ):
+                
+                urls_to_check.append( url )
+                
+            
+        
+        return urls_to_check
+        
+    
     def _NormaliseAndFilterAssociableURLs( self, urls ):
         
         normalised_urls = set()
@@ -405,6 +683,73 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return associable_urls
         
     
+    def _ReadFileURLs( self, hash ):
+        
+        pre_import_status_lookup = self._GetPreImportStatusLookup()
+        
+        if pre_import_status_lookup is not None:
+            
+            ( urls_to_url_statuses, hash_types_and_hashes_to_hash_statuses, hashes_to_urls ) = pre_import_status_lookup
+            
+            if hash in hashes_to_urls:
+                
+                return hashes_to_urls[ hash ]
+                
+            
+        
+        media_result = HG.client_controller.Read( 'media_result', hash )
+        
+        return media_result.GetLocationsManager().GetURLs()
+        
+    
+    def _ReadHashStatus( self, hash_type, hash ):
+        
+        pre_import_status_lookup = self._GetPreImportStatusLookup()
+        
+        if pre_import_status_lookup is not None:
+            
+            ( urls_to_url_statuses, hash_types_and_hashes_to_hash_statuses, hashes_to_urls ) = pre_import_status_lookup
+            
+            if ( hash_type, hash ) in hash_types_and_hashes_to_hash_statuses:
+                
+                hash_status = hash_types_and_hashes_to_hash_statuses[ ( hash_type, hash ) ]
+                
+                ( status, status_hash, note ) = hash_status
+                
+                if status != CC.STATUS_UNKNOWN or self._PreImportStatusLookupMissesAreFresh():
+                    
+                    return hash_status
+                    
+                
+            
+        
+        return HG.client_controller.Read( 'hash_status', hash_type, hash, prefix = 'hash recognised' )
+        
+    
+    def _ReadURLStatuses( self, url ):
+        
+        pre_import_status_lookup = self._GetPreImportStatusLookup()
+        
+        if pre_import_status_lookup is not None:
+            
+            ( urls_to_url_statuses, hash_types_and_hashes_to_hash_statuses, hashes_to_urls ) = pre_import_status_lookup
+            
+            if url in urls_to_url_statuses:
+                
+                url_statuses = urls_to_url_statuses[ url ]
+                
+                url_is_known = len( url_statuses ) > 0 and all( ( status != CC.STATUS_UNKNOWN for ( status, status_hash, note ) in url_statuses ) )
+                
+                if url_is_known or self._PreImportStatusLookupMissesAreFresh():
+                    
+                    return url_statuses
+                    
+                
+            
+        
+        return HG.client_controller.Read( 'url_statuses', url )
+        
+    
     def _SetupTagImportOptions( self, given_tag_import_options: ClientImportOptions.TagImportOptions ) -> ClientImportOptions.TagImportOptions:
         
         if given_tag_import_options.IsDefault():
@@ -645,7 +990,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
             for ( hash_type, found_hash ) in list(self._hashes.items()):
                 
-                ( status, hash, note ) = HG.client_controller.Read( 'hash_status', hash_type, found_hash, prefix = 'hash recognised' )
+                ( status, hash, note ) = self._ReadHashStatus( hash_type, found_hash )
                 
                 if status != CC.STATUS_UNKNOWN:
                     
@@ -678,100 +1023,73 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         
         # urls
         
-        urls = set( self._urls )
-        
-        if file_url is not None:
-            
-            urls.add( file_url )
-            
-        
-        if self.file_seed_type == FILE_SEED_TYPE_URL:
-            
-            urls.add( self.file_seed_data )
+        for url in self._GetPreImportStatusURLsToCheck( file_url = file_url ):
             
-        
-        unrecognised_url_results = set()
-        
-        for url in urls:
+            results = self._ReadURLStatuses( url )
             
-            if HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ):
+            if len( results ) == 0: # if no match found, no useful data discovered
                 
                 continue
                 
-            
-            # we now only trust url-matched single urls and the post/file urls
-            # trusting unmatched source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
-            
-            if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) or url in ( self.file_seed_data, file_url ):
+            elif len( results ) > 1: # if more than one file claims this url, it cannot be relied on to guess the file
                 
-                results = HG.client_controller.Read( 'url_statuses', url )
+                continue
                 
-                if len( results ) == 0: # if no match found, no useful data discovered
-                    
-                    continue
-                    
-                elif len( results ) > 1: # if more than one file claims this url, it cannot be relied on to guess the file
-                    
-                    continue
+            else: # i.e. 1 match found
+                
+                ( status, hash, note ) = results[0]
+                
+                if status != CC.STATUS_UNKNOWN:
                     
-                else: # i.e. 1 match found
+                    # a known one-file url has given a single clear result. sounds good
                     
-                    ( status, hash, note ) = results[0]
+                    we_have_a_match = True
                     
-                    if status != CC.STATUS_UNKNOWN:
+                    if self.file_seed_type == FILE_SEED_TYPE_URL:
                         
-                        # a known one-file url has given a single clear result. sounds good
+                        # to double-check, let's see if the file that claims that url has any other interesting urls
+                        # if the file has another url with the same url class as ours, then this is prob an unreliable 'alternate' source url attribution, and untrustworthy
                         
-                        we_have_a_match = True
+                        my_url = self.file_seed_data
                         
-                        if self.file_seed_type == FILE_SEED_TYPE_URL:
+                        if url != my_url:
                             
-                            # to double-check, let's see if the file that claims that url has any other interesting urls
-                            # if the file has another url with the same url class as ours, then this is prob an unreliable 'alternate' source url attribution, and untrustworthy
+                            my_url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( my_url )
                             
-                            my_url = self.file_seed_data
+                            this_files_urls = self._ReadFileURLs( hash )
                             
-                            if url != my_url:
-                                
-                                my_url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( my_url )
-                                
-                                media_result = HG.client_controller.Read( 'media_result', hash )
+                            for this_files_url in this_files_urls:
                                 
-                                this_files_urls = media_result.GetLocationsManager().GetURLs()
-                                
-                                for this_files_url in this_files_urls:
+                                if this_files_url != my_url:
                                     
-                                    if this_files_url != my_url:
+                                    try:
+                                        
+                                        this_url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( this_files_url )
+                                        
+                                    except HydrusExceptions.URLClassException:
+                                        
+                                        continue
+                                        
+                                    
+                                    if my_url_class == this_url_class:
+                                        
+                                        # oh no, the file this source url refers to has a different known url in this same domain
+                                        # it is more likely that an edit on this site points to the original elsewhere
                                         
-                                        try:
-                                            
-                                            this_url_class = HG.client_controller.network_engine.domain_manager.GetURLClass( this_files_url )
-                                            
-                                        except HydrusExceptions.URLClassException:
-                                            
-                                            continue
-                                            
+                                        ( status, hash, note ) = UNKNOWN_DEFAULT
                                         
-                                        if my_url_class == this_url_class:
-                                            
-                                            # oh no, the file this source url refers to has a different known url in this same domain
-                                            # it is more likely that an edit on this site points to the original elsewhere
-                                            
-                                            ( status, hash, note ) = UNKNOWN_DEFAULT
-                                            
-                                            we_have_a_match = False
-                                            
-                                            break
-                                            
+                                        we_have_a_match = False
+                                        
+                                        break
                                         
                                     
                                 
                             
                         
-                        if we_have_a_match:
-                            
-                            break # if a known one-file url gives a single clear result, that result is reliable
-                            
+                    
+                    if we_have_a_match:
+                        
+                        break # if a known one-file url gives a single clear result, that result is reliable
                         
                     
                 
@@ -788,6 +1106,15 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return ( status, hash, note )
         
     
+    def GetPreImportStatusLookupKeys( self ):
+        
+        urls = self._GetPreImportStatusURLsToCheck()
+        
+        hash_types_and_hashes = list( self._hashes.items() )
+        
+        return ( urls, hash_types_and_hashes )
+        
+    
     def GetSearchFileSeeds( self ):
         
         if self.file_seed_type == FILE_SEED_TYPE_URL:
@@ -809,9 +1136,12 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return self.GetHash() is not None
         
     
-    def Import( self, temp_path: str, file_import_options: ClientImportOptions.FileImportOptions, status_hook = None ):
+    def Import( self, temp_path: str, file_import_options: ClientImportOptions.FileImportOptions, status_hook = None, file_import_job = None ):
         
-        file_import_job = FileImportJob( temp_path, file_import_options )
+        if file_import_job is None:
+            
+            file_import_job = FileImportJob( temp_path, file_import_options )
+            
         
         ( status, hash, note ) = file_import_job.DoWork( status_hook = status_hook )
         
@@ -819,7 +1149,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self.SetHash( hash )
         
     
-    def ImportPath( self, file_seed_cache: "FileSeedCache", file_import_options: ClientImportOptions.FileImportOptions, limited_mimes = None, status_hook = None ):
+    def ImportPath( self, file_seed_cache: "FileSeedCache", file_import_options: ClientImportOptions.FileImportOptions, limited_mimes = None, status_hook = None, file_import_job_preparer: typing.Optional[ FileImportJobPreparer ] = None ):
         
         try:
             
@@ -835,28 +1165,47 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                 raise HydrusExceptions.VetoException( 'Source file does not exist!' )
                 
             
-            if limited_mimes is not None:
+            prepared_result = None
+            
+            if file_import_job_preparer is not None:
                 
-                mime = HydrusFileHandling.GetMime( path )
+                prepared_result = file_import_job_preparer.GetPreparedFileImportJob( self, file_import_options )
                 
-                if mime not in limited_mimes:
+            
+            if prepared_result is None:
+                
+                if limited_mimes is not None:
                     
-                    raise HydrusExceptions.VetoException( 'Not in allowed mimes!' )
+                    mime = HydrusFileHandling.GetMime( path )
+                    
+                    if mime not in limited_mimes:
+                        
+                        raise HydrusExceptions.VetoException( 'Not in allowed mimes!' )
+                        
                     
                 
-            
-            ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+                ( os_file_handle, temp_path ) = HydrusPaths.GetTempPath()
+                
+                file_import_job = None
+                
+            else:
+                
+                ( os_file_handle, temp_path, file_import_job ) = prepared_result
+                
             
             try:
                 
-                copied = HydrusPaths.MirrorFile( path, temp_path )
-                
-                if not copied:
+                if file_import_job is None:
                     
-                    raise Exception( 'File failed to copy to temp path--see log for error.' )
+                    copied = HydrusPaths.MirrorFile( path, temp_path )
+                    
+                    if not copied:
+                        
+                        raise Exception( 'File failed to copy to temp path--see log for error.' )
+                        
                     
                 
-                self.Import( temp_path, file_import_options, status_hook = status_hook )
+                self.Import( temp_path, file_import_options, status_hook = status_hook, file_import_job = file_import_job )
                 
             finally:
                 
@@ -921,6 +1270,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         ( url_status, url_hash, url_note ) = self.GetPreImportStatusPredictionURL( file_import_options, file_url = file_url )
         ( hash_status, hash_hash, hash_note ) = self.GetPreImportStatusPredictionHash( file_import_options )
         
+        # a batch lookup is only good for the first prediction. anything after that, like the check on a parsed file url, wants fresh results
+        self._pre_import_status_lookup = None
+        
         url_recognised_and_file_already_in_db = url_status == CC.STATUS_SUCCESSFUL_BUT_REDUNDANT
         hash_recognised_and_file_already_in_db = hash_status == CC.STATUS_SUCCESSFUL_BUT_REDUNDANT
         
@@ -995,6 +1347,19 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def PreImportStatusLookupIsStale( self ):
+        
+        # we have a batch lookup for our first prediction, but its misses are too old to trust
+        
+        return self._pre_import_status_lookup is not None and not self._PreImportStatusLookupMissesAreFresh()
+        
+    
+    def SetPreImportStatusLookup( self, pre_import_status_lookup ):
+        
+        self._pre_import_status_lookup = pre_import_status_lookup
+        self._pre_import_status_lookup_time = HydrusData.GetNow()
+        
+    
     def SetReferralURL( self, referral_url: str ):
         
         self._referral_url = referral_url
@@ -1102,6 +1467,8 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
             status_hook( 'checking url status' )
             
+            file_seed_cache.RefreshStalePreImportStatusLookups( self )
+            
             ( should_download_metadata, should_download_file ) = self.PredictPreImportStatus( file_import_options, tag_import_options )
             
             if self.IsAPostURL():
@@ -1206,7 +1573,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                             insertion_index = len( file_seed_cache )
                             
                         
-                        num_urls_added = file_seed_cache.InsertFileSeeds( insertion_index, file_seeds )
+                        num_urls_added = file_seed_cache.InsertFileSeeds( insertion_index, file_seeds, prefetch_pre_import_statuses = True )
                         
                         status = CC.STATUS_SUCCESSFUL_AND_NEW
                         note = 'Found ' + HydrusData.ToHumanInt( num_urls_added ) + ' new URLs.'
@@ -1295,7 +1662,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                                 insertion_index = len( file_seed_cache )
                                 
                             
-                            num_urls_added = file_seed_cache.InsertFileSeeds( insertion_index, child_file_seeds )
+                            num_urls_added = file_seed_cache.InsertFileSeeds( insertion_index, child_file_seeds, prefetch_pre_import_statuses = True )
                             
                             status = CC.STATUS_SUCCESSFUL_AND_NEW
                             note = 'Found ' + HydrusData.ToHumanInt( num_urls_added ) + ' new URLs.'
@@ -1323,6 +1690,8 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         except HydrusExceptions.ShutdownException:
             
+            file_seed_cache.NotifyFileSeedsUpdated( ( self, ) )
+            
             return False
             
         except HydrusExceptions.VetoException as e:
@@ -1680,6 +2049,13 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         self._file_seeds_to_indices = {}
         
+        # each status has a sorted list of the indices of its file seeds, so next-seed and counts do not have to scan the whole list
+        # a file seed's status is only re-indexed when it is notified as updated, so we remember what we filed it under
+        self._statuses_to_indices = collections.defaultdict( list )
+        self._file_seeds_to_indexed_statuses = {}
+        
+        self._latest_added_time = 0
+        
         self._file_seed_cache_key = HydrusData.GenerateKey()
         
         self._status_cache = FileSeedCacheStatus()
@@ -1694,6 +2070,43 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return len( self._file_seeds )
         
     
+    def _FixFileSeedsStatusPosition( self, file_seeds: typing.Iterable[ FileSeed ] ):
+        
+        for file_seed in file_seeds:
+            
+            if file_seed not in self._file_seeds_to_indices:
+                
+                continue
+                
+            
+            index = self._file_seeds_to_indices[ file_seed ]
+            
+            # the caller may hold an equal copy, so go by the one we actually have
+            file_seed = self._file_seeds[ index ]
+            
+            old_status = self._file_seeds_to_indexed_statuses[ file_seed ]
+            new_status = file_seed.status
+            
+            if old_status == new_status:
+                
+                continue
+                
+            
+            old_indices = self._statuses_to_indices[ old_status ]
+            
+            del old_indices[ bisect.bisect_left( old_indices, index ) ]
+            
+            if len( old_indices ) == 0:
+                
+                del self._statuses_to_indices[ old_status ]
+                
+            
+            bisect.insort( self._statuses_to_indices[ new_status ], index )
+            
+            self._file_seeds_to_indexed_statuses[ file_seed ] = new_status
+            
+        
+    
     def _GenerateStatus( self ):
         
         fscs = FileSeedCacheStatus()
@@ -1714,40 +2127,82 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         else:
             
-            return [ file_seed for file_seed in self._file_seeds if file_seed.status == status ]
+            return [ self._file_seeds[ index ] for index in self._statuses_to_indices.get( status, [] ) ]
             
         
     
     def _GetLatestAddedTime( self ):
         
-        if len( self._file_seeds ) == 0:
-            
-            latest_timestamp = 0
-            
-        else:
+        return self._latest_added_time
+        
+    
+    def _GetNextFileSeed( self, status: int ) -> typing.Optional[ FileSeed ]:
+        
+        file_seeds = self._GetNextFileSeeds( status, 1 )
+        
+        if len( file_seeds ) == 0:
             
-            latest_timestamp = max( ( file_seed.created for file_seed in self._file_seeds ) )
+            return None
             
         
-        return latest_timestamp
+        return file_seeds[0]
         
     
-    def _GetNextFileSeed( self, status: int ) -> typing.Optional[ FileSeed ]:
+    def _GetNextFileSeeds( self, status: int, num_to_get: int ) -> typing.List[ FileSeed ]:
+        
+        # a caller may have set a status and not told us yet. we check the live status here so the importer loop never gets handed the same finished seed forever
+        
+        file_seeds = []
+        misfiled_file_seeds = []
         
-        for file_seed in self._file_seeds:
+        for index in self._statuses_to_indices.get( status, [] ):
+            
+            if len( file_seeds ) >= num_to_get:
+                
+                break
+                
+            
+            file_seed = self._file_seeds[ index ]
             
             if file_seed.status == status:
                 
-                return file_seed
+                file_seeds.append( file_seed )
+                
+            else:
+                
+                misfiled_file_seeds.append( file_seed )
                 
             
         
-        return None
+        if len( misfiled_file_seeds ) > 0:
+            
+            self._NotifyFileSeedsUpdated( misfiled_file_seeds )
+            
+        
+        return file_seeds
         
     
     def _GetSerialisableInfo( self ):
         
-        return self._file_seeds.GetSerialisableTuple()
+        # most of the time spent making a big log's tuples is the cyclic gc waking up again and again to walk all the new lists, which can never hold a cycle
+        # so we pause it for the duration. another thread may have paused it too, so we only turn it back on if we turned it off
+        
+        gc_was_enabled = gc.isenabled()
+        
+        gc.disable()
+        
+        try:
+            
+            return self._file_seeds.GetSerialisableTuple()
+            
+        finally:
+            
+            if gc_was_enabled:
+                
+                gc.enable()
+                
+            
+        
         
     
     def _GetSourceTimestamp( self, file_seed: FileSeed ):
@@ -1769,9 +2224,9 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         statuses_to_counts = collections.Counter()
         
-        for file_seed in self._file_seeds:
+        for ( status, indices ) in self._statuses_to_indices.items():
             
-            statuses_to_counts[ file_seed.status ] += 1
+            statuses_to_counts[ status ] = len( indices )
             
         
         return statuses_to_counts
@@ -1786,13 +2241,46 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return has_file_seed
         
     
+    def _IndexFileSeed( self, file_seed: FileSeed, index: int ):
+        
+        # only for appending to the end of the list, since the status indices must stay sorted
+        
+        self._file_seeds_to_indices[ file_seed ] = index
+        self._file_seeds_to_indexed_statuses[ file_seed ] = file_seed.status
+        
+        self._statuses_to_indices[ file_seed.status ].append( index )
+        
+        self._latest_added_time = max( self._latest_added_time, file_seed.created )
+        
+    
     def _InitialiseFromSerialisableInfo( self, serialisable_info ):
         
         with self._lock:
             
             self._file_seeds = HydrusSerialisable.CreateFromSerialisableTuple( serialisable_info )
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._ReindexFileSeeds()
+            
+        
+    
+    def _NotifyFileSeedsUpdated( self, file_seeds: typing.Iterable[ FileSeed ] ):
+        
+        self._FixFileSeedsStatusPosition( file_seeds )
+        
+        self._SetStatusDirty()
+        
+    
+    def _ReindexFileSeeds( self ):
+        
+        self._file_seeds_to_indices = {}
+        self._file_seeds_to_indexed_statuses = {}
+        self._statuses_to_indices = collections.defaultdict( list )
+        
+        self._latest_added_time = 0
+        
+        for ( index, file_seed ) in enumerate( self._file_seeds ):
+            
+            self._IndexFileSeed( file_seed, index )
             
         
     
@@ -2007,7 +2495,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         
     
-    def AddFileSeeds( self, file_seeds: typing.Iterable[ FileSeed ] ):
+    def AddFileSeeds( self, file_seeds: typing.Iterable[ FileSeed ], prefetch_pre_import_statuses = False ):
         
         if len( file_seeds ) == 0:
             
@@ -2040,12 +2528,17 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
                 self._file_seeds.append( file_seed )
                 
-                self._file_seeds_to_indices[ file_seed ] = len( self._file_seeds ) - 1
+                self._IndexFileSeed( file_seed, len( self._file_seeds ) - 1 )
                 
             
             self._SetStatusDirty()
             
         
+        if prefetch_pre_import_statuses:
+            
+            PrefetchPreImportStatuses( new_file_seeds )
+            
+        
         self.NotifyFileSeedsUpdated( new_file_seeds )
         
         return len( new_file_seeds )
@@ -2066,7 +2559,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                     self._file_seeds.insert( index - 1, file_seed )
                     
                 
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+                self._ReindexFileSeeds()
                 
             
         
@@ -2124,7 +2617,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             new_file_seeds.extend( self._file_seeds[-self.COMPACT_NUMBER:] )
             
             self._file_seeds = new_file_seeds
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._ReindexFileSeeds()
             
             self._SetStatusDirty()
             
@@ -2145,7 +2638,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                     self._file_seeds.insert( index + 1, file_seed )
                     
                 
-                self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+                self._ReindexFileSeeds()
                 
             
         
@@ -2241,13 +2734,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 
             else:
                 
-                for file_seed in self._file_seeds:
-                    
-                    if file_seed.status == status:
-                        
-                        result += 1
-                        
-                    
+                result = len( self._statuses_to_indices.get( status, [] ) )
                 
             
         
@@ -2303,6 +2790,14 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetNextFileSeeds( self, status: int, num_to_get: int ):
+        
+        with self._lock:
+            
+            return self._GetNextFileSeeds( status, num_to_get )
+            
+        
+    
     def GetNumNewFilesSince( self, since: int ):
         
         num_files = 0
@@ -2392,7 +2887,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
         
     
-    def InsertFileSeeds( self, index: int, file_seeds: typing.Iterable[ FileSeed ] ):
+    def InsertFileSeeds( self, index: int, file_seeds: typing.Iterable[ FileSeed ], prefetch_pre_import_statuses = False ):
         
         if len( file_seeds ) == 0:
             
@@ -2421,11 +2916,16 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
                 index += 1
                 
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._ReindexFileSeeds()
             
             self._SetStatusDirty()
             
         
+        if prefetch_pre_import_statuses:
+            
+            PrefetchPreImportStatuses( new_file_seeds )
+            
+        
         self.NotifyFileSeedsUpdated( new_file_seeds )
         
         return len( new_file_seeds )
@@ -2435,12 +2935,35 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            self._SetStatusDirty()
+            self._NotifyFileSeedsUpdated( file_seeds )
             
         
         HG.client_controller.pub( 'file_seed_cache_file_seeds_updated', self._file_seed_cache_key, file_seeds )
         
     
+    def RefreshStalePreImportStatusLookups( self, file_seed: FileSeed ):
+        
+        # a file seed worked a while after it was added cannot trust the misses in its batch lookup
+        # rather than it and every file seed after it each checking the db on its own, we look up the next batch of them in one job
+        
+        if not file_seed.PreImportStatusLookupIsStale():
+            
+            return
+            
+        
+        file_seeds_to_refresh = [ file_seed ]
+        
+        for next_file_seed in self.GetNextFileSeeds( CC.STATUS_UNKNOWN, PRE_IMPORT_STATUS_LOOKUP_REFRESH_BATCH_SIZE ):
+            
+            if next_file_seed is not file_seed and next_file_seed.PreImportStatusLookupIsStale():
+                
+                file_seeds_to_refresh.append( next_file_seed )
+                
+            
+        
+        PrefetchPreImportStatuses( file_seeds_to_refresh )
+        
+    
     def RemoveFileSeeds( self, file_seeds: typing.Iterable[ FileSeed ] ):
         
         with self._lock:
@@ -2449,7 +2972,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
             
             self._file_seeds = HydrusSerialisable.SerialisableList( [ file_seed for file_seed in self._file_seeds if file_seed not in file_seeds_to_delete ] )
             
-            self._file_seeds_to_indices = { file_seed : index for ( index, file_seed ) in enumerate( self._file_seeds ) }
+            self._ReindexFileSeeds()
             
             self._SetStatusDirty()
             
@@ -2461,7 +2984,7 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         
         with self._lock:
             
-            file_seeds_to_delete = [ file_seed for file_seed in self._file_seeds if file_seed.status in statuses_to_remove ]
+            file_seeds_to_delete = [ file_seed for status in statuses_to_remove for file_seed in self._GetFileSeeds( status ) ]
             
         
         self.RemoveFileSeeds( file_seeds_to_delete )
@@ -2533,3 +3056,38 @@ def GenerateFileSeedCachesStatus( file_seed_caches: typing.Iterable[ FileSeedCac
     
     return fscs
     
+def PrefetchPreImportStatuses( file_seeds: typing.Iterable[ FileSeed ] ):
+    
+    # a page of new urls would otherwise ask the db about each url and hash one at a time when it is worked
+    # this does all those lookups in one db job and gives the results to each file seed for its first prediction
+    
+    file_seeds = [ file_seed for file_seed in file_seeds if file_seed.file_seed_type == FILE_SEED_TYPE_URL ]
+    
+    if len( file_seeds ) == 0:
+        
+        return
+        
+    
+    all_urls = set()
+    all_hash_types_and_hashes = set()
+    
+    for file_seed in file_seeds:
+        
+        ( urls, hash_types_and_hashes ) = file_seed.GetPreImportStatusLookupKeys()
+        
+        all_urls.update( urls )
+        all_hash_types_and_hashes.update( hash_types_and_hashes )
+        
+    
+    if len( all_urls ) == 0 and len( all_hash_types_and_hashes ) == 0:
+        
+        return
+        
+    
+    pre_import_status_lookup = HG.client_controller.Read( 'pre_import_statuses', all_urls, all_hash_types_and_hashes )
+    
+    for file_seed in file_seeds:
+        
+        file_seed.SetPreImportStatusLookup( pre_import_status_lookup )
+        
+    
@@ -76,6 +76,8 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
         
         self._files_repeating_job = None
         
+        self._file_import_job_preparer = ClientImportFileSeeds.FileImportJobPreparer()
+        
         HG.client_controller.sub( self, 'NotifyFileSeedsUpdated', 'file_seed_cache_file_seeds_updated' )
         
     
@@ -129,9 +131,13 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
         
         if file_seed is None:
             
+            self._file_import_job_preparer.CleanUp()
+            
             return
             
         
+        self._file_import_job_preparer.PrepareNextFileSeeds( self._file_seed_cache, self._file_import_options )
+        
         did_substantial_work = False
         
         path = file_seed.file_seed_data
@@ -154,7 +160,7 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
                 
             
         
-        file_seed.ImportPath( self._file_seed_cache, self._file_import_options, status_hook = status_hook )
+        file_seed.ImportPath( self._file_seed_cache, self._file_import_options, status_hook = status_hook, file_import_job_preparer = self._file_import_job_preparer )
         
         did_substantial_work = True
         
@@ -317,33 +323,41 @@ class HDDImport( HydrusSerialisable.SerialisableBase ):
             work_to_do = self._file_seed_cache.WorkToDo() and not ( paused or HG.client_controller.PageClosedButNotDestroyed( page_key ) )
             
         
-        while work_to_do:
-            
-            try:
-                
-                self._WorkOnFiles( page_key )
-                
-                HG.client_controller.WaitUntilViewFree()
-                
-            except Exception as e:
-                
-                HydrusData.ShowException( e )
-                
+        try:
             
-            with self._lock:
+            while work_to_do:
                 
-                if ClientImporting.PageImporterShouldStopWorking( page_key ):
+                try:
                     
-                    self._files_repeating_job.Cancel()
+                    self._WorkOnFiles( page_key )
                     
-                    return
+                    HG.client_controller.WaitUntilViewFree()
+                    
+                except Exception as e:
+                    
+                    HydrusData.ShowException( e )
                     
                 
-                paused = self._paused or HG.client_controller.new_options.GetBoolean( 'pause_all_file_queues' )
-                
-                work_to_do = self._file_seed_cache.WorkToDo() and not ( paused or HG.client_controller.PageClosedButNotDestroyed( page_key ) )
+                with self._lock:
+                    
+                    if ClientImporting.PageImporterShouldStopWorking( page_key ):
+                        
+                        self._files_repeating_job.Cancel()
+                        
+                        return
+                        
+                    
+                    paused = self._paused or HG.client_controller.new_options.GetBoolean( 'pause_all_file_queues' )
+                    
+                    work_to_do = self._file_seed_cache.WorkToDo() and not ( paused or HG.client_controller.PageClosedButNotDestroyed( page_key ) )
+                    
                 
             
+        finally:
+            
+            # we are paused, done or stopping, so drop any temp files we were getting ready
+            self._file_import_job_preparer.CleanUp()
+            
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_HDD_IMPORT ] = HDDImport
@@ -589,114 +603,125 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         num_total_unknown = self._file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN )
         num_total_done = num_total - num_total_unknown
         
-        while True:
-            
-            file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
-            
-            p1 = HC.options[ 'pause_import_folders_sync' ] or self._paused
-            p2 = HydrusThreading.IsThreadShuttingDown()
-            p3 = job_key.IsCancelled()
+        file_import_job_preparer = ClientImportFileSeeds.FileImportJobPreparer()
+        
+        try:
             
-            if file_seed is None or p1 or p2 or p3:
+            while True:
                 
-                break
+                file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
                 
-            
-            did_work = True
-            
-            if HydrusData.TimeHasPassed( time_to_save ):
-                
-                HG.client_controller.WriteSynchronous( 'serialisable', self )
+                p1 = HC.options[ 'pause_import_folders_sync' ] or self._paused
+                p2 = HydrusThreading.IsThreadShuttingDown()
+                p3 = job_key.IsCancelled()
                 
-                time_to_save = HydrusData.GetNow() + 600
+                if file_seed is None or p1 or p2 or p3:
+                    
+                    break
+                    
                 
-            
-            gauge_num_done = num_total_done + num_files_imported + 1
-            
-            job_key.SetVariable( 'popup_text_1', 'importing file ' + HydrusData.ConvertValueRangeToPrettyString( gauge_num_done, num_total ) )
-            job_key.SetVariable( 'popup_gauge_1', ( gauge_num_done, num_total ) )
-            
-            path = file_seed.file_seed_data
-            
-            file_seed.ImportPath( self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes )
-            
-            if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+                did_work = True
                 
-                if file_seed.HasHash():
+                if HydrusData.TimeHasPassed( time_to_save ):
                     
-                    hash = file_seed.GetHash()
+                    HG.client_controller.WriteSynchronous( 'serialisable', self )
                     
-                    if self._tag_import_options.HasAdditionalTags():
-                        
-                        media_result = HG.client_controller.Read( 'media_result', hash )
-                        
-                        downloaded_tags = []
+                    time_to_save = HydrusData.GetNow() + 600
+                    
+                
+                gauge_num_done = num_total_done + num_files_imported + 1
+                
+                job_key.SetVariable( 'popup_text_1', 'importing file ' + HydrusData.ConvertValueRangeToPrettyString( gauge_num_done, num_total ) )
+                job_key.SetVariable( 'popup_gauge_1', ( gauge_num_done, num_total ) )
+                
+                path = file_seed.file_seed_data
+                
+                file_import_job_preparer.PrepareNextFileSeeds( self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes )
+                
+                file_seed.ImportPath( self._file_seed_cache, self._file_import_options, limited_mimes = self._mimes, file_import_job_preparer = file_import_job_preparer )
+                
+                if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
+                    
+                    if file_seed.HasHash():
                         
-                        service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, media_result, downloaded_tags ) # additional tags
+                        hash = file_seed.GetHash()
                         
-                        if len( service_keys_to_content_updates ) > 0:
+                        if self._tag_import_options.HasAdditionalTags():
                             
-                            HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                            media_result = HG.client_controller.Read( 'media_result', hash )
                             
-                        
-                    
-                    service_keys_to_tags = ClientTags.ServiceKeysToTags()
-                    
-                    for ( tag_service_key, filename_tagging_options ) in list(self._tag_service_keys_to_filename_tagging_options.items()):
-                        
-                        if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                            downloaded_tags = []
                             
-                            continue
+                            service_keys_to_content_updates = self._tag_import_options.GetServiceKeysToContentUpdates( file_seed.status, media_result, downloaded_tags ) # additional tags
+                            
+                            if len( service_keys_to_content_updates ) > 0:
+                                
+                                HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                                
                             
                         
-                        try:
+                        service_keys_to_tags = ClientTags.ServiceKeysToTags()
+                        
+                        for ( tag_service_key, filename_tagging_options ) in list(self._tag_service_keys_to_filename_tagging_options.items()):
                             
-                            tags = filename_tagging_options.GetTags( tag_service_key, path )
+                            if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                                
+                                continue
+                                
                             
-                            if len( tags ) > 0:
+                            try:
+                                
+                                tags = filename_tagging_options.GetTags( tag_service_key, path )
+                                
+                                if len( tags ) > 0:
+                                    
+                                    service_keys_to_tags[ tag_service_key ] = tags
+                                    
                                 
-                                service_keys_to_tags[ tag_service_key ] = tags
+                            except Exception as e:
+                                
+                                HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                                
+                                HydrusData.ShowException( e )
                                 
                             
-                        except Exception as e:
+                        
+                        if len( service_keys_to_tags ) > 0:
                             
-                            HydrusData.ShowText( 'Trying to parse filename tags in the import folder "' + self._name + '" threw an error!' )
+                            service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
                             
-                            HydrusData.ShowException( e )
+                            HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
                             
                         
                     
-                    if len( service_keys_to_tags ) > 0:
-                        
-                        service_keys_to_content_updates = ClientData.ConvertServiceKeysToTagsToServiceKeysToContentUpdates( { hash }, service_keys_to_tags )
+                    num_files_imported += 1
+                    
+                    if hash not in presentation_hashes_fast:
                         
-                        HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                        if file_seed.ShouldPresent( self._file_import_options ):
+                            
+                            presentation_hashes.append( hash )
+                            
+                            presentation_hashes_fast.add( hash )
+                            
                         
                     
-                
-                num_files_imported += 1
-                
-                if hash not in presentation_hashes_fast:
+                elif file_seed.status == CC.STATUS_ERROR:
                     
-                    if file_seed.ShouldPresent( self._file_import_options ):
-                        
-                        presentation_hashes.append( hash )
-                        
-                        presentation_hashes_fast.add( hash )
-                        
+                    HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
                     
                 
-            elif file_seed.status == CC.STATUS_ERROR:
+                i += 1
                 
-                HydrusData.Print( 'A file failed to import from import folder ' + self._name + ':' + path )
+                if i % 10 == 0:
+                    
+                    self._ActionPaths()
+                    
                 
             
-            i += 1
+        finally:
             
-            if i % 10 == 0:
-                
-                self._ActionPaths()
-                
+            file_import_job_preparer.CleanUp()
             
         
         if num_files_imported > 0:
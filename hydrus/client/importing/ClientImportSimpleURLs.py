@@ -281,7 +281,7 @@ class SimpleDownloaderImport( HydrusSerialisable.SerialisableBase ):
                         
                     
                 
-                num_new = self._file_seed_cache.AddFileSeeds( file_seeds )
+                num_new = self._file_seed_cache.AddFileSeeds( file_seeds, prefetch_pre_import_statuses = True )
                 
                 if num_new > 0:
                     
@@ -834,6 +834,8 @@ class URLsImport( HydrusSerialisable.SerialisableBase ):
             
             file_seed.SetStatus( status, exception = e )
             
+            self._file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+            
             time.sleep( 3 )
             
         
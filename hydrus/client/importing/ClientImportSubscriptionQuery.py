@@ -144,6 +144,23 @@ class SubscriptionQueryHeader( HydrusSerialisable.SerialisableBase ):
         return '{}: {}'.format( subscription_name, self._GetHumanName() )
         
     
+    def _GetExampleDomain( self, example_url: typing.Optional[ str ] ):
+        
+        if example_url is None:
+            
+            return None
+            
+        
+        try:
+            
+            return ClientNetworkingDomain.ConvertURLIntoSecondLevelDomain( example_url )
+            
+        except:
+            
+            return None
+            
+        
+    
     def _GetExampleFileURL( self ):
         
         if self._example_file_seed is None or self._example_file_seed.file_seed_type == ClientImportFileSeeds.FILE_SEED_TYPE_HDD:
@@ -408,13 +425,18 @@ class SubscriptionQueryHeader( HydrusSerialisable.SerialisableBase ):
     
     def GetBandwidthWaitingEstimate( self, bandwidth_manager: ClientNetworkingBandwidth.NetworkBandwidthManager, subscription_name: str ):
         
+        ( estimate, bandwidth_network_context ) = self.GetBandwidthWaitingEstimateAndContext( bandwidth_manager, subscription_name )
+        
+        return estimate
+        
+    
+    def GetBandwidthWaitingEstimateAndContext( self, bandwidth_manager: ClientNetworkingBandwidth.NetworkBandwidthManager, subscription_name: str ):
+        
         example_url = self._GetExampleFileURL()
         
         example_network_contexts = self._GetExampleNetworkContexts( example_url, subscription_name )
         
-        ( estimate, bandwidth_network_context ) = bandwidth_manager.GetWaitingEstimateAndContext( example_network_contexts )
-        
-        return estimate
+        return bandwidth_manager.GetWaitingEstimateAndContext( example_network_contexts )
         
     
     def GetCheckerStatus( self ):
@@ -427,11 +449,21 @@ class SubscriptionQueryHeader( HydrusSerialisable.SerialisableBase ):
         return self._display_name
         
     
+    def GetGalleryDomain( self ) -> typing.Optional[ str ]:
+        
+        return self._GetExampleDomain( self._GetExampleGalleryURL() )
+        
+    
     def GetHumanName( self ):
         
         return self._GetHumanName()
         
     
+    def GetFileDomain( self ) -> typing.Optional[ str ]:
+        
+        return self._GetExampleDomain( self._GetExampleFileURL() )
+        
+    
     def GetFileSeedCacheStatus( self ):
         
         return self._file_seed_cache_status
@@ -1,3 +1,4 @@
+import collections
 import gc
 import os
 import random
@@ -20,6 +21,11 @@ from hydrus.client.importing import ClientImportSubscriptionQuery
 from hydrus.client.networking import ClientNetworkingBandwidth
 from hydrus.client.networking import ClientNetworkingDomain
 
+QUERY_LOG_CONTAINER_BATCH_SIZE = 10
+
+# besides the log a query is about to work on, we load up to this many more ahead of time
+QUERY_LOG_CONTAINER_PREFETCH_SIZE = 2
+
 class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION
@@ -70,6 +76,10 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         self._have_made_an_initial_sync_bandwidth_notification = False
         self._file_error_count = 0
         
+        # query workers can run at the same time, so this guards the pause, delay and error count state they share
+        
+        self._lock = threading.Lock()
+        
     
     def _CanDoWorkNow( self ):
         
@@ -97,15 +107,213 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         
         query_header.SetQueryLogContainerStatus( ClientImportSubscriptionQuery.LOG_CONTAINER_MISSING )
         
-        self._paused = True
+        with self._lock:
+            
+            self._paused = True
+            
         
         HydrusData.ShowText( 'The subscription "{}"\'s "{}" query was missing database data! This could be a serious error! Please go to _manage subscriptions_ to reset the data, and you may want to contact hydrus dev. The sub has paused!'.format( self._name, query_header.GetHumanName() ) )
         
     
     def _DelayWork( self, time_delta, reason ):
         
-        self._no_work_until = HydrusData.GetNow() + time_delta
-        self._no_work_until_reason = reason
+        no_work_until = HydrusData.GetNow() + time_delta
+        
+        with self._lock:
+            
+            # if several query workers hit problems at once, the longest delay wins
+            
+            if no_work_until > self._no_work_until:
+                
+                self._no_work_until = no_work_until
+                self._no_work_until_reason = reason
+                
+            
+        
+    
+    def _DoQueryWork( self, job_key: ClientThreading.JobKey, scheduler: "SubscriptionQueryWorkScheduler", work_callable ):
+        
+        num_workers = min( HG.client_controller.new_options.GetInteger( 'max_simultaneous_subscription_queries' ), scheduler.GetNumQueryHeaders() )
+        
+        # when several queries run at once, each gets its own popup, so they do not write over each other's status, gauge, network job and files
+        
+        query_job_keys = set()
+        query_job_keys_lock = threading.Lock()
+        
+        def do_work():
+            
+            while True:
+                
+                try:
+                    
+                    work = scheduler.GetNextWork()
+                    
+                except Exception as e:
+                    
+                    scheduler.Stop( exception = e )
+                    
+                    break
+                    
+                
+                if work is None:
+                    
+                    break
+                    
+                
+                ( i, domain, query_header, query_log_container ) = work
+                
+                if query_log_container is None:
+                    
+                    self._DealWithMissingQueryLogContainerError( query_header )
+                    
+                    scheduler.WorkDone( domain )
+                    
+                    scheduler.Stop()
+                    
+                    break
+                    
+                
+                if num_workers <= 1:
+                    
+                    query_job_key = job_key
+                    
+                else:
+                    
+                    query_job_key = ClientThreading.JobKey( pausable = False, cancellable = False )
+                    
+                    query_job_key.SetVariable( 'popup_title', 'subscriptions - {}: {}'.format( self._name, query_header.GetHumanName() ) )
+                    
+                    with query_job_keys_lock:
+                        
+                        query_job_keys.add( query_job_key )
+                        
+                    
+                    if job_key.IsCancelled():
+                        
+                        query_job_key.Cancel()
+                        
+                    
+                    if self._show_a_popup_while_working:
+                        
+                        HG.client_controller.pub( 'message', query_job_key )
+                        
+                    
+                
+                try:
+                    
+                    work_callable( i, query_header, query_log_container, query_job_key )
+                    
+                except HydrusExceptions.CancelledException:
+                    
+                    scheduler.Stop()
+                    
+                except Exception as e:
+                    
+                    scheduler.Stop( exception = e )
+                    
+                finally:
+                    
+                    if query_job_key != job_key:
+                        
+                        with query_job_keys_lock:
+                            
+                            query_job_keys.discard( query_job_key )
+                            
+                        
+                        query_job_key.DeleteVariable( 'popup_text_2' )
+                        query_job_key.DeleteVariable( 'popup_gauge_2' )
+                        query_job_key.DeleteVariable( 'popup_network_job' )
+                        
+                        if query_job_key.HasVariable( 'popup_files' ):
+                            
+                            query_job_key.Finish()
+                            
+                        else:
+                            
+                            query_job_key.Delete()
+                            
+                        
+                    
+                    try:
+                        
+                        scheduler.WorkDone( domain, query_log_container = query_log_container )
+                        
+                    except Exception as e:
+                        
+                        scheduler.Stop( exception = e )
+                        
+                    
+                
+            
+        
+        def do_work_in_thread( work_done_event ):
+            
+            try:
+                
+                do_work()
+                
+            except Exception as e:
+                
+                scheduler.Stop( exception = e )
+                
+            finally:
+                
+                work_done_event.set()
+                
+            
+        
+        if num_workers <= 1:
+            
+            do_work()
+            
+        else:
+            
+            job_key.SetVariable( 'popup_text_1', 'working on up to {} queries at once'.format( HydrusData.ToHumanInt( num_workers ) ) )
+            
+            work_done_events = []
+            
+            for i in range( num_workers ):
+                
+                work_done_event = threading.Event()
+                
+                HG.client_controller.CallToThreadLongRunning( do_work_in_thread, work_done_event )
+                
+                work_done_events.append( work_done_event )
+                
+            
+            for work_done_event in work_done_events:
+                
+                while not work_done_event.wait( 0.5 ):
+                    
+                    if HydrusThreading.IsThreadShuttingDown():
+                        
+                        # the pool threads see the shutdown themselves, so just make sure nothing new starts
+                        
+                        scheduler.Stop()
+                        
+                    
+                    if job_key.IsCancelled():
+                        
+                        with query_job_keys_lock:
+                            
+                            for query_job_key in query_job_keys:
+                                
+                                query_job_key.Cancel()
+                                
+                            
+                        
+                    
+                
+            
+            job_key.DeleteVariable( 'popup_text_1' )
+            
+        
+        exception = scheduler.GetException()
+        
+        if exception is not None:
+            
+            raise exception
+            
         
     
     def _GetPublishingLabel( self, query_header: ClientImportSubscriptionQuery.SubscriptionQueryHeader ):
@@ -211,6 +419,25 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         return HydrusData.TimeHasPassed( self._no_work_until )
         
     
+    def _PauseWork( self, message, reason ):
+        
+        # several query workers can hit the same problem at once, so only the first pauses and says so
+        
+        with self._lock:
+            
+            if self._paused:
+                
+                return
+                
+            
+            self._paused = True
+            
+        
+        HydrusData.ShowText( message )
+        
+        self._DelayWork( 300, reason )
+        
+    
     def _ShowHitPeriodicFileLimitMessage( self, query_text ):
         
         message = 'The query "{}" for subscription "{}" hit its periodic file limit without seeing any already-seen files.'.format( query_text, self._name )
@@ -220,7 +447,10 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
     
     def _WorkOnQueriesFiles( self, job_key ):
         
-        self._file_error_count = 0
+        with self._lock:
+            
+            self._file_error_count = 0
+            
         
         query_headers = self._GetQueryHeadersForProcessing()
         
@@ -228,7 +458,16 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         
         num_queries = len( query_headers )
         
-        for ( i, query_header ) in enumerate( query_headers ):
+        bandwidth_manager = HG.client_controller.network_engine.bandwidth_manager
+        
+        scheduler = SubscriptionQueryWorkScheduler(
+            query_headers,
+            lambda query_header: query_header.GetFileDomain(),
+            bandwidth_callable = lambda query_header: query_header.GetBandwidthWaitingEstimateAndContext( bandwidth_manager, self._name ),
+            should_stop_callable = job_key.IsCancelled
+        )
+        
+        def work_callable( i, query_header, query_log_container, query_job_key ):
             
             query_name = query_header.GetHumanName()
             
@@ -241,39 +480,24 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                 query_summary_name += ': ' + query_name
                 
             
-            text_1 += ' (' + HydrusData.ConvertValueRangeToPrettyString( i + 1, num_queries ) + ')'
-            
-            job_key.SetVariable( 'popup_text_1', text_1 )
+            text_1 += ' (' + HydrusData.ConvertValueRangeToPrettyString( i, num_queries ) + ')'
             
-            try:
-                
-                query_log_container = HG.client_controller.Read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, query_header.GetQueryLogContainerName() )
-                
-            except HydrusExceptions.DBException:
-                
-                self._DealWithMissingQueryLogContainerError( query_header )
-                
-                break
-                
+            query_job_key.SetVariable( 'popup_text_1', text_1 )
             
-            try:
-                
-                self._WorkOnQueryFiles( job_key, query_header, query_log_container, query_summary_name )
-                
-            except HydrusExceptions.CancelledException:
-                
-                break
-                
-            finally:
-                
-                HG.client_controller.WriteSynchronous( 'serialisable', query_log_container )
-                
+            self._WorkOnQueryFiles( query_job_key, query_header, query_log_container, query_summary_name )
             
         
-        job_key.DeleteVariable( 'popup_files' )
-        job_key.DeleteVariable( 'popup_text_1' )
-        job_key.DeleteVariable( 'popup_text_2' )
-        job_key.DeleteVariable( 'popup_gauge_2' )
+        try:
+            
+            self._DoQueryWork( job_key, scheduler, work_callable )
+            
+        finally:
+            
+            job_key.DeleteVariable( 'popup_files' )
+            job_key.DeleteVariable( 'popup_text_1' )
+            job_key.DeleteVariable( 'popup_text_2' )
+            job_key.DeleteVariable( 'popup_gauge_2' )
+            
         
     
     def _WorkOnQueriesFilesCanDoWork( self ):
@@ -383,20 +607,13 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     if not login_ok:
                         
-                        if not self._paused:
-                            
-                            message = 'Query "{}" for subscription "{}" seemed to have an invalid login for one of its file imports. The reason was:'.format( query_header.GetHumanName(), self._name )
-                            message += os.linesep * 2
-                            message += login_reason
-                            message += os.linesep * 2
-                            message += 'The subscription has paused. Please see if you can fix the problem and then unpause. Hydrus dev would like feedback on this process.'
-                            
-                            HydrusData.ShowText( message )
-                            
-                            self._DelayWork( 300, login_reason )
-                            
-                            self._paused = True
-                            
+                        message = 'Query "{}" for subscription "{}" seemed to have an invalid login for one of its file imports. The reason was:'.format( query_header.GetHumanName(), self._name )
+                        message += os.linesep * 2
+                        message += login_reason
+                        message += os.linesep * 2
+                        message += 'The subscription has paused. Please see if you can fix the problem and then unpause. Hydrus dev would like feedback on this process.'
+                        
+                        self._PauseWork( message, login_reason )
                         
                     
                     break
@@ -476,6 +693,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     file_seed.SetStatus( status, note = note )
                     
+                    file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                    
                 except HydrusExceptions.NotFoundException:
                     
                     status = CC.STATUS_VETOED
@@ -484,6 +703,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     file_seed.SetStatus( status, note = note )
                     
+                    file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                    
                 except Exception as e:
                     
                     status = CC.STATUS_ERROR
@@ -492,6 +713,8 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     file_seed.SetStatus( status, exception = e )
                     
+                    file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+                    
                     if isinstance( e, HydrusExceptions.DataMissing ):
                         
                         # DataMissing is a quick thing to avoid subscription abandons when lots of deleted files in e621 (or any other booru)
@@ -501,14 +724,22 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                         
                     else:
                         
-                        self._file_error_count += 1
+                        with self._lock:
+                            
+                            self._file_error_count += 1
+                            
                         
                         time.sleep( 5 )
                         
                     
                     error_count_threshold = HG.client_controller.new_options.GetNoneableInteger( 'subscription_file_error_cancel_threshold' )
                     
-                    if error_count_threshold is not None and self._file_error_count >= error_count_threshold:
+                    with self._lock:
+                        
+                        too_many_errors = error_count_threshold is not None and self._file_error_count >= error_count_threshold
+                        
+                    
+                    if too_many_errors:
                         
                         raise Exception( 'The subscription ' + self._name + ' encountered several errors when downloading files, so it abandoned its sync.' )
                         
@@ -576,7 +807,9 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         
         num_queries = len( query_headers )
         
-        for ( i, query_header ) in enumerate( query_headers ):
+        scheduler = SubscriptionQueryWorkScheduler( query_headers, lambda query_header: query_header.GetGalleryDomain(), should_stop_callable = job_key.IsCancelled )
+        
+        def work_callable( i, query_header, query_log_container, query_job_key ):
             
             status_prefix = 'synchronising'
             
@@ -587,33 +820,13 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                 status_prefix += ' "' + query_name + '"'
                 
             
-            status_prefix += ' (' + HydrusData.ConvertValueRangeToPrettyString( i + 1, num_queries ) + ')'
-            
-            try:
-                
-                query_log_container = HG.client_controller.Read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, query_header.GetQueryLogContainerName() )
-                
-            except HydrusExceptions.DBException:
-                
-                self._DealWithMissingQueryLogContainerError( query_header )
-                
-                break
-                
+            status_prefix += ' (' + HydrusData.ConvertValueRangeToPrettyString( i, num_queries ) + ')'
             
-            try:
-                
-                self._SyncQuery( job_key, gug, query_header, query_log_container, status_prefix )
-                
-            except HydrusExceptions.CancelledException:
-                
-                break
-                
-            finally:
-                
-                HG.client_controller.WriteSynchronous( 'serialisable', query_log_container )
-                
+            self._SyncQuery( query_job_key, gug, query_header, query_log_container, status_prefix )
             
         
+        self._DoQueryWork( job_key, scheduler, work_callable )
+        
     
     def _SyncQueriesCanDoWork( self ):
         
@@ -668,7 +881,10 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         
         if len( initial_search_urls ) == 0:
             
-            self._paused = True
+            with self._lock:
+                
+                self._paused = True
+                
             
             HydrusData.ShowText( 'The subscription "' + self._name + '"\'s Gallery URL Generator, "' + self._gug_key_and_name[1] + '" did not generate any URLs! The sub has paused!' )
             
@@ -690,20 +906,13 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
                     
                     if not login_ok:
                         
-                        if not self._paused:
-                            
-                            message = 'Query "{}" for subscription "{}" seemed to have an invalid login. The reason was:'.format( query_header.GetHumanName(), self._name )
-                            message += os.linesep * 2
-                            message += login_reason
-                            message += os.linesep * 2
-                            message += 'The subscription has paused. Please see if you can fix the problem and then unpause. Hydrus dev would like feedback on this process.'
-                            
-                            HydrusData.ShowText( message )
-                            
-                            self._DelayWork( 300, login_reason )
-                            
-                            self._paused = True
-                            
+                        message = 'Query "{}" for subscription "{}" seemed to have an invalid login. The reason was:'.format( query_header.GetHumanName(), self._name )
+                        message += os.linesep * 2
+                        message += login_reason
+                        message += os.linesep * 2
+                        message += 'The subscription has paused. Please see if you can fix the problem and then unpause. Hydrus dev would like feedback on this process.'
+                        
+                        self._PauseWork( message, login_reason )
                         
                     
                     raise HydrusExceptions.CancelledException( 'A problem, so stopping.' )
@@ -903,7 +1112,7 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         
         # 'first' urls are now at the end, so the file_seed_cache should stay roughly in oldest->newest order
         
-        file_seed_cache.AddFileSeeds( file_seeds_to_add_ordered )
+        file_seed_cache.AddFileSeeds( file_seeds_to_add_ordered, prefetch_pre_import_statuses = True )
         
         query_header.RegisterSyncComplete( self._checker_options, query_log_container )
         
@@ -924,11 +1133,19 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
             
             if this_is_initial_sync:
                 
-                if not query_header.FileBandwidthOK( HG.client_controller.network_engine.bandwidth_manager, self._name ) and not self._have_made_an_initial_sync_bandwidth_notification:
+                if not query_header.FileBandwidthOK( HG.client_controller.network_engine.bandwidth_manager, self._name ):
                     
-                    HydrusData.ShowText( 'FYI: The query "{}" for subscription "{}" performed its initial sync ok, but it is short on bandwidth right now, so no files will be downloaded yet. The subscription will catch up in future as bandwidth becomes available. You can review the estimated time until bandwidth is available under the manage subscriptions dialog. If more queries are performing initial syncs in this run, they may be the same.'.format( query_name, self._name ) )
+                    with self._lock:
+                        
+                        show_notification = not self._have_made_an_initial_sync_bandwidth_notification
+                        
+                        self._have_made_an_initial_sync_bandwidth_notification = True
+                        
                     
-                    self._have_made_an_initial_sync_bandwidth_notification = True
+                    if show_notification:
+                        
+                        HydrusData.ShowText( 'FYI: The query "{}" for subscription "{}" performed its initial sync ok, but it is short on bandwidth right now, so no files will be downloaded yet. The subscription will catch up in future as bandwidth becomes available. You can review the estimated time until bandwidth is available under the manage subscriptions dialog. If more queries are performing initial syncs in this run, they may be the same.'.format( query_name, self._name ) )
+                        
                     
                 
             
@@ -950,28 +1167,28 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         
         query_headers_to_do = [ query_header for query_header in self._query_headers if query_header.WantsToResyncWithLogContainer() ]
         
-        for query_header in self._query_headers:
+        for block_of_query_headers in HydrusData.SplitListIntoChunks( query_headers_to_do, QUERY_LOG_CONTAINER_BATCH_SIZE ):
             
-            if not query_header.WantsToResyncWithLogContainer():
-                
-                continue
-                
+            query_log_container_names = [ query_header.GetQueryLogContainerName() for query_header in block_of_query_headers ]
             
-            try:
+            names_to_query_log_containers = HG.client_controller.Read( 'serialisables_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, query_log_container_names )
+            
+            for query_header in block_of_query_headers:
                 
-                query_log_container = HG.client_controller.Read( 'serialisable_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, query_header.GetQueryLogContainerName() )
+                query_log_container_name = query_header.GetQueryLogContainerName()
                 
-            except HydrusExceptions.DBException:
+                if query_log_container_name not in names_to_query_log_containers:
+                    
+                    self._DealWithMissingQueryLogContainerError( query_header )
+                    
+                    return
+                    
                 
-                self._DealWithMissingQueryLogContainerError( query_header )
+                query_header.SyncToQueryLogContainer( self._checker_options, names_to_query_log_containers[ query_log_container_name ] )
                 
-                break
+                # don't need to save the container back, we made no changes
                 
             
-            query_header.SyncToQueryLogContainer( self._checker_options, query_log_container )
-            
-            # don't need to save the container back, we made no changes
-            
         
     
     def CanCheckNow( self ):
@@ -1112,6 +1329,21 @@ class Subscription( HydrusSerialisable.SerialisableBaseNamed ):
         return self._tag_import_options
         
     
+    def GetWorkDomains( self ) -> typing.Set[ str ]:
+        
+        domains = set()
+        
+        for query_header in self._query_headers:
+            
+            domains.add( query_header.GetGalleryDomain() )
+            domains.add( query_header.GetFileDomain() )
+            
+        
+        domains.discard( None )
+        
+        return domains
+        
+    
     def HasQuerySearchTextFragment( self, search_text_fragment ):
         
         for query_header in self._query_headers:
@@ -1454,6 +1686,305 @@ class SubscriptionJob( object ):
             
         
     
+class SubscriptionQueryWorkScheduler( object ):
+    
+    # most of a big sync is spent waiting on bandwidth, so rather than going down the queries in order, we take turns between their domains and skip any domain that cannot work right now
+    # queries on the same domain go one at a time, so we are polite and do not just queue up behind our own network jobs
+    # the lock only guards our own bookkeeping. bandwidth checks and db reads and writes happen outside it, so one worker does not hold up the others
+    
+    def __init__( self, query_headers, domain_callable, bandwidth_callable = None, should_stop_callable = None ):
+        
+        self._domains_to_query_headers = collections.OrderedDict()
+        
+        for query_header in query_headers:
+            
+            domain = domain_callable( query_header )
+            
+            if domain not in self._domains_to_query_headers:
+                
+                self._domains_to_query_headers[ domain ] = collections.deque()
+                
+            
+            self._domains_to_query_headers[ domain ].append( query_header )
+            
+        
+        self._domains = list( self._domains_to_query_headers.keys() )
+        self._next_domain_index = 0
+        
+        self._bandwidth_callable = bandwidth_callable
+        self._should_stop_callable = should_stop_callable
+        
+        self._num_query_headers = len( query_headers )
+        self._num_started = 0
+        
+        self._domains_in_progress = set()
+        
+        self._names_to_loaded_query_log_containers = {}
+        self._picked_query_log_container_names = set()
+        
+        self._stopped = False
+        self._exception = None
+        
+        self._lock = threading.Lock()
+        self._work_done_condition = threading.Condition( self._lock )
+        
+    
+    def _GetDomainsToTry( self ):
+        
+        # the domains nothing is working on, in turn order, with a snapshot of their waiting queries
+        
+        domains_to_try = []
+        
+        num_domains = len( self._domains )
+        
+        for offset in range( num_domains ):
+            
+            i = ( self._next_domain_index + offset ) % num_domains
+            
+            domain = self._domains[ i ]
+            
+            if domain in self._domains_in_progress or len( self._domains_to_query_headers[ domain ] ) == 0:
+                
+                continue
+                
+            
+            domains_to_try.append( ( domain, list( self._domains_to_query_headers[ domain ] ) ) )
+            
+        
+        return domains_to_try
+        
+    
+    def _GetQueryHeaderToWorkOn( self, query_headers ):
+        
+        if self._bandwidth_callable is None:
+            
+            return query_headers[0]
+            
+        
+        for query_header in query_headers:
+            
+            ( estimate, bandwidth_network_context ) = self._bandwidth_callable( query_header )
+            
+            if estimate == 0:
+                
+                return query_header
+                
+            
+            if bandwidth_network_context.context_type in ( CC.NETWORK_CONTEXT_GLOBAL, CC.NETWORK_CONTEXT_DOMAIN ):
+                
+                # the domain itself (or everything) is out of bandwidth, so no point asking the other queries
+                
+                break
+                
+            
+        
+        return None
+        
+    
+    def _GetQueryLogContainer( self, query_header ):
+        
+        name = query_header.GetQueryLogContainerName()
+        
+        with self._lock:
+            
+            if name in self._names_to_loaded_query_log_containers:
+                
+                return self._names_to_loaded_query_log_containers.pop( name )
+                
+            
+            # we'll probably want the next query for each domain soon, so grab a couple in the same db job
+            
+            names_to_load = [ name ]
+            
+            num_to_prefetch = QUERY_LOG_CONTAINER_PREFETCH_SIZE - len( self._names_to_loaded_query_log_containers )
+            
+            for domain in self._domains:
+                
+                if num_to_prefetch <= 0:
+                    
+                    break
+                    
+                
+                query_headers = self._domains_to_query_headers[ domain ]
+                
+                if len( query_headers ) > 0:
+                    
+                    next_name = query_headers[0].GetQueryLogContainerName()
+                    
+                    if next_name not in self._names_to_loaded_query_log_containers and next_name not in names_to_load:
+                        
+                        names_to_load.append( next_name )
+                        
+                        num_to_prefetch -= 1
+                        
+                    
+                
+            
+        
+        names_to_query_log_containers = dict( HG.client_controller.Read( 'serialisables_named', HydrusSerialisable.SERIALISABLE_TYPE_SUBSCRIPTION_QUERY_LOG_CONTAINER, names_to_load ) )
+        
+        query_log_container = names_to_query_log_containers.pop( name, None )
+        
+        with self._lock:
+            
+            for ( prefetched_name, prefetched_query_log_container ) in names_to_query_log_containers.items():
+                
+                # another worker may have picked this query and loaded it for itself while we were reading
+                
+                if prefetched_name not in self._picked_query_log_container_names:
+                    
+                    self._names_to_loaded_query_log_containers[ prefetched_name ] = prefetched_query_log_container
+                    
+                
+            
+        
+        return query_log_container
+        
+    
+    def _PickWork( self ):
+        
+        with self._lock:
+            
+            domains_to_try = self._GetDomainsToTry()
+            
+        
+        for ( domain, query_headers ) in domains_to_try:
+            
+            query_header = self._GetQueryHeaderToWorkOn( query_headers )
+            
+            if query_header is None:
+                
+                continue
+                
+            
+            with self._lock:
+                
+                if self._stopped:
+                    
+                    return None
+                    
+                
+                # another worker may have taken this domain or query while we were checking bandwidth
+                
+                if domain in self._domains_in_progress or query_header not in self._domains_to_query_headers[ domain ]:
+                    
+                    continue
+                    
+                
+                self._domains_to_query_headers[ domain ].remove( query_header )
+                
+                self._domains_in_progress.add( domain )
+                self._picked_query_log_container_names.add( query_header.GetQueryLogContainerName() )
+                
+                self._next_domain_index = self._domains.index( domain ) + 1
+                
+                self._num_started += 1
+                
+                return ( self._num_started, domain, query_header )
+                
+            
+        
+        return None
+        
+    
+    def GetException( self ):
+        
+        with self._lock:
+            
+            return self._exception
+            
+        
+    
+    def GetNextWork( self ):
+        
+        while True:
+            
+            with self._lock:
+                
+                if self._stopped:
+                    
+                    return None
+                    
+                
+            
+            if self._should_stop_callable is not None and self._should_stop_callable():
+                
+                self.Stop()
+                
+                return None
+                
+            
+            result = self._PickWork()
+            
+            if result is not None:
+                
+                ( num, domain, query_header ) = result
+                
+                try:
+                    
+                    query_log_container = self._GetQueryLogContainer( query_header )
+                    
+                except:
+                    
+                    self.WorkDone( domain )
+                    
+                    raise
+                    
+                
+                return ( num, domain, query_header, query_log_container )
+                
+            
+            with self._lock:
+                
+                if len( self._domains_in_progress ) == 0:
+                    
+                    # nothing running that could free up a domain, so we are done for now
+                    
+                    return None
+                    
+                
+                self._work_done_condition.wait( 1.0 )
+                
+            
+        
+    
+    def GetNumQueryHeaders( self ):
+        
+        return self._num_query_headers
+        
+    
+    def Stop( self, exception = None ):
+        
+        with self._lock:
+            
+            self._stopped = True
+            
+            if exception is not None and self._exception is None:
+                
+                self._exception = exception
+                
+            
+            self._work_done_condition.notify_all()
+            
+        
+    
+    def WorkDone( self, domain, query_log_container = None ):
+        
+        with self._lock:
+            
+            self._domains_in_progress.discard( domain )
+            
+            self._work_done_condition.notify_all()
+            
+        
+        # saved as soon as it is done, so we never hold more than the running and prefetched logs in memory
+        
+        if query_log_container is not None:
+            
+            HG.client_controller.WriteSynchronous( 'serialisable', query_log_container )
+            
+        
+    
 class SubscriptionsManager( object ):
     
     def __init__( self, controller, subscriptions: typing.List[ Subscription ] ):
@@ -1464,6 +1995,10 @@ class SubscriptionsManager( object ):
         self._names_to_running_subscription_info = {}
         self._names_that_cannot_run = set()
         self._names_to_next_work_time = {}
+        self._names_to_work_domains = {}
+        
+        self._domains_to_last_start_index = collections.Counter()
+        self._next_start_index = 1
         
         self._lock = threading.Lock()
         
@@ -1561,14 +2096,34 @@ class SubscriptionsManager( object ):
         
         if HG.client_controller.new_options.GetBoolean( 'process_subs_in_random_order' ):
             
-            subscription_name = random.choice( possible_names )
+            random.shuffle( possible_names )
             
         else:
             
             possible_names.sort()
             
-            subscription_name = possible_names.pop( 0 )
+        
+        # we want to spread our work across different sites, so prefer a sub whose domains nothing running is hitting, and then whichever domains we started least recently
+        
+        running_domains = set()
+        
+        for name in self._names_to_running_subscription_info.keys():
+            
+            running_domains.update( self._names_to_work_domains.get( name, set() ) )
+            
+        
+        def key( name ):
+            
+            domains = self._names_to_work_domains.get( name, set() )
+            
+            domains_are_busy = not running_domains.isdisjoint( domains )
+            
+            last_start_index = max( ( self._domains_to_last_start_index[ domain ] for domain in domains ), default = 0 )
             
+            return ( domains_are_busy, last_start_index )
+            
+        
+        subscription_name = min( possible_names, key = key )
         
         if HG.subscription_report_mode:
             
@@ -1592,6 +2147,8 @@ class SubscriptionsManager( object ):
             del self._names_to_next_work_time[ name ]
             
         
+        self._names_to_work_domains[ name ] = subscription.GetWorkDomains()
+        
         if not subscription.IsExpectingToWorkInFuture():
             
             self._names_that_cannot_run.add( name )
@@ -1660,6 +2217,13 @@ class SubscriptionsManager( object ):
                         
                         self._names_to_running_subscription_info[ subscription.GetName() ] = ( thread, job, subscription )
                         
+                        for domain in self._names_to_work_domains.get( subscription.GetName(), set() ):
+                            
+                            self._domains_to_last_start_index[ domain ] = self._next_start_index
+                            
+                        
+                        self._next_start_index += 1
+                        
                     
                     self._ClearFinishedSubscriptions()
                     
@@ -1706,6 +2270,7 @@ class SubscriptionsManager( object ):
             
             self._names_that_cannot_run = set()
             self._names_to_next_work_time = {}
+            self._names_to_work_domains = {}
             
             for subscription in subscriptions:
                 
@@ -349,7 +349,7 @@ def UpdateFileSeedCacheWithFileSeeds( file_seed_cache, file_seeds, max_new_urls_
             
         
     
-    file_seed_cache.AddFileSeeds( new_file_seeds )
+    file_seed_cache.AddFileSeeds( new_file_seeds, prefetch_pre_import_statuses = True )
     
     return ( num_urls_added, num_urls_already_in_file_seed_cache, can_search_for_more_files, stop_reason )
     
@@ -565,11 +565,22 @@ class RatingsManager( object ):
     
 class TagsManager( object ):
     
-    def __init__( self, service_keys_to_statuses_to_tags: typing.Dict[ bytes, typing.Dict[ int, typing.Set[ str ] ] ] ):
+    def __init__( self, service_keys_to_statuses_to_tags: typing.Dict[ bytes, typing.Dict[ int, typing.Set[ str ] ] ], display_tag_display_types_to_service_keys_to_statuses_to_tags = None ):
+        
+        # if the db has already worked out the sibling-collapsed and display-filtered tags, including the combined service, we can take them as they are
         
         self._tag_display_types_to_service_keys_to_statuses_to_tags = { ClientTags.TAG_DISPLAY_STORAGE : service_keys_to_statuses_to_tags }
         
-        self._cache_is_dirty = True
+        if display_tag_display_types_to_service_keys_to_statuses_to_tags is None:
+            
+            self._cache_is_dirty = True
+            
+        else:
+            
+            self._tag_display_types_to_service_keys_to_statuses_to_tags.update( display_tag_display_types_to_service_keys_to_statuses_to_tags )
+            
+            self._cache_is_dirty = False
+            
         
         self._lock = threading.Lock()
         
@@ -585,100 +596,94 @@ class TagsManager( object ):
         
         if self._cache_is_dirty:
             
-            # siblings (parents later)
-            
-            tag_siblings_manager = HG.client_controller.tag_siblings_manager
-            
-            # ultimately, we would like to just have these values pre-computed on the db so we can just read them in, but one step at a time
-            # and ultimately, this will make parents virtual, whether that is before or after we move this calc down to db cache level
-            # we'll want to keep this live updating capability though so we can keep up with content updates without needing a db refresh
-            # main difference is cache_dirty will default to False or similar
-            
             source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
             
-            destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            for tag_display_type in ( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SINGLE_MEDIA, ClientTags.TAG_DISPLAY_SELECTION_LIST ):
+                
+                self._tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ] = collections.defaultdict( HydrusData.default_dict_set )
+                
             
-            for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+            for service_key in list( source_service_keys_to_statuses_to_tags.keys() ):
                 
-                destination_statuses_to_tags = tag_siblings_manager.CollapseStatusesToTags( service_key, source_statuses_to_tags )
+                if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                    
+                    continue
+                    
                 
-                destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
+                self._RecalcServiceCaches( service_key )
                 
             
-            self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ] = destination_service_keys_to_statuses_to_tags
-            
-            # display filtering
+            self._RecalcCombinedCaches()
             
-            tag_display_manager = HG.client_controller.tag_display_manager
+            self._cache_is_dirty = False
             
-            cache_jobs = []
+        
+    
+    def _RecalcCombinedCaches( self ):
+        
+        # combined service merge calculation
+        
+        for ( tag_display_type, service_keys_to_statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags.items():
             
-            cache_jobs.append( ( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SINGLE_MEDIA ) )
-            cache_jobs.append( ( ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SELECTION_LIST ) )
+            combined_statuses_to_tags = HydrusData.default_dict_set()
             
-            for ( source_tag_display_type, dest_tag_display_type ) in cache_jobs:
+            for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
                 
-                source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ source_tag_display_type ]
-                
-                destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
-                
-                for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+                if service_key == CC.COMBINED_TAG_SERVICE_KEY:
                     
-                    if tag_display_manager.FiltersTags( dest_tag_display_type, service_key ):
-                        
-                        destination_statuses_to_tags = HydrusData.default_dict_set()
-                        
-                        for ( status, source_tags ) in source_statuses_to_tags.items():
-                            
-                            dest_tags = tag_display_manager.FilterTags( dest_tag_display_type, service_key, source_tags )
-                            
-                            if len( source_tags ) != len( dest_tags ):
-                                
-                                destination_statuses_to_tags[ status ] = dest_tags
-                                
-                            else:
-                                
-                                destination_statuses_to_tags[ status ] = source_tags
-                                
-                            
-                        
-                        destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
-                        
-                    else:
-                        
-                        destination_service_keys_to_statuses_to_tags[ service_key ] = source_statuses_to_tags
-                        
+                    continue
                     
                 
-                self._tag_display_types_to_service_keys_to_statuses_to_tags[ dest_tag_display_type ] = destination_service_keys_to_statuses_to_tags
+                for ( status, tags ) in statuses_to_tags.items():
+                    
+                    combined_statuses_to_tags[ status ].update( tags )
+                    
                 
             
-            # combined service merge calculation
-            # would be great if this also could be db pre-computed
+            service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
             
-            for ( tag_display_type, service_keys_to_statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags.items():
+        
+    
+    def _RecalcServiceCaches( self, service_key ):
+        
+        # siblings (parents later)
+        
+        source_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ][ service_key ]
+        
+        sibling_statuses_to_tags = HG.client_controller.tag_siblings_manager.CollapseStatusesToTags( service_key, source_statuses_to_tags )
+        
+        self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS ][ service_key ] = sibling_statuses_to_tags
+        
+        # display filtering
+        
+        tag_display_manager = HG.client_controller.tag_display_manager
+        
+        for dest_tag_display_type in ( ClientTags.TAG_DISPLAY_SINGLE_MEDIA, ClientTags.TAG_DISPLAY_SELECTION_LIST ):
+            
+            if tag_display_manager.FiltersTags( dest_tag_display_type, service_key ):
                 
-                combined_statuses_to_tags = HydrusData.default_dict_set()
+                destination_statuses_to_tags = HydrusData.default_dict_set()
                 
-                for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+                for ( status, source_tags ) in sibling_statuses_to_tags.items():
+                    
+                    dest_tags = tag_display_manager.FilterTags( dest_tag_display_type, service_key, source_tags )
                     
-                    if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                    if len( source_tags ) != len( dest_tags ):
                         
-                        continue
+                        destination_statuses_to_tags[ status ] = dest_tags
                         
-                    
-                    for ( status, tags ) in statuses_to_tags.items():
+                    else:
                         
-                        combined_statuses_to_tags[ status ].update( tags )
+                        destination_statuses_to_tags[ status ] = source_tags
                         
                     
                 
-                service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+            else:
+                
+                destination_statuses_to_tags = sibling_statuses_to_tags
                 
             
-            #
-            
-            self._cache_is_dirty = False
+            self._tag_display_types_to_service_keys_to_statuses_to_tags[ dest_tag_display_type ][ service_key ] = destination_statuses_to_tags
             
         
     
@@ -997,7 +1002,14 @@ class TagsManager( object ):
                 statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
                 
             
-            self._cache_is_dirty = True
+            # the caches were clean when we fetched storage, so only this service and the combined merge need redoing
+            
+            if service_key != CC.COMBINED_TAG_SERVICE_KEY:
+                
+                self._RecalcServiceCaches( service_key )
+                
+            
+            self._RecalcCombinedCaches()
             
         
     
@@ -1,10 +1,120 @@
+import collections
+import operator
+import threading
 import typing
 
+from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientTags
 from hydrus.client.media import ClientMediaManagers
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 
+def GenerateTagsManager( service_ids_to_service_keys, tag_ids_to_tags, tag_rows, tag_display_lookup = None ):
+    
+    # tag_rows are ( hash_id, tag_service_id, status, tag_id ) for one file
+    # tag_display_lookup is ( tag_service_id, tag_id ) -> ( collapsed_tag, single_media_ok, selection_list_ok ), if the db could make it
+    
+    service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+    
+    if tag_display_lookup is None:
+        
+        for ( hash_id, tag_service_id, status, tag_id ) in tag_rows:
+            
+            service_keys_to_statuses_to_tags[ service_ids_to_service_keys[ tag_service_id ] ][ status ].add( tag_ids_to_tags[ tag_id ] )
+            
+        
+        return ClientMediaManagers.TagsManager( service_keys_to_statuses_to_tags )
+        
+    
+    siblings_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+    single_media_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+    selection_list_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+    
+    combined_statuses_to_tags = HydrusData.default_dict_set()
+    combined_siblings_statuses_to_tags = HydrusData.default_dict_set()
+    combined_single_media_statuses_to_tags = HydrusData.default_dict_set()
+    combined_selection_list_statuses_to_tags = HydrusData.default_dict_set()
+    
+    for ( hash_id, tag_service_id, status, tag_id ) in tag_rows:
+        
+        service_key = service_ids_to_service_keys[ tag_service_id ]
+        tag = tag_ids_to_tags[ tag_id ]
+        
+        ( collapsed_tag, single_media_ok, selection_list_ok ) = tag_display_lookup[ ( tag_service_id, tag_id ) ]
+        
+        service_keys_to_statuses_to_tags[ service_key ][ status ].add( tag )
+        combined_statuses_to_tags[ status ].add( tag )
+        
+        siblings_service_keys_to_statuses_to_tags[ service_key ][ status ].add( collapsed_tag )
+        combined_siblings_statuses_to_tags[ status ].add( collapsed_tag )
+        
+        # we touch the status even if the tag is filtered, so the structure is the same as a manager that worked it out itself
+        
+        single_media_tags = single_media_service_keys_to_statuses_to_tags[ service_key ][ status ]
+        combined_single_media_tags = combined_single_media_statuses_to_tags[ status ]
+        
+        if single_media_ok:
+            
+            single_media_tags.add( collapsed_tag )
+            combined_single_media_tags.add( collapsed_tag )
+            
+        
+        selection_list_tags = selection_list_service_keys_to_statuses_to_tags[ service_key ][ status ]
+        combined_selection_list_tags = combined_selection_list_statuses_to_tags[ status ]
+        
+        if selection_list_ok:
+            
+            selection_list_tags.add( collapsed_tag )
+            combined_selection_list_tags.add( collapsed_tag )
+            
+        
+    
+    service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+    siblings_service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_siblings_statuses_to_tags
+    single_media_service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_single_media_statuses_to_tags
+    selection_list_service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_selection_list_statuses_to_tags
+    
+    display_tag_display_types_to_service_keys_to_statuses_to_tags = {
+        ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS : siblings_service_keys_to_statuses_to_tags,
+        ClientTags.TAG_DISPLAY_SINGLE_MEDIA : single_media_service_keys_to_statuses_to_tags,
+        ClientTags.TAG_DISPLAY_SELECTION_LIST : selection_list_service_keys_to_statuses_to_tags
+    }
+    
+    return ClientMediaManagers.TagsManager( service_keys_to_statuses_to_tags, display_tag_display_types_to_service_keys_to_statuses_to_tags )
+    
+def IndexRowsByHashId( rows ):
+    
+    # sorts a list of rows that start with hash_id in place, and returns hash_id -> ( start, end ) for each run
+    # a big batch then costs one list and one dict rather than a small list for every file, which keeps the garbage collector happy
+    
+    rows.sort( key = operator.itemgetter( 0 ) )
+    
+    hash_ids_to_offsets = {}
+    
+    num_rows = len( rows )
+    
+    start = 0
+    
+    while start < num_rows:
+        
+        hash_id = rows[ start ][0]
+        
+        end = start + 1
+        
+        while end < num_rows and rows[ end ][0] == hash_id:
+            
+            end += 1
+            
+        
+        hash_ids_to_offsets[ hash_id ] = ( start, end )
+        
+        start = end
+        
+    
+    return hash_ids_to_offsets
+    
 class MediaResult( object ):
     
     def __init__(
@@ -40,22 +150,22 @@ class MediaResult( object ):
         
         if service_type in HC.REAL_TAG_SERVICES:
             
-            self._tags_manager.DeletePending( service_key )
+            self.GetTagsManager().DeletePending( service_key )
             
         elif service_type in HC.FILE_SERVICES:
             
-            self._locations_manager.DeletePending( service_key )
+            self.GetLocationsManager().DeletePending( service_key )
             
         
     
     def Duplicate( self ):
         
         file_info_manager = self._file_info_manager.Duplicate()
-        tags_manager = self._tags_manager.Duplicate()
-        locations_manager = self._locations_manager.Duplicate()
-        ratings_manager = self._ratings_manager.Duplicate()
-        notes_manager = self._notes_manager.Duplicate()
-        file_viewing_stats_manager = self._file_viewing_stats_manager.Duplicate()
+        tags_manager = self.GetTagsManager().Duplicate()
+        locations_manager = self.GetLocationsManager().Duplicate()
+        ratings_manager = self.GetRatingsManager().Duplicate()
+        notes_manager = self.GetNotesManager().Duplicate()
+        file_viewing_stats_manager = self.GetFileViewingStatsManager().Duplicate()
         
         return MediaResult( file_info_manager, tags_manager, locations_manager, ratings_manager, notes_manager, file_viewing_stats_manager )
         
@@ -87,7 +197,7 @@ class MediaResult( object ):
     
     def GetInbox( self ):
         
-        return self._locations_manager.inbox
+        return self.GetLocationsManager().inbox
         
     
     def GetLocationsManager( self ):
@@ -142,7 +252,7 @@ class MediaResult( object ):
     
     def HasNotes( self ):
         
-        return self._notes_manager.GetNumNotes() > 0
+        return self.GetNotesManager().GetNumNotes() > 0
         
     
     def IsStaticImage( self ):
@@ -153,6 +263,11 @@ class MediaResult( object ):
         return image or static_animation
         
     
+    def NewTagDisplayRules( self ):
+        
+        self.GetTagsManager().NewTagDisplayRules()
+        
+    
     def ProcessContentUpdate( self, service_key, content_update ):
         
         try:
@@ -168,33 +283,33 @@ class MediaResult( object ):
         
         if service_type in HC.REAL_TAG_SERVICES:
             
-            self._tags_manager.ProcessContentUpdate( service_key, content_update )
+            self.GetTagsManager().ProcessContentUpdate( service_key, content_update )
             
         elif service_type in HC.FILE_SERVICES:
             
             if content_update.GetDataType() == HC.CONTENT_TYPE_FILE_VIEWING_STATS:
                 
-                self._file_viewing_stats_manager.ProcessContentUpdate( content_update )
+                self.GetFileViewingStatsManager().ProcessContentUpdate( content_update )
                 
             else:
                 
-                self._locations_manager.ProcessContentUpdate( service_key, content_update )
+                self.GetLocationsManager().ProcessContentUpdate( service_key, content_update )
                 
             
         elif service_type in HC.RATINGS_SERVICES:
             
-            self._ratings_manager.ProcessContentUpdate( service_key, content_update )
+            self.GetRatingsManager().ProcessContentUpdate( service_key, content_update )
             
         elif service_type == HC.LOCAL_NOTES:
             
-            self._notes_manager.ProcessContentUpdate( content_update )
+            self.GetNotesManager().ProcessContentUpdate( content_update )
             
         
     
     def ResetService( self, service_key ):
         
-        self._tags_manager.ResetService( service_key )
-        self._locations_manager.ResetService( service_key )
+        self.GetTagsManager().ResetService( service_key )
+        self.GetLocationsManager().ResetService( service_key )
         
     
     def SetTagsManager( self, tags_manager ):
@@ -204,6 +319,309 @@ class MediaResult( object ):
     
     def ToTuple( self ):
         
-        return ( self._file_info_manager, self._tags_manager, self._locations_manager, self._ratings_manager )
+        return ( self._file_info_manager, self.GetTagsManager(), self.GetLocationsManager(), self.GetRatingsManager() )
+        
+    
+class LazyMediaResult( MediaResult ):
+    
+    # a media result from a big batch load. only the file info is made up front, the other managers are made from the batch's raw rows the first time they are asked for
+    
+    def __init__( self, file_info_manager: ClientMediaManagers.FileInfoManager, batch: "MediaResultBatch" ):
+        
+        MediaResult.__init__( self, file_info_manager, None, None, None, None, None )
+        
+        self._batch = batch
+        
+    
+    def _ReleaseBatchIfDone( self ):
+        
+        # call this with the batch lock held. once we have made all our managers we do not need the batch's rows, so a result that outlives the rest of its page does not keep them alive
+        
+        managers = ( self._file_viewing_stats_manager, self._locations_manager, self._notes_manager, self._ratings_manager, self._tags_manager )
+        
+        if all( ( manager is not None for manager in managers ) ):
+            
+            self._batch = None
+            
+        
+    
+    def GetFileViewingStatsManager( self ):
+        
+        if self._file_viewing_stats_manager is None:
+            
+            batch = self._batch
+            
+            # if the batch has been let go, every manager is already made
+            
+            if batch is not None:
+                
+                with batch.lock:
+                    
+                    if self._file_viewing_stats_manager is None:
+                        
+                        self._file_viewing_stats_manager = batch.GenerateFileViewingStatsManager( self._file_info_manager.hash_id )
+                        
+                        self._ReleaseBatchIfDone()
+                        
+                    
+                
+            
+        
+        return self._file_viewing_stats_manager
+        
+    
+    def GetLocationsManager( self ):
+        
+        if self._locations_manager is None:
+            
+            batch = self._batch
+            
+            # if the batch has been let go, every manager is already made
+            
+            if batch is not None:
+                
+                with batch.lock:
+                    
+                    if self._locations_manager is None:
+                        
+                        self._locations_manager = batch.GenerateLocationsManager( self._file_info_manager.hash_id )
+                        
+                        self._ReleaseBatchIfDone()
+                        
+                    
+                
+            
+        
+        return self._locations_manager
+        
+    
+    def GetNotesManager( self ):
+        
+        if self._notes_manager is None:
+            
+            batch = self._batch
+            
+            # if the batch has been let go, every manager is already made
+            
+            if batch is not None:
+                
+                with batch.lock:
+                    
+                    if self._notes_manager is None:
+                        
+                        self._notes_manager = batch.GenerateNotesManager( self._file_info_manager.hash_id )
+                        
+                        self._ReleaseBatchIfDone()
+                        
+                    
+                
+            
+        
+        return self._notes_manager
+        
+    
+    def GetRatingsManager( self ):
+        
+        if self._ratings_manager is None:
+            
+            batch = self._batch
+            
+            # if the batch has been let go, every manager is already made
+            
+            if batch is not None:
+                
+                with batch.lock:
+                    
+                    if self._ratings_manager is None:
+                        
+                        self._ratings_manager = batch.GenerateRatingsManager( self._file_info_manager.hash_id )
+                        
+                        self._ReleaseBatchIfDone()
+                        
+                    
+                
+            
+        
+        return self._ratings_manager
+        
+    
+    def GetTagsManager( self ) -> ClientMediaManagers.TagsManager:
+        
+        if self._tags_manager is None:
+            
+            batch = self._batch
+            
+            # if the batch has been let go, every manager is already made
+            
+            if batch is not None:
+                
+                with batch.lock:
+                    
+                    if self._tags_manager is None:
+                        
+                        self._tags_manager = batch.GenerateTagsManager( self._file_info_manager.hash_id )
+                        
+                        self._ReleaseBatchIfDone()
+                        
+                    
+                
+            
+        
+        return self._tags_manager
+        
+    
+    def NewTagDisplayRules( self ):
+        
+        # no need to make a tags manager just to tell it its display tags are stale
+        
+        batch = self._batch
+        
+        if batch is not None:
+            
+            with batch.lock:
+                
+                if self._tags_manager is None:
+                    
+                    batch.NewTagDisplayRules()
+                    
+                    return
+                    
+                
+            
+        
+        self._tags_manager.NewTagDisplayRules()
+        
+    
+class MediaResultBatch( object ):
+    
+    # the raw rows for a batch of media results, fetched one table at a time
+    # each table is one list of rows sorted by hash_id, with an index of where each file's rows are
+    
+    def __init__(
+        self,
+        service_ids_to_service_keys,
+        inbox_hash_ids,
+        tag_ids_to_tags,
+        current_file_rows,
+        deleted_file_rows,
+        pending_file_rows,
+        petitioned_file_rows,
+        url_rows,
+        service_filename_rows,
+        local_rating_rows,
+        note_rows,
+        tag_rows,
+        tag_display_lookup,
+        hash_ids_to_file_modified_timestamps,
+        hash_ids_to_file_viewing_stats
+    ):
+        
+        self.lock = threading.Lock()
+        
+        self._service_ids_to_service_keys = service_ids_to_service_keys
+        self._inbox_hash_ids = inbox_hash_ids
+        self._tag_ids_to_tags = tag_ids_to_tags
+        self._tag_display_lookup = tag_display_lookup
+        
+        self._tables = {}
+        
+        for ( name, rows ) in [
+            ( 'current_files', current_file_rows ),
+            ( 'deleted_files', deleted_file_rows ),
+            ( 'pending_files', pending_file_rows ),
+            ( 'petitioned_files', petitioned_file_rows ),
+            ( 'urls', url_rows ),
+            ( 'service_filenames', service_filename_rows ),
+            ( 'local_ratings', local_rating_rows ),
+            ( 'notes', note_rows ),
+            ( 'tags', tag_rows )
+        ]:
+            
+            self._tables[ name ] = ( rows, IndexRowsByHashId( rows ) )
+            
+        
+        self._hash_ids_to_file_modified_timestamps = hash_ids_to_file_modified_timestamps
+        self._hash_ids_to_file_viewing_stats = hash_ids_to_file_viewing_stats
+        
+    
+    def _GetRows( self, name, hash_id ):
+        
+        ( rows, hash_ids_to_offsets ) = self._tables[ name ]
+        
+        if hash_id not in hash_ids_to_offsets:
+            
+            return []
+            
+        
+        ( start, end ) = hash_ids_to_offsets[ hash_id ]
+        
+        return rows[ start : end ]
+        
+    
+    def GenerateFileViewingStatsManager( self, hash_id ):
+        
+        if hash_id in self._hash_ids_to_file_viewing_stats:
+            
+            ( preview_views, preview_viewtime, media_views, media_viewtime ) = self._hash_ids_to_file_viewing_stats[ hash_id ]
+            
+            return ClientMediaManagers.FileViewingStatsManager( preview_views, preview_viewtime, media_views, media_viewtime )
+            
+        else:
+            
+            return ClientMediaManagers.FileViewingStatsManager.STATICGenerateEmptyManager()
+            
+        
+    
+    def GenerateLocationsManager( self, hash_id ):
+        
+        service_ids_to_service_keys = self._service_ids_to_service_keys
+        
+        current_file_rows = self._GetRows( 'current_files', hash_id )
+        
+        current_file_service_keys = { service_ids_to_service_keys[ service_id ] for ( hash_id, service_id, timestamp ) in current_file_rows }
+        
+        deleted_file_service_keys = { service_ids_to_service_keys[ service_id ] for ( hash_id, service_id ) in self._GetRows( 'deleted_files', hash_id ) }
+        
+        pending_file_service_keys = { service_ids_to_service_keys[ service_id ] for ( hash_id, service_id ) in self._GetRows( 'pending_files', hash_id ) }
+        
+        petitioned_file_service_keys = { service_ids_to_service_keys[ service_id ] for ( hash_id, service_id ) in self._GetRows( 'petitioned_files', hash_id ) }
+        
+        inbox = hash_id in self._inbox_hash_ids
+        
+        urls = { url for ( hash_id, url ) in self._GetRows( 'urls', hash_id ) }
+        
+        service_keys_to_filenames = HydrusData.BuildKeyToListDict( ( ( service_ids_to_service_keys[ service_id ], filename ) for ( hash_id, service_id, filename ) in self._GetRows( 'service_filenames', hash_id ) ) )
+        
+        current_file_service_keys_to_timestamps = { service_ids_to_service_keys[ service_id ] : timestamp for ( hash_id, service_id, timestamp ) in current_file_rows }
+        
+        file_modified_timestamp = self._hash_ids_to_file_modified_timestamps.get( hash_id, None )
+        
+        return ClientMediaManagers.LocationsManager( current_file_service_keys, deleted_file_service_keys, pending_file_service_keys, petitioned_file_service_keys, inbox, urls, dict( service_keys_to_filenames ), current_to_timestamps = current_file_service_keys_to_timestamps, file_modified_timestamp = file_modified_timestamp )
+        
+    
+    def GenerateNotesManager( self, hash_id ):
+        
+        names_to_notes = { name : note for ( hash_id, name, note ) in self._GetRows( 'notes', hash_id ) }
+        
+        return ClientMediaManagers.NotesManager( names_to_notes )
+        
+    
+    def GenerateRatingsManager( self, hash_id ):
+        
+        local_ratings = { self._service_ids_to_service_keys[ service_id ] : rating for ( hash_id, service_id, rating ) in self._GetRows( 'local_ratings', hash_id ) }
+        
+        return ClientMediaManagers.RatingsManager( local_ratings )
+        
+    
+    def GenerateTagsManager( self, hash_id ):
+        
+        return GenerateTagsManager( self._service_ids_to_service_keys, self._tag_ids_to_tags, self._GetRows( 'tags', hash_id ), tag_display_lookup = self._tag_display_lookup )
+        
+    
+    def NewTagDisplayRules( self ):
+        
+        # call this with the lock held. tags managers made from now on will work out their display tags themselves
+        
+        self._tag_display_lookup = None
         
     
@@ -137,7 +137,7 @@ class MediaResultCache( object ):
             
             for media_result in self._hash_ids_to_media_results.values():
                 
-                media_result.GetTagsManager().NewTagDisplayRules()
+                media_result.NewTagDisplayRules()
                 
             
         
@@ -1,4 +1,5 @@
 import collections
+import heapq
 import threading
 import time
 import traceback
@@ -6,6 +7,7 @@ import traceback
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.client.networking import ClientNetworkingAsync
 
 JOB_STATUS_AWAITING_VALIDITY = 0
 JOB_STATUS_AWAITING_BANDWIDTH = 1
@@ -39,31 +41,238 @@ class NetworkEngine( object ):
         
         self._lock = threading.Lock()
         
-        self.RefreshOptions()
-        
         self._new_work_to_do = threading.Event()
         
         self._domains_to_login = []
         
         self._active_domains_counter = collections.Counter()
         
+        # each waiting state has a priority queue of ( job_index, job ) that are ready to be looked at, oldest job first
+        # jobs that cannot progress are not re-polled. they sit in the sleeping heap, or they are parked until a slot/login/validation event
+        
+        self._job_index = 0
+        self._jobs_to_indices = {}
+        self._jobs_to_statuses = {}
+        
         self._jobs_awaiting_validity = []
+        self._jobs_awaiting_validation_process = []
         self._current_validation_process = None
         self._jobs_awaiting_bandwidth = []
         self._jobs_awaiting_login = []
+        self._jobs_awaiting_login_process = []
         self._current_login_process = None
         self._jobs_awaiting_slot = []
+        self._domains_to_jobs_awaiting_domain_slot = collections.defaultdict( list )
         self._jobs_running = []
         
+        self._statuses_to_ready_jobs = {}
+        
+        self._statuses_to_ready_jobs[ JOB_STATUS_AWAITING_VALIDITY ] = self._jobs_awaiting_validity
+        self._statuses_to_ready_jobs[ JOB_STATUS_AWAITING_BANDWIDTH ] = self._jobs_awaiting_bandwidth
+        self._statuses_to_ready_jobs[ JOB_STATUS_AWAITING_LOGIN ] = self._jobs_awaiting_login
+        self._statuses_to_ready_jobs[ JOB_STATUS_AWAITING_SLOT ] = self._jobs_awaiting_slot
+        
+        self._sleep_index = 0
+        self._sleeping_jobs_to_sleep_indices = {}
+        self._sleeping_jobs_heap = []
+        
+        # job threads report in here without taking our lock, so they can never deadlock against us
+        self._jobs_to_wake = collections.deque()
+        
+        self._async_network_loop = None
+        
         self._pause_all_new_network_traffic = self.controller.new_options.GetBoolean( 'pause_all_new_network_traffic' )
         
         self._is_running = False
         self._is_shutdown = False
         self._local_shutdown = False
         
+        self.RefreshOptions()
+        
         self.controller.sub( self, 'RefreshOptions', 'notify_new_options' )
         
     
+    def _DropJob( self, job ):
+        
+        if job in self._jobs_to_statuses:
+            
+            del self._jobs_to_statuses[ job ]
+            del self._jobs_to_indices[ job ]
+            
+        
+        if job in self._sleeping_jobs_to_sleep_indices:
+            
+            del self._sleeping_jobs_to_sleep_indices[ job ]
+            
+        
+    
+    def _GetMaxJobsPerDomain( self, second_level_domain ):
+        
+        if second_level_domain in self._domains_to_max_jobs:
+            
+            return self._domains_to_max_jobs[ second_level_domain ]
+            
+        
+        return self.MAX_JOBS_PER_DOMAIN
+        
+    
+    def _GetAsyncNetworkLoop( self ):
+        
+        if self._async_network_loop is None:
+            
+            self._async_network_loop = ClientNetworkingAsync.AsyncNetworkLoop()
+            
+        
+        return self._async_network_loop
+        
+    
+    def _ParkJob( self, jobs_queue, job ):
+        
+        heapq.heappush( jobs_queue, ( self._jobs_to_indices[ job ], job ) )
+        
+    
+    def _PopReadyJob( self, status ):
+        
+        ready_jobs = self._statuses_to_ready_jobs[ status ]
+        
+        while len( ready_jobs ) > 0:
+            
+            ( job_index, job ) = heapq.heappop( ready_jobs )
+            
+            # skip stale entries for jobs that have since finished or moved on
+            if self._jobs_to_statuses.get( job, None ) == status and job not in self._sleeping_jobs_to_sleep_indices:
+                
+                return job
+                
+            
+        
+        return None
+        
+    
+    def _ReleaseDomainSlot( self, second_level_domain ):
+        
+        self._active_domains_counter[ second_level_domain ] -= 1
+        
+        if self._active_domains_counter[ second_level_domain ] == 0:
+            
+            del self._active_domains_counter[ second_level_domain ]
+            
+        
+        if second_level_domain in self._domains_to_jobs_awaiting_domain_slot:
+            
+            jobs_awaiting_domain_slot = self._domains_to_jobs_awaiting_domain_slot[ second_level_domain ]
+            
+            while len( jobs_awaiting_domain_slot ) > 0:
+                
+                ( job_index, job ) = heapq.heappop( jobs_awaiting_domain_slot )
+                
+                if job in self._jobs_to_statuses:
+                    
+                    self._ScheduleJob( job, JOB_STATUS_AWAITING_SLOT )
+                    
+                    break
+                    
+                
+            
+            if len( jobs_awaiting_domain_slot ) == 0:
+                
+                del self._domains_to_jobs_awaiting_domain_slot[ second_level_domain ]
+                
+            
+        
+    
+    def _ReleaseParkedJobs( self, parked_jobs, status ):
+        
+        for ( job_index, job ) in parked_jobs:
+            
+            if job in self._jobs_to_statuses:
+                
+                self._ScheduleJob( job, status )
+                
+            
+        
+        parked_jobs.clear()
+        
+    
+    def _ScheduleJob( self, job, status ):
+        
+        self._jobs_to_statuses[ job ] = status
+        
+        if status == JOB_STATUS_RUNNING:
+            
+            self._jobs_running.append( job )
+            
+        else:
+            
+            heapq.heappush( self._statuses_to_ready_jobs[ status ], ( self._jobs_to_indices[ job ], job ) )
+            
+        
+    
+    def _SleepJob( self, job, wake_timestamp = None ):
+        
+        if wake_timestamp is None:
+            
+            # the job's wake time is in integer seconds, and it is asleep until the clock ticks past it
+            wake_timestamp = job.GetWakeTime() + 1
+            
+        
+        self._sleep_index += 1
+        
+        self._sleeping_jobs_to_sleep_indices[ job ] = self._sleep_index
+        
+        heapq.heappush( self._sleeping_jobs_heap, ( wake_timestamp, self._sleep_index, job ) )
+        
+    
+    def _WakeJob( self, job ):
+        
+        if job not in self._jobs_to_statuses:
+            
+            return
+            
+        
+        status = self._jobs_to_statuses[ job ]
+        
+        if status == JOB_STATUS_RUNNING:
+            
+            # the running sweep will catch it
+            
+            return
+            
+        
+        if job.IsDone():
+            
+            self._DropJob( job )
+            
+        elif job in self._sleeping_jobs_to_sleep_indices:
+            
+            del self._sleeping_jobs_to_sleep_indices[ job ]
+            
+            self._ScheduleJob( job, status )
+            
+        
+    
+    def _WakeSleepingJobs( self ):
+        
+        now = time.time()
+        
+        while len( self._sleeping_jobs_heap ) > 0 and self._sleeping_jobs_heap[0][0] <= now:
+            
+            ( wake_timestamp, sleep_index, job ) = heapq.heappop( self._sleeping_jobs_heap )
+            
+            if self._sleeping_jobs_to_sleep_indices.get( job, None ) != sleep_index:
+                
+                continue
+                
+            
+            del self._sleeping_jobs_to_sleep_indices[ job ]
+            
+            if job in self._jobs_to_statuses:
+                
+                self._ScheduleJob( job, self._jobs_to_statuses[ job ] )
+                
+            
+        
+    
     def AddJob( self, job ):
         
         if HG.network_report_mode:
@@ -75,7 +284,11 @@ class NetworkEngine( object ):
             
             job.engine = self
             
-            self._jobs_awaiting_validity.append( job )
+            self._job_index += 1
+            
+            self._jobs_to_indices[ job ] = self._job_index
+            
+            self._ScheduleJob( job, JOB_STATUS_AWAITING_VALIDITY )
             
         
         self._new_work_to_do.set()
@@ -90,18 +303,14 @@ class NetworkEngine( object ):
             self._domains_to_login = HydrusData.DedupeList( self._domains_to_login )
             
         
+        self._new_work_to_do.set()
+        
     
     def GetJobsSnapshot( self ):
         
         with self._lock:
             
-            jobs = []
-            
-            jobs.extend( ( ( JOB_STATUS_AWAITING_VALIDITY, j ) for j in self._jobs_awaiting_validity ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_BANDWIDTH, j ) for j in self._jobs_awaiting_bandwidth ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_LOGIN, j ) for j in self._jobs_awaiting_login ) )
-            jobs.extend( ( ( JOB_STATUS_AWAITING_SLOT, j ) for j in self._jobs_awaiting_slot ) )
-            jobs.extend( ( ( JOB_STATUS_RUNNING, j ) for j in self._jobs_running ) )
+            jobs = [ ( status, job ) for ( job, status ) in self._jobs_to_statuses.items() ]
             
             return jobs
             
@@ -111,7 +320,7 @@ class NetworkEngine( object ):
         
         with self._lock:
             
-            return len( self._jobs_awaiting_validity ) + len( self._jobs_awaiting_bandwidth ) + len( self._jobs_awaiting_login ) + len( self._jobs_awaiting_slot ) + len( self._jobs_running ) > 50
+            return len( self._jobs_to_statuses ) > 50
             
         
     
@@ -137,11 +346,11 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._DropJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job )
                 
             elif not job.IsValid():
                 
@@ -157,14 +366,16 @@ class NetworkEngine( object ):
                         
                         job.SetStatus( 'validation presented to user\u2026' )
                         
+                        self._ParkJob( self._jobs_awaiting_validation_process, job )
+                        
                     else:
                         
                         job.SetStatus( 'waiting in user validation queue\u2026' )
                         
                         job.Sleep( 5 )
                         
-                    
-                    return True
+                        self._SleepJob( job )
+                        
                     
                 else:
                     
@@ -172,14 +383,12 @@ class NetworkEngine( object ):
                     
                     job.SetError( HydrusExceptions.ValidationException( error_text ), error_text )
                     
-                    return False
+                    self._DropJob( job )
                     
                 
             else:
                 
-                self._jobs_awaiting_bandwidth.append( job )
-                
-                return False
+                self._ScheduleJob( job, JOB_STATUS_AWAITING_BANDWIDTH )
                 
             
         
@@ -191,6 +400,8 @@ class NetworkEngine( object ):
                     
                     self._current_validation_process = None
                     
+                    self._ReleaseParkedJobs( self._jobs_awaiting_validation_process, JOB_STATUS_AWAITING_VALIDITY )
+                    
                 
             
         
@@ -198,21 +409,28 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._DropJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job )
                 
             elif not job.TryToStartBandwidth():
                 
-                return True
+                if job.IsAsleep():
+                    
+                    self._SleepJob( job )
+                    
+                else:
+                    
+                    # bandwidth is close, so check again when the second rolls over
+                    
+                    self._SleepJob( job, wake_timestamp = int( time.time() ) + 1 )
+                    
                 
             else:
                 
-                self._jobs_awaiting_login.append( job )
-                
-                return False
+                self._ScheduleJob( job, JOB_STATUS_AWAITING_LOGIN )
                 
             
         
@@ -243,11 +461,11 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._DropJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job )
                 
             elif job.NeedsLogin():
                 
@@ -263,7 +481,7 @@ class NetworkEngine( object ):
                         
                         job.Sleep( 60 )
                         
-                        return True
+                        self._SleepJob( job )
                         
                     else:
                         
@@ -278,9 +496,11 @@ class NetworkEngine( object ):
                         
                         job.Cancel( message )
                         
-                        return False
+                        self._DropJob( job )
                         
                     
+                    return
+                    
                 
                 if self._current_login_process is None:
                     
@@ -296,7 +516,9 @@ class NetworkEngine( object ):
                         
                         job.Sleep( 60 )
                         
-                        return True
+                        self._SleepJob( job )
+                        
+                        return
                         
                     
                     self.controller.CallToThread( login_process.Start )
@@ -310,13 +532,13 @@ class NetworkEngine( object ):
                     job.SetStatus( 'waiting in login queue\u2026' )
                     
                 
-                return True
+                self._ParkJob( self._jobs_awaiting_login_process, job )
                 
             else:
                 
-                self._jobs_awaiting_slot.append( job )
+                job.SetStatus( 'waiting for a slot\u2026' )
                 
-                return False
+                self._ScheduleJob( job, JOB_STATUS_AWAITING_SLOT )
                 
             
         
@@ -328,6 +550,8 @@ class NetworkEngine( object ):
                     
                     self._current_login_process = None
                     
+                    self._ReleaseParkedJobs( self._jobs_awaiting_login_process, JOB_STATUS_AWAITING_LOGIN )
+                    
                 
             
         
@@ -335,67 +559,61 @@ class NetworkEngine( object ):
             
             if job.IsDone():
                 
-                return False
+                self._DropJob( job )
                 
             elif job.IsAsleep():
                 
-                return True
+                self._SleepJob( job )
                 
-            elif len( self._jobs_running ) < self.MAX_JOBS:
+            elif self._pause_all_new_network_traffic:
                 
-                if self._pause_all_new_network_traffic:
-                    
-                    job.SetStatus( 'all new network traffic is paused\u2026' )
-                    
-                    job.Sleep( 2 )
-                    
-                    return True
-                    
-                elif self.controller.JustWokeFromSleep():
-                    
-                    job.SetStatus( 'looks like computer just woke up, waiting a bit' )
-                    
-                    job.Sleep( 5 )
-                    
-                    return True
-                    
-                elif self._active_domains_counter[ job.GetSecondLevelDomain() ] >= self.MAX_JOBS_PER_DOMAIN:
-                    
-                    job.SetStatus( 'waiting for a slot on this domain' )
-                    
-                    job.Sleep( 2 )
-                    
-                    return True
-                    
-                elif not job.TokensOK():
+                job.SetStatus( 'all new network traffic is paused\u2026' )
+                
+                job.Sleep( 2 )
+                
+                self._SleepJob( job )
+                
+            elif self.controller.JustWokeFromSleep():
+                
+                job.SetStatus( 'looks like computer just woke up, waiting a bit' )
+                
+                job.Sleep( 5 )
+                
+                self._SleepJob( job )
+                
+            elif self._active_domains_counter[ job.GetSecondLevelDomain() ] >= self._GetMaxJobsPerDomain( job.GetSecondLevelDomain() ):
+                
+                job.SetStatus( 'waiting for a slot on this domain' )
+                
+                self._ParkJob( self._domains_to_jobs_awaiting_domain_slot[ job.GetSecondLevelDomain() ], job )
+                
+            elif not job.TokensOK():
+                
+                self._SleepJob( job )
+                
+            elif not job.DomainOK():
+                
+                self._SleepJob( job )
+                
+            else:
+                
+                if HG.network_report_mode:
                     
-                    return True
+                    HydrusData.ShowText( 'Network Job Starting: ' + job._method + ' ' + job._url )
                     
-                elif not job.DomainOK():
+                
+                self._active_domains_counter[ job.GetSecondLevelDomain() ] += 1
+                
+                self._ScheduleJob( job, JOB_STATUS_RUNNING )
+                
+                if self._async_downloads and ClientNetworkingAsync.H11_OK and job.CanStartAsync():
                     
-                    return True
+                    self._GetAsyncNetworkLoop().StartJob( job )
                     
                 else:
                     
-                    if HG.network_report_mode:
-                        
-                        HydrusData.ShowText( 'Network Job Starting: ' + job._method + ' ' + job._url )
-                        
-                    
-                    self._active_domains_counter[ job.GetSecondLevelDomain() ] += 1
-                    
                     self.controller.CallToThread( job.Start )
                     
-                    self._jobs_running.append( job )
-                    
-                    return False
-                    
-                
-            else:
-                
-                job.SetStatus( 'waiting for a slot\u2026' )
-                
-                return True
                 
             
         
@@ -408,14 +626,9 @@ class NetworkEngine( object ):
                     HydrusData.ShowText( 'Network Job Done: ' + job._method + ' ' + job._url )
                     
                 
-                second_level_domain = job.GetSecondLevelDomain()
-                
-                self._active_domains_counter[ second_level_domain ] -= 1
+                self._DropJob( job )
                 
-                if self._active_domains_counter[ second_level_domain ] == 0:
-                    
-                    del self._active_domains_counter[ second_level_domain ]
-                    
+                self._ReleaseDomainSlot( job.GetSecondLevelDomain() )
                 
                 return False
                 
@@ -425,39 +638,78 @@ class NetworkEngine( object ):
                 
             
         
+        def ProcessReadyJobs( status, process_job_callable ):
+            
+            job = self._PopReadyJob( status )
+            
+            while job is not None:
+                
+                process_job_callable( job )
+                
+                job = self._PopReadyJob( status )
+                
+            
+        
         self._is_running = True
         
         while not ( self._local_shutdown or HG.model_shutdown ):
             
+            # clear before we look at anything, so any wake that comes in while we work will get its own pass
+            self._new_work_to_do.clear()
+            
             with self._lock:
                 
-                self._jobs_awaiting_validity = list( filter( ProcessValidationJob, self._jobs_awaiting_validity ) )
+                while len( self._jobs_to_wake ) > 0:
+                    
+                    self._WakeJob( self._jobs_to_wake.popleft() )
+                    
+                
+                self._WakeSleepingJobs()
+                
+                self._jobs_running = list( filter( ProcessRunningJob, self._jobs_running ) )
+                
+                ProcessReadyJobs( JOB_STATUS_AWAITING_VALIDITY, ProcessValidationJob )
                 
                 ProcessCurrentValidationJob()
                 
-                self._jobs_awaiting_bandwidth = list( filter( ProcessBandwidthJob, self._jobs_awaiting_bandwidth ) )
+                ProcessReadyJobs( JOB_STATUS_AWAITING_BANDWIDTH, ProcessBandwidthJob )
                 
                 ProcessForceLogins()
                 
-                self._jobs_awaiting_login = list( filter( ProcessLoginJob, self._jobs_awaiting_login ) )
+                ProcessReadyJobs( JOB_STATUS_AWAITING_LOGIN, ProcessLoginJob )
                 
                 ProcessCurrentLoginJob()
                 
-                self._jobs_awaiting_slot = list( filter( ProcessReadyJob, self._jobs_awaiting_slot ) )
+                while len( self._jobs_running ) < self.MAX_JOBS:
+                    
+                    job = self._PopReadyJob( JOB_STATUS_AWAITING_SLOT )
+                    
+                    if job is None:
+                        
+                        break
+                        
+                    
+                    ProcessReadyJob( job )
+                    
+                
+                # we only poll at all for a handful of things that do not tell us when they are done, like the login processes
                 
-                self._jobs_running = list( filter( ProcessRunningJob, self._jobs_running ) )
+                timeout = 1.0
+                
+                if len( self._sleeping_jobs_heap ) > 0:
+                    
+                    timeout = max( 0.0, min( timeout, self._sleeping_jobs_heap[0][0] - time.time() ) )
+                    
                 
             
-            # we want to catch the rollover of the second for bandwidth jobs
-            
-            now_with_subsecond = time.time()
-            subsecond_part = now_with_subsecond % 1
+            self.session_manager.MaintainConnectionPools()
             
-            time_until_next_second = 1.0 - subsecond_part
+            self._new_work_to_do.wait( timeout )
             
-            self._new_work_to_do.wait( time_until_next_second )
+        
+        if self._async_network_loop is not None:
             
-            self._new_work_to_do.clear()
+            self._async_network_loop.Shutdown()
             
         
         self._is_running = False
@@ -471,6 +723,8 @@ class NetworkEngine( object ):
         
         self.controller.new_options.SetBoolean( 'pause_all_new_network_traffic', self._pause_all_new_network_traffic )
         
+        self._new_work_to_do.set()
+        
     
     def RefreshOptions( self ):
         
@@ -479,6 +733,21 @@ class NetworkEngine( object ):
             self.MAX_JOBS = self.controller.new_options.GetInteger( 'max_network_jobs' )
             self.MAX_JOBS_PER_DOMAIN = self.controller.new_options.GetInteger( 'max_network_jobs_per_domain' )
             
+            self._domains_to_max_jobs = self.controller.new_options.GetMaxNetworkJobsPerSpecificDomain()
+            
+            self._async_downloads = self.controller.new_options.GetBoolean( 'network_async_downloads' )
+            
+            # the limits may have gone up, so let everything parked on a domain have another go
+            
+            for jobs_awaiting_domain_slot in self._domains_to_jobs_awaiting_domain_slot.values():
+                
+                self._ReleaseParkedJobs( jobs_awaiting_domain_slot, JOB_STATUS_AWAITING_SLOT )
+                
+            
+            self._domains_to_jobs_awaiting_domain_slot.clear()
+            
+        
+        self._new_work_to_do.set()
         
     
     def Shutdown( self ):
@@ -488,3 +757,17 @@ class NetworkEngine( object ):
         self._new_work_to_do.set()
         
     
+    def WakeJob( self, job ):
+        
+        # called by jobs when something changes that could get them moving again, e.g. they finish or have their bandwidth overridden
+        
+        self._jobs_to_wake.append( job )
+        
+        self._new_work_to_do.set()
+        
+    
+    def WakeUp( self ):
+        
+        self._new_work_to_do.set()
+        
+    
@@ -0,0 +1,656 @@
+import asyncio
+import collections
+import concurrent.futures
+import http.client
+import io
+import ssl
+import threading
+import time
+import urllib.parse
+import zlib
+
+import requests
+import requests.certs
+import requests.cookies
+import requests.utils
+
+from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusGlobals as HG
+
+try:
+    
+    import h11
+    
+    H11_OK = True
+    
+except:
+    
+    H11_OK = False
+    
+
+# plain downloads as coroutines on one event loop, so many of them can share one thread
+# h11 does the HTTP/1.1 parsing, asyncio streams do the sockets, and this does connection pooling and redirects
+# it borrows the requests session for headers, cookies and ssl verification, so the rest of the client does not know the difference
+# anything fancy (proxies, uploads, hydrus services, encodings we cannot decode) stays on the requests path
+
+MAX_REDIRECTS = requests.models.DEFAULT_REDIRECT_LIMIT
+REDIRECT_STATUS_CODES = { 301, 302, 303, 307, 308 }
+
+# requests offers br and zstd if those libraries happen to be installed, but we only know how to decode these
+ACCEPT_ENCODING = 'gzip, deflate'
+
+class AsyncConnectException( Exception ): pass
+class AsyncReadTimeoutException( Exception ): pass
+class AsyncConnectionBrokeException( Exception ): pass
+class AsyncShouldUseThreadException( Exception ): pass
+
+class _OriginalResponse( object ):
+    
+    # just enough for requests.cookies.extract_cookies_to_jar
+    
+    def __init__( self, headers ):
+        
+        self._original_response = self
+        self.msg = headers
+        
+    
+class AsyncHTTPConnection( object ):
+    
+    def __init__( self, key, reader, writer ):
+        
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        
+        self.h11_connection = h11.Connection( h11.CLIENT, max_incomplete_event_size = 1048576 )
+        
+        self.num_requests = 0
+        self.last_used = time.time()
+        
+    
+    def Close( self ):
+        
+        try:
+            
+            self.writer.close()
+            
+        except Exception:
+            
+            pass
+            
+        
+    
+    def IsUsable( self ):
+        
+        return self.h11_connection.our_state is h11.IDLE and not ( self.reader.at_eof() or self.writer.is_closing() )
+        
+    
+    async def NextEvent( self, timeout, read_size = 65536 ):
+        
+        while True:
+            
+            event = self.h11_connection.next_event()
+            
+            if event is not h11.NEED_DATA:
+                
+                return event
+                
+            
+            # an empty read is eof, which h11 turns into the end of a close-delimited body or an error
+            data = await asyncio.wait_for( self.reader.read( read_size ), timeout )
+            
+            self.h11_connection.receive_data( data )
+            
+        
+    
+    async def Send( self, events, timeout ):
+        
+        for event in events:
+            
+            data = self.h11_connection.send( event )
+            
+            if data is not None and len( data ) > 0:
+                
+                self.writer.write( data )
+                
+            
+        
+        await asyncio.wait_for( self.writer.drain(), timeout )
+        
+    
+    def StartNextCycle( self ):
+        
+        # h11 only lets us reuse the connection if both sides finished cleanly and nobody said 'Connection: close'
+        
+        if self.h11_connection.our_state is h11.DONE and self.h11_connection.their_state is h11.DONE:
+            
+            self.h11_connection.start_next_cycle()
+            
+            return True
+            
+        
+        return False
+        
+    
+class AsyncHTTPResponse( object ):
+    
+    def __init__( self, connection, url, h11_response, read_timeout ):
+        
+        self._connection = connection
+        self._read_timeout = read_timeout
+        
+        self.url = url
+        self.status_code = h11_response.status_code
+        self.reason = h11_response.reason.decode( 'latin-1' )
+        
+        self.headers = http.client.HTTPMessage()
+        
+        for ( name, value ) in h11_response.headers:
+            
+            self.headers[ name.decode( 'latin-1' ) ] = value.decode( 'latin-1' )
+            
+        
+        self.ok = self.status_code < 400
+        self.encoding = requests.utils.get_encoding_from_headers( self.headers )
+        
+        self.num_raw_bytes_read = 0
+        
+        self._body_done = False
+        
+        content_encoding = self.headers.get( 'Content-Encoding', '' ).strip().lower()
+        
+        self.can_decode = True
+        
+        if content_encoding in ( 'gzip', 'x-gzip' ):
+            
+            self._decompressor = zlib.decompressobj( 16 + zlib.MAX_WBITS )
+            
+        elif content_encoding == 'deflate':
+            
+            self._decompressor = zlib.decompressobj()
+            
+        else:
+            
+            self._decompressor = None
+            
+            self.can_decode = content_encoding in ( '', 'identity' )
+            
+        
+        self._first_deflate_chunk = content_encoding == 'deflate'
+        
+    
+    async def _Read( self, coroutine ):
+        
+        try:
+            
+            return await coroutine
+            
+        except asyncio.TimeoutError:
+            
+            raise AsyncReadTimeoutException( 'Reading the response timed out!' )
+            
+        except ( h11.RemoteProtocolError, ConnectionError, OSError ) as e:
+            
+            raise AsyncConnectionBrokeException( 'The connection broke mid-response: {}'.format( e ) )
+            
+        
+    
+    def _Decode( self, raw_chunk ):
+        
+        if self._decompressor is None:
+            
+            return raw_chunk
+            
+        
+        if self._first_deflate_chunk:
+            
+            self._first_deflate_chunk = False
+            
+            # some servers send raw deflate without the zlib header
+            try:
+                
+                return self._decompressor.decompress( raw_chunk )
+                
+            except zlib.error:
+                
+                self._decompressor = zlib.decompressobj( -zlib.MAX_WBITS )
+                
+            
+        
+        return self._decompressor.decompress( raw_chunk )
+        
+    
+    def Close( self, connection_pool ):
+        
+        if self._connection is None:
+            
+            return
+            
+        
+        if self._body_done and self._connection.StartNextCycle():
+            
+            connection_pool.ReleaseConnection( self._connection )
+            
+        else:
+            
+            self._connection.Close()
+            
+        
+        self._connection = None
+        
+    
+    async def IterContent( self, chunk_size = 65536 ):
+        
+        while not self._body_done:
+            
+            event = await self._Read( self._connection.NextEvent( self._read_timeout, read_size = chunk_size ) )
+            
+            if isinstance( event, h11.Data ):
+                
+                raw_chunk = bytes( event.data )
+                
+                self.num_raw_bytes_read += len( raw_chunk )
+                
+                chunk = self._Decode( raw_chunk )
+                
+                if len( chunk ) > 0:
+                    
+                    yield chunk
+                    
+                
+            elif isinstance( event, ( h11.EndOfMessage, h11.ConnectionClosed ) ):
+                
+                self._body_done = True
+                
+            
+        
+        if self._decompressor is not None:
+            
+            chunk = self._decompressor.flush()
+            
+            if len( chunk ) > 0:
+                
+                yield chunk
+                
+            
+        
+    
+    async def ReadAll( self, max_allowed ):
+        
+        stream = io.BytesIO()
+        
+        async for chunk in self.IterContent():
+            
+            stream.write( chunk )
+            
+            if stream.tell() > max_allowed:
+                
+                break
+                
+            
+        
+        return stream.getvalue()
+        
+    
+class AsyncConnectionPool( object ):
+    
+    def __init__( self ):
+        
+        self._keys_to_idle_connections = collections.defaultdict( list )
+        
+        self._ssl_contexts = {}
+        
+        self._pool_size = 10
+        self._idle_timeout = 60
+        
+    
+    def _PruneIdleConnections( self ):
+        
+        for ( key, connections ) in list( self._keys_to_idle_connections.items() ):
+            
+            for connection in connections:
+                
+                if HydrusData.TimeHasPassedFloat( connection.last_used + self._idle_timeout ) or not connection.IsUsable():
+                    
+                    connection.Close()
+                    
+                
+            
+            connections = [ connection for connection in connections if connection.IsUsable() and not HydrusData.TimeHasPassedFloat( connection.last_used + self._idle_timeout ) ]
+            
+            if len( connections ) == 0:
+                
+                del self._keys_to_idle_connections[ key ]
+                
+            else:
+                
+                self._keys_to_idle_connections[ key ] = connections
+                
+            
+        
+    
+    def CloseAll( self ):
+        
+        for connections in self._keys_to_idle_connections.values():
+            
+            for connection in connections:
+                
+                connection.Close()
+                
+            
+        
+        self._keys_to_idle_connections = collections.defaultdict( list )
+        
+    
+    async def GetConnection( self, scheme, host, port, verify, ssl_context, connect_timeout ):
+        
+        key = ( scheme, host, port, verify )
+        
+        self._PruneIdleConnections()
+        
+        if key in self._keys_to_idle_connections:
+            
+            return self._keys_to_idle_connections[ key ].pop()
+            
+        
+        server_hostname = host if ssl_context is not None else None
+        
+        try:
+            
+            ( reader, writer ) = await asyncio.wait_for( asyncio.open_connection( host, port, ssl = ssl_context, server_hostname = server_hostname ), connect_timeout )
+            
+        except asyncio.TimeoutError:
+            
+            raise AsyncConnectException( 'Connecting timed out!' )
+            
+        except ( ConnectionError, OSError, ssl.SSLError ) as e:
+            
+            raise AsyncConnectException( 'Could not connect: {}'.format( e ) )
+            
+        
+        return AsyncHTTPConnection( key, reader, writer )
+        
+    
+    def GetSSLContext( self, verify ):
+        
+        # this loads certificate files, so it is called off the loop
+        
+        if verify not in self._ssl_contexts:
+            
+            if verify is False:
+                
+                ssl_context = ssl.create_default_context()
+                
+                ssl_context.check_hostname = False
+                ssl_context.verify_mode = ssl.CERT_NONE
+                
+            elif isinstance( verify, str ):
+                
+                ssl_context = ssl.create_default_context( cafile = verify )
+                
+            else:
+                
+                ssl_context = ssl.create_default_context( cafile = requests.certs.where() )
+                
+            
+            self._ssl_contexts[ verify ] = ssl_context
+            
+        
+        return self._ssl_contexts[ verify ]
+        
+    
+    def ReleaseConnection( self, connection ):
+        
+        if not connection.IsUsable():
+            
+            connection.Close()
+            
+            return
+            
+        
+        connection.last_used = time.time()
+        
+        connections = self._keys_to_idle_connections[ connection.key ]
+        
+        if len( connections ) >= self._pool_size:
+            
+            connection.Close()
+            
+        else:
+            
+            connections.append( connection )
+            
+        
+    
+    def UpdateSettings( self ):
+        
+        # the options take a lock, so this is called off the loop
+        
+        self._pool_size = HG.client_controller.new_options.GetInteger( 'network_connection_pool_size' )
+        self._idle_timeout = HG.client_controller.new_options.GetInteger( 'network_connection_idle_timeout' )
+        
+    
+class AsyncNetworkLoop( object ):
+    
+    def __init__( self ):
+        
+        self._loop = asyncio.new_event_loop()
+        
+        self._connection_pool = AsyncConnectionPool()
+        
+        # anything that touches the disk or takes a lock goes here, so a slow disk or a busy lock never stalls every download at once
+        self._blocking_executor = concurrent.futures.ThreadPoolExecutor( max_workers = 4, thread_name_prefix = 'async network blocking work' )
+        
+        self._thread = threading.Thread( target = self._RunLoop, name = 'async network loop', daemon = True )
+        
+        self._thread.start()
+        
+    
+    def _PrepareRequest( self, session, method, url, headers ):
+        
+        # let requests merge in the session headers and cookies for this url
+        prepared_request = session.prepare_request( requests.Request( method, url, headers = headers ) )
+        
+        request_headers = dict( prepared_request.headers )
+        
+        request_headers[ 'Accept-Encoding' ] = ACCEPT_ENCODING
+        
+        return ( prepared_request, request_headers )
+        
+    
+    def _RunLoop( self ):
+        
+        asyncio.set_event_loop( self._loop )
+        
+        try:
+            
+            self._loop.run_forever()
+            
+        finally:
+            
+            self._connection_pool.CloseAll()
+            
+            self._loop.close()
+            
+            self._blocking_executor.shutdown( wait = False )
+            
+        
+    
+    async def _SendRequest( self, method, url, headers, verify, connect_timeout, read_timeout ):
+        
+        parsed = urllib.parse.urlsplit( url )
+        
+        scheme = parsed.scheme.lower()
+        
+        if scheme not in ( 'http', 'https' ):
+            
+            raise AsyncShouldUseThreadException( 'Cannot do "{}" urls!'.format( scheme ) )
+            
+        
+        host = parsed.hostname
+        port = parsed.port
+        
+        if port is None:
+            
+            port = 443 if scheme == 'https' else 80
+            
+        
+        if scheme == 'https':
+            
+            ssl_context = await self.RunBlocking( self._connection_pool.GetSSLContext, verify )
+            
+        else:
+            
+            ssl_context = None
+            
+        
+        target = parsed.path
+        
+        if target == '':
+            
+            target = '/'
+            
+        
+        if parsed.query != '':
+            
+            target += '?' + parsed.query
+            
+        
+        h11_headers = []
+        
+        if 'Host' not in headers:
+            
+            h11_headers.append( ( 'Host', parsed.netloc.rsplit( '@', 1 )[-1] ) )
+            
+        
+        h11_headers.extend( headers.items() )
+        
+        # a pooled connection may have been dropped by the server while idle, so we get one fresh try
+        
+        for attempt in range( 2 ):
+            
+            connection = await self._connection_pool.GetConnection( scheme, host, port, verify, ssl_context, connect_timeout )
+            
+            connection.num_requests += 1
+            
+            try:
+                
+                await connection.Send( ( h11.Request( method = method, target = target, headers = h11_headers ), h11.EndOfMessage() ), read_timeout )
+                
+                event = await connection.NextEvent( read_timeout )
+                
+                while isinstance( event, h11.InformationalResponse ):
+                    
+                    event = await connection.NextEvent( read_timeout )
+                    
+                
+                if not isinstance( event, h11.Response ):
+                    
+                    raise h11.RemoteProtocolError( 'The server closed the connection without a response.' )
+                    
+                
+            except asyncio.TimeoutError:
+                
+                connection.Close()
+                
+                raise AsyncReadTimeoutException( 'Connection successful, but reading response timed out!' )
+                
+            except ( h11.RemoteProtocolError, ConnectionError, OSError ) as e:
+                
+                connection.Close()
+                
+                if connection.num_requests > 1 and attempt == 0:
+                    
+                    continue
+                    
+                
+                raise AsyncConnectionBrokeException( 'Connection broke before the response: {}'.format( e ) )
+                
+            except h11.LocalProtocolError as e:
+                
+                connection.Close()
+                
+                raise AsyncShouldUseThreadException( 'Could not send this request: {}'.format( e ) )
+                
+            
+            return ( connection, AsyncHTTPResponse( connection, url, event, read_timeout ) )
+            
+        
+    
+    def CloseResponse( self, response ):
+        
+        response.Close( self._connection_pool )
+        
+    
+    async def Request( self, session, method, url, headers, connect_timeout, read_timeout ):
+        
+        if len( session.proxies ) > 0 or ( session.trust_env and len( await self.RunBlocking( requests.utils.get_environ_proxies, url ) ) > 0 ):
+            
+            raise AsyncShouldUseThreadException( 'Proxies are only supported on the normal request path.' )
+            
+        
+        await self.RunBlocking( self._connection_pool.UpdateSettings )
+        
+        original_host = urllib.parse.urlsplit( url ).hostname
+        
+        for num_redirects in range( MAX_REDIRECTS + 1 ):
+            
+            ( prepared_request, request_headers ) = await self.RunBlocking( self._PrepareRequest, session, method, url, headers )
+            
+            if urllib.parse.urlsplit( prepared_request.url ).hostname != original_host:
+                
+                request_headers.pop( 'Authorization', None )
+                
+            
+            ( connection, response ) = await self._SendRequest( method, prepared_request.url, request_headers, session.verify, connect_timeout, read_timeout )
+            
+            if not response.can_decode:
+                
+                response.Close( self._connection_pool )
+                
+                raise AsyncShouldUseThreadException( 'Cannot decode "{}" content.'.format( response.headers[ 'Content-Encoding' ] ) )
+                
+            
+            await self.RunBlocking( requests.cookies.extract_cookies_to_jar, session.cookies, prepared_request, _OriginalResponse( response.headers ) )
+            
+            if response.status_code in REDIRECT_STATUS_CODES and 'Location' in response.headers:
+                
+                # drain a small redirect body so the connection can go back in the pool
+                await response.ReadAll( 65536 )
+                
+                response.Close( self._connection_pool )
+                
+                url = urllib.parse.urljoin( prepared_request.url, response.headers[ 'Location' ] )
+                
+                if response.status_code == 303:
+                    
+                    method = 'GET'
+                    
+                
+                continue
+                
+            
+            connection_reused = connection.num_requests > 1
+            
+            return ( response, connection_reused )
+            
+        
+        raise HydrusExceptions.NetworkException( 'Exceeded {} redirects!'.format( MAX_REDIRECTS ) )
+        
+    
+    async def RunBlocking( self, func, *args ):
+        
+        return await self._loop.run_in_executor( self._blocking_executor, func, *args )
+        
+    
+    def Shutdown( self ):
+        
+        self._loop.call_soon_threadsafe( self._loop.stop )
+        
+    
+    def StartJob( self, job ):
+        
+        asyncio.run_coroutine_threadsafe( job.AsyncStart( self ), self._loop )
+        
+    
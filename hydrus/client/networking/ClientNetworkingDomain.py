@@ -2443,6 +2443,11 @@ class DomainValidationPopupProcess( object ):
             
             self._is_done = True
             
+            if self._domain_manager.engine is not None:
+                
+                self._domain_manager.engine.WakeUp()
+                
+            
         
     
 GALLERY_INDEX_TYPE_PATH_COMPONENT = 0
@@ -1,3 +1,4 @@
+import asyncio
 import io
 import os
 import requests
@@ -7,6 +8,7 @@ import time
 import urllib
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client.networking import ClientNetworkingAsync
 from hydrus.client.networking import ClientNetworkingContexts
 from hydrus.client.networking import ClientNetworkingDomain
 from hydrus.core import HydrusConstants as HC
@@ -177,6 +179,8 @@ class NetworkJob( object ):
         
         self._wake_time = 0
         
+        self._connection_reused = None
+        
         self._content_type = None
         
         self._encoding = 'utf-8'
@@ -212,6 +216,106 @@ class NetworkJob( object ):
         ( self._session_network_context, self._login_network_context ) = self._GenerateSpecificNetworkContexts()
         
     
+    async def _AsyncReadResponse( self, async_network_loop, response, stream_dest, max_allowed = None ):
+        
+        mime = await async_network_loop.RunBlocking( self._StartReadingResponse, response.headers, max_allowed )
+        
+        async for chunk in response.IterContent( chunk_size = 65536 ):
+            
+            if self._IsCancelled():
+                
+                return
+                
+            
+            # the write, the size checks and the bandwidth report all touch the disk or take locks, so they happen off the loop
+            ongoing_bandwidth_ok = await async_network_loop.RunBlocking( self._AsyncReportChunk, stream_dest, chunk, response.num_raw_bytes_read, mime, max_allowed )
+            
+            if not ongoing_bandwidth_ok:
+                
+                await self._AsyncWaitOnOngoingBandwidth( async_network_loop )
+                
+            
+            if HG.view_shutdown:
+                
+                raise HydrusExceptions.ShutdownException()
+                
+            
+        
+        self._FinishReadingResponse( True )
+        
+    
+    def _AsyncReportChunk( self, stream_dest, chunk, num_raw_bytes_read, mime, max_allowed ):
+        
+        stream_dest.write( chunk )
+        
+        # we count the raw socket bytes ourselves, so this is always accurate, even for chunked responses
+        chunk_num_bytes = self._ReportChunkRead( chunk, num_raw_bytes_read, True, mime, max_allowed )
+        
+        self._ReportDataUsed( chunk_num_bytes )
+        
+        return self._OngoingBandwidthOK()
+        
+    
+    async def _AsyncSendRequestAndGetResponse( self, async_network_loop ):
+        
+        ( method, url, data, files, headers, session, connect_timeout, read_timeout ) = await async_network_loop.RunBlocking( self._GetRequestParameters )
+        
+        ( response, connection_reused ) = await async_network_loop.Request( session, method, url, headers, connect_timeout, read_timeout )
+        
+        self._connection_reused = connection_reused
+        
+        return response
+        
+    
+    def _AsyncSetDone( self ):
+        
+        with self._lock:
+            
+            self._SetDone()
+            
+        
+    
+    def _AsyncSetStarted( self ):
+        
+        with self._lock:
+            
+            self._is_started = True
+            self._status_text = 'job started'
+            
+        
+    
+    async def _AsyncWaitOnConnectionError( self, async_network_loop, status_text ):
+        
+        await async_network_loop.RunBlocking( self._SetConnectionErrorWakeTime )
+        
+        while not HydrusData.TimeHasPassed( self._connection_error_wake_time ) and not self._IsCancelled():
+            
+            await async_network_loop.RunBlocking( self.SetStatus, status_text + ' - retrying in {}'.format( HydrusData.TimestampToPrettyTimeDelta( self._connection_error_wake_time ) ) )
+            
+            await asyncio.sleep( 1 )
+            
+        
+    
+    async def _AsyncWaitOnOngoingBandwidth( self, async_network_loop ):
+        
+        while not self._IsCancelled() and not await async_network_loop.RunBlocking( self._OngoingBandwidthOK ):
+            
+            await asyncio.sleep( 0.1 )
+            
+        
+    
+    async def _AsyncWaitOnServersideBandwidth( self, async_network_loop, status_text ):
+        
+        await async_network_loop.RunBlocking( self._SetServersideBandwidthWakeTime )
+        
+        while not HydrusData.TimeHasPassed( self._serverside_bandwidth_wake_time ) and not self._IsCancelled():
+            
+            await async_network_loop.RunBlocking( self.SetStatus, status_text + ' - retrying in {}'.format( HydrusData.TimestampToPrettyTimeDelta( self._serverside_bandwidth_wake_time ) ) )
+            
+            await asyncio.sleep( 1 )
+            
+        
+    
     def _CanReattemptConnection( self ):
         
         return self._current_connection_attempt_number <= self._max_connection_attempts_allowed
@@ -255,7 +359,7 @@ class NetworkJob( object ):
         return ( session_network_context, login_network_context )
         
     
-    def _SendRequestAndGetResponse( self ):
+    def _GetRequestParameters( self ):
         
         with self._lock:
             
@@ -319,8 +423,28 @@ class NetworkJob( object ):
         
         read_timeout = connect_timeout * 6
         
+        return ( method, url, data, files, headers, session, connect_timeout, read_timeout )
+        
+    
+    def _SendRequestAndGetResponse( self ):
+        
+        ( method, url, data, files, headers, session, connect_timeout, read_timeout ) = self._GetRequestParameters()
+        
         response = session.request( method, url, data = data, files = files, headers = headers, stream = True, timeout = ( connect_timeout, read_timeout ) )
         
+        # our connection pools count the requests on each connection, so we can tell if keep-alive gave us an existing one
+        connection = getattr( response.raw, 'connection', None )
+        
+        num_requests_on_this_socket = getattr( connection, 'num_requests_on_this_socket', None )
+        
+        if num_requests_on_this_socket is not None:
+            
+            with self._lock:
+                
+                self._connection_reused = num_requests_on_this_socket > 1
+                
+            
+        
         return response
         
     
@@ -400,7 +524,7 @@ class NetworkJob( object ):
             
         
     
-    def _ReadResponse( self, response, stream_dest, max_allowed = None ):
+    def _StartReadingResponse( self, response_headers, max_allowed ):
         
         with self._lock:
             
@@ -413,9 +537,9 @@ class NetworkJob( object ):
                 mime = None
                 
             
-            if 'content-length' in response.headers:
+            if 'content-length' in response_headers:
                 
-                self._num_bytes_to_read = int( response.headers[ 'content-length' ] )
+                self._num_bytes_to_read = int( response_headers[ 'content-length' ] )
                 
                 if max_allowed is not None and self._num_bytes_to_read > max_allowed:
                     
@@ -435,6 +559,13 @@ class NetworkJob( object ):
                 
             
         
+        return mime
+        
+    
+    def _ReadResponse( self, response, stream_dest, max_allowed = None ):
+        
+        mime = self._StartReadingResponse( response.headers, max_allowed )
+        
         num_bytes_read_is_accurate = True
         
         for chunk in response.iter_content( chunk_size = 65536 ):
@@ -456,46 +587,61 @@ class NetworkJob( object ):
                 
                 num_bytes_read_is_accurate = False
                 
-                chunk_num_bytes = len( chunk )
-                
-                self._num_bytes_read += chunk_num_bytes
-                
-            else:
-                
-                chunk_num_bytes = total_bytes_read - self._num_bytes_read
+            
+            chunk_num_bytes = self._ReportChunkRead( chunk, total_bytes_read, num_bytes_read_is_accurate, mime, max_allowed )
+            
+            self._ReportDataUsed( chunk_num_bytes )
+            self._WaitOnOngoingBandwidth()
+            
+            if HG.view_shutdown:
                 
-                self._num_bytes_read = total_bytes_read
+                raise HydrusExceptions.ShutdownException()
                 
             
-            with self._lock:
+        
+        self._FinishReadingResponse( num_bytes_read_is_accurate )
+        
+    
+    def _ReportChunkRead( self, chunk, total_bytes_read, num_bytes_read_is_accurate, mime, max_allowed ):
+        
+        if num_bytes_read_is_accurate:
+            
+            chunk_num_bytes = total_bytes_read - self._num_bytes_read
+            
+            self._num_bytes_read = total_bytes_read
+            
+        else:
+            
+            chunk_num_bytes = len( chunk )
+            
+            self._num_bytes_read += chunk_num_bytes
+            
+        
+        with self._lock:
+            
+            if self._num_bytes_to_read is not None and num_bytes_read_is_accurate and self._num_bytes_read > self._num_bytes_to_read:
                 
-                if self._num_bytes_to_read is not None and num_bytes_read_is_accurate and self._num_bytes_read > self._num_bytes_to_read:
-                    
-                    raise HydrusExceptions.NetworkException( 'Too much data: Was expecting {} but server continued responding!'.format( HydrusData.ToHumanBytes( self._num_bytes_to_read ) ) )
-                    
+                raise HydrusExceptions.NetworkException( 'Too much data: Was expecting {} but server continued responding!'.format( HydrusData.ToHumanBytes( self._num_bytes_to_read ) ) )
                 
-                if max_allowed is not None and self._num_bytes_read > max_allowed:
-                    
-                    raise HydrusExceptions.NetworkException( 'The url exceeded the max network size for this type of job, which is ' + HydrusData.ToHumanBytes( max_allowed ) + '!' )
-                    
+            
+            if max_allowed is not None and self._num_bytes_read > max_allowed:
                 
-                if self._file_import_options is not None:
-                    
-                    is_complete_file_size = False
-                    
-                    self._file_import_options.CheckNetworkDownload( mime, self._num_bytes_read, is_complete_file_size )
-                    
+                raise HydrusExceptions.NetworkException( 'The url exceeded the max network size for this type of job, which is ' + HydrusData.ToHumanBytes( max_allowed ) + '!' )
                 
             
-            self._ReportDataUsed( chunk_num_bytes )
-            self._WaitOnOngoingBandwidth()
-            
-            if HG.view_shutdown:
+            if self._file_import_options is not None:
                 
-                raise HydrusExceptions.ShutdownException()
+                is_complete_file_size = False
+                
+                self._file_import_options.CheckNetworkDownload( mime, self._num_bytes_read, is_complete_file_size )
                 
             
         
+        return chunk_num_bytes
+        
+    
+    def _FinishReadingResponse( self, num_bytes_read_is_accurate ):
+        
         if self._num_bytes_to_read is not None and num_bytes_read_is_accurate and self._num_bytes_read < self._num_bytes_to_read:
             
             raise HydrusExceptions.ShouldReattemptNetworkException( 'Incomplete response: Was expecting {} but actually got {} !'.format( HydrusData.ToHumanBytes( self._num_bytes_to_read ), HydrusData.ToHumanBytes( self._num_bytes_read ) ) )
@@ -516,6 +662,22 @@ class NetworkJob( object ):
         self._SetDone()
         
     
+    def _SetEncodingFromResponse( self, response ):
+        
+        if response.encoding is not None:
+            
+            encoding = response.encoding
+            
+            # we'll default to utf-8 rather than ISO-8859-1
+            we_got_lame_iso_default_from_requests = encoding == 'ISO-8859-1' and ( self._content_type is None or encoding not in self._content_type )
+            
+            if not we_got_lame_iso_default_from_requests:
+                
+                self._encoding = encoding
+                
+            
+        
+    
     def _SetError( self, e, error ):
         
         self._error_exception = e
@@ -531,12 +693,70 @@ class NetworkJob( object ):
         self._SetDone()
         
     
+    def _SetErrorFromResponseData( self, status_code ):
+        
+        with self._lock:
+            
+            self._stream_io.seek( 0 )
+            
+            data = self._stream_io.read()
+            
+            ( e, error_text ) = ConvertStatusCodeAndDataIntoExceptionInfo( status_code, data, self.IS_HYDRUS_SERVICE )
+            
+            if isinstance( e, ( HydrusExceptions.BandwidthException, HydrusExceptions.ShouldReattemptNetworkException ) ):
+                
+                raise e
+                
+            
+            self._SetError( e, error_text )
+            
+        
+    
+    def _SetErrorFromStartException( self, e ):
+        
+        with self._lock:
+            
+            # this can be called off the thread that caught the exception, so we format its own traceback
+            trace = ''.join( traceback.format_exception( type( e ), e, e.__traceback__ ) )
+            
+            if not isinstance( e, ( HydrusExceptions.NetworkInfrastructureException, HydrusExceptions.StreamTimeoutException, HydrusExceptions.FileSizeException ) ):
+                
+                HydrusData.Print( trace )
+                
+            
+            if isinstance( e, HydrusExceptions.NetworkInfrastructureException ):
+                
+                self.engine.domain_manager.ReportNetworkInfrastructureError( self._url )
+                
+            
+            self._status_text = 'Error: ' + str( e )
+            
+            self._SetError( e, trace )
+            
+        
+    
+    def _SetConnectionErrorWakeTime( self ):
+        
+        connection_error_wait_time = HG.client_controller.new_options.GetInteger( 'connection_error_wait_time' )
+        
+        self._connection_error_wake_time = HydrusData.GetNow() + ( ( self._current_connection_attempt_number - 1 ) * connection_error_wait_time )
+        
+    
     def _SetDone( self ):
         
         self._is_done = True
         
         self._is_done_event.set()
         
+        self._WakeEngine()
+        
+    
+    def _SetServersideBandwidthWakeTime( self ):
+        
+        serverside_bandwidth_wait_time = HG.client_controller.new_options.GetInteger( 'serverside_bandwidth_wait_time' )
+        
+        self._serverside_bandwidth_wake_time = HydrusData.GetNow() + ( ( self._current_connection_attempt_number - 1 ) * serverside_bandwidth_wait_time )
+        
     
     def _Sleep( self, seconds ):
         
@@ -630,11 +850,17 @@ class NetworkJob( object ):
             
         
     
-    def _WaitOnConnectionError( self, status_text ):
+    def _WakeEngine( self ):
         
-        connection_error_wait_time = HG.client_controller.new_options.GetInteger( 'connection_error_wait_time' )
+        if self.engine is not None:
+            
+            self.engine.WakeJob( self )
+            
         
-        self._connection_error_wake_time = HydrusData.GetNow() + ( ( self._current_connection_attempt_number - 1 ) * connection_error_wait_time )
+    
+    def _WaitOnConnectionError( self, status_text ):
+        
+        self._SetConnectionErrorWakeTime()
         
         while not HydrusData.TimeHasPassed( self._connection_error_wake_time ) and not self._IsCancelled():
             
@@ -660,9 +886,7 @@ class NetworkJob( object ):
         # 429 or 509 response from server. basically means 'I'm under big load mate'
         # a future version of this could def talk to domain manager and add a temp delay so other network jobs can be informed
         
-        serverside_bandwidth_wait_time = HG.client_controller.new_options.GetInteger( 'serverside_bandwidth_wait_time' )
-        
-        self._serverside_bandwidth_wake_time = HydrusData.GetNow() + ( ( self._current_connection_attempt_number - 1 ) * serverside_bandwidth_wait_time )
+        self._SetServersideBandwidthWakeTime()
         
         while not HydrusData.TimeHasPassed( self._serverside_bandwidth_wake_time ) and not self._IsCancelled():
             
@@ -683,6 +907,171 @@ class NetworkJob( object ):
             
         
     
+    async def AsyncStart( self, async_network_loop ):
+        
+        # this mirrors Start, but all the waiting happens on the event loop rather than holding a thread
+        # anything that takes a lock or touches the disk goes through RunBlocking, so it cannot stall the loop
+        
+        handed_off_to_thread = False
+        
+        try:
+            
+            await async_network_loop.RunBlocking( self._AsyncSetStarted )
+            
+            request_completed = False
+            
+            while not request_completed:
+                
+                if self._IsCancelled():
+                    
+                    return
+                    
+                
+                response = None
+                
+                try:
+                    
+                    response = await self._AsyncSendRequestAndGetResponse( async_network_loop )
+                    
+                    if 'Content-Type' in response.headers:
+                        
+                        self._content_type = response.headers[ 'Content-Type' ]
+                        
+                    
+                    if response.ok:
+                        
+                        await async_network_loop.RunBlocking( self.SetStatus, 'downloading\u2026' )
+                        
+                        self._SetEncodingFromResponse( response )
+                        
+                        if self._temp_path is None:
+                            
+                            await self._AsyncReadResponse( async_network_loop, response, self._stream_io, 104857600 )
+                            
+                        else:
+                            
+                            f = await async_network_loop.RunBlocking( open, self._temp_path, 'wb' )
+                            
+                            try:
+                                
+                                await self._AsyncReadResponse( async_network_loop, response, f )
+                                
+                            finally:
+                                
+                                await async_network_loop.RunBlocking( f.close )
+                                
+                            
+                        
+                        await async_network_loop.RunBlocking( self.SetStatus, 'done!' )
+                        
+                    else:
+                        
+                        await async_network_loop.RunBlocking( self.SetStatus, str( response.status_code ) + ' - ' + str( response.reason ) )
+                        
+                        if CLOUDSCRAPER_OK and not self._we_tried_cloudflare_once and response.status_code in ( 403, 503 ):
+                            
+                            # cloudscraper wants a requests response, so let the normal path have a go at this one
+                            raise ClientNetworkingAsync.AsyncShouldUseThreadException( 'Possible CloudFlare challenge.' )
+                            
+                        
+                        await self._AsyncReadResponse( async_network_loop, response, self._stream_io, 104857600 )
+                        
+                        await async_network_loop.RunBlocking( self._SetErrorFromResponseData, response.status_code )
+                        
+                    
+                    request_completed = True
+                    
+                except HydrusExceptions.BandwidthException as e:
+                    
+                    self._current_connection_attempt_number += 1
+                    
+                    if self._CanReattemptRequest():
+                        
+                        await async_network_loop.RunBlocking( self.engine.domain_manager.ReportNetworkInfrastructureError, self._url )
+                        
+                    else:
+                        
+                        raise HydrusExceptions.BandwidthException( 'Server reported very limited bandwidth: ' + str( e ) )
+                        
+                    
+                    await self._AsyncWaitOnServersideBandwidth( async_network_loop, 'server reported limited bandwidth' )
+                    
+                except HydrusExceptions.ShouldReattemptNetworkException as e:
+                    
+                    self._current_connection_attempt_number += 1
+                    
+                    if not self._CanReattemptRequest():
+                        
+                        raise HydrusExceptions.NetworkInfrastructureException( 'Ran out of reattempts on this error: ' + str( e ) )
+                        
+                    
+                    await self._AsyncWaitOnConnectionError( async_network_loop, str( e ) )
+                    
+                except ClientNetworkingAsync.AsyncConnectionBrokeException:
+                    
+                    self._current_connection_attempt_number += 1
+                    
+                    if not self._CanReattemptRequest():
+                        
+                        raise HydrusExceptions.StreamTimeoutException( 'Unable to complete request--it broke mid-way!' )
+                        
+                    
+                    await self._AsyncWaitOnConnectionError( async_network_loop, 'connection broke mid-request' )
+                    
+                except ClientNetworkingAsync.AsyncConnectException:
+                    
+                    self._current_connection_attempt_number += 1
+                    
+                    if self._CanReattemptConnection():
+                        
+                        await async_network_loop.RunBlocking( self.engine.domain_manager.ReportNetworkInfrastructureError, self._url )
+                        
+                    else:
+                        
+                        raise HydrusExceptions.ConnectionException( 'Could not connect!' )
+                        
+                    
+                    await self._AsyncWaitOnConnectionError( async_network_loop, 'connection failed' )
+                    
+                except ClientNetworkingAsync.AsyncReadTimeoutException:
+                    
+                    self._current_connection_attempt_number += 1
+                    
+                    if not self._CanReattemptRequest():
+                        
+                        raise HydrusExceptions.StreamTimeoutException( 'Connection successful, but reading response timed out!' )
+                        
+                    
+                    await self._AsyncWaitOnConnectionError( async_network_loop, 'read timed out' )
+                    
+                finally:
+                    
+                    if response is not None:
+                        
+                        async_network_loop.CloseResponse( response )
+                        
+                    
+                
+            
+        except ClientNetworkingAsync.AsyncShouldUseThreadException:
+            
+            handed_off_to_thread = True
+            
+            await async_network_loop.RunBlocking( self.engine.controller.CallToThread, self.Start )
+            
+        except Exception as e:
+            
+            await async_network_loop.RunBlocking( self._SetErrorFromStartException, e )
+            
+        finally:
+            
+            if not handed_off_to_thread:
+                
+                await async_network_loop.RunBlocking( self._AsyncSetDone )
+                
+            
+        
+    
     def BandwidthOK( self ):
         
         with self._lock:
@@ -713,6 +1102,14 @@ class NetworkJob( object ):
             
         
     
+    def CanStartAsync( self ):
+        
+        with self._lock:
+            
+            return self._method == 'GET' and self._body is None and self._files is None and not ( self.IS_HYDRUS_SERVICE or self.IS_IPFS_SERVICE )
+            
+        
+    
     def CanValidateInPopup( self ):
         
         with self._lock:
@@ -816,6 +1213,14 @@ class NetworkJob( object ):
         return text
         
     
+    def GetConnectionReused( self ):
+        
+        with self._lock:
+            
+            return self._connection_reused
+            
+        
+    
     def GetContentType( self ):
         
         with self._lock:
@@ -916,6 +1321,14 @@ class NetworkJob( object ):
             
         
     
+    def GetWakeTime( self ):
+        
+        with self._lock:
+            
+            return self._wake_time
+            
+        
+    
     def HasError( self ):
         
         with self._lock:
@@ -1011,6 +1424,8 @@ class NetworkJob( object ):
                 self._wake_time = min( self._wake_time, self._bandwidth_manual_override_delayed_timestamp + 1 )
                 
             
+            self._WakeEngine()
+            
         
     
     def OverrideConnectionErrorWait( self ):
@@ -1037,6 +1452,8 @@ class NetworkJob( object ):
             
             self._wake_time = 0
             
+            self._WakeEngine()
+            
         
     
     def SetError( self, e, error ):
@@ -1140,18 +1557,7 @@ class NetworkJob( object ):
                             self._status_text = 'downloading\u2026'
                             
                         
-                        if response.encoding is not None:
-                            
-                            encoding = response.encoding
-                            
-                            # we'll default to utf-8 rather than ISO-8859-1
-                            we_got_lame_iso_default_from_requests = encoding == 'ISO-8859-1' and ( self._content_type is None or encoding not in self._content_type )
-                            
-                            if not we_got_lame_iso_default_from_requests:
-                                
-                                self._encoding = encoding
-                                
-                            
+                        self._SetEncodingFromResponse( response )
                         
                         if self._temp_path is None:
                             
@@ -1187,21 +1593,7 @@ class NetworkJob( object ):
                         
                         self._ReadResponse( response, self._stream_io, 104857600 )
                         
-                        with self._lock:
-                            
-                            self._stream_io.seek( 0 )
-                            
-                            data = self._stream_io.read()
-                            
-                            ( e, error_text ) = ConvertStatusCodeAndDataIntoExceptionInfo( response.status_code, data, self.IS_HYDRUS_SERVICE )
-                            
-                            if isinstance( e, ( HydrusExceptions.BandwidthException, HydrusExceptions.ShouldReattemptNetworkException ) ):
-                                
-                                raise e
-                                
-                            
-                            self._SetError( e, error_text )
-                            
+                        self._SetErrorFromResponseData( response.status_code )
                         
                     
                     request_completed = True
@@ -1282,24 +1674,7 @@ class NetworkJob( object ):
             
         except Exception as e:
             
-            with self._lock:
-                
-                trace = traceback.format_exc()
-                
-                if not isinstance( e, ( HydrusExceptions.NetworkInfrastructureException, HydrusExceptions.StreamTimeoutException, HydrusExceptions.FileSizeException ) ):
-                    
-                    HydrusData.Print( trace )
-                    
-                
-                if isinstance( e, HydrusExceptions.NetworkInfrastructureException ):
-                    
-                    self.engine.domain_manager.ReportNetworkInfrastructureError( self._url )
-                    
-                
-                self._status_text = 'Error: ' + str( e )
-                
-                self._SetError( e, trace )
-                
+            self._SetErrorFromStartException( e )
             
         finally:
             
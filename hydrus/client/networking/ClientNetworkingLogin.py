@@ -913,6 +913,11 @@ class LoginProcess( object ):
             
             self._done = True
             
+            if self.engine is not None:
+                
+                self.engine.WakeUp()
+                
+            
         
     
 class LoginProcessDomain( LoginProcess ):
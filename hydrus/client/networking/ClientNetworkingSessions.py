@@ -1,6 +1,10 @@
+import functools
 import pickle
 import requests
+import requests.adapters
 import threading
+import urllib3
+import urllib3.connection
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client.networking import ClientNetworkingContexts
@@ -20,6 +24,92 @@ except:
     
     SOCKS_PROXY_OK = False
     
+class KeepAliveLimitedConnectionMixin( object ):
+    
+    # urllib3 will reuse a kept-alive connection for as long as the server lets it
+    # this counts the requests on each socket and asks the server to close it on the last one, like the 'max' of a Keep-Alive header
+    
+    def __init__( self, *args, max_requests_per_connection = None, **kwargs ):
+        
+        super().__init__( *args, **kwargs )
+        
+        self.max_requests_per_connection = max_requests_per_connection
+        self.num_requests_on_this_socket = 0
+        
+        self._counted_socket = None
+        
+    
+    def request( self, method, url, body = None, headers = None, **kwargs ):
+        
+        if self.sock is None or self.sock is not self._counted_socket:
+            
+            # a new socket, or one that will connect as this request goes out
+            
+            self.num_requests_on_this_socket = 0
+            
+        
+        self.num_requests_on_this_socket += 1
+        
+        if self.max_requests_per_connection is not None and self.num_requests_on_this_socket >= self.max_requests_per_connection:
+            
+            headers = { key : value for ( key, value ) in ( headers or {} ).items() if key.lower() != 'connection' }
+            
+            headers[ 'Connection' ] = 'close'
+            
+        
+        result = super().request( method, url, body = body, headers = headers, **kwargs )
+        
+        self._counted_socket = self.sock
+        
+        return result
+        
+    
+class KeepAliveLimitedHTTPConnection( KeepAliveLimitedConnectionMixin, urllib3.connection.HTTPConnection ):
+    
+    pass
+    
+class KeepAliveLimitedHTTPSConnection( KeepAliveLimitedConnectionMixin, urllib3.connection.HTTPSConnection ):
+    
+    pass
+    
+class KeepAliveLimitedHTTPConnectionPool( urllib3.HTTPConnectionPool ):
+    
+    ConnectionCls = KeepAliveLimitedHTTPConnection
+    
+class KeepAliveLimitedHTTPSConnectionPool( urllib3.HTTPSConnectionPool ):
+    
+    ConnectionCls = KeepAliveLimitedHTTPSConnection
+    
+class NetworkConnectionPoolAdapter( requests.adapters.HTTPAdapter ):
+    
+    # an HTTPAdapter that remembers the settings it was made with and limits how many requests go down each kept-alive connection
+    
+    # sessions are pickled, so these have to survive that
+    __attrs__ = requests.adapters.HTTPAdapter.__attrs__ + [ 'num_hosts', 'pool_settings' ]
+    
+    def __init__( self, num_hosts, pool_settings ):
+        
+        # these have to be set before the pool manager is made
+        self.num_hosts = num_hosts
+        self.pool_settings = pool_settings
+        
+        ( pool_size, max_requests_per_connection, idle_timeout ) = pool_settings
+        
+        requests.adapters.HTTPAdapter.__init__( self, pool_connections = num_hosts, pool_maxsize = pool_size )
+        
+    
+    def init_poolmanager( self, *args, **kwargs ):
+        
+        requests.adapters.HTTPAdapter.init_poolmanager( self, *args, **kwargs )
+        
+        ( pool_size, max_requests_per_connection, idle_timeout ) = self.pool_settings
+        
+        self.poolmanager.pool_classes_by_scheme = {
+            'http' : functools.partial( KeepAliveLimitedHTTPConnectionPool, max_requests_per_connection = max_requests_per_connection ),
+            'https' : functools.partial( KeepAliveLimitedHTTPSConnectionPool, max_requests_per_connection = max_requests_per_connection )
+        }
+        
+    
 class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
     
     SERIALISABLE_TYPE = HydrusSerialisable.SERIALISABLE_TYPE_NETWORK_SESSION_MANAGER
@@ -42,8 +132,16 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         
         self._network_contexts_to_session_timeouts = {}
         
+        self._network_contexts_to_last_request_times = {}
+        
+        self._last_connection_pool_maintenance = 0
+        
         self._proxies_dict = {}
         
+        self._connection_pool_hosts = 10
+        self._default_connection_pool_settings = ( 10, 100, 60 )
+        self._domains_to_connection_pool_settings = {}
+        
         self._Reinitialise()
         
         HG.client_controller.sub( self, 'Reinitialise', 'notify_new_options' )
@@ -66,6 +164,30 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         session.cookies.clear_expired_cookies()
         
     
+    def _ConfigureConnectionPools( self, network_context, session ):
+        
+        # requests' default adapters keep 10 connections to each of 10 hosts. we want that to be tunable per domain, and we only remount if the numbers changed, so existing keep-alive connections survive
+        
+        pool_settings = self._GetConnectionPoolSettings( network_context )
+        
+        for prefix in ( 'https://', 'http://' ):
+            
+            adapter = session.adapters.get( prefix, None )
+            
+            if isinstance( adapter, NetworkConnectionPoolAdapter ) and adapter.num_hosts == self._connection_pool_hosts and adapter.pool_settings == pool_settings:
+                
+                continue
+                
+            
+            if adapter is not None:
+                
+                adapter.close()
+                
+            
+            session.mount( prefix, NetworkConnectionPoolAdapter( self._connection_pool_hosts, pool_settings ) )
+            
+        
+    
     def _GenerateSession( self, network_context ):
         
         session = requests.Session()
@@ -78,6 +200,16 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
         return session
         
     
+    def _GetConnectionPoolSettings( self, network_context ):
+        
+        if network_context.context_type == CC.NETWORK_CONTEXT_DOMAIN and network_context.context_data in self._domains_to_connection_pool_settings:
+            
+            return self._domains_to_connection_pool_settings[ network_context.context_data ]
+            
+        
+        return self._default_connection_pool_settings
+        
+    
     def _GetSerialisableInfo( self ):
         
         serialisable_network_contexts_to_sessions = [ ( network_context.GetSerialisableTuple(), pickle.dumps( session ).hex() ) for ( network_context, session ) in list(self._network_contexts_to_sessions.items()) ]
@@ -140,6 +272,16 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             self._proxies_dict[ 'https' ] = https_proxy
             
         
+        self._connection_pool_hosts = HG.client_controller.new_options.GetInteger( 'network_connection_pool_hosts' )
+        
+        pool_size = HG.client_controller.new_options.GetInteger( 'network_connection_pool_size' )
+        max_requests_per_connection = HG.client_controller.new_options.GetNoneableInteger( 'network_connection_max_requests' )
+        idle_timeout = HG.client_controller.new_options.GetInteger( 'network_connection_idle_timeout' )
+        
+        self._default_connection_pool_settings = ( pool_size, max_requests_per_connection, idle_timeout )
+        
+        self._domains_to_connection_pool_settings = HG.client_controller.new_options.GetNetworkConnectionPoolSettingsPerSpecificDomain()
+        
     
     def _SetDirty( self ):
         
@@ -187,6 +329,10 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
                 session.proxies = dict( self._proxies_dict )
                 
             
+            self._ConfigureConnectionPools( network_context, session )
+            
+            self._network_contexts_to_last_request_times[ network_context ] = HydrusData.GetNow()
+            
             #
             
             self._CleanSessionCookies( network_context, session )
@@ -224,6 +370,41 @@ class NetworkSessionManager( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def MaintainConnectionPools( self ):
+        
+        with self._lock:
+            
+            if not HydrusData.TimeHasPassed( self._last_connection_pool_maintenance + 10 ):
+                
+                return
+                
+            
+            self._last_connection_pool_maintenance = HydrusData.GetNow()
+            
+            # requests has no per-connection idle timeout, so we drop all the pooled connections of a session that has not been asked for in a while
+            
+            for ( network_context, last_request_time ) in list( self._network_contexts_to_last_request_times.items() ):
+                
+                ( pool_size, max_requests_per_connection, idle_timeout ) = self._GetConnectionPoolSettings( network_context )
+                
+                if HydrusData.TimeHasPassed( last_request_time + idle_timeout ):
+                    
+                    if network_context in self._network_contexts_to_sessions:
+                        
+                        session = self._network_contexts_to_sessions[ network_context ]
+                        
+                        for adapter in session.adapters.values():
+                            
+                            adapter.close()
+                            
+                        
+                    
+                    del self._network_contexts_to_last_request_times[ network_context ]
+                    
+                
+            
+        
+    
     def Reinitialise( self ):
         
         with self._lock:
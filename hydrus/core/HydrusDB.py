@@ -1,3 +1,4 @@
+import copy
 import distutils.version
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
@@ -7,10 +8,13 @@ from hydrus.core import HydrusPaths
 import os
 import queue
 import sqlite3
+import threading
 import traceback
 import time
+import urllib.request
 
 CONNECTION_REFRESH_TIME = 60 * 30
+CACHE_REPORT_PERIOD = 60
 
 def CheckCanVacuum( db_path, stop_time = None ):
     
@@ -42,6 +46,10 @@ def CheckCanVacuum( db_path, stop_time = None ):
     
     HydrusPaths.CheckHasSpaceForDBTransaction( db_dir, db_size )
     
+def GetReadOnlyURI( db_path ):
+    
+    return 'file:{}?mode=ro'.format( urllib.request.pathname2url( db_path ) )
+    
 def ReadLargeIdQueryInSeparateChunks( cursor, select_statement, chunk_size ):
     
     table_name = 'tempbigread' + os.urandom( 32 ).hex()
@@ -116,6 +124,9 @@ class HydrusDB( object ):
     READ_WRITE_ACTIONS = []
     UPDATE_WAIT = 2
     
+    # how many extra read-only connections serve plain reads in parallel with the main db thread
+    READ_POOL_SIZE = 0
+    
     TRANSACTION_COMMIT_TIME = 30
     
     def __init__( self, controller, db_dir, db_name ):
@@ -170,6 +181,18 @@ class HydrusDB( object ):
         self._jobs = queue.Queue()
         self._pubsubs = []
         
+        self._read_pool_lock = threading.Lock()
+        self._read_connections = []
+        self._read_pool_paused = False
+        self._read_pool_condition = threading.Condition()
+        self._num_outstanding_write_jobs = 0
+        self._read_pool_wants_commit = False
+        
+        # set on the shallow copies that do pooled reads. their snapshot can be behind the main thread, so take care filling shared caches from them
+        self._is_read_only_view = False
+        
+        self._last_cache_report_time = 0
+        
         self._currently_doing_job = False
         self._current_status = ''
         self._current_job_name = ''
@@ -309,6 +332,8 @@ class HydrusDB( object ):
     
     def _CloseDBCursor( self ):
         
+        self._DisconnectReadPool()
+        
         if self._db is not None:
             
             if self._in_transaction:
@@ -375,6 +400,59 @@ class HydrusDB( object ):
         self._c.execute( statement )
         
     
+    def _CloseReadConnection( self, read_connection ):
+        
+        read_connection.Close()
+        
+        with self._read_pool_condition:
+            
+            self._read_pool_condition.notify_all()
+            
+        
+    
+    def _ConnectReadConnection( self, read_connection ):
+        
+        try:
+            
+            read_connection.Connect( self._db_dir, self._db_filenames, self._durable_temp_db_filename )
+            
+            return True
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not open the read-only db connection "{}", so its reads will go through the main db thread:'.format( read_connection.GetName() ) )
+            
+            HydrusData.PrintException( e, do_wait = False )
+            
+            return False
+            
+        
+    
+    def _DisconnectReadPool( self ):
+        
+        # we are about to close or do something exclusive with the main connection, so the read-only connections have to let go of the files too
+        
+        if len( self._read_connections ) == 0:
+            
+            return
+            
+        
+        self._read_pool_paused = True
+        
+        for read_connection in self._read_connections:
+            
+            read_connection.Wake()
+            
+        
+        with self._read_pool_condition:
+            
+            while True in ( read_connection.IsConnected() for read_connection in self._read_connections ):
+                
+                self._read_pool_condition.wait()
+                
+            
+        
+    
     def _DisplayCatastrophicError( self, text ):
         
         message = 'The db encountered a serious error! This is going to be written to the log as well, but here it is for a screenshot:'
@@ -413,6 +491,28 @@ class HydrusDB( object ):
         return HydrusData.JobDatabase( job_type, synchronous, action, *args, **kwargs )
         
     
+    def _GetCacheReportLines( self ):
+        
+        return []
+        
+    
+    def _GetReadPoolSize( self ):
+        
+        # read-only connections can only work alongside our long-running write transaction in WAL mode
+        
+        if HG.no_wal or HG.db_memory_journaling:
+            
+            return 0
+            
+        
+        if HG.db_read_connections is not None:
+            
+            return HG.db_read_connections
+            
+        
+        return self.READ_POOL_SIZE
+        
+    
     def _GetRowCount( self ):
         
         row_count = self._c.rowcount
@@ -471,6 +571,13 @@ class HydrusDB( object ):
             
         
     
+    def _InitReadOnlyView( self ):
+        
+        # called on a pooled read's shallow copy before its transaction starts
+        
+        self._is_read_only_view = True
+        
+    
     def _InitDBCursor( self ):
         
         self._CloseDBCursor()
@@ -559,6 +666,13 @@ class HydrusDB( object ):
             raise HydrusExceptions.DBAccessException( str( e ) )
             
         
+        with self._read_pool_condition:
+            
+            self._read_pool_paused = False
+            
+            self._read_pool_condition.notify_all()
+            
+        
     
     def _InitDiskCache( self ):
         
@@ -570,6 +684,16 @@ class HydrusDB( object ):
         pass
         
     
+    def _InitReadPool( self ):
+        
+        self._read_connections = [ DBReadConnection( 'read connection {}'.format( i + 1 ) ) for i in range( self._GetReadPoolSize() ) ]
+        
+        for read_connection in self._read_connections:
+            
+            self._controller.CallToThreadLongRunning( self._ReadPoolLoop, read_connection )
+            
+        
+    
     def _ManageDBError( self, job, e ):
         
         raise NotImplementedError()
@@ -663,11 +787,171 @@ class HydrusDB( object ):
             
         
     
+    def _ProcessReadOnlyJob( self, read_connection, job ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        # a shallow copy shares all our caches but lets the read run on its own cursor without touching the main thread's transaction state
+        
+        db_view = copy.copy( self )
+        
+        ( db_view._db, db_view._c ) = read_connection.GetDBAndCursor()
+        
+        db_view._pubsubs = []
+        db_view._in_transaction = False
+        db_view._transaction_contains_writes = False
+        
+        db_view._InitReadOnlyView()
+        
+        try:
+            
+            # one snapshot for the whole job, so a commit on the main thread halfway through cannot give us a mix of before and after
+            
+            db_view._c.execute( 'BEGIN DEFERRED;' )
+            
+            try:
+                
+                result = db_view._Read( action, *args, **kwargs )
+                
+            finally:
+                
+                if db_view._db.in_transaction:
+                    
+                    db_view._c.execute( 'COMMIT;' )
+                
+            
+        except Exception as e:
+            
+            # this read wanted to write something, or needed state that only the main connection has. it can try again there, where errors are reported as normal
+            # since it may write, later reads have to wait for it like any other write
+            
+            HydrusData.Print( '{} could not do {}, so it is going to the main db thread: {}'.format( read_connection.GetName(), job.ToString(), e ) )
+            
+            if HG.db_report_mode:
+                
+                HydrusData.ShowText( '{} could not do {}, so it is going to the main db thread. The error follows:'.format( read_connection.GetName(), job.ToString() ) )
+                
+                HydrusData.ShowException( e )
+                
+            
+            job.SetType( 'read_write' )
+            
+            self._PutJob( job )
+            
+            return
+            
+        
+        for ( topic, args, kwargs ) in db_view._pubsubs:
+            
+            self._controller.pub( topic, *args, **kwargs )
+            
+        
+        if job.IsSynchronous():
+            
+            job.PutResult( result )
+            
+        
+    
+    def _PutJob( self, job ):
+        
+        with self._read_pool_lock:
+            
+            if job.GetType() in ( 'read_write', 'write' ):
+                
+                self._num_outstanding_write_jobs += 1
+                
+            
+            self._jobs.put( job )
+            
+        
+    
     def _Read( self, action, *args, **kwargs ):
         
         raise NotImplementedError()
         
     
+    def _ReadPoolLoop( self, read_connection ):
+        
+        try:
+            
+            if not self._ConnectReadConnection( read_connection ):
+                
+                return
+                
+            
+            while not ( ( self._local_shutdown or HG.model_shutdown ) and read_connection.JobsQueueEmpty() ):
+                
+                if self._read_pool_paused:
+                    
+                    self._CloseReadConnection( read_connection )
+                    
+                    with self._read_pool_condition:
+                        
+                        while self._read_pool_paused and not ( self._local_shutdown or HG.model_shutdown ):
+                            
+                            # the timeout is just so we notice shutdown
+                            self._read_pool_condition.wait( 1 )
+                            
+                        
+                    
+                    if self._read_pool_paused or not self._ConnectReadConnection( read_connection ):
+                        
+                        return
+                        
+                    
+                
+                job = read_connection.GetJob( timeout = 1 )
+                
+                if job is not None:
+                    
+                    read_connection.SetCurrentJobName( job.ToString() )
+                    
+                    self.publish_status_update()
+                    
+                    try:
+                        
+                        if HG.db_report_mode:
+                            
+                            HydrusData.ShowText( 'Running {} on {}'.format( job.ToString(), read_connection.GetName() ) )
+                            
+                        
+                        self._ProcessReadOnlyJob( read_connection, job )
+                        
+                    finally:
+                        
+                        read_connection.SetCurrentJobName( '' )
+                        
+                        self.publish_status_update()
+                        
+                    
+                
+                if read_connection.ConnectionIsOld(): # just to clear out the journal files
+                    
+                    if not self._ConnectReadConnection( read_connection ):
+                        
+                        return
+                        
+                    
+                
+            
+        finally:
+            
+            # whatever happened, nothing should be left waiting on this connection
+            
+            with self._read_pool_lock:
+                
+                read_connection.SetDead()
+                
+            
+            self._CloseReadConnection( read_connection )
+            
+            for job in read_connection.FlushJobs():
+                
+                self._jobs.put( job )
+                
+            
+        
+    
     def _RepairDB( self ):
         
         pass
@@ -733,6 +1017,39 @@ class HydrusDB( object ):
         return { item for ( item, ) in iterable_cursor }
         
     
+    def _TryToPutJobInReadPool( self, job ):
+        
+        if len( self._read_connections ) == 0 or self._read_pool_paused or self._pause_and_disconnect:
+            
+            return False
+            
+        
+        with self._read_pool_lock:
+            
+            # the read connections only see committed work, so anything a caller has asked to write must be done and committed before we can read around the main thread
+            
+            if self._num_outstanding_write_jobs > 0 or self._transaction_contains_writes:
+                
+                self._read_pool_wants_commit = True
+                
+                return False
+                
+            
+            read_connections = [ read_connection for read_connection in self._read_connections if read_connection.IsAlive() ]
+            
+            if len( read_connections ) == 0:
+                
+                return False
+                
+            
+            read_connection = min( read_connections, key = lambda rc: rc.GetLoad() )
+            
+            read_connection.PutJob( job )
+            
+        
+        return True
+        
+    
     def _TableHasAtLeastRowCount( self, name, row_count ):
         
         cursor = self._c.execute( 'SELECT 1 FROM {};'.format( name ) )
@@ -806,7 +1123,35 @@ class HydrusDB( object ):
     
     def GetStatus( self ):
         
-        return ( self._current_status, self._current_job_name )
+        current_status = self._current_status
+        current_job_name = self._current_job_name
+        
+        if len( self._read_connections ) > 0:
+            
+            statuses = [ read_connection.GetStatus() for read_connection in self._read_connections ]
+            
+            if current_status == '' and True in ( busy for ( busy, text ) in statuses ):
+                
+                current_status = 'db reading'
+                
+            
+            if current_job_name == '':
+                
+                writer_job_name = 'idle'
+                
+            else:
+                
+                writer_job_name = current_job_name
+                
+            
+            lines = [ 'main: {} ({} queued)'.format( writer_job_name, HydrusData.ToHumanInt( self._jobs.qsize() ) ) ]
+            
+            lines.extend( ( text for ( busy, text ) in statuses ) )
+            
+            current_job_name = os.linesep.join( lines )
+            
+        
+        return ( current_status, current_job_name )
         
     
     def IsDBUpdated( self ):
@@ -826,7 +1171,7 @@ class HydrusDB( object ):
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.empty() and False not in ( read_connection.JobsQueueEmpty() for read_connection in self._read_connections )
         
     
     def MainLoop( self ):
@@ -839,6 +1184,8 @@ class HydrusDB( object ):
             
             self._InitCaches()
             
+            self._InitReadPool()
+            
         except:
             
             self._DisplayCatastrophicError( traceback.format_exc() )
@@ -885,6 +1232,26 @@ class HydrusDB( object ):
                         self._ProcessJob( job )
                         
                     
+                    if job.GetType() in ( 'read_write', 'write' ):
+                        
+                        with self._read_pool_lock:
+                            
+                            self._num_outstanding_write_jobs -= 1
+                            
+                        
+                    
+                    if HG.db_report_mode and HydrusData.TimeHasPassed( self._last_cache_report_time + CACHE_REPORT_PERIOD ):
+                        
+                        # the counts are cumulative, so an occasional line in the log is plenty
+                        
+                        for line in self._GetCacheReportLines():
+                            
+                            HydrusData.Print( line )
+                            
+                        
+                        self._last_cache_report_time = HydrusData.GetNow()
+                        
+                    
                     error_count = 0
                     
                 except:
@@ -918,6 +1285,19 @@ class HydrusDB( object ):
                     
                 
             
+            if self._read_pool_wants_commit and self._transaction_contains_writes and HydrusData.TimeHasPassed( self._transaction_started + 1 ):
+                
+                # reads are queueing up behind our uncommitted work, so commit early and let the read connections see it
+                
+                self._Commit()
+                
+                self._BeginImmediate()
+                
+                self._transaction_contains_writes = False
+                
+                self._read_pool_wants_commit = False
+                
+            
             if HydrusData.TimeHasPassed( self._connection_timestamp + CONNECTION_REFRESH_TIME ): # just to clear out the journal files
                 
                 self._InitDBCursor()
@@ -977,7 +1357,12 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        put_in_read_pool = job_type == 'read' and self._TryToPutJobInReadPool( job )
+        
+        if not put_in_read_pool:
+            
+            self._PutJob( job )
+            
         
         return job.GetResult()
         
@@ -1003,11 +1388,199 @@ class HydrusDB( object ):
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        self._PutJob( job )
         
         if synchronous: return job.GetResult()
         
     
+class DBReadConnection( object ):
+    
+    def __init__( self, name ):
+        
+        self._name = name
+        
+        self._jobs = queue.Queue()
+        
+        self._db = None
+        self._c = None
+        
+        self._connection_timestamp = 0
+        
+        self._current_job_name = ''
+        self._alive = True
+        
+    
+    def Close( self ):
+        
+        if self._db is not None:
+            
+            self._c.close()
+            self._db.close()
+            
+            self._db = None
+            self._c = None
+            
+        
+    
+    def Connect( self, db_dir, db_filenames, durable_temp_db_filename ):
+        
+        self.Close()
+        
+        db_path = os.path.join( db_dir, db_filenames[ 'main' ] )
+        
+        self._db = sqlite3.connect( GetReadOnlyURI( db_path ), uri = True, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
+        
+        self._connection_timestamp = HydrusData.GetNow()
+        
+        self._c = self._db.cursor()
+        
+        if HG.no_db_temp_files:
+            
+            self._c.execute( 'PRAGMA temp_store = 2;' )
+            
+        
+        # mem stays writeable, so temp integer tables and so on work as normal
+        
+        self._c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        for ( name, filename ) in db_filenames.items():
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            self._c.execute( 'ATTACH ? AS ' + name + ';', ( GetReadOnlyURI( os.path.join( db_dir, filename ) ), ) )
+            
+        
+        self._c.execute( 'ATTACH ? AS durable_temp;', ( GetReadOnlyURI( os.path.join( db_dir, durable_temp_db_filename ) ), ) )
+        
+        db_names = [ name for ( index, name, path ) in self._c.execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp' ) ]
+        
+        for db_name in db_names:
+            
+            self._c.execute( 'PRAGMA {}.cache_size = -10000;'.format( db_name ) )
+            
+            self._c.execute( 'SELECT * FROM {}.sqlite_master;'.format( db_name ) ).fetchone()
+            
+        
+    
+    def ConnectionIsOld( self ):
+        
+        return HydrusData.TimeHasPassed( self._connection_timestamp + CONNECTION_REFRESH_TIME )
+        
+    
+    def FlushJobs( self ):
+        
+        jobs = []
+        
+        while not self._jobs.empty():
+            
+            job = self._jobs.get()
+            
+            if job is not None:
+                
+                jobs.append( job )
+                
+            
+        
+        return jobs
+        
+    
+    def GetDBAndCursor( self ):
+        
+        return ( self._db, self._c )
+        
+    
+    def GetJob( self, timeout = 1 ):
+        
+        try:
+            
+            return self._jobs.get( timeout = timeout )
+            
+        except queue.Empty:
+            
+            return None
+            
+        
+    
+    def GetLoad( self ):
+        
+        load = self._jobs.qsize()
+        
+        if self._current_job_name != '':
+            
+            load += 1
+            
+        
+        return load
+        
+    
+    def GetName( self ):
+        
+        return self._name
+        
+    
+    def GetStatus( self ):
+        
+        busy = self._current_job_name != ''
+        
+        if not self._alive:
+            
+            text = '{}: not connected'.format( self._name )
+            
+        else:
+            
+            if busy:
+                
+                job_name = self._current_job_name
+                
+            else:
+                
+                job_name = 'idle'
+                
+            
+            text = '{}: {} ({} queued)'.format( self._name, job_name, HydrusData.ToHumanInt( self._jobs.qsize() ) )
+            
+        
+        return ( busy, text )
+        
+    
+    def IsAlive( self ):
+        
+        return self._alive
+        
+    
+    def IsConnected( self ):
+        
+        return self._db is not None
+        
+    
+    def JobsQueueEmpty( self ):
+        
+        return self._jobs.empty() and self._current_job_name == ''
+        
+    
+    def PutJob( self, job ):
+        
+        self._jobs.put( job )
+        
+    
+    def SetCurrentJobName( self, job_name ):
+        
+        self._current_job_name = job_name
+        
+    
+    def SetDead( self ):
+        
+        self._alive = False
+        
+    
+    def Wake( self ):
+        
+        self._jobs.put( None )
+        
+    
 class TemporaryIntegerTable( object ):
     
     def __init__( self, cursor, integer_iterable, column_name ):
@@ -1,6 +1,7 @@
 import collections
 import cProfile
 import io
+import numpy
 import os
 import pstats
 import psutil
@@ -23,6 +24,8 @@ from hydrus.core import HydrusText
 
 ORIGINAL_PATH = None
 
+POPCOUNT_TABLE = numpy.array( [ bin( i ).count( '1' ) for i in range( 256 ) ], dtype = numpy.uint8 )
+
 def default_dict_list(): return collections.defaultdict( list )
 
 def default_dict_set(): return collections.defaultdict( set )
@@ -206,6 +209,22 @@ def ConvertNumericalRatingToPrettyString( lower, upper, rating, rounded_result =
     
     return s
     
+def ConvertPHashesToNumPy( phashes ):
+    
+    # phashes are big-endian 8-byte strings. accepts one phash, a packed buffer of phashes, an iterable of phashes, or an existing array
+    
+    if isinstance( phashes, numpy.ndarray ):
+        
+        return phashes
+        
+    
+    if not isinstance( phashes, ( bytes, bytearray, memoryview ) ):
+        
+        phashes = b''.join( phashes )
+        
+    
+    return numpy.frombuffer( phashes, dtype = '>u8' ).astype( numpy.uint64 )
+    
 def ConvertPixelsToInt( unit ):
     
     if unit == 'pixels': return 1
@@ -598,6 +617,24 @@ def Get64BitHammingDistance( phash1, phash2 ):
     
     return n
     
+def Get64BitHammingDistances( phash, phashes ):
+    
+    # one phash against many, returns a numpy array of distances, one per phash
+    
+    phash_array = ConvertPHashesToNumPy( phash )
+    phashes_array = ConvertPHashesToNumPy( phashes )
+    
+    return GetPopCounts( numpy.bitwise_xor( phashes_array, phash_array[0] ) )
+    
+def Get64BitHammingDistanceMatrix( phashes_1, phashes_2 ):
+    
+    # many against many, returns a numpy array of len( phashes_1 ) rows by len( phashes_2 ) columns
+    
+    phashes_1_array = ConvertPHashesToNumPy( phashes_1 )
+    phashes_2_array = ConvertPHashesToNumPy( phashes_2 )
+    
+    return GetPopCounts( numpy.bitwise_xor( phashes_1_array[ :, None ], phashes_2_array[ None, : ] ) )
+    
 def GetEmptyDataDict():
     
     data = collections.defaultdict( default_dict_list )
@@ -619,6 +656,19 @@ def GetNonDupeName( original_name, disallowed_names ):
     
     return non_dupe_name
     
+def GetPopCounts( array ):
+    
+    # number of set bits in each cell of a uint64 array
+    
+    if hasattr( numpy, 'bitwise_count' ):
+        
+        return numpy.bitwise_count( array )
+        
+    
+    byte_view = array.view( numpy.uint8 ).reshape( array.shape + ( 8, ) )
+    
+    return POPCOUNT_TABLE[ byte_view ].sum( axis = -1, dtype = numpy.uint8 )
+    
 def GetNow():
     
     return int( time.time() )
@@ -1775,6 +1825,11 @@ class JobDatabase( object ):
         self._result_ready.set()
         
     
+    def SetType( self, job_type ):
+        
+        self._type = job_type
+        
+    
     def ToString( self ):
         
         return '{} {}'.format( self._type, self._action )
@@ -246,6 +246,40 @@ def GetFileModifiedTimestamp( path ):
     
     return file_modified_timestamp
     
+def GetHashesAndHeaderFromPath( path ):
+    
+    # one read through the file for the sha256 and the extra hashes, and we keep the front of it for mime sniffing
+    
+    h_sha256 = hashlib.sha256()
+    h_md5 = hashlib.md5()
+    h_sha1 = hashlib.sha1()
+    h_sha512 = hashlib.sha512()
+    
+    header = b''
+    
+    with open( path, 'rb' ) as f:
+        
+        for block in HydrusPaths.ReadFileLikeAsBlocks( f ):
+            
+            if len( header ) < 256:
+                
+                header += block[ : 256 - len( header ) ]
+                
+            
+            h_sha256.update( block )
+            h_md5.update( block )
+            h_sha1.update( block )
+            h_sha512.update( block )
+            
+        
+    
+    sha256 = h_sha256.digest()
+    md5 = h_md5.digest()
+    sha1 = h_sha1.digest()
+    sha512 = h_sha512.digest()
+    
+    return ( sha256, md5, sha1, sha512, header )
+    
 def GetHashFromPath( path ):
     
     h = hashlib.sha256()
@@ -260,7 +294,7 @@ def GetHashFromPath( path ):
     
     return h.digest()
     
-def GetMime( path, ok_to_look_for_hydrus_updates = False ):
+def GetMime( path, ok_to_look_for_hydrus_updates = False, bit_to_check = None ):
     
     size = os.path.getsize( path )
     
@@ -269,9 +303,12 @@ def GetMime( path, ok_to_look_for_hydrus_updates = False ):
         raise HydrusExceptions.FileSizeException( 'File is of zero length!' )
         
     
-    with open( path, 'rb' ) as f:
+    if bit_to_check is None:
         
-        bit_to_check = f.read( 256 )
+        with open( path, 'rb' ) as f:
+            
+            bit_to_check = f.read( 256 )
+            
         
     
     for ( offset, header, mime ) in header_and_mime:
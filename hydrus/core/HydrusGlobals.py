@@ -12,6 +12,7 @@ no_wal = False
 no_db_temp_files = False
 db_memory_journaling = False
 db_synchronous_override = None
+db_read_connections = None
 
 import_folders_running = False
 export_folders_running = False
@@ -2550,7 +2550,7 @@ class UpdateBuilder( object ):
         self._update_class = update_class
         self._max_rows = max_rows
         
-        self._updates = []
+        self._finished_updates = []
         
         self._current_update = self._update_class()
         self._current_num_rows = 0
@@ -2563,7 +2563,7 @@ class UpdateBuilder( object ):
         
         if self._current_num_rows > self._max_rows:
             
-            self._updates.append( self._current_update )
+            self._finished_updates.append( self._current_update )
             
             self._current_update = self._update_class()
             self._current_num_rows = 0
@@ -2574,14 +2574,20 @@ class UpdateBuilder( object ):
         
         if self._current_update.GetNumRows() > 0:
             
-            self._updates.append( self._current_update )
+            self._finished_updates.append( self._current_update )
             
         
         self._current_update = None
         
     
-    def GetUpdates( self ):
+    def PopFinishedUpdates( self ):
         
-        return self._updates
+        # the caller takes ownership, so a full update can be written out and dropped while we fill the next
+        
+        updates = self._finished_updates
+        
+        self._finished_updates = []
+        
+        return updates
         
     
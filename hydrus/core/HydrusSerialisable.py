@@ -1,4 +1,5 @@
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 import json
 import zlib
 
@@ -15,6 +16,59 @@ except: # ImportError wasn't enough here as Linux went up the shoot with a __ver
     
     print( 'Could not import lz4--nbd.' )
     
+
+MSGPACK_OK = False
+
+try:
+    
+    import msgpack
+    
+    MSGPACK_OK = True
+    
+except Exception as e:
+    
+    pass
+    
+
+ZSTD_OK = False
+
+try:
+    
+    import zstandard
+    
+    ZSTD_OK = True
+    
+except Exception as e:
+    
+    pass
+    
+
+# network bytes were originally always zlib-compressed json, with no header
+# the framed format starts with a marker byte that cannot begin a zlib stream, then a frame version, then the compression and encoding used for the rest
+
+NETWORK_BYTES_FRAME_MARKER = 0xff
+NETWORK_BYTES_FRAME_VERSION = 1
+
+NETWORK_BYTES_FRAME_HEADER_LENGTH = 4
+
+NETWORK_BYTES_COMPRESSION_ZLIB = 0
+NETWORK_BYTES_COMPRESSION_LZ4 = 1
+NETWORK_BYTES_COMPRESSION_ZSTD = 2
+
+network_bytes_compression_string_lookup = {}
+
+network_bytes_compression_string_lookup[ NETWORK_BYTES_COMPRESSION_ZLIB ] = 'zlib'
+network_bytes_compression_string_lookup[ NETWORK_BYTES_COMPRESSION_LZ4 ] = 'lz4'
+network_bytes_compression_string_lookup[ NETWORK_BYTES_COMPRESSION_ZSTD ] = 'zstd'
+
+NETWORK_BYTES_ENCODING_JSON = 0
+NETWORK_BYTES_ENCODING_MSGPACK = 1
+
+network_bytes_encoding_string_lookup = {}
+
+network_bytes_encoding_string_lookup[ NETWORK_BYTES_ENCODING_JSON ] = 'json'
+network_bytes_encoding_string_lookup[ NETWORK_BYTES_ENCODING_MSGPACK ] = 'msgpack'
+
 SERIALISABLE_TYPE_BASE = 0
 SERIALISABLE_TYPE_BASE_NAMED = 1
 SERIALISABLE_TYPE_SHORTCUT_SET = 2
@@ -109,27 +163,49 @@ SERIALISABLE_TYPE_SUBSCRIPTION_CONTAINER = 90
 
 SERIALISABLE_TYPES_TO_OBJECT_TYPES = {}
 
-def CreateFromNetworkBytes( network_string ):
+def CompressObjectBytes( compression, obj_bytes ):
     
-    try:
+    if compression == NETWORK_BYTES_COMPRESSION_ZLIB:
         
-        obj_bytes = zlib.decompress( network_string )
+        return zlib.compress( obj_bytes, 6 )
         
-    except zlib.error:
+    elif compression == NETWORK_BYTES_COMPRESSION_LZ4 and LZ4_OK:
         
-        if LZ4_OK:
+        return lz4.block.compress( obj_bytes )
+        
+    elif compression == NETWORK_BYTES_COMPRESSION_ZSTD and ZSTD_OK:
+        
+        return zstandard.ZstdCompressor( level = 3 ).compress( obj_bytes )
+        
+    
+    raise HydrusExceptions.SerialisationException( 'Cannot compress with {}!'.format( network_bytes_compression_string_lookup.get( compression, 'unknown compression {}'.format( compression ) ) ) )
+    
+def CreateFromNetworkBytes( network_string ):
+    
+    if IsFramedNetworkBytes( network_string ):
+        
+        try:
             
-            obj_bytes = lz4.block.decompress( network_string )
+            obj_tuple = LoadSerialisableTupleFromFramedNetworkBytes( network_string )
             
-        else:
+            return CreateFromSerialisableTuple( obj_tuple )
             
-            raise
+        except Exception as e:
+            
+            # an old lz4 payload starts with its length, which can happen to look like a frame header
+            
+            try:
+                
+                return CreateFromUnframedNetworkBytes( network_string )
+                
+            except:
+                
+                raise e
+                
             
         
     
-    obj_string = str( obj_bytes, 'utf-8' )
-    
-    return CreateFromString( obj_string )
+    return CreateFromUnframedNetworkBytes( network_string )
     
 def CreateFromNoneableSerialisableTuple( obj_tuple_or_none ):
     
@@ -167,6 +243,102 @@ def CreateFromSerialisableTuple( obj_tuple ):
     
     return obj
     
+def CreateFromUnframedNetworkBytes( network_string ):
+    
+    try:
+        
+        obj_bytes = zlib.decompress( network_string )
+        
+    except zlib.error:
+        
+        if LZ4_OK:
+            
+            obj_bytes = lz4.block.decompress( network_string )
+            
+        else:
+            
+            raise
+            
+        
+    
+    obj_string = str( obj_bytes, 'utf-8' )
+    
+    return CreateFromString( obj_string )
+    
+def DecodeSerialisableTuple( encoding, obj_bytes ):
+    
+    if encoding == NETWORK_BYTES_ENCODING_JSON:
+        
+        return json.loads( str( obj_bytes, 'utf-8' ) )
+        
+    elif encoding == NETWORK_BYTES_ENCODING_MSGPACK and MSGPACK_OK:
+        
+        return msgpack.unpackb( obj_bytes, raw = False, strict_map_key = False )
+        
+    
+    raise HydrusExceptions.SerialisationException( 'Cannot decode {}! You may need to install a library.'.format( network_bytes_encoding_string_lookup.get( encoding, 'unknown encoding {}'.format( encoding ) ) ) )
+    
+def DecompressObjectBytes( compression, compressed_bytes ):
+    
+    if compression == NETWORK_BYTES_COMPRESSION_ZLIB:
+        
+        return zlib.decompress( compressed_bytes )
+        
+    elif compression == NETWORK_BYTES_COMPRESSION_LZ4 and LZ4_OK:
+        
+        return lz4.block.decompress( compressed_bytes )
+        
+    elif compression == NETWORK_BYTES_COMPRESSION_ZSTD and ZSTD_OK:
+        
+        return zstandard.ZstdDecompressor().decompress( compressed_bytes )
+        
+    
+    raise HydrusExceptions.SerialisationException( 'Cannot decompress {}! You may need to install a library.'.format( network_bytes_compression_string_lookup.get( compression, 'unknown compression {}'.format( compression ) ) ) )
+    
+def DumpSerialisableTupleToFramedNetworkBytes( obj_tuple, network_bytes_format ):
+    
+    ( compression, encoding ) = network_bytes_format
+    
+    header = bytes( ( NETWORK_BYTES_FRAME_MARKER, NETWORK_BYTES_FRAME_VERSION, compression, encoding ) )
+    
+    return header + CompressObjectBytes( compression, EncodeSerialisableTuple( encoding, obj_tuple ) )
+    
+def EncodeSerialisableTuple( encoding, obj_tuple ):
+    
+    if encoding == NETWORK_BYTES_ENCODING_JSON:
+        
+        return bytes( json.dumps( obj_tuple ), 'utf-8' )
+        
+    elif encoding == NETWORK_BYTES_ENCODING_MSGPACK and MSGPACK_OK:
+        
+        return msgpack.packb( obj_tuple, use_bin_type = True )
+        
+    
+    raise HydrusExceptions.SerialisationException( 'Cannot encode with {}!'.format( network_bytes_encoding_string_lookup.get( encoding, 'unknown encoding {}'.format( encoding ) ) ) )
+    
+def GetAvailableNetworkBytesFormats():
+    
+    compressions = [ NETWORK_BYTES_COMPRESSION_ZLIB ]
+    
+    if LZ4_OK:
+        
+        compressions.append( NETWORK_BYTES_COMPRESSION_LZ4 )
+        
+    
+    if ZSTD_OK:
+        
+        compressions.append( NETWORK_BYTES_COMPRESSION_ZSTD )
+        
+    
+    encodings = [ NETWORK_BYTES_ENCODING_JSON ]
+    
+    if MSGPACK_OK:
+        
+        encodings.append( NETWORK_BYTES_ENCODING_MSGPACK )
+        
+    
+    return [ ( compression, encoding ) for compression in compressions for encoding in encodings ]
+    
 def GetNoneableSerialisableTuple( obj_or_none ):
     
     if obj_or_none is None:
@@ -178,6 +350,23 @@ def GetNoneableSerialisableTuple( obj_or_none ):
         return obj_or_none.GetSerialisableTuple()
         
     
+def IsFramedNetworkBytes( network_string ):
+    
+    return len( network_string ) > NETWORK_BYTES_FRAME_HEADER_LENGTH and network_string[0] == NETWORK_BYTES_FRAME_MARKER
+    
+def LoadSerialisableTupleFromFramedNetworkBytes( network_string ):
+    
+    ( marker, frame_version, compression, encoding ) = network_string[ : NETWORK_BYTES_FRAME_HEADER_LENGTH ]
+    
+    if frame_version != NETWORK_BYTES_FRAME_VERSION:
+        
+        raise HydrusExceptions.SerialisationException( 'Do not understand network bytes frame version {}! You may need to update.'.format( frame_version ) )
+        
+    
+    obj_bytes = DecompressObjectBytes( compression, network_string[ NETWORK_BYTES_FRAME_HEADER_LENGTH : ] )
+    
+    return DecodeSerialisableTuple( encoding, obj_bytes )
+    
 def SetNonDupeName( obj, disallowed_names ):
     
     non_dupe_name = HydrusData.GetNonDupeName( obj.GetName(), disallowed_names )
@@ -205,13 +394,20 @@ class SerialisableBase( object ):
         return old_serialisable_info
         
     
-    def DumpToNetworkBytes( self ):
+    def DumpToNetworkBytes( self, network_bytes_format = None ):
         
-        obj_string = self.DumpToString()
+        # with no format, this is the old unframed zlib json that every version can read
         
-        obj_bytes = bytes( obj_string, 'utf-8' )
+        if network_bytes_format is None:
+            
+            obj_string = self.DumpToString()
+            
+            obj_bytes = bytes( obj_string, 'utf-8' )
+            
+            return zlib.compress( obj_bytes, 9 )
+            
         
-        return zlib.compress( obj_bytes, 9 )
+        return DumpSerialisableTupleToFramedNetworkBytes( self.GetSerialisableTuple(), network_bytes_format )
         
     
     def DumpToString( self ):
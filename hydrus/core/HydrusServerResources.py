@@ -10,9 +10,10 @@ import time
 import traceback
 from twisted.internet import reactor, defer
 from twisted.internet.threads import deferToThread
+from twisted.web import http
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.resource import Resource
-from twisted.web.static import File as FileResource, NoRangeStaticProducer
+from twisted.web.static import File as FileResource
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
 
@@ -208,6 +209,43 @@ def GenerateEris( service ):
                                      <font color="gray">MMMM</font>
 </pre></body></html>'''
     
+def ETagMatches( header_value, etag, weak_comparison = True ):
+    
+    # header_value is an If-None-Match or If-Range list like '"abc", W/"def"'. If-None-Match compares weakly and If-Range strongly
+    
+    for candidate in header_value.split( ',' ):
+        
+        candidate = candidate.strip()
+        
+        if candidate == '*':
+            
+            return True
+            
+        
+        if candidate.startswith( 'W/' ):
+            
+            if not weak_comparison:
+                
+                continue
+                
+            
+            candidate = candidate[2:]
+            
+        
+        if candidate == '"{}"'.format( etag ):
+            
+            return True
+            
+        
+    
+    return False
+    
+def GenerateThumbnailETag( hash, path ):
+    
+    # thumbnails get regenerated when the user changes their thumbnail size, so the tag has to change with them
+    
+    return '{}-thumbnail-{}'.format( hash.hex(), int( os.path.getmtime( path ) ) )
+    
 def ParseFileArguments( path, decompression_bombs_ok = False ):
     
     HydrusImageHandling.ConvertToPngIfBmp( path )
@@ -463,32 +501,90 @@ class HydrusResource( Resource ):
             
             path = response_context.GetPath()
             
-            size = os.path.getsize( path )
-            
             mime = response_context.GetMime()
             
             content_type = HC.mime_mimetype_string_lookup[ mime ]
             
-            content_length = size
-            
             ( base, filename ) = os.path.split( path )
             
             content_disposition = 'inline; filename="' + filename + '"'
             
-            request.setHeader( 'Content-Type', str( content_type ) )
-            request.setHeader( 'Content-Length', str( content_length ) )
             request.setHeader( 'Content-Disposition', str( content_disposition ) )
+            request.setHeader( 'Accept-Ranges', 'bytes' )
             
             request.setHeader( 'Expires', time.strftime( '%a, %d %b %Y %H:%M:%S GMT', time.gmtime( time.time() + 86400 * 365 ) ) )
             request.setHeader( 'Cache-Control', 'max-age={}'.format( 86400 * 365 ) )
             
-            fileObject = open( path, 'rb' )
+            if request.requestHeaders.hasHeader( 'Origin' ) and self._service.SupportsCORS():
+                
+                request.setHeader( 'Access-Control-Expose-Headers', 'Accept-Ranges, Content-Length, Content-Range, ETag, Last-Modified' )
+                
+            
+            etag = response_context.GetETag()
+            last_modified = os.path.getmtime( path )
             
-            producer = NoRangeStaticProducer( request, fileObject )
+            if_none_match = request.getHeader( 'If-None-Match' )
             
-            producer.start()
+            if etag is not None:
+                
+                request.setHeader( 'ETag', '"{}"'.format( etag ) )
+                
+            
+            if etag is not None and if_none_match is not None:
+                
+                # If-None-Match wins over If-Modified-Since, so we set Last-Modified ourselves to stop twisted checking it
+                
+                request.setHeader( 'Last-Modified', http.datetimeToString( int( last_modified ) ) )
+                
+                not_modified = ETagMatches( if_none_match, etag )
+                
+            else:
+                
+                not_modified = request.setLastModified( last_modified ) == http.CACHED
+                
             
-            do_finish = False
+            if not_modified:
+                
+                request.setResponseCode( 304 )
+                
+                content_length = 0
+                
+            else:
+                
+                if_range = request.getHeader( 'If-Range' )
+                
+                if if_range is not None and request.requestHeaders.hasHeader( 'Range' ) and not self._IfRangeMatches( if_range, etag, last_modified ):
+                    
+                    # the client's copy is out of date, so it gets the whole thing
+                    
+                    request.requestHeaders.removeHeader( 'Range' )
+                    
+                
+                file_resource = FileResource( path )
+                
+                file_resource.type = str( content_type )
+                file_resource.encoding = None
+                
+                fileObject = open( path, 'rb' )
+                
+                # this sets the response code and Content-Type/Length, for a 200, a 206 of one or several ranges, or a 416
+                producer = file_resource.makeProducer( request, fileObject )
+                
+                content_length = int( request.responseHeaders.getRawHeaders( 'Content-Length' )[0] )
+                
+                if request.code == 416:
+                    
+                    # no range overlapped the file, so there is nothing to produce
+                    
+                    fileObject.close()
+                    
+                else:
+                    
+                    producer.start()
+                    
+                    do_finish = False
+                    
+                
             
         elif response_context.HasBody():
             
@@ -527,6 +623,25 @@ class HydrusResource( Resource ):
             
         
     
+    def _IfRangeMatches( self, if_range, etag, last_modified ):
+        
+        if_range = if_range.strip()
+        
+        if if_range.startswith( '"' ) or if_range.startswith( 'W/' ):
+            
+            return etag is not None and ETagMatches( if_range, etag, weak_comparison = False )
+            
+        
+        try:
+            
+            return http.stringToDatetime( if_range.encode( 'utf-8' ) ) >= int( last_modified )
+            
+        except ValueError:
+            
+            return False
+            
+        
+    
     def _callbackDoGETJob( self, request ):
         
         def wrap_thread_result( response_context ):
@@ -889,7 +1004,7 @@ class HydrusResourceWelcome( HydrusResource ):
     
 class ResponseContext( object ):
     
-    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None ):
+    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, etag = None ):
         
         if body is None:
             
@@ -923,6 +1038,7 @@ class ResponseContext( object ):
         self._body_bytes = body_bytes
         self._path = path
         self._cookies = cookies
+        self._etag = etag
         
     
     def GetBodyBytes( self ):
@@ -932,6 +1048,8 @@ class ResponseContext( object ):
     
     def GetCookies( self ): return self._cookies
     
+    def GetETag( self ): return self._etag
+    
     def GetMime( self ): return self._mime
     
     def GetPath( self ): return self._path
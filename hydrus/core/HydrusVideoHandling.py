@@ -4,6 +4,7 @@ from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusText
 from hydrus.core import HydrusThreading
+import bisect
 import numpy
 import os
 import re
@@ -12,6 +13,9 @@ import subprocess
 FFMPEG_MISSING_ERROR_PUBBED = False
 FFMPEG_NO_CONTENT_ERROR_PUBBED = False
 
+# roughly how many frames' worth of piped decoding a fresh ffmpeg process costs us to start up
+FRAMES_PER_PROCESS_LAUNCH = 30
+
 if HC.PLATFORM_LINUX or HC.PLATFORM_MACOS:
     
     FFMPEG_PATH = os.path.join( HC.BIN_DIR, 'ffmpeg' )
@@ -295,6 +299,35 @@ def GetFFMPEGVideoProperties( path, force_count_frames_manually = False ):
     
     return ( resolution, duration_in_ms, num_frames )
     
+def GetKeyframeTimestamps( path ):
+    
+    # decode only the keyframes and have showinfo report each one's timestamp
+    
+    cmd = [ FFMPEG_PATH, '-skip_frame', 'nokey', '-i', path, '-an', '-sn', '-vf', 'showinfo', '-f', 'null', '-' ]
+    
+    sbp_kwargs = HydrusData.GetSubprocessKWArgs()
+    
+    HydrusData.CheckProgramIsNotShuttingDown()
+    
+    try:
+        
+        process = subprocess.Popen( cmd, bufsize = 10**5, stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE, **sbp_kwargs )
+        
+    except FileNotFoundError as e:
+        
+        raise FileNotFoundError( 'Cannot interact with video because FFMPEG not found--are you sure it is installed? Full error: ' + str( e ) )
+        
+    
+    ( stdout, stderr ) = HydrusThreading.SubprocessCommunicate( process )
+    
+    del process
+    
+    ( text, encoding ) = HydrusText.NonFailingUnicodeDecode( stderr, 'utf-8' )
+    
+    lines = text.splitlines()
+    
+    return ParseFFMPEGKeyframeTimestamps( lines )
+    
 def GetMime( path ):
     
     lines = GetFFMPEGInfoLines( path )
@@ -570,6 +603,38 @@ def ParseFFMPEGHasVideo( lines ):
     
     return True
     
+def ParseFFMPEGKeyframeTimestamps( lines ):
+    
+    # [Parsed_showinfo_0 @ 0x55d3c8b2a0c0] n:   3 pts: 384000 pts_time:30      duration:   512 ...
+    
+    keyframe_timestamps = set()
+    
+    for line in lines:
+        
+        if 'showinfo' not in line:
+            
+            continue
+            
+        
+        match = re.search( r'pts_time:\s*(-?[0-9.]+)', line )
+        
+        if match is None:
+            
+            continue
+            
+        
+        try:
+            
+            keyframe_timestamps.add( max( 0.0, float( match.group( 1 ) ) ) )
+            
+        except ValueError:
+            
+            continue
+            
+        
+    
+    return sorted( keyframe_timestamps )
+    
 def ParseFFMPEGMimeText( lines ):
     
     try:
@@ -712,6 +777,8 @@ class VideoRendererFFMPEG( object ):
         self._num_frames = num_frames
         self._target_resolution = target_resolution
         
+        self._keyframe_timestamps = None
+        
         self.lastread = None
         
         self.fps = self._num_frames / self._duration
@@ -734,6 +801,8 @@ class VideoRendererFFMPEG( object ):
         
         self.bufsize = bufsize
         
+        self._skip_buffer = bytearray( bufsize )
+        
         self.initialize()
         
     
@@ -750,6 +819,37 @@ class VideoRendererFFMPEG( object ):
             
         
     
+    def _ShouldRelaunchToJumpAhead( self, pos ):
+        
+        if not self._keyframe_timestamps or self._mime in ( HC.IMAGE_APNG, HC.IMAGE_GIF ):
+            
+            return pos > self.pos + 60
+            
+        
+        # a new process seeks to the last keyframe at or before the target and decodes from there, so only launch one if that saves work over reading on through the pipe
+        
+        current_time = self.pos / self.fps
+        target_time = pos / self.fps
+        
+        keyframe_index = bisect.bisect_right( self._keyframe_timestamps, target_time ) - 1
+        
+        if keyframe_index < 0:
+            
+            return False
+            
+        
+        keyframe_time = self._keyframe_timestamps[ keyframe_index ]
+        
+        if keyframe_time <= current_time:
+            
+            return False
+            
+        
+        frames_to_decode_after_seek = ( target_time - keyframe_time ) * self.fps
+        
+        return pos - self.pos > frames_to_decode_after_seek + FRAMES_PER_PROCESS_LAUNCH
+        
+    
     def initialize( self, start_index = 0 ):
         
         self.close()
@@ -823,13 +923,13 @@ class VideoRendererFFMPEG( object ):
         
         ( w, h ) = self._target_resolution
         
+        skip_view = memoryview( self._skip_buffer )[ : self.depth * w * h ]
+        
         for i in range( n ):
             
             if self.process is not None:
                 
-                self.process.stdout.read( self.depth * w * h )
-                
-                self.process.stdout.flush()
+                self.process.stdout.readinto( skip_view )
                 
             
             self.pos += 1
@@ -896,9 +996,8 @@ class VideoRendererFFMPEG( object ):
     def set_position( self, pos ):
         
         rewind = pos < self.pos
-        jump_a_long_way_ahead = pos > self.pos + 60
         
-        if rewind or jump_a_long_way_ahead:
+        if rewind or self._ShouldRelaunchToJumpAhead( pos ):
             
             self.initialize( pos )
             
@@ -908,6 +1007,11 @@ class VideoRendererFFMPEG( object ):
             
         
     
+    def SetKeyframeTimestamps( self, keyframe_timestamps ):
+        
+        self._keyframe_timestamps = keyframe_timestamps
+        
+    
     def Stop( self ):
         
         self.close()
@@ -1,5 +1,6 @@
 import collections
 import hashlib
+import itertools
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusDB
 from hydrus.core import HydrusEncryption
@@ -1531,42 +1532,44 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusData.Print( 'Creating update for ' + repr( name ) + ' from ' + HydrusData.ConvertTimestampToPrettyTime( begin, in_gmt = True ) + ' to ' + HydrusData.ConvertTimestampToPrettyTime( end, in_gmt = True ) )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
-        
         update_hashes = []
         
         total_definition_rows = 0
         total_content_rows = 0
         
-        if len( updates ) > 0:
+        # each update is written to disk as soon as it is full and then dropped, so we only ever hold about one in memory
+        
+        for update in self._RepositoryGenerateUpdates( service_id, begin, end ):
             
-            for update in updates:
-                
-                num_rows = update.GetNumRows()
-                
-                if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
-                    
-                    total_definition_rows += num_rows
-                    
-                elif isinstance( update, HydrusNetwork.ContentUpdate ):
-                    
-                    total_content_rows += num_rows
-                    
+            num_rows = update.GetNumRows()
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
                 
-                update_bytes = update.DumpToNetworkBytes()
+                total_definition_rows += num_rows
                 
-                update_hash = hashlib.sha256( update_bytes ).digest()
+            elif isinstance( update, HydrusNetwork.ContentUpdate ):
                 
-                dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+                total_content_rows += num_rows
                 
-                with open( dest_path, 'wb' ) as f:
-                    
-                    f.write( update_bytes )
-                    
+            
+            update_bytes = update.DumpToNetworkBytes()
+            
+            del update
+            
+            update_hash = hashlib.sha256( update_bytes ).digest()
+            
+            dest_path = ServerFiles.GetExpectedFilePath( update_hash )
+            
+            with open( dest_path, 'wb' ) as f:
                 
-                update_hashes.append( update_hash )
+                f.write( update_bytes )
                 
             
+            update_hashes.append( update_hash )
+            
+        
+        if len( update_hashes ) > 0:
+            
             ( update_table_name ) = GenerateRepositoryUpdateTableName( service_id )
             
             master_hash_ids = self._GetMasterHashIds( update_hashes )
@@ -1574,7 +1577,7 @@ class DB( HydrusDB.HydrusDB ):
             self._c.executemany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
             
         
-        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( updates ) ) + ' update files.' )
+        HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( update_hashes ) ) + ' update files.' )
         
         return update_hashes
         
@@ -1720,42 +1723,49 @@ class DB( HydrusDB.HydrusDB ):
         
         service_id = self._GetServiceId( service_key )
         
-        updates = self._RepositoryGenerateUpdates( service_id, begin, end )
+        updates = list( self._RepositoryGenerateUpdates( service_id, begin, end ) )
         
         return updates
         
     
     def _RepositoryGenerateUpdates( self, service_id, begin, end ):
         
+        # this yields each update as soon as it fills, and rows are streamed from the db rather than loaded all at once, so a busy period does not have to fit in memory
+        # the caller is free to use self._c between updates, so we read from our own cursor
+        
         MAX_DEFINITIONS_ROWS = 50000
         MAX_CONTENT_ROWS = 250000
         
         MAX_CONTENT_CHUNK = 25000
         
-        updates = []
+        c = self._db.cursor()
         
         definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
         content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
         
         ( service_hash_ids_table_name, service_tag_ids_table_name ) = GenerateRepositoryMasterMapTableNames( service_id )
         
-        for ( service_hash_id, hash ) in self._c.execute( 'SELECT service_hash_id, hash FROM ' + service_hash_ids_table_name + ' NATURAL JOIN hashes WHERE hash_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+        for ( service_hash_id, hash ) in c.execute( 'SELECT service_hash_id, hash FROM ' + service_hash_ids_table_name + ' NATURAL JOIN hashes WHERE hash_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
             
             row = ( HC.DEFINITIONS_TYPE_HASHES, service_hash_id, hash )
             
             definitions_update_builder.AddRow( row )
             
+            yield from definitions_update_builder.PopFinishedUpdates()
+            
         
-        for ( service_tag_id, tag ) in self._c.execute( 'SELECT service_tag_id, tag FROM ' + service_tag_ids_table_name + ' NATURAL JOIN tags WHERE tag_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+        for ( service_tag_id, tag ) in c.execute( 'SELECT service_tag_id, tag FROM ' + service_tag_ids_table_name + ' NATURAL JOIN tags WHERE tag_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
             
             row = ( HC.DEFINITIONS_TYPE_TAGS, service_tag_id, tag )
             
             definitions_update_builder.AddRow( row )
             
+            yield from definitions_update_builder.PopFinishedUpdates()
+            
         
         definitions_update_builder.Finish()
         
-        updates.extend( definitions_update_builder.GetUpdates() )
+        yield from definitions_update_builder.PopFinishedUpdates()
         
         #
         
@@ -1763,45 +1773,44 @@ class DB( HydrusDB.HydrusDB ):
         
         table_join = self._RepositoryGetFilesInfoFilesTableJoin( service_id, HC.CONTENT_STATUS_CURRENT )
         
-        for ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words ) in self._c.execute( 'SELECT service_hash_id, size, mime, file_timestamp, width, height, duration, num_frames, num_words FROM ' + table_join + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+        for ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words ) in c.execute( 'SELECT service_hash_id, size, mime, file_timestamp, width, height, duration, num_frames, num_words FROM ' + table_join + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
             
             file_row = ( service_hash_id, size, mime, timestamp, width, height, duration, num_frames, num_words )
             
             content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, file_row ) )
             
+            yield from content_update_builder.PopFinishedUpdates()
+            
         
-        service_hash_ids = [ service_hash_id for ( service_hash_id, ) in self._c.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ) ]
-        
-        for service_hash_id in service_hash_ids:
+        for ( service_hash_id, ) in c.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
             
             content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ) )
             
+            yield from content_update_builder.PopFinishedUpdates()
+            
         
         #
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateRepositoryMappingsTableNames( service_id )
         
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + current_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
+        for ( mappings_table_name, action ) in ( ( current_mappings_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_mappings_table_name, HC.CONTENT_UPDATE_DELETE ) ):
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
-                
-                row_weight = len( block_of_service_hash_ids )
-                
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
-                
+            # sorted by tag, so we can group each tag's files as they come rather than building a dict of the whole period
             
-        
-        service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + deleted_mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
-        
-        for ( service_tag_id, service_hash_ids ) in list(service_tag_ids_to_service_hash_ids.items()):
+            cursor = c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ? ORDER BY service_tag_id;', ( begin, end ) )
             
-            for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
+            for ( service_tag_id, rows ) in itertools.groupby( cursor, key = lambda row: row[0] ):
                 
-                row_weight = len( block_of_service_hash_ids )
+                service_hash_ids = [ service_hash_id for ( service_tag_id, service_hash_id ) in rows ]
                 
-                content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
+                for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
+                    
+                    row_weight = len( block_of_service_hash_ids )
+                    
+                    content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, action, ( service_tag_id, block_of_service_hash_ids ) ), row_weight )
+                    
+                    yield from content_update_builder.PopFinishedUpdates()
+                    
                 
             
         
@@ -1809,45 +1818,35 @@ class DB( HydrusDB.HydrusDB ):
         
         ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = GenerateRepositoryTagParentsTableNames( service_id )
         
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + current_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, pair ) )
-            
-        
-        pairs = self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + deleted_tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
+        for ( tag_parents_table_name, action ) in ( ( current_tag_parents_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_tag_parents_table_name, HC.CONTENT_UPDATE_DELETE ) ):
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, pair ) )
+            for pair in c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+                
+                content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, action, pair ) )
+                
+                yield from content_update_builder.PopFinishedUpdates()
+                
             
         
         #
         
         ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = GenerateRepositoryTagSiblingsTableNames( service_id )
         
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + current_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
+        for ( tag_siblings_table_name, action ) in ( ( current_tag_siblings_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_tag_siblings_table_name, HC.CONTENT_UPDATE_DELETE ) ):
             
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, pair ) )
-            
-        
-        pairs = self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + deleted_tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall()
-        
-        for pair in pairs:
-            
-            content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, pair ) )
+            for pair in c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ):
+                
+                content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, action, pair ) )
+                
+                yield from content_update_builder.PopFinishedUpdates()
+                
             
         
         #
         
         content_update_builder.Finish()
         
-        updates.extend( content_update_builder.GetUpdates() )
-        
-        return updates
+        yield from content_update_builder.PopFinishedUpdates()
         
     
     def _RepositoryGetAccountInfo( self, service_id, account_id ):
@@ -0,0 +1,232 @@
+from hydrus.client import ClientCaches
+from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
+import unittest
+from mock import patch
+
+class FakeCacheData( object ):
+    
+    def __init__( self, estimated_memory_footprint = 10 ):
+        
+        self._estimated_memory_footprint = estimated_memory_footprint
+        
+    
+    def GetEstimatedMemoryFootprint( self ):
+        
+        return self._estimated_memory_footprint
+        
+    
+class TestDataCache( unittest.TestCase ):
+    
+    def test_accounting( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 100 )
+        
+        for i in range( 5 ):
+            
+            data_cache.AddData( i, FakeCacheData() )
+            
+        
+        # adding the same key again does not count it twice
+        
+        data_cache.AddData( 0, FakeCacheData() )
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'estimated_memory_footprint' ], 50 )
+        
+        data_cache.DeleteData( 0 )
+        data_cache.DeleteData( 'not in there' )
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'estimated_memory_footprint' ], 40 )
+        
+        # a big item pushes out as many old ones as it needs to fit
+        
+        data_cache.AddData( 'big', FakeCacheData( 85 ) )
+        
+        statistics = data_cache.GetStatistics()
+        
+        self.assertEqual( statistics[ 'num_items' ], 2 )
+        self.assertEqual( statistics[ 'estimated_memory_footprint' ], 95 )
+        self.assertEqual( statistics[ 'evictions' ], 3 )
+        
+        self.assertTrue( data_cache.HasData( 4 ) )
+        self.assertTrue( data_cache.HasData( 'big' ) )
+        
+        data_cache.Clear()
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'estimated_memory_footprint' ], 0 )
+        
+    
+    def test_hits_and_misses( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 100 )
+        
+        data = FakeCacheData()
+        
+        data_cache.AddData( 'a', data )
+        
+        self.assertIs( data_cache.GetData( 'a' ), data )
+        self.assertIs( data_cache.GetIfHasData( 'a' ), data )
+        self.assertIsNone( data_cache.GetIfHasData( 'b' ) )
+        
+        with self.assertRaises( Exception ):
+            
+            data_cache.GetData( 'b' )
+            
+        
+        # HasData is just a peek and does not count
+        
+        data_cache.HasData( 'a' )
+        data_cache.HasData( 'b' )
+        
+        statistics = data_cache.GetStatistics()
+        
+        self.assertEqual( statistics[ 'hits' ], 2 )
+        self.assertEqual( statistics[ 'misses' ], 2 )
+        self.assertEqual( statistics[ 'evictions' ], 0 )
+        
+    
+    def test_lru( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 30 )
+        
+        for key in ( 'a', 'b', 'c' ):
+            
+            data_cache.AddData( key, FakeCacheData() )
+            
+        
+        data_cache.GetData( 'a' )
+        
+        data_cache.AddData( 'd', FakeCacheData() )
+        
+        self.assertTrue( data_cache.HasData( 'a' ) )
+        self.assertFalse( data_cache.HasData( 'b' ) )
+        
+    
+    def test_scan_resistance( self ):
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 100, scan_resistant = True )
+        
+        hot_keys = [ 'hot {}'.format( i ) for i in range( 4 ) ]
+        
+        for key in hot_keys:
+            
+            data_cache.AddData( key, FakeCacheData() )
+            
+        
+        # new keys wait on probation, and using them in the same burst does not promote them
+        
+        for key in hot_keys:
+            
+            data_cache.GetData( key )
+            
+        
+        statistics = data_cache.GetStatistics()
+        
+        self.assertEqual( statistics[ 'num_items' ], 4 )
+        self.assertEqual( statistics[ 'num_probationary_items' ], 4 )
+        
+        # a scan pushes them out, but they are remembered as ghosts
+        
+        for i in range( 10 ):
+            
+            data_cache.AddData( 'first scan {}'.format( i ), FakeCacheData() )
+            
+        
+        for key in hot_keys:
+            
+            self.assertFalse( data_cache.HasData( key ) )
+            
+        
+        # coming back as a ghost skips probation
+        
+        for key in hot_keys:
+            
+            data_cache.AddData( key, FakeCacheData() )
+            
+        
+        statistics = data_cache.GetStatistics()
+        
+        self.assertEqual( statistics[ 'num_items' ], 10 )
+        self.assertEqual( statistics[ 'num_probationary_items' ], 6 )
+        
+        # now a long scan, many times the size of the cache, only churns the probationary part
+        
+        scan_keys = [ 'second scan {}'.format( i ) for i in range( 100 ) ]
+        
+        for key in scan_keys:
+            
+            data_cache.AddData( key, FakeCacheData() )
+            
+        
+        for key in hot_keys:
+            
+            self.assertTrue( data_cache.HasData( key ) )
+            
+        
+        statistics = data_cache.GetStatistics()
+        
+        self.assertLessEqual( statistics[ 'estimated_memory_footprint' ], 100 )
+        self.assertEqual( statistics[ 'num_items' ], 10 )
+        self.assertEqual( statistics[ 'num_probationary_items' ], 6 )
+        
+        # a scan key that comes back soon after it was dropped is a ghost hit and goes straight to the protected part
+        
+        returning_key = scan_keys[ -8 ]
+        
+        self.assertFalse( data_cache.HasData( returning_key ) )
+        
+        data_cache.AddData( returning_key, FakeCacheData() )
+        
+        statistics = data_cache.GetStatistics()
+        
+        self.assertTrue( data_cache.HasData( returning_key ) )
+        self.assertEqual( statistics[ 'num_probationary_items' ], 5 )
+        
+        # but the ghost list is bounded, so one from the start of the scan is long forgotten and goes on probation
+        
+        forgotten_key = scan_keys[0]
+        
+        data_cache.AddData( forgotten_key, FakeCacheData() )
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'num_probationary_items' ], 5 )
+        
+    
+    def test_timeout( self ):
+        
+        now = HydrusData.GetNow()
+        
+        data_cache = ClientCaches.DataCache( HG.test_controller, 'test', 100, timeout = 60, scan_resistant = True )
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now ):
+            
+            data_cache.AddData( 'old', FakeCacheData() )
+            data_cache.AddData( 'used', FakeCacheData() )
+            
+        
+        # a probationary key is timed out by when it was last used, not when it was added
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now + 50 ):
+            
+            data_cache.GetData( 'used' )
+            
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now + 100 ):
+            
+            data_cache.MaintainCache()
+            
+        
+        self.assertFalse( data_cache.HasData( 'old' ) )
+        self.assertTrue( data_cache.HasData( 'used' ) )
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'estimated_memory_footprint' ], 10 )
+        
+        with patch.object( HydrusData, 'GetNow', return_value = now + 200 ):
+            
+            data_cache.MaintainCache()
+            
+        
+        self.assertFalse( data_cache.HasData( 'used' ) )
+        
+        self.assertEqual( data_cache.GetStatistics()[ 'estimated_memory_footprint' ], 0 )
+        
+    
@@ -1,3 +1,4 @@
+import collections
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDB
 from hydrus.client import ClientDefaults
@@ -7,9 +8,11 @@ from hydrus.client.gui import ClientGUIPages
 from hydrus.client.importing import ClientImportLocal
 from hydrus.client.importing import ClientImportOptions
 from hydrus.client.importing import ClientImportFileSeeds
+from hydrus.client.media import ClientMediaManagers
 from hydrus.client import ClientSearch
 from hydrus.client import ClientServices
 from hydrus.client import ClientTags
+from hydrus.client import ClientThreading
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
@@ -19,6 +22,7 @@ import os
 from hydrus.test import TestController
 import time
 import unittest
+from mock import patch
 
 class TestClientDB( unittest.TestCase ):
     
@@ -433,6 +437,10 @@ class TestClientDB( unittest.TestCase ):
         tests.append( ( True, 'bus', 0 ) )
         tests.append( ( False, 'bus', 1 ) )
         
+        # searched before they are added, so the tag search has already seen them empty
+        tests.append( ( True, 'maker:ford', 0 ) )
+        tests.append( ( True, 'ford', 0 ) )
+        
         run_tag_predicate_tests( tests )
         
         #
@@ -582,6 +590,26 @@ class TestClientDB( unittest.TestCase ):
         
         run_system_predicate_tests( tests )
         
+        # mixed searches, which the planner reorders. report mode exercises the plan report too
+        
+        tests = []
+        
+        tests.append( ( [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'maker:ford' ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'series:cars' ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_RATING, ( '=', 'rated', TestController.LOCAL_RATING_LIKE_SERVICE_KEY ) ) ], 1 ) )
+        tests.append( ( [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_NAMESPACE, 'series' ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'ford' ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_RATING, ( '>', 0.4, TestController.LOCAL_RATING_NUMERICAL_SERVICE_KEY ) ) ], 1 ) )
+        tests.append( ( [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_WILDCARD, 'ser*:c*' ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'maker:ford' ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'bus' ) ], 0 ) )
+        tests.append( ( [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'maker:ford' ), ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_RATING, ( '>', 0.6, TestController.LOCAL_RATING_NUMERICAL_SERVICE_KEY ) ) ], 0 ) )
+        
+        HG.db_report_mode = True
+        
+        try:
+            
+            run_or_predicate_tests( tests )
+            
+        finally:
+            
+            HG.db_report_mode = False
+            
+        
         #
         
         content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hash, ), reason = 'test delete' )
@@ -607,6 +635,65 @@ class TestClientDB( unittest.TestCase ):
         run_system_predicate_tests( tests )
         
     
+    def test_file_query_plan( self ):
+        
+        TestClientDB._clear_db()
+        
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:cars', ( hash, ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'maker:ford', ( hash, ) ) ) )
+        
+        self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+        
+        predicates = []
+        
+        predicates.append( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_NAMESPACE, 'series' ) )
+        predicates.append( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_WILDCARD, 'ser*:c*' ) )
+        predicates.append( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'maker:ford' ) )
+        
+        search_context = ClientSearch.FileSearchContext( file_service_key = CC.LOCAL_FILE_SERVICE_KEY, predicates = predicates )
+        
+        # a tag's estimate is summed over siblings, namespaces and services, so it can be bigger than the file domain. it must still go before the namespace and wildcard steps
+        
+        HG.db_report_mode = True
+        
+        try:
+            
+            with patch.object( TestClientDB._db, '_GetHashIdsFromTagEstimate', return_value = 1000000 ):
+                
+                with patch.object( HydrusData, 'ShowText' ) as show_text:
+                    
+                    file_query_ids = self._read( 'file_query_ids', search_context )
+                    
+                
+            
+        finally:
+            
+            HG.db_report_mode = False
+            
+        
+        self.assertEqual( len( file_query_ids ), 1 )
+        
+        [ message ] = [ text for ( ( text, ), kwargs ) in show_text.call_args_list if text.startswith( 'File search plan' ) ]
+        
+        step_descriptions = [ line.split( ': estimated' )[0] for line in message.splitlines()[ 2 : ] ]
+        
+        self.assertEqual( step_descriptions, [ 'maker:ford', 'series:*anything*', 'ser*:c*' ] )
+        
+    
     def test_file_system_predicates( self ):
         
         TestClientDB._clear_db()
@@ -1016,6 +1103,70 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( mr_num_words, None )
         
     
+    def test_media_results_display_tags( self ):
+        
+        TestClientDB._clear_db()
+        
+        hash = HydrusData.GenerateKey()
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'car', ( hash, ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:cars', ( hash, ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'maker:ford', ( hash, ) ) ) )
+        
+        self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+        
+        tag_display_manager = HG.test_controller.tag_display_manager
+        
+        tag_filter = ClientTags.TagFilter()
+        
+        tag_filter.SetRule( 'series:', CC.FILTER_BLACKLIST )
+        
+        tag_display_manager.SetTagFilter( ClientTags.TAG_DISPLAY_SINGLE_MEDIA, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, tag_filter )
+        
+        try:
+            
+            ( media_result, ) = self._read( 'media_results', ( hash, ) )
+            
+            tags_manager = media_result.GetTagsManager()
+            
+            # the db worked these out for the batch, so they should match what a manager calculates from scratch
+            
+            service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            
+            for ( status, tags ) in tags_manager.GetStatusesToTags( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ).items():
+                
+                service_keys_to_statuses_to_tags[ CC.DEFAULT_LOCAL_TAG_SERVICE_KEY ][ status ] = set( tags )
+                
+            
+            recalculated_tags_manager = ClientMediaManagers.TagsManager( service_keys_to_statuses_to_tags )
+            
+            for tag_display_type in ( ClientTags.TAG_DISPLAY_STORAGE, ClientTags.TAG_DISPLAY_SIBLINGS_AND_PARENTS, ClientTags.TAG_DISPLAY_SINGLE_MEDIA, ClientTags.TAG_DISPLAY_SELECTION_LIST ):
+                
+                for service_key in ( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, CC.COMBINED_TAG_SERVICE_KEY ):
+                    
+                    self.assertEqual( tags_manager.GetCurrent( service_key, tag_display_type ), recalculated_tags_manager.GetCurrent( service_key, tag_display_type ) )
+                    
+                
+            
+            self.assertEqual( tags_manager.GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SINGLE_MEDIA ), { 'car', 'maker:ford' } )
+            self.assertEqual( tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SELECTION_LIST ), { 'car', 'series:cars', 'maker:ford' } )
+            
+            # a content update on a clean manager only redoes the one service
+            
+            tags_manager.ProcessContentUpdate( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:trucks', ( hash, ) ) ) )
+            
+            self.assertEqual( tags_manager.GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SINGLE_MEDIA ), { 'car', 'maker:ford' } )
+            self.assertEqual( tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ), { 'car', 'series:cars', 'series:trucks', 'maker:ford' } )
+            self.assertEqual( tags_manager.GetCurrent( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_SELECTION_LIST ), { 'car', 'series:cars', 'series:trucks', 'maker:ford' } )
+            
+        finally:
+            
+            tag_display_manager.SetTagFilter( ClientTags.TAG_DISPLAY_SINGLE_MEDIA, CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TagFilter() )
+            
+        
+    
     def test_nums_pending( self ):
         
         result = self._read( 'nums_pending' )
@@ -1078,6 +1229,239 @@ class TestClientDB( unittest.TestCase ):
         self.assertTrue( result, ( pixiv_id, password ) )
         
     
+    def test_pre_import_statuses( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_job = ClientImportFileSeeds.FileImportJob( path )
+        
+        file_import_job.GenerateHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        md5 = bytes.fromhex( 'fdadb2cae78f2dfeb629449cd005f2a2' )
+        
+        known_url = 'https://site.com/post/123'
+        other_known_url = 'https://site.com/source/123'
+        unknown_url = 'https://site.com/post/456'
+        
+        service_keys_to_content_updates = { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( ( known_url, other_known_url ), ( hash, ) ) ) ] }
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        urls = ( known_url, unknown_url )
+        hash_types_and_hashes = ( ( 'md5', md5 ), ( 'sha256', os.urandom( 32 ) ) )
+        
+        ( urls_to_url_statuses, hash_types_and_hashes_to_hash_statuses, hashes_to_urls ) = self._read( 'pre_import_statuses', urls, hash_types_and_hashes )
+        
+        for url in urls:
+            
+            self.assertEqual( urls_to_url_statuses[ url ], self._read( 'url_statuses', url ) )
+            
+        
+        for ( hash_type, lookup_hash ) in hash_types_and_hashes:
+            
+            self.assertEqual( hash_types_and_hashes_to_hash_statuses[ ( hash_type, lookup_hash ) ], self._read( 'hash_status', hash_type, lookup_hash, prefix = 'hash recognised' ) )
+            
+        
+        self.assertEqual( len( urls_to_url_statuses[ known_url ] ), 1 )
+        self.assertEqual( urls_to_url_statuses[ unknown_url ], [] )
+        
+        ( status, url_hash, note ) = urls_to_url_statuses[ known_url ][0]
+        
+        self.assertEqual( url_hash, hash )
+        
+        # the test client files manager may report the file as missing, which makes the url match unknown and not worth double-checking
+        if status == CC.STATUS_UNKNOWN:
+            
+            self.assertEqual( hashes_to_urls, {} )
+            
+        else:
+            
+            self.assertEqual( hashes_to_urls, { hash : { known_url, other_known_url } } )
+            
+        
+        # a file seed trusts the prefetched hits. it trusts the misses for a short while, and after that checks them live in case the file has turned up since
+        
+        live_url_statuses = [ ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash, 'imported since' ) ]
+        live_hash_status = ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash, 'imported since' )
+        
+        HG.test_controller.SetRead( 'url_statuses', live_url_statuses )
+        HG.test_controller.SetRead( 'hash_status', live_hash_status )
+        
+        try:
+            
+            file_seed = ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, unknown_url )
+            
+            file_seed.SetPreImportStatusLookup( ( urls_to_url_statuses, hash_types_and_hashes_to_hash_statuses, hashes_to_urls ) )
+            
+            self.assertFalse( file_seed.PreImportStatusLookupIsStale() )
+            
+            self.assertEqual( file_seed._ReadURLStatuses( unknown_url ), [] )
+            
+            for ( hash_type, lookup_hash ) in hash_types_and_hashes:
+                
+                self.assertEqual( file_seed._ReadHashStatus( hash_type, lookup_hash ), hash_types_and_hashes_to_hash_statuses[ ( hash_type, lookup_hash ) ] )
+                
+            
+            with patch.object( HydrusData, 'GetNow', return_value = HydrusData.GetNow() + ClientImportFileSeeds.PRE_IMPORT_STATUS_LOOKUP_MISS_LIFETIME + 1 ):
+                
+                self.assertTrue( file_seed.PreImportStatusLookupIsStale() )
+                
+                self.assertEqual( file_seed._ReadURLStatuses( unknown_url ), live_url_statuses )
+                
+                for ( hash_type, lookup_hash ) in hash_types_and_hashes:
+                    
+                    self.assertEqual( file_seed._ReadHashStatus( hash_type, lookup_hash ), live_hash_status )
+                    
+                
+                if status != CC.STATUS_UNKNOWN:
+                    
+                    self.assertEqual( file_seed._ReadURLStatuses( known_url ), urls_to_url_statuses[ known_url ] )
+                    
+                
+            
+        finally:
+            
+            HG.test_controller.SetRead( 'hash_status', ( CC.STATUS_UNKNOWN, None, '' ) )
+            
+        
+        # when a queue is worked after its misses have gone stale, the file seed being worked and the ones after it are looked up again in one db job
+        
+        HG.test_controller.SetRead( 'pre_import_statuses', ( {}, {}, {} ) )
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://site.com/post/{}'.format( i ) ) for i in range( 5 ) ]
+        
+        file_seed_cache.AddFileSeeds( file_seeds, prefetch_pre_import_statuses = True )
+        
+        with patch.object( HydrusData, 'GetNow', return_value = HydrusData.GetNow() + ClientImportFileSeeds.PRE_IMPORT_STATUS_LOOKUP_MISS_LIFETIME + 1 ):
+            
+            self.assertTrue( all( ( file_seed.PreImportStatusLookupIsStale() for file_seed in file_seeds ) ) )
+            
+            with patch.object( HG.test_controller, 'Read', wraps = HG.test_controller.Read ) as read:
+                
+                file_seed_cache.RefreshStalePreImportStatusLookups( file_seeds[0] )
+                
+                self.assertEqual( read.call_count, 1 )
+                
+                ( ( name, lookup_urls, lookup_hash_types_and_hashes ), kwargs ) = read.call_args
+                
+                self.assertEqual( name, 'pre_import_statuses' )
+                self.assertEqual( lookup_urls, { file_seed.file_seed_data for file_seed in file_seeds } )
+                
+                self.assertFalse( any( ( file_seed.PreImportStatusLookupIsStale() for file_seed in file_seeds ) ) )
+                
+                # fresh again, so working the next one does not go to the db
+                
+                file_seed_cache.RefreshStalePreImportStatusLookups( file_seeds[1] )
+                
+                self.assertEqual( read.call_count, 1 )
+                
+            
+        
+    
+    def test_repository_processing( self ):
+        
+        services = self._read( 'services' )
+        
+        old_services = list( services )
+        
+        service_key = HydrusData.GenerateKey()
+        
+        services.append( ClientServices.GenerateService( service_key, HC.TAG_REPOSITORY, 'processing test' ) )
+        
+        self._write( 'update_services', services )
+        
+        stage_timer = ClientServices.RepositoryProcessingStageTimer()
+        
+        job_key = ClientThreading.JobKey()
+        
+        #
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 5 ) ]
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for ( i, hash ) in enumerate( hashes ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, 500 + i, hash ) )
+            
+        
+        for ( i, tag ) in enumerate( ( 'series:processing test', 'character:processing test', 'processing test', 'test' ) ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, 100 + i, tag ) )
+            
+        
+        iterator_dict = {}
+        
+        iterator_dict[ 'service_hash_ids_to_hashes' ] = iter( definitions_update.GetHashIdsToHashes().items() )
+        iterator_dict[ 'service_tag_ids_to_tags' ] = iter( definitions_update.GetTagIdsToTags().items() )
+        
+        num_rows_done = self._write( 'process_repository_definitions', service_key, HydrusData.GenerateKey(), iterator_dict, job_key, 60, stage_timer = stage_timer )
+        
+        self.assertEqual( num_rows_done, 9 )
+        self.assertEqual( iterator_dict, {} )
+        
+        #
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        # the same files turn up under several tags, so each chunk has repeated service ids to normalise
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 100, [ 500, 501, 502 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 101, [ 501, 502, 503, 504 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 101, [ 504 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( 103, 102 ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( 102, 100 ) ) )
+        
+        iterator_dict = {}
+        
+        iterator_dict[ 'new_files' ] = iter( content_update.GetNewFiles() )
+        iterator_dict[ 'deleted_files' ] = iter( content_update.GetDeletedFiles() )
+        iterator_dict[ 'new_mappings' ] = HydrusData.SmoothOutMappingIterator( content_update.GetNewMappings(), 50 )
+        iterator_dict[ 'deleted_mappings' ] = HydrusData.SmoothOutMappingIterator( content_update.GetDeletedMappings(), 50 )
+        iterator_dict[ 'new_parents' ] = iter( content_update.GetNewTagParents() )
+        iterator_dict[ 'deleted_parents' ] = iter( content_update.GetDeletedTagParents() )
+        iterator_dict[ 'new_siblings' ] = iter( content_update.GetNewTagSiblings() )
+        iterator_dict[ 'deleted_siblings' ] = iter( content_update.GetDeletedTagSiblings() )
+        
+        num_rows_done = self._write( 'process_repository_content', service_key, HydrusData.GenerateKey(), iterator_dict, job_key, 60, stage_timer = stage_timer )
+        
+        self.assertEqual( num_rows_done, 10 )
+        self.assertEqual( iterator_dict, {} )
+        
+        #
+        
+        tag_search_context = ClientSearch.TagSearchContext( service_key = service_key )
+        
+        for ( tag, result ) in ( ( 'series:processing test', 3 ), ( 'character:processing test', 3 ) ):
+            
+            predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, tag ) ]
+            
+            search_context = ClientSearch.FileSearchContext( file_service_key = CC.COMBINED_FILE_SERVICE_KEY, tag_search_context = tag_search_context, predicates = predicates )
+            
+            file_query_ids = self._read( 'file_query_ids', search_context )
+            
+            self.assertEqual( len( file_query_ids ), result )
+            
+        
+        summary = stage_timer.GetSummary()
+        
+        self.assertIn( 'normalising', summary )
+        self.assertIn( 'writing', summary )
+        
+        #
+        
+        self._write( 'update_services', old_services )
+        
+    
     def test_services( self ):
         
         result = self._read( 'services', ( HC.LOCAL_FILE_DOMAIN, HC.LOCAL_FILE_TRASH_DOMAIN, HC.COMBINED_LOCAL_FILE, HC.LOCAL_TAG ) )
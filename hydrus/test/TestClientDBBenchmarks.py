@@ -0,0 +1,137 @@
+import gc
+import os
+import time
+import unittest
+
+from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientDB
+from hydrus.client import ClientTags
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
+from hydrus.test import TestController
+
+# these are slow and want a lot of memory at the top end, so they are not part of 'all'. run them with 'python test.py benchmarks'
+
+MEDIA_RESULTS_BENCHMARK_SIZES = ( 10000, 100000, 1000000 )
+MEDIA_RESULTS_BENCHMARK_NUM_TAGS = 5000
+MEDIA_RESULTS_BENCHMARK_TAGS_PER_FILE = 8
+
+class BenchmarkDB( ClientDB.DB ):
+    
+    def _AddSyntheticFiles( self, num_files ):
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( num_files ) ]
+        
+        hash_ids = sorted( self._GetHashIds( hashes ) )
+        
+        now = HydrusData.GetNow()
+        
+        self._AddFilesInfo( [ ( hash_id, 250000, HC.IMAGE_JPEG, 1280, 720, None, None, False, None ) for hash_id in hash_ids ] )
+        
+        self._AddFiles( self._local_file_service_id, [ ( hash_id, now ) for hash_id in hash_ids ] )
+        self._AddFiles( self._combined_local_file_service_id, [ ( hash_id, now ) for hash_id in hash_ids ] )
+        
+        self._InboxFiles( hash_ids[ : num_files // 2 ] )
+        
+        tag_ids = [ self._GetTagId( 'synthetic:tag {}'.format( i ) ) for i in range( MEDIA_RESULTS_BENCHMARK_NUM_TAGS ) ]
+        
+        tag_ids_to_hash_ids = HydrusData.BuildKeyToListDict( ( ( tag_ids[ ( hash_id * 7 + i * 131 ) % len( tag_ids ) ], hash_id ) for hash_id in hash_ids for i in range( MEDIA_RESULTS_BENCHMARK_TAGS_PER_FILE ) ) )
+        
+        tag_service_id = self._GetServiceId( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        self._UpdateMappings( tag_service_id, mappings_ids = list( tag_ids_to_hash_ids.items() ) )
+        
+        self._c.executemany( 'INSERT OR IGNORE INTO file_viewing_stats ( hash_id, preview_views, preview_viewtime, media_views, media_viewtime ) VALUES ( ?, ?, ?, ?, ? );', ( ( hash_id, 1, 2, 3, 4 ) for hash_id in hash_ids[ : num_files // 10 ] ) )
+        
+        return hash_ids
+        
+    
+    def _Write( self, action, *args, **kwargs ):
+        
+        if action == 'synthetic_files':
+            
+            return self._AddSyntheticFiles( *args, **kwargs )
+            
+        
+        return ClientDB.DB._Write( self, action, *args, **kwargs )
+        
+    
+class TestMediaResultsBenchmark( unittest.TestCase ):
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        cls._db = BenchmarkDB( HG.test_controller, TestController.DB_DIR, 'client' )
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        cls._db.Shutdown()
+        
+        while not cls._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        for filename in cls._db._db_filenames.values():
+            
+            os.remove( os.path.join( TestController.DB_DIR, filename ) )
+            
+        
+        del cls._db
+        
+    
+    def test_media_results( self ):
+        
+        hash_ids = []
+        
+        for num_files in MEDIA_RESULTS_BENCHMARK_SIZES:
+            
+            started = time.perf_counter()
+            
+            hash_ids.extend( self._db.Write( 'synthetic_files', True, num_files - len( hash_ids ) ) )
+            
+            HydrusData.Print( '{} synthetic files ready in {}'.format( HydrusData.ToHumanInt( num_files ), HydrusData.TimeDeltaToPrettyTimeDelta( time.perf_counter() - started ) ) )
+            
+            gc.collect() # clear out the db's weakref media result cache from the last run
+            
+            started = time.perf_counter()
+            
+            media_results = self._db.Read( 'media_results_from_ids', hash_ids )
+            
+            load_time = time.perf_counter() - started
+            
+            self.assertEqual( len( media_results ), num_files )
+            
+            started = time.perf_counter()
+            
+            num_tags = 0
+            
+            # we let go of each result as we go, or a million of them with all their managers will not fit in memory
+            
+            media_results.reverse()
+            
+            while len( media_results ) > 0:
+                
+                media_result = media_results.pop()
+                
+                num_tags += len( media_result.GetTagsManager().GetCurrent( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE ) )
+                
+                media_result.GetLocationsManager()
+                media_result.GetRatingsManager()
+                media_result.GetNotesManager()
+                media_result.GetFileViewingStatsManager()
+                
+            
+            materialise_time = time.perf_counter() - started
+            
+            self.assertEqual( num_tags, num_files * MEDIA_RESULTS_BENCHMARK_TAGS_PER_FILE )
+            
+            HydrusData.Print( '{} media results: loaded in {}, all managers made in a further {}'.format( HydrusData.ToHumanInt( num_files ), HydrusData.TimeDeltaToPrettyTimeDelta( load_time ), HydrusData.TimeDeltaToPrettyTimeDelta( materialise_time ) ) )
+            
+            del media_results
+            
+        
+    
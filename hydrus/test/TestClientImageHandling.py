@@ -1,11 +1,36 @@
+from hydrus.client import ClientCaches
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientImageHandling
+from hydrus.client import ClientSimilarFiles
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusImageHandling
+from hydrus.core import HydrusPaths
+import numpy
 import os
+import threading
+import time
 import unittest
+from mock import patch
 
 class TestImageHandling( unittest.TestCase ):
     
+    def setUp( self ):
+        
+        self._slab_caches = []
+        
+    
+    def tearDown( self ):
+        
+        for slab_cache in self._slab_caches:
+            
+            slab_cache.Close()
+            
+        
+        HydrusPaths.DeletePath( os.path.join( HG.test_controller.db_dir, 'client_thumbnail_slabs' ) )
+        
+    
     def test_phash( self ):
         
         phashes = ClientImageHandling.GenerateShapePerceptualHashes( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), HC.IMAGE_PNG )
@@ -20,3 +45,270 @@ class TestImageHandling( unittest.TestCase ):
         
         self.assertEqual( phashes, set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
+    
+    def test_phash_index( self ):
+        
+        phashes = [ os.urandom( 8 ) for i in range( 500 ) ]
+        
+        phash_index = ClientSimilarFiles.PHashIndex( list( enumerate( phashes ) ) )
+        
+        self.assertEqual( len( phash_index ), 500 )
+        
+        search_phashes = phashes[:10]
+        
+        for max_hamming_distance in ( 0, 8, 24 ):
+            
+            results = phash_index.Search( search_phashes, max_hamming_distance )
+            
+            for ( search_phash, result ) in zip( search_phashes, results ):
+                
+                expected_result = { phash_id : HydrusData.Get64BitHammingDistance( search_phash, phash ) for ( phash_id, phash ) in enumerate( phashes ) }
+                expected_result = { phash_id : distance for ( phash_id, distance ) in expected_result.items() if distance <= max_hamming_distance }
+                
+                self.assertEqual( result, expected_result )
+                
+            
+        
+        phash_index.RemovePHashIds( [ 0, 1 ] )
+        phash_index.AddPHash( 1000, phashes[0] )
+        
+        self.assertEqual( len( phash_index ), 499 )
+        
+        self.assertEqual( phash_index.Search( [ phashes[0], phashes[1] ], 0 ), [ { 1000 : 0 }, {} ] )
+        
+    
+    def test_decoded_thumbnail_slab_cache( self ):
+        
+        ( width, height ) = HG.test_controller.options[ 'thumbnail_dimensions' ]
+        
+        slab_cache = ClientCaches.DecodedThumbnailSlabCache( HG.test_controller, 1 )
+        
+        self._slab_caches.append( slab_cache )
+        
+        hash_1 = os.urandom( 32 )
+        hash_2 = os.urandom( 32 )
+        
+        numpy_image_1 = numpy.random.randint( 0, 256, ( height, width, 3 ), dtype = numpy.uint8 )
+        numpy_image_2 = numpy.random.randint( 0, 256, ( height // 2, width, 4 ), dtype = numpy.uint8 )
+        
+        self.assertIsNone( slab_cache.GetHydrusBitmap( hash_1 ) )
+        
+        slab_cache.AddNumPyImage( hash_1, numpy_image_1 )
+        slab_cache.AddNumPyImage( hash_2, numpy_image_2 )
+        
+        hydrus_bitmap = slab_cache.GetHydrusBitmap( hash_1 )
+        
+        self.assertEqual( hydrus_bitmap.GetSize(), ( width, height ) )
+        self.assertEqual( hydrus_bitmap.GetDepth(), 3 )
+        self.assertEqual( hydrus_bitmap._GetData(), numpy_image_1.tobytes() )
+        
+        # a fresh cache over the same files picks up what is already there
+        
+        slab_cache.Close()
+        
+        slab_cache = ClientCaches.DecodedThumbnailSlabCache( HG.test_controller, 1 )
+        
+        self._slab_caches.append( slab_cache )
+        
+        hydrus_bitmap = slab_cache.GetHydrusBitmap( hash_2 )
+        
+        self.assertEqual( hydrus_bitmap.GetSize(), ( width, height // 2 ) )
+        self.assertEqual( hydrus_bitmap.GetDepth(), 4 )
+        self.assertEqual( hydrus_bitmap._GetData(), numpy_image_2.tobytes() )
+        
+        slab_cache.DeleteThumbnails( [ hash_1 ] )
+        
+        self.assertIsNone( slab_cache.GetHydrusBitmap( hash_1 ) )
+        self.assertIsNotNone( slab_cache.GetHydrusBitmap( hash_2 ) )
+        
+        # new dimensions means the old slots are useless
+        
+        slab_cache.SetBoundingDimensions( ( width + 10, height + 10 ) )
+        
+        self.assertIsNone( slab_cache.GetHydrusBitmap( hash_2 ) )
+        
+        slab_cache.SetBoundingDimensions( ( width, height ) )
+        
+    
+        
+    
+class FakeLocationsManager( object ):
+    
+    def IsLocal( self ):
+        
+        return True
+        
+    
+    def ShouldIdeallyHaveThumbnail( self ):
+        
+        return True
+        
+    
+class FakeThumbnailMedia( object ):
+    
+    def __init__( self, hash, resolution ):
+        
+        self._hash = hash
+        self._resolution = resolution
+        
+    
+    def GetDisplayMedia( self ):
+        
+        return self
+        
+    
+    def GetHash( self ):
+        
+        return self._hash
+        
+    
+    def GetLocationsManager( self ):
+        
+        return FakeLocationsManager()
+        
+    
+    def GetMediaResult( self ):
+        
+        return self
+        
+    
+    def GetMime( self ):
+        
+        return HC.IMAGE_PNG
+        
+    
+    def GetResolution( self ):
+        
+        return self._resolution
+        
+    
+class TestThumbnailCache( unittest.TestCase ):
+    
+    def _GetMedias( self, num_medias ):
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        ( resolution, duration, num_frames ) = HydrusImageHandling.GetImageProperties( path, HC.IMAGE_PNG )
+        
+        target_resolution = HydrusImageHandling.GetThumbnailResolution( resolution, HG.test_controller.options[ 'thumbnail_dimensions' ] )
+        
+        thumbnail_bytes = HydrusImageHandling.GenerateThumbnailBytesFromStaticImagePath( path, target_resolution, HC.IMAGE_PNG )
+        
+        medias = []
+        
+        for i in range( num_medias ):
+            
+            hash = os.urandom( 32 )
+            
+            HG.test_controller.client_files_manager.AddThumbnailFromBytes( hash, thumbnail_bytes, silent = True )
+            
+            medias.append( FakeThumbnailMedia( hash, resolution ) )
+            
+        
+        return medias
+        
+    
+    def test_benchmark( self ):
+        
+        thumbnail_cache = ClientCaches.ThumbnailCache( HG.test_controller )
+        
+        medias = self._GetMedias( 10 )
+        
+        thumbnail_paths = [ HG.test_controller.client_files_manager.GetThumbnailPath( media ) for media in medias ]
+        
+        thumbnail_mtimes = [ os.path.getmtime( path ) for path in thumbnail_paths ]
+        
+        temp_dirs = []
+        
+        def get_temp_dir():
+            
+            temp_dir = original_get_temp_dir()
+            
+            temp_dirs.append( temp_dir )
+            
+            return temp_dir
+            
+        
+        original_get_temp_dir = HydrusPaths.GetTempDir
+        
+        with patch.object( HydrusPaths, 'GetTempDir', side_effect = get_temp_dir ):
+            
+            results = thumbnail_cache.BenchmarkThumbnailDecoding( medias, [ 1, 2 ] )
+            
+        
+        self.assertEqual( [ num_workers for ( num_workers, thumbnails_per_second ) in results ], [ 1, 2 ] )
+        
+        for ( num_workers, thumbnails_per_second ) in results:
+            
+            self.assertGreater( thumbnails_per_second, 0 )
+            
+        
+        # it worked on copies in a temp dir that is now gone, and did not touch the cache or the real thumbnails
+        
+        self.assertEqual( len( temp_dirs ), 1 )
+        self.assertFalse( os.path.exists( temp_dirs[0] ) )
+        
+        self.assertEqual( [ os.path.getmtime( path ) for path in thumbnail_paths ], thumbnail_mtimes )
+        
+        statistics = thumbnail_cache.GetStatistics()
+        
+        self.assertEqual( statistics[ 'num_items' ], 0 )
+        self.assertEqual( statistics[ 'hits' ] + statistics[ 'misses' ], 0 )
+        
+    
+    def test_waterfall_workers( self ):
+        
+        HG.test_controller.new_options.SetInteger( 'thumbnail_waterfall_workers', 4 )
+        
+        try:
+            
+            thumbnail_cache = ClientCaches.ThumbnailCache( HG.test_controller )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetInteger( 'thumbnail_waterfall_workers', 2 )
+            
+        
+        medias = self._GetMedias( 50 )
+        
+        # slow each load down a little, so we can see the work is spread over several threads
+        
+        thread_idents = set()
+        
+        original_get_thumbnail_hydrus_bitmap = thumbnail_cache._GetThumbnailHydrusBitmap
+        
+        def get_thumbnail_hydrus_bitmap( display_media ):
+            
+            thread_idents.add( threading.get_ident() )
+            
+            time.sleep( 0.01 )
+            
+            return original_get_thumbnail_hydrus_bitmap( display_media )
+            
+        
+        thumbnail_cache._GetThumbnailHydrusBitmap = get_thumbnail_hydrus_bitmap
+        
+        page_key = HydrusData.GenerateKey()
+        
+        thumbnail_cache.Waterfall( page_key, medias )
+        
+        stop_time = HydrusData.GetNow() + 15
+        
+        while False in ( thumbnail_cache.HasThumbnailCached( media ) for media in medias ):
+            
+            self.assertFalse( HydrusData.TimeHasPassed( stop_time ), 'The waterfall did not finish in time!' )
+            
+            time.sleep( 0.05 )
+            
+        
+        # the workers share one queue, so every thumbnail was loaded exactly once
+        
+        statistics = thumbnail_cache.GetStatistics()
+        
+        self.assertEqual( statistics[ 'num_items' ], 50 )
+        self.assertEqual( statistics[ 'misses' ], 50 )
+        self.assertEqual( statistics[ 'hits' ], 0 )
+        
+        self.assertGreater( len( thread_idents ), 1 )
+        
+    
@@ -1,12 +1,21 @@
 
+from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientDefaults
+from hydrus.client import ClientThreading
+from hydrus.client.importing import ClientImportSubscriptions
 from hydrus.client.networking import ClientNetworking
 from hydrus.client.networking import ClientNetworkingBandwidth
+from hydrus.client.networking import ClientNetworkingContexts
 from hydrus.client.networking import ClientNetworkingDomain
 from hydrus.client.networking import ClientNetworkingLogin
 from hydrus.client.networking import ClientNetworkingSessions
+from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusThreading
 from hydrus.test import TestController
+import threading
 import unittest
+from mock import patch
 from httmock import all_requests
 
 MISSING_RESPONSE = '404, bad result'
@@ -92,3 +101,179 @@ class TestSubscription( unittest.TestCase ):
         
         pass
         
+    
+class TestSubscriptionQueryWorkScheduler( unittest.TestCase ):
+    
+    class FakeQueryHeader( object ):
+        
+        def __init__( self, name, domain ):
+            
+            self.name = name
+            self.domain = domain
+            
+        
+        def GetHumanName( self ):
+            
+            return self.name
+            
+        
+        def GetQueryLogContainerName( self ):
+            
+            return self.name
+            
+        
+    
+    def _GetQueryHeaders( self ):
+        
+        query_headers = [ self.FakeQueryHeader( name, domain ) for ( name, domain ) in ( ( 'a1', 'a.com' ), ( 'a2', 'a.com' ), ( 'b1', 'b.com' ), ( 'c1', 'c.com' ) ) ]
+        
+        HG.test_controller.SetRead( 'serialisables_named', { query_header.name : 'container ' + query_header.name for query_header in query_headers } )
+        
+        return query_headers
+        
+    
+    def test_round_robin( self ):
+        
+        scheduler = ClientImportSubscriptions.SubscriptionQueryWorkScheduler( self._GetQueryHeaders(), lambda query_header: query_header.domain )
+        
+        results = []
+        
+        for i in range( 3 ):
+            
+            ( num, domain, query_header, query_log_container ) = scheduler.GetNextWork()
+            
+            results.append( ( num, domain, query_header.name, query_log_container ) )
+            
+        
+        # one query per domain at a time, so a2 has to wait for a1
+        
+        self.assertEqual( results, [ ( 1, 'a.com', 'a1', 'container a1' ), ( 2, 'b.com', 'b1', 'container b1' ), ( 3, 'c.com', 'c1', 'container c1' ) ] )
+        
+        scheduler.WorkDone( 'b.com', query_log_container = 'container b1' )
+        scheduler.WorkDone( 'a.com', query_log_container = 'container a1' )
+        
+        ( num, domain, query_header, query_log_container ) = scheduler.GetNextWork()
+        
+        self.assertEqual( ( num, domain, query_header.name ), ( 4, 'a.com', 'a2' ) )
+        
+        scheduler.WorkDone( 'a.com', query_log_container = 'container a2' )
+        scheduler.WorkDone( 'c.com', query_log_container = 'container c1' )
+        
+        self.assertIsNone( scheduler.GetNextWork() )
+        
+        # each log is saved as soon as its query is done
+        
+        writes = HG.test_controller.GetWrite( 'serialisable' )
+        
+        self.assertEqual( [ args for ( args, kwargs ) in writes ], [ ( 'container b1', ), ( 'container a1', ), ( 'container a2', ), ( 'container c1', ) ] )
+        
+    
+    def test_bandwidth( self ):
+        
+        def bandwidth_callable( query_header ):
+            
+            network_context = ClientNetworkingContexts.NetworkContext( CC.NETWORK_CONTEXT_DOMAIN, query_header.domain )
+            
+            if query_header.domain == 'a.com':
+                
+                return ( 60, network_context )
+                
+            
+            return ( 0, network_context )
+            
+        
+        scheduler = ClientImportSubscriptions.SubscriptionQueryWorkScheduler( self._GetQueryHeaders(), lambda query_header: query_header.domain, bandwidth_callable = bandwidth_callable )
+        
+        names = []
+        
+        while True:
+            
+            work = scheduler.GetNextWork()
+            
+            if work is None:
+                
+                break
+                
+            
+            ( num, domain, query_header, query_log_container ) = work
+            
+            names.append( query_header.name )
+            
+            scheduler.WorkDone( domain )
+            
+        
+        self.assertEqual( names, [ 'b1', 'c1' ] )
+        
+    
+    def test_stop( self ):
+        
+        scheduler = ClientImportSubscriptions.SubscriptionQueryWorkScheduler( self._GetQueryHeaders(), lambda query_header: query_header.domain )
+        
+        scheduler.GetNextWork()
+        
+        scheduler.Stop( exception = Exception( 'test' ) )
+        
+        self.assertIsNone( scheduler.GetNextWork() )
+        
+        self.assertEqual( str( scheduler.GetException() ), 'test' )
+        
+    
+class TestSubscriptionQueryWork( unittest.TestCase ):
+    
+    def test_concurrent_workers( self ):
+        
+        query_headers = [ TestSubscriptionQueryWorkScheduler.FakeQueryHeader( name, domain ) for ( name, domain ) in ( ( 'a1', 'a.com' ), ( 'b1', 'b.com' ), ( 'c1', 'c.com' ) ) ]
+        
+        HG.test_controller.SetRead( 'serialisables_named', { query_header.name : 'container ' + query_header.name for query_header in query_headers } )
+        
+        subscription = ClientImportSubscriptions.Subscription( 'test' )
+        
+        scheduler = ClientImportSubscriptions.SubscriptionQueryWorkScheduler( query_headers, lambda query_header: query_header.domain )
+        
+        # all three queries have to be in flight at once to get past this
+        
+        barrier = threading.Barrier( 3, timeout = 10 )
+        
+        worker_threads = []
+        worker_threads_lock = threading.Lock()
+        
+        def work_callable( i, query_header, query_log_container, query_job_key ):
+            
+            with worker_threads_lock:
+                
+                worker_threads.append( threading.current_thread() )
+                
+            
+            barrier.wait()
+            
+            subscription._DelayWork( 1000 * i, 'delay {}'.format( i ) )
+            
+            subscription._PauseWork( 'paused', 'bad login' )
+            
+        
+        with patch.object( HydrusData, 'ShowText' ) as show_text:
+            
+            subscription._DoQueryWork( ClientThreading.JobKey(), scheduler, work_callable )
+            
+        
+        # the workers come from the controller's pool
+        
+        self.assertEqual( len( set( worker_threads ) ), 3 )
+        
+        for worker_thread in worker_threads:
+            
+            self.assertIsInstance( worker_thread, HydrusThreading.THREADCallToThread )
+            
+        
+        # only the first worker pauses and says so, and the longest delay wins
+        
+        self.assertEqual( show_text.call_count, 1 )
+        
+        self.assertTrue( subscription._paused )
+        self.assertEqual( subscription._no_work_until_reason, 'delay 3' )
+        
+        writes = HG.test_controller.GetWrite( 'serialisable' )
+        
+        self.assertEqual( sorted( args for ( args, kwargs ) in writes ), [ ( 'container a1', ), ( 'container b1', ), ( 'container c1', ) ] )
+        
+    
@@ -1,5 +1,6 @@
 from hydrus.client import ClientConstants as CC
 from hydrus.client.networking import ClientNetworking
+from hydrus.client.networking import ClientNetworkingAsync
 from hydrus.client.networking import ClientNetworkingBandwidth
 from hydrus.client.networking import ClientNetworkingContexts
 from hydrus.client.networking import ClientNetworkingDomain
@@ -13,6 +14,9 @@ from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusNetworking
 from hydrus.test import TestController
+import gzip
+import http.server
+import threading
 import time
 import unittest
 from hydrus.core import HydrusGlobals as HG
@@ -325,8 +329,154 @@ class TestNetworkingDomain( unittest.TestCase ):
         self.assertEqual( url_class.GetReferralURL( good_url, None ), converted_referral_url )
         
     
+class LocalHTTPHandler( http.server.BaseHTTPRequestHandler ):
+    
+    protocol_version = 'HTTP/1.1'
+    
+    last_accept_encoding = None
+    
+    def do_GET( self ):
+        
+        LocalHTTPHandler.last_accept_encoding = self.headers.get( 'Accept-Encoding' )
+        
+        self.send_response( 200 )
+        
+        if self.path == '/gzip':
+            
+            data = gzip.compress( GOOD_RESPONSE )
+            
+            self.send_header( 'Content-Encoding', 'gzip' )
+            self.send_header( 'Content-Length', str( len( data ) ) )
+            self.end_headers()
+            
+            self.wfile.write( data )
+            
+        elif self.path == '/chunked':
+            
+            self.send_header( 'Transfer-Encoding', 'chunked' )
+            self.end_headers()
+            
+            for chunk in ( GOOD_RESPONSE[:100], GOOD_RESPONSE[100:] ):
+                
+                self.wfile.write( b'%x\r\n' % len( chunk ) + chunk + b'\r\n' )
+                
+            
+            self.wfile.write( b'0\r\n\r\n' )
+            
+        else:
+            
+            self.send_header( 'Content-Length', str( len( GOOD_RESPONSE ) ) )
+            self.end_headers()
+            
+            self.wfile.write( GOOD_RESPONSE )
+            
+        
+    
+    def log_message( self, *args ):
+        
+        pass
+        
+    
 class TestNetworkingEngine( unittest.TestCase ):
     
+    @unittest.skipUnless( ClientNetworkingAsync.H11_OK, 'h11 is not available' )
+    def test_engine_async_job( self ):
+        
+        server = http.server.ThreadingHTTPServer( ( '127.0.0.1', 0 ), LocalHTTPHandler )
+        
+        threading.Thread( target = server.serve_forever, daemon = True ).start()
+        
+        mock_controller = TestController.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        mock_controller.new_options.SetBoolean( 'network_async_downloads', True )
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+        try:
+            
+            for path in ( '/plain', '/chunked', '/gzip', '/plain' ):
+                
+                job = ClientNetworkingJobs.NetworkJob( 'GET', 'http://127.0.0.1:{}{}'.format( server.server_port, path ) )
+                
+                engine.AddJob( job )
+                
+                job.WaitUntilDone()
+                
+                self.assertFalse( job.HasError() )
+                self.assertEqual( job.GetContentBytes(), GOOD_RESPONSE )
+                
+            
+            # we only offer what we can decode
+            self.assertEqual( LocalHTTPHandler.last_accept_encoding, 'gzip, deflate' )
+            
+            # the last job should have had its connection back from the pool
+            self.assertTrue( job.GetConnectionReused() )
+            
+        finally:
+            
+            engine.Shutdown()
+            
+            server.shutdown()
+            
+        
+    
+    def test_engine_keep_alive_limit( self ):
+        
+        server = http.server.ThreadingHTTPServer( ( '127.0.0.1', 0 ), LocalHTTPHandler )
+        
+        threading.Thread( target = server.serve_forever, daemon = True ).start()
+        
+        original_max_requests = HG.client_controller.new_options.GetNoneableInteger( 'network_connection_max_requests' )
+        
+        HG.client_controller.new_options.SetNoneableInteger( 'network_connection_max_requests', 2 )
+        
+        mock_controller = TestController.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+        try:
+            
+            connections_reused = []
+            
+            for i in range( 5 ):
+                
+                job = ClientNetworkingJobs.NetworkJob( 'GET', 'http://127.0.0.1:{}/plain'.format( server.server_port ) )
+                
+                engine.AddJob( job )
+                
+                job.WaitUntilDone()
+                
+                self.assertFalse( job.HasError() )
+                self.assertEqual( job.GetContentBytes(), GOOD_RESPONSE )
+                
+                connections_reused.append( job.GetConnectionReused() )
+                
+            
+            # the second request on each connection asks the server to close it
+            self.assertEqual( connections_reused, [ False, True, False, True, False ] )
+            
+        finally:
+            
+            HG.client_controller.new_options.SetNoneableInteger( 'network_connection_max_requests', original_max_requests )
+            
+            engine.Shutdown()
+            
+            server.shutdown()
+            
+        
+    
     def test_engine_shutdown_app( self ):
         
         mock_controller = TestController.MockController()
@@ -439,6 +589,64 @@ class TestNetworkingEngine( unittest.TestCase ):
         engine.Shutdown()
         
     
+    def test_engine_domain_slots( self ):
+        
+        mock_controller = TestController.MockController()
+        bandwidth_manager = ClientNetworkingBandwidth.NetworkBandwidthManager()
+        session_manager = ClientNetworkingSessions.NetworkSessionManager()
+        domain_manager = ClientNetworkingDomain.NetworkDomainManager()
+        login_manager = ClientNetworkingLogin.NetworkLoginManager()
+        
+        engine = ClientNetworking.NetworkEngine( mock_controller, bandwidth_manager, session_manager, domain_manager, login_manager )
+        
+        mock_controller.CallToThread( engine.MainLoop )
+        
+        #
+        
+        with HTTMock( catch_all ):
+            
+            with HTTMock( catch_wew_ok ):
+                
+                jobs = [ ClientNetworkingJobs.NetworkJob( 'GET', MOCK_URL ) for i in range( engine.MAX_JOBS_PER_DOMAIN * 4 ) ]
+                
+                start_time = HydrusData.GetNowPrecise()
+                
+                for job in jobs:
+                    
+                    engine.AddJob( job )
+                    
+                
+                # jobs waiting on a domain slot are woken as soon as one frees up, not on the engine's one second fallback poll
+                # four rounds of slots would take at least three seconds if each round waited for a poll
+                
+                for job in jobs:
+                    
+                    job.WaitUntilDone()
+                    
+                    self.assertTrue( job.IsDone() )
+                    self.assertFalse( job.HasError() )
+                    
+                
+                self.assertLess( HydrusData.GetNowPrecise() - start_time, 2.0 )
+                
+                # the engine clears finished jobs on its next loop, which the last job's finish wakes
+                
+                give_up_time = HydrusData.GetNowPrecise() + 0.5
+                
+                while len( engine.GetJobsSnapshot() ) > 0 and not HydrusData.TimeHasPassedPrecise( give_up_time ):
+                    
+                    time.sleep( 0.01 )
+                    
+                
+                self.assertEqual( engine.GetJobsSnapshot(), [] )
+                
+            
+        
+        #
+        
+        engine.Shutdown()
+        
+    
 class TestNetworkingJob( unittest.TestCase ):
     
     def _GetJob( self, for_login = False ):
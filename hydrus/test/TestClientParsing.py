@@ -264,3 +264,138 @@ class TestStringProcessor( unittest.TestCase ):
         
         self.assertEqual( processor.ProcessStrings( [ '0123456789abcdef' ] ), [] )
         
+    
+
+class TestHTMLBackends( unittest.TestCase ):
+    
+    # the lxml backend tidies its tree to look like html5lib's, so every check here has to give the same answer for both
+    
+    def _GetDocuments( self, html ):
+        
+        return [ ClientParsing.GetSoup( html ), ClientParsing.GetLXMLDocument( html ) ]
+        
+    
+    @unittest.skipUnless( ClientParsing.HTML5LIB_IS_OK and ClientParsing.LXML_IS_OK, 'html5lib or lxml is not available' )
+    def test_ascending( self ):
+        
+        for document in self._GetDocuments( '<div><p>text</p></div>' ):
+            
+            node = ClientParsing.FindHTMLNodes( document, 'p', {} )[0]
+            
+            names = []
+            
+            node = ClientParsing.GetHTMLNodeParent( node )
+            
+            while node is not None:
+                
+                names.append( ClientParsing.GetHTMLNodeName( node ) )
+                
+                node = ClientParsing.GetHTMLNodeParent( node )
+                
+            
+            self.assertEqual( names, [ 'div', 'body', 'html', '[document]' ] )
+            
+            # and descending from the top finds the whole document again
+            
+            self.assertEqual( len( ClientParsing.FindHTMLNodes( document, 'html', {} ) ), 1 )
+            
+        
+    
+    @unittest.skipUnless( ClientParsing.HTML5LIB_IS_OK and ClientParsing.LXML_IS_OK, 'html5lib or lxml is not available' )
+    def test_attributes( self ):
+        
+        html = '<div class="a  b" data-id="123"><input type="checkbox" checked><select multiple><option selected>o</option></select></div>'
+        
+        for document in self._GetDocuments( html ):
+            
+            div = ClientParsing.FindHTMLNodes( document, 'div', {} )[0]
+            
+            self.assertEqual( ClientParsing.GetHTMLNodeAttribute( div, 'class' ), [ 'a', 'b' ] )
+            self.assertEqual( ClientParsing.GetHTMLNodeAttribute( div, 'data-id' ), '123' )
+            self.assertEqual( ClientParsing.GetHTMLNodeAttribute( div, 'title' ), None )
+            
+            self.assertEqual( len( ClientParsing.FindHTMLNodes( document, 'div', { 'class' : 'a' } ) ), 1 )
+            self.assertEqual( len( ClientParsing.FindHTMLNodes( document, 'div', { 'class' : 'b' } ) ), 1 )
+            self.assertEqual( len( ClientParsing.FindHTMLNodes( document, 'div', { 'class' : 'a b' } ) ), 1 )
+            self.assertEqual( len( ClientParsing.FindHTMLNodes( document, 'div', { 'class' : 'c' } ) ), 0 )
+            self.assertEqual( len( ClientParsing.FindHTMLNodes( document, None, { 'data-id' : '123' } ) ), 1 )
+            
+            for ( tag_name, attribute ) in ( ( 'input', 'checked' ), ( 'select', 'multiple' ), ( 'option', 'selected' ) ):
+                
+                node = ClientParsing.FindHTMLNodes( document, tag_name, {} )[0]
+                
+                self.assertEqual( ClientParsing.GetHTMLNodeAttribute( node, attribute ), '' )
+                
+            
+        
+    
+    @unittest.skipUnless( ClientParsing.HTML5LIB_IS_OK and ClientParsing.LXML_IS_OK, 'html5lib or lxml is not available' )
+    def test_html_content( self ):
+        
+        html = '<div class="a  b" id=x><br><img src="x&amp;y" alt=\'say "hi"\'>text &amp; &lt;more&gt;<!-- c --><input type=checkbox checked><script>if ( a < b && c ) {}</script><video><source src="a.mp4">fallback</video></div>'
+        
+        expected_html = '<div class="a b" id="x"><br/><img alt=\'say "hi"\' src="x&amp;y"/>text &amp; &lt;more&gt;<!-- c --><input checked="" type="checkbox"/><script>if ( a < b && c ) {}</script><video><source src="a.mp4"/>fallback</video></div>'
+        
+        for document in self._GetDocuments( html ):
+            
+            div = ClientParsing.FindHTMLNodes( document, 'div', {} )[0]
+            
+            self.assertEqual( ClientParsing.GetHTMLNodeHTML( div ), expected_html )
+            
+        
+        html = '<!DOCTYPE html><!-- top --><html><head><title>t</title></head><body><p>text</p></body></html>'
+        
+        ( soup, lxml_document ) = self._GetDocuments( html )
+        
+        self.assertEqual( ClientParsing.GetHTMLNodeHTML( lxml_document ), ClientParsing.GetHTMLNodeHTML( soup ) )
+        
+        ( soup, lxml_document ) = self._GetDocuments( '<p>text</p>' )
+        
+        self.assertEqual( ClientParsing.GetHTMLNodeHTML( lxml_document ), '<html><head></head><body><p>text</p></body></html>' )
+        self.assertEqual( ClientParsing.GetHTMLNodeHTML( lxml_document ), ClientParsing.GetHTMLNodeHTML( soup ) )
+        
+    
+    @unittest.skipUnless( ClientParsing.HTML5LIB_IS_OK and ClientParsing.LXML_IS_OK, 'html5lib or lxml is not available' )
+    def test_tbody( self ):
+        
+        html = '<table><tr><td>a</td></tr><tr><td>b</td></tr></table>'
+        
+        for document in self._GetDocuments( html ):
+            
+            tbodies = ClientParsing.FindHTMLNodes( document, 'tbody', {} )
+            
+            self.assertEqual( len( tbodies ), 1 )
+            
+            tds = ClientParsing.FindHTMLNodes( tbodies[0], 'td', {} )
+            
+            self.assertEqual( [ ClientParsing.GetHTMLTagString( td ) for td in tds ], [ 'a', 'b' ] )
+            
+            row = ClientParsing.GetHTMLNodeParent( tds[0] )
+            
+            self.assertEqual( ClientParsing.GetHTMLNodeName( ClientParsing.GetHTMLNodeParent( row ) ), 'tbody' )
+            
+        
+    
+    @unittest.skipUnless( ClientParsing.HTML5LIB_IS_OK and ClientParsing.LXML_IS_OK, 'html5lib or lxml is not available' )
+    def test_void_tags( self ):
+        
+        html = '<video><source src="a.mp4">fallback <b>text</b></video><p>x<wbr>y</p>'
+        
+        for document in self._GetDocuments( html ):
+            
+            source = ClientParsing.FindHTMLNodes( document, 'source', {} )[0]
+            
+            self.assertEqual( ClientParsing.GetHTMLTagString( source ), '' )
+            self.assertEqual( len( ClientParsing.FindHTMLNodes( source, None, {} ) ), 0 )
+            
+            b = ClientParsing.FindHTMLNodes( document, 'b', {} )[0]
+            
+            self.assertEqual( ClientParsing.GetHTMLNodeName( ClientParsing.GetHTMLNodeParent( b ) ), 'video' )
+            
+            wbr = ClientParsing.FindHTMLNodes( document, 'wbr', {} )[0]
+            
+            self.assertEqual( ClientParsing.GetHTMLNodeName( ClientParsing.GetHTMLNodeParent( wbr ) ), 'p' )
+            self.assertEqual( ClientParsing.GetHTMLTagString( wbr ), '' )
+            
+        
+    
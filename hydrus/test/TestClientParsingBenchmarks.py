@@ -0,0 +1,212 @@
+import json
+import os
+import time
+import unittest
+
+from hydrus.client import ClientCaches
+from hydrus.client import ClientDefaults
+from hydrus.client import ClientParsing
+from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
+
+# runs every default parser over some pages with each html backend we have, with and without the parse result cache
+# to run it on real pages, point HYDRUS_BENCHMARK_PAGE_DIR at a folder of saved html and json, and run 'python test.py benchmarks'
+
+PAGE_DIR_ENV_VAR = 'HYDRUS_BENCHMARK_PAGE_DIR'
+
+SYNTHETIC_NUM_TAGS = 150
+SYNTHETIC_NUM_THUMBNAILS = 100
+SYNTHETIC_NUM_POSTS = 300
+
+# a watcher or subscription check sees the same page again, so we parse everything a few times
+NUM_PASSES = 3
+
+def GetRealPages():
+    
+    pages = []
+    
+    page_dir = os.environ.get( PAGE_DIR_ENV_VAR, None )
+    
+    if page_dir is None:
+        
+        return pages
+        
+    
+    for filename in sorted( os.listdir( page_dir ) ):
+        
+        path = os.path.join( page_dir, filename )
+        
+        if not os.path.isfile( path ):
+            
+            continue
+            
+        
+        with open( path, 'r', encoding = 'utf-8', errors = 'replace' ) as f:
+            
+            pages.append( ( filename, f.read() ) )
+            
+        
+    
+    return pages
+    
+def GetSyntheticPages():
+    
+    tag_types = ( 'artist', 'copyright', 'character', 'general', 'meta' )
+    
+    tag_rows = ''.join( '<li class="tag-type-{} tag"><a class="search-tag" href="/posts?tags=tag_{}">tag {}</a> <span class="post-count">{}</span></li>'.format( tag_types[ i % len( tag_types ) ], i, i, i * 17 ) for i in range( SYNTHETIC_NUM_TAGS ) )
+    thumbnails = ''.join( '<article id="post_{}" class="post-preview thumb" data-id="{}"><a href="/posts/{}"><img src="/thumbs/{}.jpg" alt="post {}"></a></article>'.format( i, i, i, i, i ) for i in range( SYNTHETIC_NUM_THUMBNAILS ) )
+    
+    booru_html = '<!DOCTYPE html><html><head><title>post 123456</title><meta property="og:image" content="https://example.com/images/123456.jpg"></head><body><section id="tag-list"><ul>{}</ul></section><section id="post-information"><ul><li>Rating: Safe</li><li>Source: <a href="https://example.com/source">link</a></li></ul></section><div id="posts">{}</div><div class="paginator"><a rel="next" href="/posts?page=2">next</a></div><img id="image" src="https://example.com/images/123456.jpg"></body></html>'.format( tag_rows, thumbnails )
+    
+    posts = [ { 'no' : i, 'time' : 1600000000 + i, 'com' : 'comment {}'.format( i ), 'filename' : 'file {}'.format( i ), 'ext' : '.jpg', 'tim' : 1600000000000 + i, 'md5' : 'AAAAAAAAAAAAAAAAAAAAAA==' } for i in range( SYNTHETIC_NUM_POSTS ) ]
+    
+    thread_json = json.dumps( { 'posts' : posts } )
+    
+    return [ ( 'synthetic booru page', booru_html ), ( 'synthetic thread json', thread_json ) ]
+    
+class SoupParsingCache( ClientCaches.ParsingCache ):
+    
+    # what we had before, with everything going through bs4
+    
+    def __init__( self ):
+        
+        ClientCaches.ParsingCache.__init__( self )
+        
+        self._html_to_soups = {}
+        
+    
+    def GetHTMLDocument( self, html ):
+        
+        if html not in self._html_to_soups:
+            
+            self._html_to_soups[ html ] = ClientParsing.GetSoup( html )
+            
+        
+        return self._html_to_soups[ html ]
+        
+    
+    def GetParseResults( self, formula, parsing_text, parse_callable ):
+        
+        return parse_callable()
+        
+    
+class LXMLParsingCache( ClientCaches.ParsingCache ):
+    
+    # the lxml backend whatever the option says, with no results cache
+    
+    def __init__( self ):
+        
+        ClientCaches.ParsingCache.__init__( self )
+        
+        self._html_to_lxml_documents = {}
+        
+    
+    def GetHTMLDocument( self, html ):
+        
+        if html not in self._html_to_lxml_documents:
+            
+            self._html_to_lxml_documents[ html ] = ClientParsing.GetLXMLDocument( html )
+            
+        
+        return self._html_to_lxml_documents[ html ]
+        
+    
+    def GetParseResults( self, formula, parsing_text, parse_callable ):
+        
+        return parse_callable()
+        
+    
+class TestParsingBenchmark( unittest.TestCase ):
+    
+    def _ParseEverything( self, parsers, pages ):
+        
+        all_results = []
+        
+        for ( name, page ) in pages:
+            
+            for parser in parsers:
+                
+                try:
+                    
+                    results = parser.Parse( { 'url' : 'https://example.com/posts/123456' }, page )
+                    
+                except Exception as e:
+                    
+                    results = [ 'error: {}'.format( repr( e ) ) ]
+                    
+                
+                all_results.append( [ repr( result ) for result in results ] )
+                
+            
+        
+        return all_results
+        
+    
+    def test_default_parsers( self ):
+        
+        pages = GetRealPages()
+        
+        if len( pages ) == 0:
+            
+            pages = GetSyntheticPages()
+            
+        
+        parsers = ClientDefaults.GetDefaultParsers()
+        
+        configs = []
+        
+        if ClientParsing.HTML5LIB_IS_OK or ClientParsing.LXML_IS_OK:
+            
+            configs.append( ( 'bs4, no results cache', SoupParsingCache() ) )
+            
+        
+        if ClientParsing.LXML_IS_OK:
+            
+            configs.append( ( 'lxml, no results cache', LXMLParsingCache() ) )
+            
+        
+        configs.append( ( 'default backend, with results cache', ClientCaches.ParsingCache() ) )
+        
+        HydrusData.Print( '{} parsers over {} pages, {} passes:'.format( HydrusData.ToHumanInt( len( parsers ) ), HydrusData.ToHumanInt( len( pages ) ), NUM_PASSES ) )
+        
+        original_parsing_cache = HG.client_controller.parsing_cache
+        
+        expected_results = None
+        
+        try:
+            
+            for ( name, parsing_cache ) in configs:
+                
+                HG.client_controller.parsing_cache = parsing_cache
+                
+                pass_times = []
+                
+                for i in range( NUM_PASSES ):
+                    
+                    started = time.perf_counter()
+                    
+                    all_results = self._ParseEverything( parsers, pages )
+                    
+                    pass_times.append( time.perf_counter() - started )
+                    
+                    # every backend and the cache have to give the same answers
+                    
+                    if expected_results is None:
+                        
+                        expected_results = all_results
+                        
+                    else:
+                        
+                        self.assertEqual( all_results, expected_results )
+                        
+                    
+                
+                HydrusData.Print( '{}: first pass in {}, repeat passes in {}'.format( name, HydrusData.TimeDeltaToPrettyTimeDelta( pass_times[0] ), ', '.join( ( HydrusData.TimeDeltaToPrettyTimeDelta( pass_time ) for pass_time in pass_times[ 1 : ] ) ) ) )
+                
+            
+        finally:
+            
+            HG.client_controller.parsing_cache = original_parsing_cache
+            
+        
+    
@@ -1206,6 +1206,8 @@ class TestTagParents( unittest.TestCase ):
         
         HG.test_controller.SetRead( 'tag_parents', tag_parents )
         
+        cls._tag_parents = tag_parents
+        
         cls._tag_parents_manager = ClientManagers.TagParentsManager( HG.client_controller )
         
     
@@ -1317,6 +1319,64 @@ class TestTagParents( unittest.TestCase ):
         self.assertEqual( self._tag_parents_manager.ExpandTags( CC.COMBINED_TAG_SERVICE_KEY, [ 'pending_b' ] ), { 'pending_b' } )
         
     
+    def test_update( self ):
+        
+        tag_parents_manager = ClientManagers.TagParentsManager( HG.client_controller )
+        
+        # mother gets a new parent, cousin loses aunt, and the loop gets broken so its held-back pair can go in
+        
+        service_keys_to_children_and_pairs = {}
+        
+        service_keys_to_children_and_pairs[ self._first_key ] = ( { 'mother', 'cousin', 'loop_b' }, { ( 'mother', 'grandmother' ), ( 'mother', 'grandfather' ), ( 'mother', 'great grandmother' ), ( 'cousin', 'uncle' ) } )
+        
+        tag_parents_manager.NotifyNewParents( service_keys_to_children_and_pairs )
+        
+        self.assertEqual( set( tag_parents_manager.GetParents( self._first_key, 'child' ) ), { 'mother', 'father', 'grandmother', 'grandfather', 'great grandmother' } )
+        self.assertEqual( set( tag_parents_manager.GetParents( CC.COMBINED_TAG_SERVICE_KEY, 'sister' ) ), { 'mother', 'father', 'grandmother', 'grandfather', 'great grandmother' } )
+        self.assertEqual( set( tag_parents_manager.GetParents( CC.COMBINED_TAG_SERVICE_KEY, 'cousin' ) ), { 'uncle' } )
+        self.assertEqual( set( tag_parents_manager.GetParents( CC.COMBINED_TAG_SERVICE_KEY, 'loop_c' ) ), { 'loop_a', 'loop_b' } )
+        
+        # the same result as building it all from scratch
+        
+        tag_parents = collections.defaultdict( HydrusData.default_dict_set )
+        
+        for ( service_key, statuses_to_pairs ) in self._tag_parents.items():
+            
+            for ( status, pairs ) in statuses_to_pairs.items():
+                
+                tag_parents[ service_key ][ status ] = set( pairs )
+                
+            
+        
+        for ( service_key, ( children, pairs ) ) in service_keys_to_children_and_pairs.items():
+            
+            statuses_to_pairs = tag_parents[ service_key ]
+            
+            statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ] = { pair for pair in statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ] if pair[0] not in children }.union( pairs )
+            
+        
+        HG.test_controller.SetRead( 'tag_parents', tag_parents )
+        
+        try:
+            
+            fresh_tag_parents_manager = ClientManagers.TagParentsManager( HG.client_controller )
+            
+        finally:
+            
+            HG.test_controller.SetRead( 'tag_parents', self._tag_parents )
+            
+        
+        all_tags = { tag for statuses_to_pairs in tag_parents.values() for pairs in statuses_to_pairs.values() for pair in pairs for tag in pair }
+        
+        for service_key in ( self._first_key, self._second_key, self._third_key, CC.COMBINED_TAG_SERVICE_KEY ):
+            
+            for tag in all_tags:
+                
+                self.assertEqual( set( tag_parents_manager.GetParents( service_key, tag ) ), set( fresh_tag_parents_manager.GetParents( service_key, tag ) ) )
+                
+            
+        
+    
 class TestTagSiblings( unittest.TestCase ):
     
     @classmethod
@@ -1344,6 +1404,8 @@ class TestTagSiblings( unittest.TestCase ):
         
         HG.test_controller.SetRead( 'tag_siblings', tag_siblings )
         
+        cls._tag_siblings = tag_siblings
+        
         cls._tag_siblings_manager = ClientManagers.TagSiblingsManager( HG.test_controller )
         
     
@@ -1490,3 +1552,67 @@ class TestTagSiblings( unittest.TestCase ):
         self.assertEqual( self._tag_siblings_manager.CollapseTagsToCount( self._first_key, { 'tree_1' : 10, 'tree_2' : 3, 'tree_3' : 5, 'tree_4' : 2, 'tree_5' : 20, 'tree_6' : 30 } ), { 'tree_6' : 70 } )
         
     
+        
+    
+    def test_update( self ):
+        
+        tag_siblings_manager = ClientManagers.TagSiblingsManager( HG.test_controller )
+        
+        # the chain gets longer, the tree loses its top, and the repository's pending pair is rescinded
+        
+        service_keys_to_bad_tags_and_pairs = {}
+        
+        service_keys_to_bad_tags_and_pairs[ self._first_key ] = ( { 'chain_c', 'tree_5' }, { ( 'chain_c', 'chain_d' ) } )
+        service_keys_to_bad_tags_and_pairs[ self._second_key ] = ( { 'pending_a' }, set() )
+        
+        tag_siblings_manager.NotifyNewSiblings( service_keys_to_bad_tags_and_pairs )
+        
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'chain_a' ), 'chain_d' )
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'tree_1' ), 'tree_5' )
+        self.assertEqual( tag_siblings_manager.GetSibling( self._first_key, 'tree_6' ), None )
+        self.assertEqual( tag_siblings_manager.GetSibling( self._second_key, 'pending_a' ), None )
+        self.assertEqual( set( tag_siblings_manager.GetAllSiblings( CC.COMBINED_TAG_SERVICE_KEY, 'chain_d' ) ), { 'chain_a', 'chain_b', 'chain_c', 'chain_d' } )
+        
+        # the same result as building it all from scratch
+        
+        tag_siblings = collections.defaultdict( HydrusData.default_dict_set )
+        
+        for ( service_key, statuses_to_pairs ) in self._tag_siblings.items():
+            
+            for ( status, pairs ) in statuses_to_pairs.items():
+                
+                tag_siblings[ service_key ][ status ] = set( pairs )
+                
+            
+        
+        for ( service_key, ( bad_tags, pairs ) ) in service_keys_to_bad_tags_and_pairs.items():
+            
+            statuses_to_pairs = tag_siblings[ service_key ]
+            
+            statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ] = { pair for pair in statuses_to_pairs[ HC.CONTENT_STATUS_CURRENT ] if pair[0] not in bad_tags }.union( pairs )
+            statuses_to_pairs[ HC.CONTENT_STATUS_PENDING ] = { pair for pair in statuses_to_pairs[ HC.CONTENT_STATUS_PENDING ] if pair[0] not in bad_tags }
+            
+        
+        HG.test_controller.SetRead( 'tag_siblings', tag_siblings )
+        
+        try:
+            
+            fresh_tag_siblings_manager = ClientManagers.TagSiblingsManager( HG.test_controller )
+            
+        finally:
+            
+            HG.test_controller.SetRead( 'tag_siblings', self._tag_siblings )
+            
+        
+        all_tags = { tag for statuses_to_pairs in tag_siblings.values() for pairs in statuses_to_pairs.values() for pair in pairs for tag in pair }
+        
+        for service_key in ( self._first_key, self._second_key, CC.COMBINED_TAG_SERVICE_KEY ):
+            
+            for tag in all_tags:
+                
+                self.assertEqual( tag_siblings_manager.GetSibling( service_key, tag ), fresh_tag_siblings_manager.GetSibling( service_key, tag ) )
+                self.assertEqual( set( tag_siblings_manager.GetAllSiblings( service_key, tag ) ), set( fresh_tag_siblings_manager.GetAllSiblings( service_key, tag ) ) )
+                
+            
+        
+    
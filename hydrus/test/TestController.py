@@ -26,10 +26,12 @@ from hydrus.core import HydrusPubSub
 from hydrus.core import HydrusSessions
 from hydrus.core import HydrusThreading
 from hydrus.test import TestClientAPI
+from hydrus.test import TestClientCaches
 from hydrus.test import TestClientConstants
 from hydrus.test import TestClientDaemons
 from hydrus.test import TestClientData
 from hydrus.test import TestClientDB
+from hydrus.test import TestClientDBBenchmarks
 from hydrus.test import TestClientDBDuplicates
 from hydrus.test import TestClientImageHandling
 from hydrus.test import TestClientImportOptions
@@ -38,13 +40,17 @@ from hydrus.test import TestClientListBoxes
 from hydrus.test import TestClientMigration
 from hydrus.test import TestClientNetworking
 from hydrus.test import TestClientParsing
+from hydrus.test import TestClientParsingBenchmarks
 from hydrus.test import TestClientTags
 from hydrus.test import TestClientThreading
 from hydrus.test import TestDialogs
 from hydrus.test import TestFunctions
+from hydrus.test import TestHydrusDB
 from hydrus.test import TestHydrusNetworking
 from hydrus.test import TestHydrusSerialisable
+from hydrus.test import TestHydrusSerialisableBenchmarks
 from hydrus.test import TestHydrusServer
+from hydrus.test import TestHydrusVideoHandling
 from hydrus.test import TestHydrusSessions
 from hydrus.test import TestServerDB
 from hydrus.client import ClientCaches
@@ -652,6 +658,7 @@ class Controller( object ):
             TestClientListBoxes,
             TestClientAPI,
             TestClientDaemons,
+            TestClientCaches,
             TestClientConstants,
             TestClientData,
             TestClientImportOptions,
@@ -662,12 +669,14 @@ class Controller( object ):
             TestHydrusSerialisable,
             TestHydrusSessions,
             TestClientDB,
+            TestHydrusDB,
             TestServerDB,
             TestClientDBDuplicates,
             TestClientNetworking,
             TestHydrusNetworking,
             TestClientImportSubscriptions,
             TestClientImageHandling,
+            TestHydrusVideoHandling,
             TestClientMigration,
             TestHydrusServer
         ]
@@ -686,6 +695,7 @@ class Controller( object ):
         ]
         
         module_lookup[ 'data' ] = [
+            TestClientCaches,
             TestClientConstants,
             TestClientData,
             TestClientImportOptions,
@@ -703,6 +713,7 @@ class Controller( object ):
         
         module_lookup[ 'db' ] = [
             TestClientDB,
+            TestHydrusDB,
             TestClientDBDuplicates,
             TestServerDB
         ]
@@ -721,7 +732,8 @@ class Controller( object ):
         ]
         
         module_lookup[ 'image' ] = [
-            TestClientImageHandling
+            TestClientImageHandling,
+            TestHydrusVideoHandling
         ]
         
         module_lookup[ 'migration' ] = [
@@ -732,6 +744,12 @@ class Controller( object ):
             TestHydrusServer
         ]
         
+        module_lookup[ 'benchmarks' ] = [
+            TestClientDBBenchmarks,
+            TestClientParsingBenchmarks,
+            TestHydrusSerialisableBenchmarks
+        ]
+        
         if run_all:
             
             modules = module_lookup[ 'all' ]
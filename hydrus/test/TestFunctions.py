@@ -1,9 +1,13 @@
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusGlobals as HG
 from hydrus.client import ClientData
+from hydrus.client import ClientDBIdCache
+from hydrus.client import ClientDBTagBitmaps
 from hydrus.client import ClientTags
+import os
 import unittest
 from hydrus.core import HydrusData
+from hydrus.core import HydrusFileHandling
 from hydrus.client import ClientConstants as CC
 
 class TestFunctions( unittest.TestCase ):
@@ -51,3 +55,116 @@ class TestFunctions( unittest.TestCase ):
         self.assertEqual( i_pretty, '123,456,789' )
         
     
+    def test_file_hashes( self ):
+        
+        for filename in ( 'muh_jpg.jpg', 'muh_mp4.mp4' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            ( sha256, md5, sha1, sha512, header ) = HydrusFileHandling.GetHashesAndHeaderFromPath( path )
+            
+            self.assertEqual( sha256, HydrusFileHandling.GetHashFromPath( path ) )
+            self.assertEqual( ( md5, sha1, sha512 ), HydrusFileHandling.GetExtraHashesFromPath( path ) )
+            
+            with open( path, 'rb' ) as f:
+                
+                self.assertEqual( header, f.read( 256 ) )
+                
+            
+            self.assertEqual( HydrusFileHandling.GetMime( path, bit_to_check = header ), HydrusFileHandling.GetMime( path ) )
+            
+        
+    
+    def test_hamming_distances( self ):
+        
+        phashes = [ os.urandom( 8 ) for i in range( 50 ) ]
+        
+        phash = phashes[0]
+        
+        distances = HydrusData.Get64BitHammingDistances( phash, b''.join( phashes ) )
+        
+        self.assertEqual( distances.tolist(), [ HydrusData.Get64BitHammingDistance( phash, p ) for p in phashes ] )
+        
+        self.assertEqual( HydrusData.Get64BitHammingDistances( phash, [ phash ] ).tolist(), [ 0 ] )
+        self.assertEqual( HydrusData.Get64BitHammingDistances( b'\x00' * 8, [ b'\xff' * 8 ] ).tolist(), [ 64 ] )
+        
+        matrix = HydrusData.Get64BitHammingDistanceMatrix( phashes[:10], phashes )
+        
+        self.assertEqual( matrix.shape, ( 10, 50 ) )
+        self.assertEqual( matrix.tolist(), [ [ HydrusData.Get64BitHammingDistance( p1, p2 ) for p2 in phashes ] for p1 in phashes[:10] ] )
+        
+    
+    def test_id_cache( self ):
+        
+        hashes = [ HydrusData.GenerateKey() for i in range( 100 ) ]
+        
+        cache = ClientDBIdCache.IdCache( 'test', 50 * ( ClientDBIdCache.ENTRY_OVERHEAD + 32 ) )
+        
+        cache.AddPairs( enumerate( hashes[:50] ) )
+        
+        self.assertEqual( cache.GetValue( 3 ), hashes[3] )
+        self.assertEqual( cache.GetId( hashes[3] ), 3 )
+        
+        ( ids_to_values, uncached_ids ) = cache.GetIdsToValues( [ 3, 4, 75 ] )
+        
+        self.assertEqual( ids_to_values, { 3 : hashes[3], 4 : hashes[4] } )
+        self.assertEqual( uncached_ids, { 75 } )
+        
+        # we are full, so new entries push out old unreferenced ones, and the recently used ones get a second chance
+        
+        cache.AddPairs( [ ( 60, hashes[60] ) ] )
+        
+        self.assertEqual( cache.GetValue( 0 ), None )
+        self.assertEqual( cache.GetValue( 3 ), hashes[3] )
+        self.assertEqual( cache.GetId( hashes[60] ), 60 )
+        
+        cache.AddPairs( enumerate( hashes ) )
+        
+        ( values_to_ids, uncached_values ) = cache.GetValuesToIds( hashes )
+        
+        self.assertEqual( len( values_to_ids ), 50 )
+        self.assertEqual( len( uncached_values ), 50 )
+        self.assertTrue( all( hashes[ id ] == value for ( value, id ) in values_to_ids.items() ) )
+        
+        cache.Clear()
+        
+        self.assertEqual( cache.GetValue( 3 ), None )
+        
+    
+    @unittest.skipUnless( ClientDBTagBitmaps.ROARING_OK, 'pyroaring is not available' )
+    def test_tag_bitmap_index( self ):
+        
+        BitMap = ClientDBTagBitmaps.BitMap
+        
+        small_size = ClientDBTagBitmaps.GetBitmapMemoryUsage( BitMap( range( 10 ) ) )
+        
+        index = ClientDBTagBitmaps.TagBitmapIndex( 'test', 3 * small_size + 100 )
+        
+        # updates for keys we do not hold are ignored, since the next search fetches them fresh
+        
+        index.AddIds( 'a', [ 1, 2, 3 ] )
+        
+        self.assertEqual( index.GetBitmap( 'a' ), None )
+        
+        index.SetBitmap( 'a', BitMap( range( 10 ) ) )
+        index.SetBitmap( 'b', BitMap( range( 10, 20 ) ) )
+        
+        index.AddIds( 'a', { 50, 51 } )
+        index.DeleteIds( 'a', { 0, 1 } )
+        
+        self.assertEqual( set( index.GetBitmap( 'a' ) ), set( range( 2, 10 ) ) | { 50, 51 } )
+        
+        # 'a' was used more recently than 'b', so 'b' goes first when we run out of room
+        
+        index.SetBitmap( 'c', BitMap( range( 20, 30 ) ) )
+        index.SetBitmap( 'd', BitMap( range( 30, 40 ) ) )
+        
+        self.assertEqual( index.GetBitmap( 'b' ), None )
+        self.assertNotEqual( index.GetBitmap( 'a' ), None )
+        self.assertEqual( set( index.GetBitmap( 'd' ) ), set( range( 30, 40 ) ) )
+        
+        index.Clear()
+        
+        self.assertEqual( index.GetBitmap( 'a' ), None )
+        
+    
@@ -0,0 +1,189 @@
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusDB
+from hydrus.core import HydrusData
+from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusPaths
+import threading
+import time
+import unittest
+
+class ReadPoolTestDB( HydrusDB.HydrusDB ):
+    
+    READ_POOL_SIZE = 2
+    
+    def _CreateDB( self ):
+        
+        self._c.execute( 'CREATE TABLE version ( version INTEGER );' )
+        
+        self._c.execute( 'INSERT INTO version ( version ) VALUES ( ? );', ( HC.SOFTWARE_VERSION, ) )
+        
+        self._c.execute( 'CREATE TABLE numbers ( number INTEGER );' )
+        
+    
+    def _ManageDBError( self, job, e ):
+        
+        if job.IsSynchronous():
+            
+            job.PutResult( e )
+            
+        
+    
+    def _Read( self, action, *args, **kwargs ):
+        
+        if action == 'numbers':
+            
+            numbers = self._STL( self._c.execute( 'SELECT number FROM numbers ORDER BY number;' ) )
+            
+        elif action == 'numbers_slowly':
+            
+            ( started_event, release_event ) = args
+            
+            numbers = self._STL( self._c.execute( 'SELECT number FROM numbers ORDER BY number;' ) )
+            
+            started_event.set()
+            
+            release_event.wait( 10 )
+            
+        
+        # whether we were on a pooled read-only connection or the main db thread
+        return ( self._is_read_only_view, numbers )
+        
+    
+    def _Write( self, action, *args, **kwargs ):
+        
+        if action == 'number':
+            
+            ( number, ) = args
+            
+            self._c.execute( 'INSERT INTO numbers ( number ) VALUES ( ? );', ( number, ) )
+            
+        
+    
+class TestReadPool( unittest.TestCase ):
+    
+    def setUp( self ):
+        
+        self._db_dir = HydrusPaths.GetTempDir()
+        
+    
+    def tearDown( self ):
+        
+        HydrusPaths.DeletePath( self._db_dir )
+        
+    
+    def _ShutdownDB( self, db ):
+        
+        db.Shutdown()
+        
+        while not db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+    
+    def test_no_read_connections( self ):
+        
+        HG.db_read_connections = 0
+        
+        try:
+            
+            db = ReadPoolTestDB( HG.test_controller, self._db_dir, 'test' )
+            
+        finally:
+            
+            HG.db_read_connections = None
+            
+        
+        try:
+            
+            db.Write( 'number', True, 1 )
+            
+            # with no pool, every read goes through the main db thread
+            
+            self.assertEqual( db._read_connections, [] )
+            
+            for i in range( 3 ):
+                
+                self.assertEqual( db.Read( 'numbers' ), ( False, [ 1 ] ) )
+                
+            
+        finally:
+            
+            self._ShutdownDB( db )
+            
+        
+    
+    def test_read_pool( self ):
+        
+        db = ReadPoolTestDB( HG.test_controller, self._db_dir, 'test' )
+        
+        try:
+            
+            db.Write( 'number', True, 1 )
+            
+            # the pool can only see committed work, so a read straight after a write goes to the main db thread, which then commits early
+            
+            self.assertEqual( db.Read( 'numbers' ), ( False, [ 1 ] ) )
+            
+            give_up_time = HydrusData.GetNowPrecise() + 10
+            
+            while True:
+                
+                ( read_on_pool, numbers ) = db.Read( 'numbers' )
+                
+                self.assertEqual( numbers, [ 1 ] )
+                
+                if read_on_pool:
+                    
+                    break
+                    
+                
+                self.assertFalse( HydrusData.TimeHasPassedPrecise( give_up_time ), 'Reads never moved to the read pool!' )
+                
+                time.sleep( 0.1 )
+                
+            
+            # now a slow read on the pool does not hold up the main db thread, which can take and commit a write while it runs
+            
+            started_event = threading.Event()
+            release_event = threading.Event()
+            
+            slow_read_results = []
+            
+            slow_read_thread = threading.Thread( target = lambda: slow_read_results.append( db.Read( 'numbers_slowly', started_event, release_event ) ) )
+            
+            slow_read_thread.start()
+            
+            self.assertTrue( started_event.wait( 5 ) )
+            
+            write_thread = threading.Thread( target = db.Write, args = ( 'number', True, 2 ) )
+            
+            write_thread.start()
+            
+            write_thread.join( 5 )
+            
+            self.assertFalse( write_thread.is_alive() )
+            
+            self.assertFalse( release_event.is_set() )
+            self.assertTrue( slow_read_thread.is_alive() )
+            
+            release_event.set()
+            
+            slow_read_thread.join( 5 )
+            
+            # the slow read ran on the pool, with the snapshot it started with
+            
+            self.assertEqual( slow_read_results, [ ( True, [ 1 ] ) ] )
+            
+            # and a read after the write sees it
+            
+            ( read_on_pool, numbers ) = db.Read( 'numbers' )
+            
+            self.assertEqual( numbers, [ 1, 2 ] )
+            
+        finally:
+            
+            self._ShutdownDB( db )
+            
+        
+    
@@ -3,6 +3,7 @@ from hydrus.client import ClientData
 from hydrus.client import ClientDefaults
 from hydrus.client import ClientDuplicates
 from hydrus.client.gui import ClientGUIShortcuts
+from hydrus.client.importing import ClientImportFileSeeds
 from hydrus.client.importing import ClientImportOptions
 from hydrus.client.importing import ClientImportSubscriptions
 from hydrus.client.importing import ClientImportSubscriptionQuery
@@ -13,9 +14,16 @@ from hydrus.client import ClientSearch
 from hydrus.client import ClientTags
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusSerialisable
 from hydrus.test import TestController as TC
 import unittest
+import zlib
+
+if HydrusSerialisable.LZ4_OK:
+    
+    import lz4.block
+    
 
 class TestSerialisables( unittest.TestCase ):
     
@@ -67,6 +75,21 @@ class TestSerialisables( unittest.TestCase ):
         
         test_func( obj, dupe_obj )
         
+        #
+        
+        for network_bytes_format in HydrusSerialisable.GetAvailableNetworkBytesFormats():
+            
+            network_bytes = obj.DumpToNetworkBytes( network_bytes_format = network_bytes_format )
+            
+            self.assertTrue( HydrusSerialisable.IsFramedNetworkBytes( network_bytes ) )
+            
+            dupe_obj = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+            
+            self.assertIsNot( obj, dupe_obj )
+            
+            test_func( obj, dupe_obj )
+            
+        
     
     def test_basics( self ):
         
@@ -123,6 +146,54 @@ class TestSerialisables( unittest.TestCase ):
         self._dump_and_load_and_test( db, test )
         
     
+    def test_network_bytes_formats( self ):
+        
+        d = HydrusSerialisable.SerialisableDictionary()
+        
+        d[ 'rows' ] = [ [ i, 'tag {}'.format( i ), [ i, i + 1 ] ] for i in range( 100 ) ]
+        
+        # what old clients and servers write and read
+        
+        legacy_network_bytes = d.DumpToNetworkBytes()
+        
+        self.assertFalse( HydrusSerialisable.IsFramedNetworkBytes( legacy_network_bytes ) )
+        self.assertEqual( HydrusSerialisable.CreateFromString( zlib.decompress( legacy_network_bytes ).decode( 'utf-8' ) )[ 'rows' ], d[ 'rows' ] )
+        
+        for network_bytes in [ legacy_network_bytes ] + [ d.DumpToNetworkBytes( network_bytes_format = network_bytes_format ) for network_bytes_format in HydrusSerialisable.GetAvailableNetworkBytesFormats() ]:
+            
+            dupe_d = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+            
+            self.assertEqual( dupe_d[ 'rows' ], d[ 'rows' ] )
+            
+        
+        if HydrusSerialisable.LZ4_OK:
+            
+            lz4_network_bytes = lz4.block.compress( bytes( d.DumpToString(), 'utf-8' ) )
+            
+            self.assertEqual( len( HydrusSerialisable.CreateFromNetworkBytes( lz4_network_bytes )[ 'rows' ] ), 100 )
+            
+        
+        # a frame from a future version, or one we do not have the library for, should say so
+        
+        ( compression, encoding ) = ( HydrusSerialisable.NETWORK_BYTES_COMPRESSION_ZLIB, HydrusSerialisable.NETWORK_BYTES_ENCODING_JSON )
+        
+        framed_network_bytes = d.DumpToNetworkBytes( network_bytes_format = ( compression, encoding ) )
+        
+        future_network_bytes = bytes( ( HydrusSerialisable.NETWORK_BYTES_FRAME_MARKER, HydrusSerialisable.NETWORK_BYTES_FRAME_VERSION + 1 ) ) + framed_network_bytes[ 2 : ]
+        
+        with self.assertRaises( HydrusExceptions.SerialisationException ):
+            
+            HydrusSerialisable.CreateFromNetworkBytes( future_network_bytes )
+            
+        
+        unknown_compression_network_bytes = framed_network_bytes[ : 2 ] + bytes( ( 200, encoding ) ) + framed_network_bytes[ 4 : ]
+        
+        with self.assertRaises( HydrusExceptions.SerialisationException ):
+            
+            HydrusSerialisable.CreateFromNetworkBytes( unknown_compression_network_bytes )
+            
+        
+    
     def test_SERIALISABLE_TYPE_APPLICATION_COMMAND( self ):
         
         def test( obj, dupe_obj ):
@@ -382,6 +453,83 @@ class TestSerialisables( unittest.TestCase ):
         assertSCUEqual( result, scu )
         
     
+    def test_SERIALISABLE_TYPE_FILE_SEED_CACHE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( [ file_seed.file_seed_data for file_seed in obj.GetFileSeeds() ], [ file_seed.file_seed_data for file_seed in dupe_obj.GetFileSeeds() ] )
+            self.assertEqual( [ file_seed.status for file_seed in obj.GetFileSeeds() ], [ file_seed.status for file_seed in dupe_obj.GetFileSeeds() ] )
+            self.assertEqual( obj.GetStatus().GetStatusesToCounts(), dupe_obj.GetStatus().GetStatusesToCounts() )
+            self.assertEqual( obj.GetNextFileSeed( CC.STATUS_UNKNOWN ), dupe_obj.GetNextFileSeed( CC.STATUS_UNKNOWN ) )
+            
+        
+        file_seed_cache = ClientImportFileSeeds.FileSeedCache()
+        
+        file_seeds = [ ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://site.com/{}'.format( i ) ) for i in range( 10 ) ]
+        
+        self.assertEqual( file_seed_cache.AddFileSeeds( file_seeds ), 10 )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[0] )
+        self.assertEqual( file_seed_cache.GetNextFileSeeds( CC.STATUS_UNKNOWN, 3 ), file_seeds[:3] )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 10 )
+        
+        for file_seed in ( file_seeds[0], file_seeds[5], file_seeds[2] ):
+            
+            file_seed.SetStatus( CC.STATUS_SUCCESSFUL_AND_NEW )
+            
+            file_seed_cache.NotifyFileSeedsUpdated( ( file_seed, ) )
+            
+        
+        file_seeds[1].SetStatus( CC.STATUS_ERROR )
+        
+        file_seed_cache.NotifyFileSeedsUpdated( ( file_seeds[1], ) )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[3] )
+        self.assertEqual( file_seed_cache.GetFileSeeds( CC.STATUS_SUCCESSFUL_AND_NEW ), [ file_seeds[0], file_seeds[2], file_seeds[5] ] )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 6 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_ERROR ), 1 )
+        self.assertEqual( file_seed_cache.GetStatus().GetStatusesToCounts(), { CC.STATUS_UNKNOWN : 6, CC.STATUS_SUCCESSFUL_AND_NEW : 3, CC.STATUS_ERROR : 1 } )
+        
+        # an importer that forgets to notify must not get the same seed back forever
+        
+        file_seeds[3].SetStatus( CC.STATUS_VETOED )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[4] )
+        self.assertEqual( file_seed_cache.GetFileSeeds( CC.STATUS_VETOED ), [ file_seeds[3] ] )
+        
+        file_seed_cache.RetryFailed()
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[1] )
+        
+        file_seed_cache.RemoveFileSeeds( ( file_seeds[1], file_seeds[4] ) )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ), file_seeds[6] )
+        self.assertEqual( file_seed_cache.GetFileSeedIndex( file_seeds[6] ), 4 )
+        self.assertEqual( file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN ), 4 )
+        
+        file_seed_cache.InsertFileSeeds( 0, ( ClientImportFileSeeds.FileSeed( ClientImportFileSeeds.FILE_SEED_TYPE_URL, 'https://site.com/inserted' ), ) )
+        
+        self.assertEqual( file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN ).file_seed_data, 'https://site.com/inserted' )
+        
+        self._dump_and_load_and_test( file_seed_cache, test )
+        
+        # a change is saved even if nothing was notified of it
+        
+        dupe_file_seed_cache = HydrusSerialisable.CreateFromString( file_seed_cache.DumpToString() )
+        
+        dupe_file_seeds = dupe_file_seed_cache.GetFileSeeds()
+        
+        dupe_file_seeds[-1].SetStatus( CC.STATUS_DELETED, note = 'gone' )
+        
+        reloaded_file_seed_cache = HydrusSerialisable.CreateFromString( dupe_file_seed_cache.DumpToString() )
+        
+        reloaded_file_seed = reloaded_file_seed_cache.GetFileSeeds()[-1]
+        
+        self.assertEqual( reloaded_file_seed.status, CC.STATUS_DELETED )
+        self.assertEqual( reloaded_file_seed.note, 'gone' )
+        self.assertEqual( reloaded_file_seed_cache.GetFileSeedCount( CC.STATUS_DELETED ), 1 )
+        
+    
     def test_SERIALISABLE_TYPE_SHORTCUT( self ):
         
         def test( obj, dupe_obj ):
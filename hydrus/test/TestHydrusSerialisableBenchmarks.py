@@ -0,0 +1,149 @@
+import os
+import random
+import time
+import unittest
+
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusNetwork
+from hydrus.core import HydrusSerialisable
+
+# compares the old zlib json network bytes against every framed format we have the libraries for
+# to run it on real update files, point HYDRUS_BENCHMARK_UPDATE_DIR at a folder of them, for instance one of your client_files 'fxx' folders, and run 'python test.py benchmarks'
+
+UPDATE_DIR_ENV_VAR = 'HYDRUS_BENCHMARK_UPDATE_DIR'
+MAX_REAL_UPDATES = 20
+
+SYNTHETIC_NUM_MAPPING_ROWS = 250000
+SYNTHETIC_HASHES_PER_TAG = 50
+
+def GetRealUpdates():
+    
+    updates = []
+    
+    update_dir = os.environ.get( UPDATE_DIR_ENV_VAR, None )
+    
+    if update_dir is None:
+        
+        return updates
+        
+    
+    for filename in sorted( os.listdir( update_dir ) ):
+        
+        path = os.path.join( update_dir, filename )
+        
+        if not os.path.isfile( path ):
+            
+            continue
+            
+        
+        with open( path, 'rb' ) as f:
+            
+            network_bytes = f.read()
+            
+        
+        try:
+            
+            update = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+            
+        except:
+            
+            continue
+            
+        
+        if isinstance( update, ( HydrusNetwork.ContentUpdate, HydrusNetwork.DefinitionsUpdate ) ):
+            
+            updates.append( ( filename, update ) )
+            
+        
+        if len( updates ) >= MAX_REAL_UPDATES:
+            
+            break
+            
+        
+    
+    return updates
+    
+def GetSyntheticContentUpdate():
+    
+    content_update = HydrusNetwork.ContentUpdate()
+    
+    num_tags = SYNTHETIC_NUM_MAPPING_ROWS // SYNTHETIC_HASHES_PER_TAG
+    
+    for service_tag_id in range( num_tags ):
+        
+        service_hash_ids = sorted( random.sample( range( 10000000 ), SYNTHETIC_HASHES_PER_TAG ) )
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( service_tag_id, service_hash_ids ) ) )
+        
+    
+    return content_update
+    
+def GetFormatName( network_bytes_format ):
+    
+    if network_bytes_format is None:
+        
+        return 'unframed zlib json'
+        
+    
+    ( compression, encoding ) = network_bytes_format
+    
+    return '{} {}'.format( HydrusSerialisable.network_bytes_compression_string_lookup[ compression ], HydrusSerialisable.network_bytes_encoding_string_lookup[ encoding ] )
+    
+class TestNetworkBytesBenchmark( unittest.TestCase ):
+    
+    def test_network_bytes_formats( self ):
+        
+        updates = GetRealUpdates()
+        
+        if len( updates ) == 0:
+            
+            updates = [ ( 'synthetic {} row content update'.format( HydrusData.ToHumanInt( SYNTHETIC_NUM_MAPPING_ROWS ) ), GetSyntheticContentUpdate() ) ]
+            
+        
+        network_bytes_formats = [ None ] + HydrusSerialisable.GetAvailableNetworkBytesFormats()
+        
+        formats_to_totals = { network_bytes_format : [ 0, 0.0, 0.0 ] for network_bytes_format in network_bytes_formats }
+        
+        total_rows = 0
+        
+        for ( name, update ) in updates:
+            
+            total_rows += update.GetNumRows()
+            
+            expected_tuple = update.GetSerialisableTuple()
+            
+            for network_bytes_format in network_bytes_formats:
+                
+                started = time.perf_counter()
+                
+                network_bytes = update.DumpToNetworkBytes( network_bytes_format = network_bytes_format )
+                
+                encode_time = time.perf_counter() - started
+                
+                started = time.perf_counter()
+                
+                dupe_update = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+                
+                decode_time = time.perf_counter() - started
+                
+                self.assertEqual( dupe_update.GetNumRows(), update.GetNumRows() )
+                
+                totals = formats_to_totals[ network_bytes_format ]
+                
+                totals[0] += len( network_bytes )
+                totals[1] += encode_time
+                totals[2] += decode_time
+                
+            
+        
+        HydrusData.Print( '{} updates, {} rows:'.format( HydrusData.ToHumanInt( len( updates ) ), HydrusData.ToHumanInt( total_rows ) ) )
+        
+        for network_bytes_format in network_bytes_formats:
+            
+            ( size, encode_time, decode_time ) = formats_to_totals[ network_bytes_format ]
+            
+            HydrusData.Print( '{}: {}, encoded in {}, decoded in {}'.format( GetFormatName( network_bytes_format ), HydrusData.ToHumanBytes( size ), HydrusData.TimeDeltaToPrettyTimeDelta( encode_time ), HydrusData.TimeDeltaToPrettyTimeDelta( decode_time ) ) )
+            
+        
+    
@@ -309,6 +309,8 @@ class TestServer( unittest.TestCase ):
         
         self._test_local_booru_requests( connection, share_key, hashes[0], 200 )
         
+        self._test_local_booru_file_ranges( connection, share_key, hashes[0] )
+        
         #
         
         HG.test_controller.SetRead( 'local_booru_share_keys', [] )
@@ -320,6 +322,108 @@ class TestServer( unittest.TestCase ):
         self._test_local_booru_requests( connection, share_key, hashes[0], 404 )
         
     
+    def _test_local_booru_file_ranges( self, connection, share_key, hash ):
+        
+        request = '/file?share_key=' + share_key.hex() + '&hash=' + hash.hex()
+        
+        connection.request( 'GET', request )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( data, EXAMPLE_FILE )
+        self.assertEqual( response.getheader( 'Accept-Ranges' ), 'bytes' )
+        
+        etag = response.getheader( 'ETag' )
+        
+        self.assertEqual( etag, '"{}"'.format( hash.hex() ) )
+        
+        last_modified = response.getheader( 'Last-Modified' )
+        
+        self.assertIsNotNone( last_modified )
+        
+        # a seek
+        
+        connection.request( 'GET', request, headers = { 'Range' : 'bytes=100-199' } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        self.assertEqual( data, EXAMPLE_FILE[ 100 : 200 ] )
+        self.assertEqual( response.getheader( 'Content-Range' ), 'bytes 100-199/{}'.format( len( EXAMPLE_FILE ) ) )
+        
+        # the tail
+        
+        connection.request( 'GET', request, headers = { 'Range' : 'bytes=-50' } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        self.assertEqual( data, EXAMPLE_FILE[ -50 : ] )
+        
+        # past the end
+        
+        connection.request( 'GET', request, headers = { 'Range' : 'bytes={}-'.format( len( EXAMPLE_FILE ) + 10 ) } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 416 )
+        
+        # conditional
+        
+        connection.request( 'GET', request, headers = { 'If-None-Match' : etag } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        self.assertEqual( data, b'' )
+        
+        connection.request( 'GET', request, headers = { 'If-None-Match' : '"something else"' } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        
+        connection.request( 'GET', request, headers = { 'If-Modified-Since' : last_modified } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 304 )
+        
+        # If-Range on our etag gets the range, anything else gets the whole file
+        
+        connection.request( 'GET', request, headers = { 'Range' : 'bytes=100-199', 'If-Range' : etag } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 206 )
+        
+        connection.request( 'GET', request, headers = { 'Range' : 'bytes=100-199', 'If-Range' : '"something else"' } )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( data, EXAMPLE_FILE )
+        
+    
     def _test_local_booru_requests( self, connection, share_key, hash, expected_result ):
         
         requests = []
@@ -0,0 +1,82 @@
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusVideoHandling
+import unittest
+
+# what ffmpeg -skip_frame nokey -i video.mp4 -an -sn -vf showinfo -f null - prints to stderr, trimmed
+KEYFRAME_SHOWINFO_LINES = '''Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'video.mp4':
+  Duration: 00:00:25.00, start: 0.000000, bitrate: 540 kb/s
+    Stream #0:0(und): Video: h264 (High) (avc1 / 0x31637661), yuv420p, 640x360 [SAR 1:1 DAR 16:9], 536 kb/s, 25 fps, 25 tbr, 12800 tbn, 50 tbc (default)
+Stream mapping:
+  Stream #0:0 -> #0:0 (h264 (native) -> wrapped_avframe (native))
+[Parsed_showinfo_0 @ 0x55d3c8b2a0c0] config in time_base: 1/12800, frame_rate: 25/1
+[Parsed_showinfo_0 @ 0x55d3c8b2a0c0] config out time_base: 0/0, frame_rate: 0/0
+[Parsed_showinfo_0 @ 0x55d3c8b2a0c0] n:   0 pts:   -512 pts_time:-0.04   duration:    512 duration_time:0.04    fmt:yuv420p cl:left sar:1/1 s:640x360 i:P iskey:1 type:I checksum:6A1F2D3C plane_checksum:[0D2E5A10 5A2C6B7F 02E2D0A6] mean:[97 125 130] stdev:[52.9 6.1 7.8]
+[Parsed_showinfo_0 @ 0x55d3c8b2a0c0] n:   1 pts: 128000 pts_time:10      duration:    512 duration_time:0.04    fmt:yuv420p cl:left sar:1/1 s:640x360 i:P iskey:1 type:I checksum:2C44AE1B plane_checksum:[1F1B7C2D 3A5E18C9 50A7B6F1] mean:[95 125 131] stdev:[51.2 6.0 7.7]
+[Parsed_showinfo_0 @ 0x55d3c8b2a0c0] n:   2 pts: 256000 pts_time:20      duration:    512 duration_time:0.04    fmt:yuv420p cl:left sar:1/1 s:640x360 i:P iskey:1 type:I checksum:8B2E0D11 plane_checksum:[4C0E2B6A 1D2F3E4A 5B6C7D8E] mean:[96 125 130] stdev:[52.1 6.1 7.9]
+[Parsed_showinfo_0 @ 0x55d3c8b2a0c0] n:   3 pts: 128000 pts_time:10      duration:    512 duration_time:0.04    fmt:yuv420p cl:left sar:1/1 s:640x360 i:P iskey:1 type:I checksum:2C44AE1B plane_checksum:[1F1B7C2D 3A5E18C9 50A7B6F1] mean:[95 125 131] stdev:[51.2 6.0 7.7]
+frame=    4 fps=0.0 q=-0.0 Lsize=N/A time=00:00:20.04 bitrate=N/A speed= 245x
+video:2kB audio:0kB subtitle:0kB other streams:0kB global headers:0kB muxing overhead: unknown'''.splitlines()
+
+class TestVideoHandling( unittest.TestCase ):
+    
+    def _GetRenderer( self, mime, keyframe_timestamps, pos ):
+        
+        # we only want the seek logic here, so skip __init__, which launches ffmpeg
+        
+        renderer = HydrusVideoHandling.VideoRendererFFMPEG.__new__( HydrusVideoHandling.VideoRendererFFMPEG )
+        
+        renderer._mime = mime
+        renderer._keyframe_timestamps = keyframe_timestamps
+        renderer.fps = 25
+        renderer.pos = pos
+        
+        return renderer
+        
+    
+    def test_keyframe_timestamps( self ):
+        
+        # config lines and progress lines are skipped, negative times are clamped, and repeats are merged
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGKeyframeTimestamps( KEYFRAME_SHOWINFO_LINES ), [ 0.0, 10.0, 20.0 ] )
+        
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGKeyframeTimestamps( [] ), [] )
+        self.assertEqual( HydrusVideoHandling.ParseFFMPEGKeyframeTimestamps( [ '[Parsed_showinfo_0 @ 0x1] n:   0 pts: 0 pts_time:nan' ] ), [] )
+        
+    
+    def test_relaunch_to_jump_ahead( self ):
+        
+        keyframe_timestamps = HydrusVideoHandling.ParseFFMPEGKeyframeTimestamps( KEYFRAME_SHOWINFO_LINES )
+        
+        # 25fps, so the keyframes are at frames 0, 250 and 500
+        
+        renderer = self._GetRenderer( HC.VIDEO_MP4, keyframe_timestamps, 0 )
+        
+        # the last keyframe before these is the one we started from, so a relaunch would decode the same frames again
+        
+        self.assertFalse( renderer._ShouldRelaunchToJumpAhead( 30 ) )
+        self.assertFalse( renderer._ShouldRelaunchToJumpAhead( 249 ) )
+        
+        self.assertTrue( renderer._ShouldRelaunchToJumpAhead( 260 ) )
+        
+        # from just before a keyframe, a relaunch has to save more than a process launch is worth
+        
+        renderer = self._GetRenderer( HC.VIDEO_MP4, keyframe_timestamps, 220 )
+        
+        self.assertFalse( renderer._ShouldRelaunchToJumpAhead( 250 ) )
+        self.assertFalse( renderer._ShouldRelaunchToJumpAhead( 400 ) )
+        
+        renderer = self._GetRenderer( HC.VIDEO_MP4, keyframe_timestamps, 219 )
+        
+        self.assertTrue( renderer._ShouldRelaunchToJumpAhead( 250 ) )
+        
+        self.assertTrue( renderer._ShouldRelaunchToJumpAhead( 510 ) )
+        
+        # with no keyframe info, or for gifs, which cannot seek, we fall back to a flat distance
+        
+        for renderer in ( self._GetRenderer( HC.VIDEO_MP4, None, 100 ), self._GetRenderer( HC.VIDEO_MP4, [], 100 ), self._GetRenderer( HC.IMAGE_GIF, keyframe_timestamps, 100 ) ):
+            
+            self.assertFalse( renderer._ShouldRelaunchToJumpAhead( 160 ) )
+            self.assertTrue( renderer._ShouldRelaunchToJumpAhead( 161 ) )
+            
+        
+    
@@ -2,11 +2,20 @@ from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusNetwork
+from hydrus.core import HydrusPaths
 from hydrus.server import ServerDB
 from hydrus.test import TestController
 import time
+import types
 import unittest
 
+# enough to go over _RepositoryGenerateUpdates' 50,000 definitions rows and 250,000 content rows, and its 25,000 chunk of files per mapping row
+
+NUM_SYNTHETIC_HASHES = 50010
+NUM_SYNTHETIC_TAGS = 8
+NUM_SYNTHETIC_MAPPED_TAGS = 6
+
 class TestServerDB( unittest.TestCase ):
     
     def _read( self, action, *args, **kwargs ): return TestServerDB._db.Read( action, *args, **kwargs )
@@ -177,4 +186,231 @@ class TestServerDB( unittest.TestCase ):
         
         #self._test_content_creation()
         
-
+    
+class FakeAccount( object ):
+    
+    def HasPermission( self, content_type, permission ):
+        
+        return True
+        
+    
+class UpdatesTestDB( ServerDB.DB ):
+    
+    def _AddSyntheticRepositoryRows( self, service_key, timestamp ):
+        
+        self._AddService( HydrusNetwork.GenerateService( service_key, HC.TAG_REPOSITORY, 'test tag repository', 100 ) )
+        
+        service_id = self._GetServiceId( service_key )
+        
+        account_id = 1
+        
+        master_hash_ids = [ self._GetMasterHashId( HydrusData.GenerateKey() ) for i in range( NUM_SYNTHETIC_HASHES ) ]
+        
+        service_hash_ids = [ self._RepositoryGetServiceHashId( service_id, master_hash_id, timestamp ) for master_hash_id in master_hash_ids ]
+        service_tag_ids = [ self._RepositoryGetServiceTagId( service_id, self._GetMasterTagId( 'tag {}'.format( i ) ), timestamp ) for i in range( NUM_SYNTHETIC_TAGS ) ]
+        
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = ServerDB.GenerateRepositoryFilesTableNames( service_id )
+        
+        self._c.executemany( 'INSERT INTO files_info ( master_hash_id, size, mime, width, height, duration, num_frames, num_words ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ? );', ( ( master_hash_id, 1000, HC.IMAGE_PNG, 640, 480, None, None, None ) for master_hash_id in master_hash_ids[ : 10 ] ) )
+        
+        self._c.executemany( 'INSERT INTO ' + current_files_table_name + ' ( service_hash_id, account_id, file_timestamp ) VALUES ( ?, ?, ? );', ( ( service_hash_id, account_id, timestamp ) for service_hash_id in service_hash_ids[ : 10 ] ) )
+        self._c.executemany( 'INSERT INTO ' + deleted_files_table_name + ' ( service_hash_id, account_id, file_timestamp ) VALUES ( ?, ?, ? );', ( ( service_hash_id, account_id, timestamp ) for service_hash_id in service_hash_ids[ 10 : 15 ] ) )
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ServerDB.GenerateRepositoryMappingsTableNames( service_id )
+        
+        self._c.executemany( 'INSERT INTO ' + current_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', ( ( service_tag_id, service_hash_id, account_id, timestamp ) for service_tag_id in service_tag_ids[ : NUM_SYNTHETIC_MAPPED_TAGS ] for service_hash_id in service_hash_ids ) )
+        self._c.executemany( 'INSERT INTO ' + deleted_mappings_table_name + ' ( service_tag_id, service_hash_id, account_id, mapping_timestamp ) VALUES ( ?, ?, ?, ? );', ( ( service_tag_ids[ -1 ], service_hash_id, account_id, timestamp ) for service_hash_id in service_hash_ids[ : 10 ] ) )
+        
+        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = ServerDB.GenerateRepositoryTagParentsTableNames( service_id )
+        
+        self._c.execute( 'INSERT INTO ' + current_tag_parents_table_name + ' ( child_service_tag_id, parent_service_tag_id, account_id, parent_timestamp ) VALUES ( ?, ?, ?, ? );', ( service_tag_ids[0], service_tag_ids[1], account_id, timestamp ) )
+        self._c.execute( 'INSERT INTO ' + deleted_tag_parents_table_name + ' ( child_service_tag_id, parent_service_tag_id, account_id, parent_timestamp ) VALUES ( ?, ?, ?, ? );', ( service_tag_ids[2], service_tag_ids[3], account_id, timestamp ) )
+        
+        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = ServerDB.GenerateRepositoryTagSiblingsTableNames( service_id )
+        
+        self._c.execute( 'INSERT INTO ' + current_tag_siblings_table_name + ' ( bad_service_tag_id, good_service_tag_id, account_id, sibling_timestamp ) VALUES ( ?, ?, ?, ? );', ( service_tag_ids[4], service_tag_ids[5], account_id, timestamp ) )
+        self._c.execute( 'INSERT INTO ' + deleted_tag_siblings_table_name + ' ( bad_service_tag_id, good_service_tag_id, account_id, sibling_timestamp ) VALUES ( ?, ?, ?, ? );', ( service_tag_ids[6], service_tag_ids[7], account_id, timestamp ) )
+        
+    
+    def _GenerateUpdatesAllAtOnce( self, service_id, begin, end ):
+        
+        # how updates were made before they were streamed, fetching each table whole and handing back every update at the end
+        
+        MAX_DEFINITIONS_ROWS = 50000
+        MAX_CONTENT_ROWS = 250000
+        
+        MAX_CONTENT_CHUNK = 25000
+        
+        definitions_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.DefinitionsUpdate, MAX_DEFINITIONS_ROWS )
+        content_update_builder = HydrusNetwork.UpdateBuilder( HydrusNetwork.ContentUpdate, MAX_CONTENT_ROWS )
+        
+        ( service_hash_ids_table_name, service_tag_ids_table_name ) = ServerDB.GenerateRepositoryMasterMapTableNames( service_id )
+        
+        for ( service_hash_id, hash ) in self._c.execute( 'SELECT service_hash_id, hash FROM ' + service_hash_ids_table_name + ' NATURAL JOIN hashes WHERE hash_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall():
+            
+            definitions_update_builder.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, service_hash_id, hash ) )
+            
+        
+        for ( service_tag_id, tag ) in self._c.execute( 'SELECT service_tag_id, tag FROM ' + service_tag_ids_table_name + ' NATURAL JOIN tags WHERE tag_id_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall():
+            
+            definitions_update_builder.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, service_tag_id, tag ) )
+            
+        
+        definitions_update_builder.Finish()
+        
+        ( current_files_table_name, deleted_files_table_name, pending_files_table_name, petitioned_files_table_name, ip_addresses_table_name ) = ServerDB.GenerateRepositoryFilesTableNames( service_id )
+        
+        table_join = self._RepositoryGetFilesInfoFilesTableJoin( service_id, HC.CONTENT_STATUS_CURRENT )
+        
+        for file_row in self._c.execute( 'SELECT service_hash_id, size, mime, file_timestamp, width, height, duration, num_frames, num_words FROM ' + table_join + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall():
+            
+            content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, file_row ) )
+            
+        
+        for ( service_hash_id, ) in self._c.execute( 'SELECT service_hash_id FROM ' + deleted_files_table_name + ' WHERE file_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall():
+            
+            content_update_builder.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, service_hash_id ) )
+            
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ServerDB.GenerateRepositoryMappingsTableNames( service_id )
+        
+        for ( mappings_table_name, action ) in ( ( current_mappings_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_mappings_table_name, HC.CONTENT_UPDATE_DELETE ) ):
+            
+            service_tag_ids_to_service_hash_ids = HydrusData.BuildKeyToListDict( self._c.execute( 'SELECT service_tag_id, service_hash_id FROM ' + mappings_table_name + ' WHERE mapping_timestamp BETWEEN ? AND ?;', ( begin, end ) ) )
+            
+            for ( service_tag_id, service_hash_ids ) in service_tag_ids_to_service_hash_ids.items():
+                
+                for block_of_service_hash_ids in HydrusData.SplitListIntoChunks( service_hash_ids, MAX_CONTENT_CHUNK ):
+                    
+                    content_update_builder.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, action, ( service_tag_id, block_of_service_hash_ids ) ), len( block_of_service_hash_ids ) )
+                    
+                
+            
+        
+        ( current_tag_parents_table_name, deleted_tag_parents_table_name, pending_tag_parents_table_name, petitioned_tag_parents_table_name ) = ServerDB.GenerateRepositoryTagParentsTableNames( service_id )
+        
+        for ( tag_parents_table_name, action ) in ( ( current_tag_parents_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_tag_parents_table_name, HC.CONTENT_UPDATE_DELETE ) ):
+            
+            for pair in self._c.execute( 'SELECT child_service_tag_id, parent_service_tag_id FROM ' + tag_parents_table_name + ' WHERE parent_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall():
+                
+                content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, action, pair ) )
+                
+            
+        
+        ( current_tag_siblings_table_name, deleted_tag_siblings_table_name, pending_tag_siblings_table_name, petitioned_tag_siblings_table_name ) = ServerDB.GenerateRepositoryTagSiblingsTableNames( service_id )
+        
+        for ( tag_siblings_table_name, action ) in ( ( current_tag_siblings_table_name, HC.CONTENT_UPDATE_ADD ), ( deleted_tag_siblings_table_name, HC.CONTENT_UPDATE_DELETE ) ):
+            
+            for pair in self._c.execute( 'SELECT bad_service_tag_id, good_service_tag_id FROM ' + tag_siblings_table_name + ' WHERE sibling_timestamp BETWEEN ? AND ?;', ( begin, end ) ).fetchall():
+                
+                content_update_builder.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, action, pair ) )
+                
+            
+        
+        content_update_builder.Finish()
+        
+        return definitions_update_builder.PopFinishedUpdates() + content_update_builder.PopFinishedUpdates()
+        
+    
+    def _Read( self, action, *args, **kwargs ):
+        
+        if action in ( 'streamed_updates', 'all_at_once_updates' ):
+            
+            ( service_key, begin, end ) = args
+            
+            service_id = self._GetServiceId( service_key )
+            
+            if action == 'streamed_updates':
+                
+                updates = self._RepositoryGenerateUpdates( service_id, begin, end )
+                
+                return ( isinstance( updates, types.GeneratorType ), list( updates ) )
+                
+            else:
+                
+                return self._GenerateUpdatesAllAtOnce( service_id, begin, end )
+                
+            
+        
+        return ServerDB.DB._Read( self, action, *args, **kwargs )
+        
+    
+    def _Write( self, action, *args, **kwargs ):
+        
+        if action == 'synthetic_repository_rows':
+            
+            return self._AddSyntheticRepositoryRows( *args, **kwargs )
+            
+        
+        return ServerDB.DB._Write( self, action, *args, **kwargs )
+        
+    
+class TestRepositoryUpdates( unittest.TestCase ):
+    
+    @classmethod
+    def setUpClass( cls ):
+        
+        cls._db_dir = HydrusPaths.GetTempDir()
+        
+        cls._db = UpdatesTestDB( HG.test_controller, cls._db_dir, 'server' )
+        
+    
+    @classmethod
+    def tearDownClass( cls ):
+        
+        cls._db.Shutdown()
+        
+        while not cls._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        del cls._db
+        
+        HydrusPaths.DeletePath( cls._db_dir )
+        
+    
+    def test_generate_updates( self ):
+        
+        service_key = HydrusData.GenerateKey()
+        
+        timestamp = HydrusData.GetNow() - 3600
+        
+        self._db.Write( 'synthetic_repository_rows', True, service_key, timestamp )
+        
+        ( begin, end ) = ( timestamp - 60, timestamp + 60 )
+        
+        ( is_generator, streamed_updates ) = self._db.Read( 'streamed_updates', service_key, begin, end )
+        
+        self.assertTrue( is_generator )
+        
+        all_at_once_updates = self._db.Read( 'all_at_once_updates', service_key, begin, end )
+        
+        # the rows really did fill more than one update of each type
+        
+        num_definitions_updates = len( [ update for update in streamed_updates if isinstance( update, HydrusNetwork.DefinitionsUpdate ) ] )
+        num_content_updates = len( [ update for update in streamed_updates if isinstance( update, HydrusNetwork.ContentUpdate ) ] )
+        
+        self.assertEqual( ( num_definitions_updates, num_content_updates ), ( 2, 2 ) )
+        
+        self.assertEqual( sum( ( update.GetNumRows() for update in streamed_updates ) ), sum( ( update.GetNumRows() for update in all_at_once_updates ) ) )
+        
+        # same updates, in the same order, with the same rows in each
+        
+        self.assertEqual( [ update.GetSerialisableTuple() for update in streamed_updates ], [ update.GetSerialisableTuple() for update in all_at_once_updates ] )
+        
+        # the immediate update still hands back a plain list
+        
+        immediate_updates = self._db.Read( 'immediate_update', service_key, FakeAccount(), begin, end )
+        
+        self.assertIsInstance( immediate_updates, list )
+        
+        self.assertEqual( [ update.GetSerialisableTuple() for update in immediate_updates ], [ update.GetSerialisableTuple() for update in streamed_updates ] )
+        
+        # and nothing outside the period
+        
+        ( is_generator, streamed_updates ) = self._db.Read( 'streamed_updates', service_key, end + 1, end + 3600 )
+        
+        self.assertEqual( streamed_updates, [] )
+        
+    